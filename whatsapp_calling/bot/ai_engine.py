@@ -1,21 +1,74 @@
 import frappe
 import json
-import requests
+import threading
+import time
 from datetime import datetime
 import openai
 import anthropic
-from frappe.utils import cstr
+from frappe.utils import cint, cstr, flt
+from whatsapp_calling.utils.settings_cache import get_whatsapp_settings, get_settings_secret, get_settings_version
+from whatsapp_calling.utils.phone import E164_FIELD, normalize_phone
+from whatsapp_calling.whatsapp_integration.graph_client import send_message, GraphAPIError
+from whatsapp_calling.whatsapp_integration.outbound_queue import is_outbound_worker_running, queue_outbound_message
+from whatsapp_calling.bot.llm_metrics import record_llm_turn, record_prompt_usage
+from whatsapp_calling.bot.prompts import (
+    ROLLING_SUMMARY, get_claude_system, get_config_version, get_openai_messages, get_response_suffix, get_static_prefix
+)
+from whatsapp_calling.bot.context_builder import build_context, get_recent_turns, schedule_summary, trim_history
+from whatsapp_calling.bot.intent_classifier import DEFAULT_THRESHOLD, classify
+from whatsapp_calling.bot.response_cache import (
+    DEFAULT_TTL, cache_response, get_cache_key, get_cached_entry, get_excluded_intents
+)
+
+
+INTENTS = [
+    "greeting", "product_inquiry", "pricing", "support", "appointment",
+    "complaint", "lead_qualification", "goodbye", "other"
+]
+
+# Small talk the local classifier answers with the canned reply, without any LLM call
+CANNED_INTENTS = ("greeting", "goodbye")
+
+# Lead details the structured call may pick up from the conversation
+USER_FIELDS = ("name", "email", "company", "requirement", "budget", "timeline")
+
+BOT_REPLY_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "intent": {"type": "string", "enum": INTENTS},
+        "reply": {"type": "string", "description": "Message to send to the user"},
+        "language": {"type": "string", "description": "ISO 639-1 code of the language the user writes in"},
+        "user_fields": {
+            "type": "object",
+            "properties": {field: {"type": "string"} for field in USER_FIELDS},
+            "description": "Details the user shared in this message; omit anything not stated"
+        },
+        "summary": {
+            "type": "string",
+            "description": "Two or three sentences for the sales team: interests, details gathered and next steps"
+        }
+    },
+    "required": ["intent", "reply", "language"]
+}
+
+
+# Engines of this worker thread per site; see get_engine
+_engines = threading.local()
 
 
 class AIBotEngine:
     def __init__(self):
-        self.settings = frappe.get_single("WhatsApp Business Account")
+        self.settings = get_whatsapp_settings()
+        self.settings_version = get_settings_version()
         self.ai_provider = self.settings.ai_provider if self.settings else "claude"
         
+        # LLM tokens used by the last generated reply, 0 when it came from the fallback
+        self.last_tokens = 0
+        
         if self.ai_provider == "claude":
-            self.client = anthropic.Anthropic(api_key=self.settings.claude_api_key)
+            self.client = anthropic.Anthropic(api_key=get_settings_secret("claude_api_key"))
         elif self.ai_provider == "openai":
-            openai.api_key = self.settings.openai_api_key
+            openai.api_key = get_settings_secret("openai_api_key")
     
     def process_message(self, phone_number, message_body, conversation_state, message_id):
         """Process incoming message with AI bot"""
@@ -23,14 +76,49 @@ class AIBotEngine:
             # Get conversation context
             context = self.get_conversation_context(conversation_state)
             
-            # Classify intent
-            intent = self.classify_intent(message_body, context)
+            # Rules and the trained model settle confident intents locally
+            started = time.monotonic()
+            local = self.classify_locally(message_body)
+            intent, intent_source = (local[0], local[2]) if local else (None, "llm")
+            language = conversation_state.language
+            result = response = None
+            cached = False
+            
+            # Small talk and repeated questions are answered without an LLM call
+            if intent in CANNED_INTENTS:
+                response = self.get_fallback_response(intent)
+                record_llm_turn(self.ai_provider, "local", time.monotonic() - started)
+            else:
+                cached_reply = self.get_cached_reply(message_body, intent, language)
+                if cached_reply:
+                    (response, intent), cached = cached_reply, True
+                    record_llm_turn(self.ai_provider, "cached", time.monotonic() - started)
             
-            # Generate response based on intent
-            response = self.generate_response(intent, message_body, context)
+            if not response:
+                self.last_tokens = 0
+                
+                # One call for intent, reply, language and lead details; the two-call path is the fallback
+                result = self.get_structured_reply(message_body, context) if self.settings.structured_bot_replies else None
+            
+            if result:
+                intent, response, intent_source = result["intent"], result["reply"], "llm"
+            elif not response:
+                started = time.monotonic()
+                
+                # Classify intent, unless the local classifier already did
+                if not intent:
+                    intent, intent_source = self.classify_intent(message_body, context), "llm"
+                
+                # Generate response based on intent
+                self.last_tokens = 0
+                response = self.generate_response(intent, message_body, context)
+                record_llm_turn(self.ai_provider, "two_call", time.monotonic() - started)
             
             # Update conversation state
-            self.update_conversation_state(conversation_state, intent, message_body, response)
+            self.update_conversation_state(conversation_state, intent, message_body, response, result, intent_source)
+            
+            if not cached and intent not in CANNED_INTENTS:
+                self.cache_reply(message_body, intent, conversation_state, response)
             
             # Send response if not escalated to human
             if not conversation_state.is_escalated:
@@ -44,6 +132,54 @@ class AIBotEngine:
             # Send fallback response
             self.send_fallback_response(phone_number)
     
+    def classify_locally(self, message_body):
+        """(intent, confidence, source) from the local classifier, or None when the LLM should decide"""
+        if not self.settings.local_intent_classifier:
+            return None
+        
+        try:
+            return classify(message_body, flt(self.settings.local_intent_threshold) or DEFAULT_THRESHOLD)
+            
+        except Exception as e:
+            frappe.logger().error(f"Error classifying intent locally: {str(e)}")
+            return None
+    
+    def get_response_cache_key(self, message_body, intent, language):
+        """Response cache key, or None when caching is off or the intent opted out"""
+        if not self.settings.bot_response_cache or intent in get_excluded_intents(self.settings):
+            return None
+        
+        return get_cache_key(message_body, language, get_config_version(self.get_company_info()))
+    
+    def get_cached_reply(self, message_body, intent, language):
+        """(reply, intent) generated earlier for the same question and language; intent is None when not known yet"""
+        try:
+            key = self.get_response_cache_key(message_body, intent, language)
+            entry = get_cached_entry(key) if key else None
+            return (entry["response"], intent or entry["intent"]) if entry else None
+            
+        except Exception as e:
+            frappe.logger().error(f"Error reading cached bot reply: {str(e)}")
+            return None
+    
+    def cache_reply(self, message_body, intent, conversation_state, response):
+        """Cache a reply the LLM generated, unless it repeats the user's own details"""
+        try:
+            if not self.last_tokens:
+                return
+            
+            context_data = json.loads(conversation_state.context_data) if conversation_state.context_data else {}
+            personal = [cstr(value).lower() for value in (context_data.get("user_data") or {}).values()]
+            if any(len(value) > 2 and value in response.lower() for value in personal):
+                return
+            
+            key = self.get_response_cache_key(message_body, intent, conversation_state.language)
+            if key:
+                cache_response(key, response, self.last_tokens, intent, cint(self.settings.response_cache_ttl) or DEFAULT_TTL)
+            
+        except Exception as e:
+            frappe.logger().error(f"Error caching bot reply: {str(e)}")
+    
     def classify_intent(self, message_body, context):
         """Classify user intent using AI"""
         try:
@@ -85,7 +221,7 @@ class AIBotEngine:
                 )
                 intent = response.choices[0].message.content.strip().lower()
             
-            return intent if intent in ['greeting', 'product_inquiry', 'pricing', 'support', 'appointment', 'complaint', 'lead_qualification', 'goodbye', 'other'] else 'other'
+            return intent if intent in INTENTS else 'other'
             
         except Exception as e:
             frappe.logger().error(f"Error classifying intent: {str(e)}")
@@ -94,52 +230,27 @@ class AIBotEngine:
     def generate_response(self, intent, message_body, context):
         """Generate appropriate response based on intent"""
         try:
-            # Get company information
-            company_info = self.get_company_info()
-            
-            system_prompt = f"""
-            You are a helpful WhatsApp bot for {company_info['company_name']}. 
-            
-            Company Information:
-            - Name: {company_info['company_name']}
-            - Industry: {company_info['industry']}
-            - Products/Services: {company_info['products']}
-            - Contact: {company_info['contact']}
-            
-            Current Intent: {intent}
-            Conversation Context: {context}
-            
-            Guidelines:
-            - Be friendly and professional
-            - Keep responses concise (under 160 characters when possible)
-            - For pricing inquiries, mention that a sales representative will contact them
-            - For appointments, offer to schedule a call or demo
-            - For support issues, try to help or escalate to human agent
-            - For lead qualification, gather contact details and requirements
-            - Use emojis appropriately
-            - Always end with a question to keep conversation flowing
-            
-            Respond naturally to the user's message.
-            """
+            # Static prefix from the prompt cache; only the intent and context change per message
+            prefix = get_static_prefix("response", self.get_company_info())
+            suffix = get_response_suffix(intent, context)
             
             if self.ai_provider == "claude":
-                response = self.client.messages.create(
+                response = self.create_claude_message(
+                    "response",
                     model="claude-3-haiku-20240307",
                     max_tokens=200,
-                    system=system_prompt,
+                    system=get_claude_system(prefix, suffix),
                     messages=[{
                         "role": "user",
                         "content": message_body
                     }]
                 )
-                return response.content[0].text.strip()
+                return "".join(block.text for block in response.content if block.type == "text").strip()
             else:
-                response = openai.ChatCompletion.create(
+                response = self.create_openai_completion(
+                    "response",
                     model="gpt-3.5-turbo",
-                    messages=[
-                        {"role": "system", "content": system_prompt},
-                        {"role": "user", "content": message_body}
-                    ],
+                    messages=get_openai_messages(prefix, suffix, message_body),
                     max_tokens=200,
                     temperature=0.7
                 )
@@ -149,36 +260,88 @@ class AIBotEngine:
             frappe.logger().error(f"Error generating response: {str(e)}")
             return self.get_fallback_response(intent)
     
+    def get_structured_reply(self, message_body, context):
+        """Structured reply validated against BOT_REPLY_SCHEMA, or None to fall back to two calls"""
+        started = time.monotonic()
+        
+        try:
+            result = validate_bot_reply(self.generate_structured_reply(message_body, context))
+        except Exception as e:
+            frappe.logger().error(f"Error generating structured bot reply: {str(e)}")
+            result = None
+        
+        record_llm_turn(self.ai_provider, "structured", time.monotonic() - started, fallback=not result)
+        return result
+    
+    def generate_structured_reply(self, message_body, context):
+        """Classify, reply, detect the language and extract lead details in one forced tool call"""
+        prefix = get_static_prefix("structured", self.get_company_info())
+        user_content = f"Context: {context}\n\nMessage: {message_body}"
+        description = "Intent, reply and extracted details for the user's message"
+        
+        if self.ai_provider == "claude":
+            tools = [{"name": "bot_reply", "description": description, "input_schema": BOT_REPLY_SCHEMA}]
+            response = self.create_claude_message(
+                "structured",
+                model="claude-3-haiku-20240307",
+                max_tokens=400,
+                system=get_claude_system(prefix, tools=tools),
+                tools=tools,
+                tool_choice={"type": "tool", "name": "bot_reply"},
+                messages=[{"role": "user", "content": user_content}]
+            )
+            return next((block.input for block in response.content if block.type == "tool_use"), None)
+        
+        response = self.create_openai_completion(
+            "structured",
+            model="gpt-3.5-turbo",
+            messages=get_openai_messages(prefix, None, user_content),
+            functions=[{"name": "bot_reply", "description": description, "parameters": BOT_REPLY_SCHEMA}],
+            function_call={"name": "bot_reply"},
+            max_tokens=400,
+            temperature=0.5
+        )
+        function_call = response.choices[0].message.get("function_call")
+        return json.loads(function_call["arguments"]) if function_call else None
+    
+    def create_claude_message(self, call, **kwargs):
+        """Stream a Claude message to time the first token, then record prompt cache use"""
+        started = time.monotonic()
+        ttft = None
+        
+        with self.client.messages.stream(**kwargs) as stream:
+            for event in stream:
+                if ttft is None and event.type == "content_block_delta":
+                    ttft = time.monotonic() - started
+            response = stream.get_final_message()
+        
+        self.last_tokens = get_token_usage(response)
+        cacheable = any("cache_control" in block for block in kwargs.get("system") or [])
+        record_prompt_usage(self.ai_provider, call, ttft, *get_prompt_tokens(response), cacheable=cacheable)
+        return response
+    
+    def create_openai_completion(self, call, **kwargs):
+        """OpenAI completion with its token use recorded; not streamed, as streams carry no usage.
+        
+        The legacy ChatCompletion API reports no prompt_tokens_details, so cached tokens read as 0.
+        """
+        response = openai.ChatCompletion.create(**kwargs)
+        
+        self.last_tokens = get_token_usage(response)
+        record_prompt_usage(self.ai_provider, call, None, *get_prompt_tokens(response))
+        return response
+    
     def get_conversation_context(self, conversation_state):
         """Get conversation context for AI processing"""
         try:
-            context_data = json.loads(conversation_state.context_data) if conversation_state.context_data else {}
-            
-            # Get recent messages
-            recent_messages = frappe.get_all(
-                "WhatsApp Message",
-                filters={"conversation_id": conversation_state.conversation_id},
-                fields=["message_body", "direction", "timestamp"],
-                order_by="timestamp desc",
-                limit=5
-            )
-            
-            context = {
-                "current_intent": conversation_state.current_intent,
-                "lead_score": conversation_state.lead_score,
-                "language": conversation_state.language,
-                "recent_messages": recent_messages,
-                "user_data": context_data.get("user_data", {}),
-                "session_data": context_data.get("session_data", {})
-            }
-            
-            return json.dumps(context)
+            # Rolling summary and recent turns from the state, within the token budget
+            return build_context(conversation_state, self.settings)
             
         except Exception as e:
             frappe.logger().error(f"Error getting conversation context: {str(e)}")
             return "{}"
     
-    def update_conversation_state(self, conversation_state, intent, message, response):
+    def update_conversation_state(self, conversation_state, intent, message, response, result=None, intent_source="llm"):
         """Update conversation state with new interaction"""
         try:
             conversation_state.current_intent = intent
@@ -187,19 +350,33 @@ class AIBotEngine:
             # Update context data
             context_data = json.loads(conversation_state.context_data) if conversation_state.context_data else {}
             
+            timestamp = datetime.now().isoformat()
+            
+            # Details from a structured reply; its summary covers this turn, so no turn is left to fold in
+            if result:
+                if result["language"]:
+                    # Bot Conversation State tracks English and Hindi, everything else as regional
+                    conversation_state.language = result["language"] if result["language"] in ("en", "hi") else "regional"
+                
+                context_data.setdefault("user_data", {}).update(result["user_fields"])
+                if result["summary"]:
+                    context_data["summary"] = result["summary"]
+                    context_data["summary_through"] = timestamp
+            
             # Track conversation history
             if "conversation_history" not in context_data:
                 context_data["conversation_history"] = []
             
             context_data["conversation_history"].append({
-                "timestamp": datetime.now().isoformat(),
+                "timestamp": timestamp,
                 "user_message": message,
                 "bot_response": response,
-                "intent": intent
+                "intent": intent,
+                "intent_source": intent_source
             })
             
-            # Keep only last 10 exchanges
-            context_data["conversation_history"] = context_data["conversation_history"][-10:]
+            # Keep the last exchanges, including those the rolling summary has not folded in yet
+            trim_history(context_data, get_recent_turns(self.settings))
             
             # Update lead score based on intent
             self.update_lead_score(conversation_state, intent)
@@ -208,6 +385,9 @@ class AIBotEngine:
             conversation_state.save(ignore_permissions=True)
             frappe.db.commit()
             
+            # Turns that left the recent window are summarized after the reply, in the conversation's partition
+            schedule_summary(conversation_state, context_data, self.settings)
+            
         except Exception as e:
             frappe.logger().error(f"Error updating conversation state: {str(e)}")
     
@@ -232,15 +412,10 @@ class AIBotEngine:
     def send_bot_response(self, phone_number, response):
         """Send bot response via WhatsApp API"""
         try:
-            account = frappe.get_single("WhatsApp Business Account")
+            account = get_whatsapp_settings()
             if not account:
                 return
             
-            headers = {
-                'Authorization': f'Bearer {account.access_token}',
-                'Content-Type': 'application/json'
-            }
-            
             payload = {
                 "messaging_product": "whatsapp",
                 "to": phone_number,
@@ -250,19 +425,23 @@ class AIBotEngine:
                 }
             }
             
-            url = f"https://graph.facebook.com/v17.0/{account.phone_number_id}/messages"
-            response = requests.post(url, json=payload, headers=headers)
+            # The outbound worker sends it and records the result
+            if is_outbound_worker_running():
+                self.log_bot_message(phone_number, response, "sent", "queued", payload=payload)
+                return
+            
+            send_message(payload, account.phone_number_id)
+            
+            # Log bot message
+            self.log_bot_message(phone_number, response, "sent", "delivered")
+            
+        except GraphAPIError as e:
+            frappe.logger().error(f"Failed to send bot response: {str(e)}")
             
-            if response.status_code == 200:
-                # Log bot message
-                self.log_bot_message(phone_number, response, "sent", "delivered")
-            else:
-                frappe.logger().error(f"Failed to send bot response: {response.text}")
-                
         except Exception as e:
             frappe.logger().error(f"Error sending bot response: {str(e)}")
     
-    def log_bot_message(self, phone_number, message_body, direction, status):
+    def log_bot_message(self, phone_number, message_body, direction, status, payload=None):
         """Log bot message in WhatsApp Message"""
         try:
             message_log = frappe.new_doc("WhatsApp Message")
@@ -277,6 +456,11 @@ class AIBotEngine:
             message_log.is_bot_message = True
             
             message_log.insert(ignore_permissions=True)
+            
+            # Registered before the commit, so the job is pushed once the log exists
+            if status == "queued":
+                queue_outbound_message(message_log, payload)
+            
             frappe.db.commit()
             
         except Exception as e:
@@ -356,7 +540,7 @@ class AIBotEngine:
         """Create or update lead record for qualified prospect"""
         try:
             # Check if lead already exists
-            lead_name = frappe.db.get_value("Lead", {"mobile_no": conversation_state.phone_number}, "name")
+            lead_name = frappe.db.get_value("Lead", {E164_FIELD: conversation_state.whatsapp_phone_e164}, "name")
             
             if lead_name:
                 # Update existing lead
@@ -377,7 +561,9 @@ class AIBotEngine:
             
             # Add conversation summary to notes
             context_data = json.loads(conversation_state.context_data) if conversation_state.context_data else {}
-            conversation_summary = self.generate_conversation_summary(context_data.get("conversation_history", []))
+            conversation_summary = context_data.get("summary") or self.generate_conversation_summary(
+                context_data.get("conversation_history", [])
+            )
             
             lead.notes = f"Qualified via WhatsApp Bot\nLead Score: {conversation_state.lead_score}\nConversation Summary:\n{conversation_summary}"
             
@@ -439,10 +625,42 @@ class AIBotEngine:
             frappe.logger().error(f"Error generating conversation summary: {str(e)}")
             return "Error generating summary"
     
+    def fold_summary(self, summary, turns):
+        """Merge exchanges into the rolling summary with one short LLM call; None on failure"""
+        try:
+            conversation_text = "\n".join(
+                f"User: {turn['user_message']}\nBot: {turn['bot_response']}" for turn in turns
+            )
+            content = f"Current summary: {summary or 'None yet'}\n\nNew exchanges:\n{conversation_text}"
+            
+            if self.ai_provider == "claude":
+                response = self.client.messages.create(
+                    model="claude-3-haiku-20240307",
+                    max_tokens=200,
+                    system=ROLLING_SUMMARY,
+                    messages=[{"role": "user", "content": content}]
+                )
+                return response.content[0].text.strip()
+            else:
+                response = openai.ChatCompletion.create(
+                    model="gpt-3.5-turbo",
+                    messages=[
+                        {"role": "system", "content": ROLLING_SUMMARY},
+                        {"role": "user", "content": content}
+                    ],
+                    max_tokens=200,
+                    temperature=0.3
+                )
+                return response.choices[0].message.content.strip()
+                
+        except Exception as e:
+            frappe.logger().error(f"Error updating rolling conversation summary: {str(e)}")
+            return None
+    
     def get_company_info(self):
         """Get company information for bot responses"""
         try:
-            company = frappe.get_doc("Company", frappe.defaults.get_user_default("Company"))
+            company = frappe.get_cached_doc("Company", frappe.defaults.get_user_default("Company"))
             
             return {
                 "company_name": company.company_name,
@@ -482,7 +700,7 @@ class AIBotEngine:
     
     def get_business_phone_number(self):
         """Get business phone number"""
-        account = frappe.get_single("WhatsApp Business Account")
+        account = get_whatsapp_settings()
         return account.phone_number if account else None
     
     def get_next_available_sales_user(self):
@@ -504,11 +722,77 @@ class AIBotEngine:
             return "Administrator"
 
 
+def validate_bot_reply(data):
+    """Check a structured reply against BOT_REPLY_SCHEMA; returns the cleaned result or None"""
+    if not isinstance(data, dict):
+        return None
+    
+    intent = cstr(data.get("intent")).strip().lower()
+    reply = cstr(data.get("reply")).strip()
+    user_fields = data.get("user_fields") or {}
+    
+    if intent not in INTENTS or not reply or not isinstance(user_fields, dict):
+        return None
+    
+    return {
+        "intent": intent,
+        "reply": reply,
+        "language": cstr(data.get("language")).strip().lower()[:10] or None,
+        "user_fields": {
+            field: cstr(value).strip() for field, value in user_fields.items()
+            if field in USER_FIELDS and cstr(value).strip()
+        },
+        "summary": cstr(data.get("summary")).strip() or None
+    }
+
+
+def get_engine():
+    """The worker's engine for this site, rebuilt only when the account settings change"""
+    # A live engine keeps the provider client and its pooled TLS connections warm across jobs;
+    # engines are per thread because a turn keeps state such as last_tokens on the engine
+    engines = getattr(_engines, "by_site", None)
+    if engines is None:
+        engines = _engines.by_site = {}
+    
+    engine = engines.get(frappe.local.site)
+    if not engine or engine.settings_version != get_settings_version():
+        engine = engines[frappe.local.site] = AIBotEngine()
+    
+    return engine
+
+
+def get_token_usage(response):
+    """Input plus output tokens reported by a Claude or OpenAI response"""
+    usage = getattr(response, "usage", None)
+    if not usage:
+        return 0
+    
+    if hasattr(usage, "input_tokens"):
+        return get_prompt_tokens(response)[0] + cint(usage.output_tokens)
+    
+    return cint(getattr(usage, "total_tokens", 0))
+
+
+def get_prompt_tokens(response):
+    """(input tokens, input tokens read from the provider's prompt cache) of a Claude or OpenAI response"""
+    usage = getattr(response, "usage", None)
+    if not usage:
+        return 0, 0
+    
+    if hasattr(usage, "input_tokens"):
+        # Claude reports cache reads and writes apart from the uncached input
+        cached = cint(getattr(usage, "cache_read_input_tokens", 0))
+        return cint(usage.input_tokens) + cached + cint(getattr(usage, "cache_creation_input_tokens", 0)), cached
+    
+    details = getattr(usage, "prompt_tokens_details", None)
+    return cint(getattr(usage, "prompt_tokens", 0)), cint(getattr(details, "cached_tokens", 0)) if details else 0
+
+
 @frappe.whitelist()
 def process_message(phone_number, message_body, conversation_state, message_id):
     """Queue function to process message with AI bot"""
     try:
-        engine = AIBotEngine()
+        engine = get_engine()
         state_doc = frappe.get_doc("Bot Conversation State", conversation_state)
         engine.process_message(phone_number, message_body, state_doc, message_id)
         
@@ -520,11 +804,15 @@ def process_message(phone_number, message_body, conversation_state, message_id):
 def escalate_conversation(phone_number, reason="user_request"):
     """Manually escalate conversation to human agent"""
     try:
-        conversation_state = frappe.get_value("Bot Conversation State", {"phone_number": phone_number}, "name")
+        conversation_state = frappe.get_value(
+            "Bot Conversation State",
+            {E164_FIELD: normalize_phone(phone_number, international=True)},
+            "name"
+        )
         
         if conversation_state:
             state_doc = frappe.get_doc("Bot Conversation State", conversation_state)
-            engine = AIBotEngine()
+            engine = get_engine()
             engine.escalate_to_human(state_doc)
             
             return {"success": True, "message": "Conversation escalated to human agent"}
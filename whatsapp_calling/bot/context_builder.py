@@ -0,0 +1,164 @@
+"""
+Conversation context for bot prompts: the lead details, a rolling summary of
+older turns and the last few turns, fitted to a token budget with a local
+estimate. Turns that leave the recent window are folded into the summary by a
+task that runs in the conversation's bot partition, after the reply is sent.
+"""
+
+import json
+import math
+import frappe
+from frappe.utils import cint
+from whatsapp_calling.utils.phone import normalize_phone
+
+
+DEFAULT_TOKEN_BUDGET = 600
+DEFAULT_RECENT_TURNS = 4
+
+# Older turns are summarized in batches, so a long conversation costs one summary call per few turns
+SUMMARY_BATCH = 3
+MAX_HISTORY = 10
+
+SUMMARY_TASK = "whatsapp_calling.bot.context_builder.update_rolling_summary"
+SUMMARY_QUEUED_KEY = "whatsapp_calling:bot_summary_queued:"
+SUMMARY_QUEUED_SECONDS = 300
+
+# Roughly four characters per token for Latin text; other scripts and emoji are closer to one per character
+CHARS_PER_TOKEN = 4
+
+# Keys, quotes and the ellipses of a shortened turn
+TURN_OVERHEAD = 8
+
+
+def estimate_tokens(text):
+    """Local token estimate, close enough to budget a prompt without calling the provider"""
+    text = text or ""
+    ascii_chars = sum(1 for char in text if char.isascii())
+    return math.ceil(ascii_chars / CHARS_PER_TOKEN) + len(text) - ascii_chars
+
+
+def truncate_to_tokens(text, tokens):
+    """Cut text to about the given number of tokens, keeping its end where the latest facts are"""
+    text = text or ""
+    cost = 0
+    
+    for index in range(len(text) - 1, -1, -1):
+        cost += 1 / CHARS_PER_TOKEN if text[index].isascii() else 1
+        if cost > tokens:
+            return "…" + text[index + 1:]
+    
+    return text
+
+
+def get_token_budget(settings):
+    return cint(settings.get("context_token_budget")) or DEFAULT_TOKEN_BUDGET
+
+
+def get_recent_turns(settings):
+    return cint(settings.get("context_recent_turns")) or DEFAULT_RECENT_TURNS
+
+
+def build_context(conversation_state, settings):
+    """JSON context for the prompt: fixed fields, then the summary, then the newest turns that fit the budget"""
+    context_data = json.loads(conversation_state.context_data) if conversation_state.context_data else {}
+    budget = get_token_budget(settings)
+    
+    context = {
+        "current_intent": conversation_state.current_intent,
+        "lead_score": conversation_state.lead_score,
+        "language": conversation_state.language,
+        "user_data": context_data.get("user_data", {})
+    }
+    used = estimate_tokens(dump(dict(context, summary="", recent_turns=[])))
+    
+    summary = context_data.get("summary")
+    if summary:
+        context["summary"] = truncate_to_tokens(summary, max(budget - used, 0) // 2)
+        used += estimate_tokens(context["summary"]) + 1
+    
+    turns = []
+    for turn in reversed((context_data.get("conversation_history") or [])[-get_recent_turns(settings):]):
+        item = {"user": turn.get("user_message"), "bot": turn.get("bot_response")}
+        cost = estimate_tokens(dump(item)) + 1
+        
+        if used + cost > budget:
+            # The latest turn always goes in, shortened if need be
+            if not turns and budget > used + TURN_OVERHEAD:
+                share = (budget - used - TURN_OVERHEAD) // 2
+                item = {"user": truncate_to_tokens(item["user"], share), "bot": truncate_to_tokens(item["bot"], share)}
+                turns.append(item)
+            break
+        
+        turns.append(item)
+        used += cost
+    
+    context["recent_turns"] = list(reversed(turns))
+    return dump(context)
+
+
+def dump(value):
+    # Compact and unescaped: \uXXXX escapes cost several tokens per character of non-Latin text
+    return json.dumps(value, ensure_ascii=False, separators=(",", ":"), default=str)
+
+
+def get_unsummarized_turns(context_data, recent_turns):
+    """Turns older than the recent window that the rolling summary does not cover yet"""
+    history = context_data.get("conversation_history") or []
+    through = context_data.get("summary_through") or ""
+    older = history[:-recent_turns] if recent_turns else history
+    
+    return [turn for turn in older if (turn.get("timestamp") or "") > through]
+
+
+def trim_history(context_data, recent_turns):
+    """Cap the stored history, keeping turns the summary still has to fold in"""
+    history = context_data.get("conversation_history") or []
+    keep = max(MAX_HISTORY, recent_turns + SUMMARY_BATCH * 2)
+    context_data["conversation_history"] = history[-keep:]
+
+
+def schedule_summary(conversation_state, context_data, settings):
+    """Queue the summary task in the conversation's partition once a batch of old turns is waiting"""
+    from whatsapp_calling.whatsapp_integration.partition_dispatcher import dispatch_task
+    
+    if len(get_unsummarized_turns(context_data, get_recent_turns(settings))) < SUMMARY_BATCH:
+        return
+    
+    try:
+        cache = frappe.cache()
+        conversation = normalize_phone(conversation_state.phone_number, international=True) or conversation_state.phone_number
+        if cache.set(cache.make_key(SUMMARY_QUEUED_KEY + conversation), 1, nx=True, ex=SUMMARY_QUEUED_SECONDS):
+            dispatch_task(conversation_state.phone_number, SUMMARY_TASK)
+        
+    except Exception as e:
+        frappe.logger().error(f"Error scheduling conversation summary: {str(e)}")
+
+
+def update_rolling_summary(phone_number):
+    """Partition task: fold the turns that left the recent window into the rolling summary"""
+    from whatsapp_calling.bot.ai_engine import get_engine
+    from whatsapp_calling.whatsapp_integration.webhook_handler import get_bot_conversation_state
+    
+    cache = frappe.cache()
+    conversation = normalize_phone(phone_number, international=True) or phone_number
+    cache.delete(cache.make_key(SUMMARY_QUEUED_KEY + conversation))
+    
+    conversation_state = get_bot_conversation_state(phone_number)
+    if not conversation_state:
+        return
+    
+    engine = get_engine()
+    context_data = json.loads(conversation_state.context_data) if conversation_state.context_data else {}
+    turns = get_unsummarized_turns(context_data, get_recent_turns(engine.settings))
+    if not turns:
+        return
+    
+    summary = engine.fold_summary(context_data.get("summary"), turns)
+    if not summary:
+        return
+    
+    context_data["summary"] = summary
+    context_data["summary_through"] = turns[-1]["timestamp"]
+    
+    conversation_state.context_data = json.dumps(context_data)
+    conversation_state.save(ignore_permissions=True)
\ No newline at end of file
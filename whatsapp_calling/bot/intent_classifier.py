@@ -0,0 +1,291 @@
+"""
+First-tier intent classifier in front of the LLM: anchored rules for small
+talk and keyword rules, then a TF-IDF plus softmax regression model trained on
+intents the LLM assigned earlier. Only answers below the confidence threshold
+go to the LLM.
+"""
+
+import json
+import math
+import os
+import random
+import re
+import threading
+import time
+import frappe
+from frappe.utils import flt
+
+
+MODEL_FILE = "whatsapp_intent_model.json"
+DEFAULT_THRESHOLD = 0.85
+
+MAX_TRAINING_EXAMPLES = 20000
+MIN_TRAINING_EXAMPLES = 50
+MAX_VOCABULARY = 5000
+EPOCHS = 15
+LEARNING_RATE = 0.5
+L2 = 1e-4
+
+# (intent, pattern, confidence); whole-message patterns for small talk, keywords for the rest
+RULES = [
+    ("greeting", re.compile(
+        r"^\s*(hi+|hello+|hey+|hiya|yo|namaste|hola|good\s+(morning|afternoon|evening))"
+        r"(\s+(there|team|all|everyone))?[\s!.,:)🙏👋😊]*$", re.I
+    ), 1.0),
+    ("goodbye", re.compile(
+        r"^\s*(ok(ay)?[\s,]*)?(bye+|good\s*bye|see\s+(you|ya)|thanks?(\s+you)?(\s+(so\s+much|a\s+lot))?|thx|ty|"
+        r"cheers|good\s+night)[\s!.,:)🙏👍😊]*$", re.I
+    ), 1.0),
+    ("complaint", re.compile(r"\b(complain\w*|refund|not\s+working|broken|worst|disappointed|terrible)\b", re.I), 0.9),
+    ("appointment", re.compile(r"\b(book|schedule)\w*\s+(a\s+)?(demo|call|meeting|appointment)\b", re.I), 0.9),
+    ("pricing", re.compile(r"\b(price|pricing|prices|cost|costs|how\s+much|quote|quotation)\b", re.I), 0.9)
+]
+
+TOKEN_PATTERN = re.compile(r"[^\W_]+", re.U)
+
+_models = {}
+_lock = threading.Lock()
+
+
+class IntentModel:
+    """TF-IDF features over word unigrams and bigrams, scored by a linear softmax model"""
+    
+    def __init__(self, intents, idf, weights, bias):
+        self.intents = intents
+        self.idf = idf
+        self.weights = weights
+        self.bias = bias
+    
+    def predict(self, text):
+        """(intent, probability) of the most likely intent"""
+        scores = list(self.bias)
+        for term, value in self.vectorize(text).items():
+            for index, weight in enumerate(self.weights[term]):
+                scores[index] += weight * value
+        
+        probabilities = softmax(scores)
+        best = max(range(len(probabilities)), key=probabilities.__getitem__)
+        return self.intents[best], probabilities[best]
+    
+    def vectorize(self, text):
+        """L2-normalised TF-IDF vector over the model's vocabulary"""
+        counts = {}
+        for term in get_terms(text):
+            if term in self.idf:
+                counts[term] = counts.get(term, 0) + 1
+        
+        vector = {term: count * self.idf[term] for term, count in counts.items()}
+        norm = math.sqrt(sum(value * value for value in vector.values())) or 1
+        return {term: value / norm for term, value in vector.items()}
+    
+    def as_dict(self):
+        return {"intents": self.intents, "idf": self.idf, "weights": self.weights, "bias": self.bias}
+    
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data["intents"], data["idf"], data["weights"], data["bias"])
+
+
+def classify(message, threshold=DEFAULT_THRESHOLD, model=None):
+    """Settle an intent locally; returns (intent, confidence, source) or None to ask the LLM"""
+    result = match_rules(message)
+    if result and result[1] >= threshold:
+        return result
+    
+    model = model or load_model()
+    if model and message:
+        intent, probability = model.predict(message)
+        if probability >= threshold:
+            return intent, probability, "model"
+    
+    return None
+
+
+def match_rules(message):
+    """(intent, confidence, 'rules') when exactly one intent's rules match"""
+    matches = {intent: confidence for intent, pattern, confidence in RULES if pattern.search(message or "")}
+    if len(matches) != 1:
+        return None
+    
+    intent, confidence = matches.popitem()
+    return intent, confidence, "rules"
+
+
+def get_terms(text):
+    words = TOKEN_PATTERN.findall((text or "").lower())
+    return words + [f"{first} {second}" for first, second in zip(words, words[1:])]
+
+
+def softmax(scores):
+    top = max(scores)
+    exps = [math.exp(score - top) for score in scores]
+    total = sum(exps)
+    return [value / total for value in exps]
+
+
+def train_model(pairs, epochs=EPOCHS, seed=0):
+    """Fit an IntentModel on (message, intent) pairs with plain SGD"""
+    pairs = [(message, intent) for message, intent in pairs if message and intent]
+    intents = sorted({intent for _, intent in pairs})
+    if len(intents) < 2:
+        return None
+    
+    # Vocabulary: the terms found in most messages
+    document_counts = {}
+    for message, _ in pairs:
+        for term in set(get_terms(message)):
+            document_counts[term] = document_counts.get(term, 0) + 1
+    
+    vocabulary = sorted(document_counts, key=lambda term: (-document_counts[term], term))[:MAX_VOCABULARY]
+    idf = {term: math.log((1 + len(pairs)) / (1 + document_counts[term])) + 1 for term in vocabulary}
+    
+    model = IntentModel(intents, idf, {term: [0.0] * len(intents) for term in vocabulary}, [0.0] * len(intents))
+    examples = [(model.vectorize(message), intents.index(intent)) for message, intent in pairs]
+    generator = random.Random(seed)
+    
+    for epoch in range(epochs):
+        generator.shuffle(examples)
+        rate = LEARNING_RATE / (1 + epoch)
+        
+        for vector, label in examples:
+            scores = list(model.bias)
+            for term, value in vector.items():
+                for index, weight in enumerate(model.weights[term]):
+                    scores[index] += weight * value
+            
+            # Gradient of the cross-entropy loss: predicted probability minus the one-hot label
+            gradient = softmax(scores)
+            gradient[label] -= 1
+            
+            for index, error in enumerate(gradient):
+                model.bias[index] -= rate * error
+            for term, value in vector.items():
+                weights = model.weights[term]
+                for index, error in enumerate(gradient):
+                    weights[index] -= rate * (error * value + L2 * weights[index])
+    
+    return model
+
+
+def get_model_path():
+    return frappe.get_site_path("private", MODEL_FILE)
+
+
+def load_model():
+    """The site's trained model, reloaded when the file changes; None before the first training"""
+    path = get_model_path()
+    
+    try:
+        modified = os.path.getmtime(path)
+    except OSError:
+        return None
+    
+    cached = _models.get(path)
+    if cached and cached[0] == modified:
+        return cached[1]
+    
+    try:
+        with open(path) as f:
+            model = IntentModel.from_dict(json.load(f))
+    except (OSError, ValueError, KeyError) as e:
+        frappe.logger().error(f"Error loading intent model: {str(e)}")
+        return None
+    
+    with _lock:
+        _models[path] = (modified, model)
+    
+    return model
+
+
+def get_training_pairs(limit=MAX_TRAINING_EXAMPLES):
+    """(message, intent) pairs labelled by the LLM, newest conversations first"""
+    pairs = []
+    states = frappe.get_all(
+        "Bot Conversation State",
+        filters={"context_data": ["is", "set"]},
+        fields=["context_data"],
+        order_by="last_interaction desc",
+        limit=limit
+    )
+    
+    for state in states:
+        try:
+            history = json.loads(state.context_data).get("conversation_history") or []
+        except (TypeError, ValueError, AttributeError):
+            continue
+        
+        for exchange in history:
+            # Only LLM labels; training on the classifier's own answers would reinforce its mistakes
+            if exchange.get("intent_source", "llm") == "llm" and exchange.get("user_message"):
+                pairs.append((exchange["user_message"], exchange.get("intent")))
+        
+        if len(pairs) >= limit:
+            break
+    
+    return pairs[:limit]
+
+
+def train_intent_model():
+    """Scheduled: retrain the model on logged intents and publish it to every worker"""
+    try:
+        pairs = get_training_pairs()
+        if len(pairs) < MIN_TRAINING_EXAMPLES:
+            return
+        
+        model = train_model(pairs)
+        if not model:
+            return
+        
+        path = get_model_path()
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        
+        # Write then rename, so a worker never reads a half-written model
+        with open(f"{path}.tmp", "w") as f:
+            json.dump(model.as_dict(), f)
+        os.replace(f"{path}.tmp", path)
+        
+        frappe.logger().info(f"Trained intent model on {len(pairs)} messages")
+        
+    except Exception as e:
+        frappe.logger().error(f"Error training intent model: {str(e)}")
+
+
+def evaluate(pairs, thresholds=(0.7, 0.8, 0.85, 0.9, 0.95), holdout=0.2, llm_latency_ms=None, seed=0):
+    """Hold out part of the LLM-labelled pairs and report, per threshold, the share answered locally,
+    their accuracy and the expected latency with the LLM answering the rest"""
+    pairs = list(pairs)
+    random.Random(seed).shuffle(pairs)
+    split = int(len(pairs) * (1 - holdout))
+    train, test = pairs[:split], pairs[split:]
+    
+    model = train_model(train, seed=seed)
+    if not model or not test:
+        return {"train": len(train), "test": len(test), "rows": []}
+    
+    rows = []
+    for threshold in thresholds:
+        local = correct = 0
+        started = time.perf_counter()
+        
+        for message, intent in test:
+            result = classify(message, threshold, model)
+            if result:
+                local += 1
+                correct += result[0] == intent
+        
+        local_us = (time.perf_counter() - started) / len(test) * 1e6
+        local_share = local / len(test)
+        
+        rows.append({
+            "threshold": threshold,
+            "local_share": flt(local_share, 4),
+            "local_accuracy": flt(correct / local, 4) if local else None,
+            # The LLM's label is the reference, so messages it answers count as correct
+            "overall_accuracy": flt((correct + len(test) - local) / len(test), 4),
+            "local_latency_us": flt(local_us, 1),
+            "expected_latency_ms": flt(
+                local_share * local_us / 1000 + (1 - local_share) * llm_latency_ms, 1
+            ) if llm_latency_ms else None
+        })
+    
+    return {"train": len(train), "test": len(test), "rows": rows}
\ No newline at end of file
@@ -0,0 +1,133 @@
+import frappe
+from frappe.utils import cint, flt
+from whatsapp_calling.whatsapp_integration.graph_client import get_percentile
+
+
+METRICS_KEY = "whatsapp_calling:llm_metrics:"
+LATENCY_KEY = "whatsapp_calling:llm_latency:"
+PROMPT_KEY = "whatsapp_calling:llm_prompt:"
+TTFT_KEY = "whatsapp_calling:llm_ttft:"
+PROVIDERS = ("claude", "openai")
+
+# structured: one call returning intent, reply, language and user fields; two_call: intent, then reply;
+# local: small talk settled by the intent classifier without an LLM call; cached: a reply from the response cache
+MODES = ("structured", "two_call", "local", "cached")
+LATENCY_SAMPLES = 1000
+
+# Calls built from a cached static prompt prefix
+PROMPT_CALLS = ("response", "structured")
+
+# Why no cached input tokens show up
+UNCACHED_CLAUDE_NOTE = "Tools and static prefix are below Anthropic's minimum cacheable length; no breakpoint was sent"
+UNREPORTED_OPENAI_NOTE = "The legacy openai.ChatCompletion API does not report cached prompt tokens"
+
+
+def record_llm_turn(provider, mode, duration, fallback=False):
+    """Count one bot turn per provider and mode, keeping its latency in a capped sample list"""
+    try:
+        cache = frappe.cache()
+        metrics_key = cache.make_key(METRICS_KEY + provider)
+        latency_key = cache.make_key(f"{LATENCY_KEY}{provider}:{mode}")
+        
+        pipe = cache.pipeline()
+        pipe.hincrby(metrics_key, mode, 1)
+        if fallback:
+            pipe.hincrby(metrics_key, "fallbacks", 1)
+        pipe.lpush(latency_key, round(duration * 1000, 2))
+        pipe.ltrim(latency_key, 0, LATENCY_SAMPLES - 1)
+        pipe.execute()
+        
+    except Exception as e:
+        frappe.logger().error(f"Error recording LLM metrics: {str(e)}")
+
+
+def record_prompt_usage(provider, call, ttft=None, input_tokens=0, cached_tokens=0, cacheable=False):
+    """Count input tokens and those served from the provider's prompt cache; keep time-to-first-token samples.
+    
+    cacheable tells whether the call sent a prompt cache breakpoint.
+    """
+    try:
+        cache = frappe.cache()
+        prompt_key = cache.make_key(PROMPT_KEY + provider)
+        
+        pipe = cache.pipeline()
+        pipe.hincrby(prompt_key, f"{call}_calls", 1)
+        pipe.hincrby(prompt_key, f"{call}_input_tokens", cint(input_tokens))
+        pipe.hincrby(prompt_key, f"{call}_cached_tokens", cint(cached_tokens))
+        if cacheable:
+            pipe.hincrby(prompt_key, f"{call}_cacheable_calls", 1)
+        if ttft is not None:
+            ttft_key = cache.make_key(f"{TTFT_KEY}{provider}:{call}")
+            pipe.lpush(ttft_key, round(ttft * 1000, 2))
+            pipe.ltrim(ttft_key, 0, LATENCY_SAMPLES - 1)
+        pipe.execute()
+        
+    except Exception as e:
+        frappe.logger().error(f"Error recording LLM prompt metrics: {str(e)}")
+
+
+@frappe.whitelist()
+def get_llm_stats():
+    """Report bot turns, structured-call fallback rate, latency percentiles and prompt cache use per provider"""
+    frappe.only_for("System Manager")
+    
+    cache = frappe.cache()
+    pipe = cache.pipeline()
+    for provider in PROVIDERS:
+        pipe.hmget(cache.make_key(METRICS_KEY + provider), list(MODES) + ["fallbacks"])
+        for mode in MODES:
+            pipe.lrange(cache.make_key(f"{LATENCY_KEY}{provider}:{mode}"), 0, -1)
+        pipe.hgetall(cache.make_key(PROMPT_KEY + provider))
+        for call in PROMPT_CALLS:
+            pipe.lrange(cache.make_key(f"{TTFT_KEY}{provider}:{call}"), 0, -1)
+    results = iter(pipe.execute())
+    
+    stats = {}
+    for provider in PROVIDERS:
+        counts = dict(zip(MODES + ("fallbacks",), [cint(count) for count in next(results)]))
+        turns = sum(counts[mode] for mode in MODES) - counts["fallbacks"]
+        
+        stats[provider] = dict(counts)
+        stats[provider]["fallback_rate"] = flt(counts["fallbacks"] / counts["structured"], 4) if counts["structured"] else None
+        stats[provider]["local_share"] = flt(counts["local"] / turns, 4) if turns else None
+        
+        for mode in MODES:
+            latencies = sorted(float(sample) for sample in next(results))
+            stats[provider][f"{mode}_p50_ms"] = get_percentile(latencies, 0.5)
+            stats[provider][f"{mode}_p99_ms"] = get_percentile(latencies, 0.99)
+        
+        prompt = {frappe.safe_decode(field): cint(count) for field, count in (next(results) or {}).items()}
+        for call in PROMPT_CALLS:
+            calls = prompt.get(f"{call}_calls", 0)
+            cacheable_calls = prompt.get(f"{call}_cacheable_calls", 0)
+            input_tokens = prompt.get(f"{call}_input_tokens", 0)
+            cached_tokens = prompt.get(f"{call}_cached_tokens", 0)
+            samples = sorted(float(sample) for sample in next(results))
+            
+            stats[provider][f"{call}_calls"] = calls
+            stats[provider][f"{call}_input_tokens"] = input_tokens
+            if provider == "openai":
+                stats[provider][f"{call}_cached_input_tokens"] = None
+                stats[provider][f"{call}_cache_share"] = None
+                stats[provider][f"{call}_prompt_cache_note"] = UNREPORTED_OPENAI_NOTE
+            else:
+                stats[provider][f"{call}_cacheable_calls"] = cacheable_calls
+                stats[provider][f"{call}_cached_input_tokens"] = cached_tokens
+                stats[provider][f"{call}_cache_share"] = flt(cached_tokens / input_tokens, 4) if input_tokens else None
+                stats[provider][f"{call}_prompt_cache_note"] = UNCACHED_CLAUDE_NOTE if calls and not cacheable_calls else None
+            stats[provider][f"{call}_ttft_p50_ms"] = get_percentile(samples, 0.5)
+            stats[provider][f"{call}_ttft_p99_ms"] = get_percentile(samples, 0.99)
+    
+    return stats
+
+
+def get_median_latency(provider, mode):
+    """p50 latency in ms of recent turns, or None without samples"""
+    try:
+        cache = frappe.cache()
+        # Through the pipeline like the writes; RedisWrapper.lrange would prefix the key a second time
+        [samples] = cache.pipeline().lrange(cache.make_key(f"{LATENCY_KEY}{provider}:{mode}"), 0, -1).execute()
+        return get_percentile(sorted(float(sample) for sample in samples), 0.5)
+        
+    except Exception:
+        return None
\ No newline at end of file
@@ -0,0 +1,132 @@
+"""
+Bot system prompts, split into a static prefix (company profile and reply
+guidelines) compiled once per config version and a small per-message suffix.
+The prefix goes first so providers can serve it from their prompt cache once
+it is long enough to be cached.
+"""
+
+import hashlib
+import json
+import threading
+from whatsapp_calling.bot.context_builder import estimate_tokens
+from whatsapp_calling.utils.settings_cache import get_settings_version
+
+
+# Bump when a template changes, so compiled prefixes and cached replies from the old text are dropped
+PROMPT_VERSION = 2
+
+MAX_PREFIXES = 32
+
+# Anthropic ignores a cache breakpoint before this many tokens (2048 for the Haiku model used here);
+# tools come before the system prompt, so they count towards it
+MIN_CACHEABLE_TOKENS = 2048
+
+COMPANY_PROFILE = """You are a helpful WhatsApp bot for {company_name}.
+
+Company Information:
+- Name: {company_name}
+- Industry: {industry}
+- Products/Services: {products}
+- Contact: {contact}"""
+
+REPLY_GUIDELINES = """- Be friendly and professional
+- Keep responses concise (under 160 characters when possible)
+- For pricing inquiries, mention that a sales representative will contact them
+- For appointments, offer to schedule a call or demo
+- For support issues, try to help or escalate to human agent
+- For lead qualification, gather contact details and requirements
+- Use emojis appropriately
+- Always end with a question to keep conversation flowing"""
+
+TEMPLATES = {
+    "response": f"""{COMPANY_PROFILE}
+
+Guidelines:
+{REPLY_GUIDELINES}
+
+Respond naturally to the user's message.""",
+
+    "structured": f"""{COMPANY_PROFILE}
+
+Classify the user's message into one intent:
+- greeting: Hello, hi, good morning, etc.
+- product_inquiry: Questions about products/services
+- pricing: Questions about cost, price, rates
+- support: Technical support, help requests
+- appointment: Booking meetings, demos, calls
+- complaint: Issues, problems, dissatisfaction
+- lead_qualification: Ready to purchase, interested in buying
+- goodbye: Bye, thanks, end conversation
+- other: Anything else
+
+Reply guidelines:
+- Reply in the user's language
+{REPLY_GUIDELINES}
+
+Record any name, email, company, requirement, budget or timeline the user states, and update
+the running summary of the conversation. Answer by calling bot_reply."""
+}
+
+ROLLING_SUMMARY = """Keep a running summary of a WhatsApp conversation between a user and a sales bot.
+Merge the new exchanges into the current summary. Keep the user's interests and requirements,
+details gathered, open questions and next steps. Drop small talk. Answer with the updated summary
+only, in at most four sentences."""
+
+RESPONSE_SUFFIX = """Current Intent: {intent}
+Conversation Context: {context}"""
+
+_prefixes = {}
+_lock = threading.Lock()
+
+
+def get_config_version(company_info):
+    """Hash of what a prompt depends on besides the message: company details, templates and settings"""
+    config = json.dumps([PROMPT_VERSION, get_settings_version(), company_info], sort_keys=True, default=str)
+    return hashlib.sha1(config.encode()).hexdigest()[:12]
+
+
+def get_static_prefix(kind, company_info):
+    """The template's static part filled with the company profile, compiled once per config version"""
+    key = (kind, get_config_version(company_info))
+    prefix = _prefixes.get(key)
+    
+    if prefix is None:
+        prefix = TEMPLATES[kind].format(**company_info)
+        
+        with _lock:
+            # Old versions are never asked for again
+            if len(_prefixes) >= MAX_PREFIXES:
+                _prefixes.clear()
+            _prefixes[key] = prefix
+    
+    return prefix
+
+
+def get_response_suffix(intent, context):
+    return RESPONSE_SUFFIX.format(intent=intent, context=context)
+
+
+def is_prefix_cacheable(prefix, tools=None):
+    """True when the tools and static prefix reach the minimum length Anthropic caches"""
+    return estimate_tokens(prefix) + estimate_tokens(json.dumps(tools) if tools else "") >= MIN_CACHEABLE_TOKENS
+
+
+def get_claude_system(prefix, suffix=None, tools=None):
+    """System blocks with the static prefix marked as a prompt cache breakpoint when it can be cached"""
+    blocks = [{"type": "text", "text": prefix}]
+    if is_prefix_cacheable(prefix, tools):
+        blocks[0]["cache_control"] = {"type": "ephemeral"}
+    if suffix:
+        blocks.append({"type": "text", "text": suffix})
+    
+    return blocks
+
+
+def get_openai_messages(prefix, suffix, user_content):
+    """Chat messages with the static prefix first; OpenAI caches repeated prefixes on its own"""
+    messages = [{"role": "system", "content": prefix}]
+    if suffix:
+        messages.append({"role": "system", "content": suffix})
+    messages.append({"role": "user", "content": user_content})
+    
+    return messages
\ No newline at end of file
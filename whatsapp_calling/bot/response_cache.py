@@ -0,0 +1,158 @@
+"""
+Cache of bot replies to repeated questions, keyed on the normalized message,
+language and the prompt config version from bot.prompts, so it is checked
+before any LLM call; entries carry the intent their reply was generated for.
+A per-process LRU with TTL sits in front of Redis, which every worker shares.
+"""
+
+import hashlib
+import json
+import re
+import threading
+import time
+from collections import OrderedDict
+import frappe
+from frappe.utils import cint, flt
+from whatsapp_calling.bot.intent_classifier import TOKEN_PATTERN
+
+
+CACHE_KEY = "whatsapp_calling:bot_response:"
+STATS_KEY = "whatsapp_calling:bot_response_stats"
+
+DEFAULT_TTL = 3600
+DEFAULT_EXCLUDED_INTENTS = ("complaint", "lead_qualification", "other")
+
+# Long messages practically never repeat
+MAX_MESSAGE_LENGTH = 200
+
+LOCAL_ENTRIES = 1000
+LOCAL_TTL = 300
+
+STATS_FIELDS = ("hits", "local_hits", "misses", "stores", "saved_tokens")
+
+
+class LRUCache:
+    """Thread-safe LRU of (value, expiry) pairs"""
+    
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+    
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if not entry:
+                return None
+            
+            if entry[1] < time.monotonic():
+                del self.entries[key]
+                return None
+            
+            self.entries.move_to_end(key)
+            return entry[0]
+    
+    def set(self, key, value, ttl):
+        with self.lock:
+            self.entries[key] = (value, time.monotonic() + ttl)
+            self.entries.move_to_end(key)
+            
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+    
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+
+_local = LRUCache(LOCAL_ENTRIES)
+
+
+def normalize_message(message):
+    """Lowercase words only, so punctuation, emoji and spacing do not split entries"""
+    return " ".join(TOKEN_PATTERN.findall((message or "").lower()))
+
+
+def get_excluded_intents(settings):
+    """Intents whose replies are never cached"""
+    if settings.get("response_cache_excluded_intents") is None:
+        return set(DEFAULT_EXCLUDED_INTENTS)
+    
+    return {intent for intent in re.split(r"[\s,]+", settings.response_cache_excluded_intents.lower()) if intent}
+
+
+def get_cache_key(message, language, version):
+    """Cache key for a message, or None when the message is too long or empty to be worth caching"""
+    normalized = normalize_message(message)
+    if not normalized or len(normalized) > MAX_MESSAGE_LENGTH:
+        return None
+    
+    digest = hashlib.sha1(normalized.encode()).hexdigest()
+    return f"{language or 'en'}:{version}:{digest}"
+
+
+def get_cached_entry(key):
+    """Cached {response, tokens, intent} entry for a key, from this process first and then Redis"""
+    entry = _local.get(key)
+    if entry:
+        record_cache_event(hits=1, local_hits=1, saved_tokens=entry["tokens"])
+        return entry
+    
+    try:
+        cache = frappe.cache()
+        value = cache.get(cache.make_key(CACHE_KEY + key))
+        entry = json.loads(value) if value else None
+        
+    except Exception as e:
+        frappe.logger().error(f"Error reading bot response cache: {str(e)}")
+        entry = None
+    
+    if not entry:
+        record_cache_event(misses=1)
+        return None
+    
+    _local.set(key, entry, LOCAL_TTL)
+    record_cache_event(hits=1, saved_tokens=entry["tokens"])
+    return entry
+
+
+def cache_response(key, response, tokens, intent, ttl=DEFAULT_TTL):
+    """Share a generated reply and its intent with every worker for ttl seconds"""
+    entry = {"response": response, "tokens": cint(tokens), "intent": intent}
+    _local.set(key, entry, min(ttl, LOCAL_TTL))
+    
+    try:
+        cache = frappe.cache()
+        cache.set(cache.make_key(CACHE_KEY + key), json.dumps(entry), ex=ttl)
+        record_cache_event(stores=1)
+        
+    except Exception as e:
+        frappe.logger().error(f"Error writing bot response cache: {str(e)}")
+
+
+def record_cache_event(**counts):
+    try:
+        cache = frappe.cache()
+        key = cache.make_key(STATS_KEY)
+        
+        pipe = cache.pipeline()
+        for field, count in counts.items():
+            if count:
+                pipe.hincrby(key, field, cint(count))
+        pipe.execute()
+        
+    except Exception as e:
+        frappe.logger().error(f"Error recording bot response cache stats: {str(e)}")
+
+
+@frappe.whitelist()
+def get_response_cache_stats():
+    """Report cache hits, misses, hit rate and the LLM tokens the hits saved"""
+    frappe.only_for("System Manager")
+    
+    cache = frappe.cache()
+    stats = dict(zip(STATS_FIELDS, [cint(count) for count in cache.hmget(cache.make_key(STATS_KEY), list(STATS_FIELDS))]))
+    
+    lookups = stats["hits"] + stats["misses"]
+    stats["hit_rate"] = flt(stats["hits"] / lookups, 4) if lookups else None
+    return stats
\ No newline at end of file
@@ -5,11 +5,12 @@ from datetime import datetime, timedelta
 import uuid
 import jwt
 from frappe.utils import now_datetime, cstr
+from whatsapp_calling.utils.settings_cache import get_whatsapp_settings, get_mediasoup_settings
 
 
 class WebRTCManager:
     def __init__(self):
-        self.mediasoup_settings = frappe.get_single("MediaSoup WebRTC Settings")
+        self.mediasoup_settings = get_mediasoup_settings()
         if not self.mediasoup_settings or not self.mediasoup_settings.is_enabled:
             frappe.throw("MediaSoup WebRTC Settings not configured or disabled")
     
@@ -186,12 +187,12 @@ class WebRTCManager:
     
     def should_enable_recording(self):
         """Check if recording should be enabled based on tier"""
-        account = frappe.get_single("WhatsApp Business Account")
+        account = get_whatsapp_settings()
         return account and account.tier in ["Professional", "Enterprise"]
     
     def should_enable_transcription(self):
         """Check if transcription should be enabled"""
-        account = frappe.get_single("WhatsApp Business Account")
+        account = get_whatsapp_settings()
         return account and account.tier in ["Professional", "Enterprise"]
     
     def handle_call_event(self, event_data):
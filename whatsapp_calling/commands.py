@@ -0,0 +1,56 @@
+import click
+import frappe
+from frappe.commands import get_site, pass_context
+
+
+@click.command("whatsapp-outbound-worker")
+@click.option("--concurrency", default=200, type=int, help="Maximum number of sends in flight")
+@click.option("--name", help="Worker name; unfinished messages of a worker with this name are resumed")
+@pass_context
+def outbound_worker(context, concurrency=200, name=None):
+    """Send queued outbound WhatsApp messages until stopped"""
+    from whatsapp_calling.whatsapp_integration.outbound_worker import start_outbound_worker
+    
+    site = get_site(context)
+    frappe.init(site=site)
+    frappe.connect()
+    
+    try:
+        start_outbound_worker(concurrency, name)
+    finally:
+        frappe.destroy()
+
+
+@click.command("whatsapp-evaluate-intents")
+@click.option("--threshold", "thresholds", multiple=True, type=float, help="Confidence threshold to report; repeatable")
+@click.option("--holdout", default=0.2, type=float, help="Share of logged intents held out for testing")
+@click.option("--llm-latency-ms", type=float, help="LLM classification latency; defaults to the measured two-call p50")
+@pass_context
+def evaluate_intents(context, thresholds=(), holdout=0.2, llm_latency_ms=None):
+    """Report local intent accuracy, latency and share of messages settled without the LLM"""
+    from whatsapp_calling.bot.intent_classifier import evaluate, get_training_pairs
+    from whatsapp_calling.bot.llm_metrics import get_median_latency
+    from whatsapp_calling.utils.settings_cache import get_whatsapp_settings
+    
+    site = get_site(context)
+    frappe.init(site=site)
+    frappe.connect()
+    
+    try:
+        pairs = get_training_pairs()
+        latency = llm_latency_ms or get_median_latency(get_whatsapp_settings().ai_provider or "claude", "two_call")
+        report = evaluate(pairs, thresholds or (0.7, 0.8, 0.85, 0.9, 0.95), holdout, latency)
+        
+        click.echo(f"Trained on {report['train']} logged intents, tested on {report['test']}")
+        click.echo(f"{'threshold':>10}{'local share':>13}{'local acc':>11}{'overall acc':>13}{'local us':>10}{'expected ms':>13}")
+        for row in report["rows"]:
+            click.echo(
+                f"{row['threshold']:>10}{row['local_share']:>13}{str(row['local_accuracy']):>11}"
+                f"{row['overall_accuracy']:>13}{row['local_latency_us']:>10}{str(row['expected_latency_ms']):>13}"
+            )
+        
+    finally:
+        frappe.destroy()
+
+
+commands = [outbound_worker, evaluate_intents]
\ No newline at end of file
@@ -40,16 +40,38 @@ doctype_js = {
 doc_events = {
     "Lead": {
         "validate": "whatsapp_calling.whatsapp_integration.api_client.create_lead_from_whatsapp",
-        "after_insert": "whatsapp_calling.analytics.metrics_collector.track_lead_creation"
+        "after_insert": "whatsapp_calling.analytics.metrics_collector.track_lead_creation",
+        "before_save": "whatsapp_calling.utils.phone.set_phone_e164",
+        "on_update": "whatsapp_calling.whatsapp_integration.crm_resolver.update_phone_index",
+        "on_trash": "whatsapp_calling.whatsapp_integration.crm_resolver.remove_from_phone_index"
     },
     "Contact": {
         "validate": "whatsapp_calling.whatsapp_integration.api_client.sync_contact_phone",
-        "on_update": "whatsapp_calling.analytics.metrics_collector.track_contact_update"
+        "before_save": "whatsapp_calling.utils.phone.set_phone_e164",
+        "on_update": [
+            "whatsapp_calling.analytics.metrics_collector.track_contact_update",
+            "whatsapp_calling.whatsapp_integration.crm_resolver.update_phone_index"
+        ],
+        "on_trash": "whatsapp_calling.whatsapp_integration.crm_resolver.remove_from_phone_index"
+    },
+    "Customer": {
+        "before_save": "whatsapp_calling.utils.phone.set_phone_e164",
+        "on_update": "whatsapp_calling.whatsapp_integration.crm_resolver.update_phone_index",
+        "on_trash": "whatsapp_calling.whatsapp_integration.crm_resolver.remove_from_phone_index"
     }
 }
 
 # Scheduled Tasks
 scheduler_events = {
+    "all": [
+        "whatsapp_calling.whatsapp_integration.inbound_queue.recover_inbound_queue",
+        "whatsapp_calling.whatsapp_integration.status_pipeline.recover_status_buffer",
+        "whatsapp_calling.whatsapp_integration.realtime.recover_realtime_buffer",
+        "whatsapp_calling.whatsapp_integration.partition_dispatcher.recover_partitions",
+        "whatsapp_calling.whatsapp_integration.burst_buffer.recover_bursts",
+        "whatsapp_calling.whatsapp_integration.broadcast.resume_broadcasts",
+        "whatsapp_calling.whatsapp_integration.outbound_queue.recover_outbound_queue"
+    ],
     "cron": {
         "*/5 * * * *": [
             "whatsapp_calling.calling.webrtc_manager.check_call_quality",
@@ -57,7 +79,9 @@ scheduler_events = {
         ]
     },
     "daily": [
-        "whatsapp_calling.analytics.report_generator.generate_daily_report"
+        "whatsapp_calling.analytics.report_generator.generate_daily_report",
+        "whatsapp_calling.whatsapp_integration.inbound_queue.purge_processed_events",
+        "whatsapp_calling.bot.intent_classifier.train_intent_model"
     ]
 }
 
@@ -0,0 +1,25 @@
+import frappe
+
+
+# Doctypes whose controllers declare composite indexes in on_doctype_update
+INDEXED_DOCTYPES = {
+    "whatsapp_message": "whatsapp_calling.whatsapp_calling.doctype.whatsapp_message.whatsapp_message",
+    "bot_conversation_state": "whatsapp_calling.whatsapp_calling.doctype.bot_conversation_state.bot_conversation_state",
+    "whatsapp_webhook_event": "whatsapp_calling.whatsapp_calling.doctype.whatsapp_webhook_event.whatsapp_webhook_event",
+    "whatsapp_call_log": None
+}
+
+
+def execute():
+    """Add the single-column and composite indexes used by the webhook, bot and calling hot paths"""
+    
+    for doctype, controller in INDEXED_DOCTYPES.items():
+        # Syncs search_index flags from the doctype JSON
+        frappe.reload_doc("whatsapp_calling", "doctype", doctype)
+        
+        if controller:
+            frappe.get_attr(f"{controller}.on_doctype_update")()
+    
+    frappe.db.commit()
+    
+    print("WhatsApp hot path indexes created")
\ No newline at end of file
@@ -0,0 +1,12 @@
+import frappe
+
+
+def execute():
+    """Add the (whatsapp_phone_e164, modified) index used by delta history polling"""
+    
+    from whatsapp_calling.whatsapp_calling.doctype.whatsapp_message.whatsapp_message import on_doctype_update
+    on_doctype_update()
+    
+    frappe.db.commit()
+    
+    print("WhatsApp message history indexes created")
\ No newline at end of file
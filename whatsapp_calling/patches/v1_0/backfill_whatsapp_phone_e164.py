@@ -0,0 +1,139 @@
+import frappe
+from frappe.custom.doctype.custom_field.custom_field import create_custom_fields
+from whatsapp_calling.utils.phone import E164_FIELD, normalize_phones
+
+
+BACKFILL_CHUNK_SIZE = 5000
+
+# Doctype -> number fields in order of preference; the first valid one is stored
+BACKFILL_SOURCES = {
+    "Lead": ["whatsapp_phone", "mobile_no"],
+    "Contact": ["whatsapp_phone", "mobile_no"],
+    "Customer": ["whatsapp_phone", "mobile_no"]
+}
+
+
+def execute():
+    """Add an indexed E.164 phone column to CRM and WhatsApp doctypes and backfill it"""
+    
+    e164_field = {
+        "fieldname": E164_FIELD,
+        "label": "WhatsApp Phone (E.164)",
+        "fieldtype": "Data",
+        "insert_after": "whatsapp_phone",
+        "read_only": 1,
+        "search_index": 1
+    }
+    
+    create_custom_fields({
+        "Lead": [e164_field],
+        "Contact": [e164_field],
+        "Customer": [e164_field]
+    }, update=True)
+    
+    frappe.reload_doc("whatsapp_calling", "doctype", "whatsapp_message")
+    frappe.reload_doc("whatsapp_calling", "doctype", "bot_conversation_state")
+    
+    for doctype, fields in BACKFILL_SOURCES.items():
+        backfill(doctype, fields)
+    
+    # Bot conversations are keyed by the number Meta sent
+    backfill("Bot Conversation State", ["phone_number"], international=True)
+    backfill_messages()
+    
+    print("WhatsApp E.164 phone column backfilled")
+
+
+def backfill(doctype, fields, international=False):
+    """Fill the E.164 column chunk by chunk, paging on name"""
+    last_name = ""
+    
+    while True:
+        records = frappe.get_all(
+            doctype,
+            filters={"name": [">", last_name]},
+            fields=["name", *fields],
+            order_by="name asc",
+            limit=BACKFILL_CHUNK_SIZE
+        )
+        if not records:
+            break
+        
+        raw_numbers = [record.get(fieldname) for record in records for fieldname in fields]
+        normalized = normalize_phones(raw_numbers, international=international)
+        
+        values = {}
+        for record in records:
+            for fieldname in fields:
+                value = normalized.get(record.get(fieldname))
+                if value:
+                    values[record.name] = value
+                    break
+        
+        update_chunk(doctype, values)
+        frappe.db.commit()
+        
+        last_name = records[-1].name
+
+
+def backfill_messages():
+    """Store the counterpart number of every message; both directions hold numbers exchanged with Meta"""
+    last_name = ""
+    
+    while True:
+        records = frappe.get_all(
+            "WhatsApp Message",
+            filters={"name": [">", last_name]},
+            fields=["name", "direction", "from_number", "to_number"],
+            order_by="name asc",
+            limit=BACKFILL_CHUNK_SIZE
+        )
+        if not records:
+            break
+        
+        received = normalize_phones(
+            [record.from_number for record in records if record.direction == "received"],
+            international=True
+        )
+        sent = normalize_phones(
+            [record.to_number for record in records if record.direction != "received"],
+            international=True
+        )
+        
+        values = {}
+        for record in records:
+            if record.direction == "received":
+                value = received.get(record.from_number)
+            else:
+                value = sent.get(record.to_number)
+            
+            if value:
+                values[record.name] = value
+        
+        update_chunk("WhatsApp Message", values)
+        frappe.db.commit()
+        
+        last_name = records[-1].name
+
+
+def update_chunk(doctype, values):
+    """Write one chunk of name -> E.164 values with a single UPDATE"""
+    if not values:
+        return
+    
+    names = list(values)
+    cases = " ".join(["when %s then %s"] * len(names))
+    placeholders = ", ".join(["%s"] * len(names))
+    
+    params = []
+    for name in names:
+        params.extend([name, values[name]])
+    
+    frappe.db.sql(
+        f"""
+        update `tab{doctype}`
+        set `{E164_FIELD}` = case name {cases} end
+        where name in ({placeholders})
+        """,
+        params + names
+    )
\ No newline at end of file
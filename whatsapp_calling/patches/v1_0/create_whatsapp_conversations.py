@@ -0,0 +1,84 @@
+import frappe
+from whatsapp_calling.whatsapp_integration.conversations import assign_conversations
+
+
+BACKFILL_CHUNK_SIZE = 5000
+
+MESSAGE_FIELDS = [
+    "name", "message_id", "whatsapp_phone_e164", "from_number", "to_number", "direction",
+    "message_type", "message_body", "status", "timestamp", "lead", "contact", "customer"
+]
+
+
+def execute():
+    """Create the WhatsApp Conversation read model and build it from message history"""
+    
+    frappe.reload_doc("whatsapp_calling", "doctype", "whatsapp_conversation")
+    frappe.reload_doc("whatsapp_calling", "doctype", "whatsapp_message")
+    
+    from whatsapp_calling.whatsapp_calling.doctype.whatsapp_conversation.whatsapp_conversation import (
+        on_doctype_update
+    )
+    on_doctype_update()
+    frappe.db.add_index("WhatsApp Message", ["whatsapp_conversation", "timestamp"])
+    
+    backfill_conversations()
+    
+    print("WhatsApp conversations built from message history")
+
+
+def backfill_conversations():
+    """Replay messages in timestamp order, paging on (timestamp, name), so sessions split as they would live"""
+    last_timestamp, last_name = None, ""
+    
+    while True:
+        conditions = "whatsapp_phone_e164 is not null and timestamp is not null"
+        if last_timestamp:
+            conditions += " and (timestamp > %(timestamp)s or (timestamp = %(timestamp)s and name > %(name)s))"
+        
+        messages = frappe.db.sql(
+            f"""
+            select {", ".join(MESSAGE_FIELDS)}
+            from `tabWhatsApp Message`
+            where {conditions}
+            order by timestamp asc, name asc
+            limit {BACKFILL_CHUNK_SIZE}
+            """,
+            {"timestamp": last_timestamp, "name": last_name},
+            as_dict=True
+        )
+        if not messages:
+            break
+        
+        conversations = assign_conversations(messages)
+        update_chunk({
+            message.name: conversations[message.message_id]
+            for message in messages
+            if message.message_id in conversations
+        })
+        frappe.db.commit()
+        
+        last_timestamp, last_name = messages[-1].timestamp, messages[-1].name
+
+
+def update_chunk(values):
+    """Write one chunk of message name -> conversation with a single UPDATE"""
+    if not values:
+        return
+    
+    names = list(values)
+    cases = " ".join(["when %s then %s"] * len(names))
+    placeholders = ", ".join(["%s"] * len(names))
+    
+    params = []
+    for name in names:
+        params.extend([name, values[name]])
+    
+    frappe.db.sql(
+        f"""
+        update `tabWhatsApp Message`
+        set whatsapp_conversation = case name {cases} end
+        where name in ({placeholders})
+        """,
+        params + names
+    )
\ No newline at end of file
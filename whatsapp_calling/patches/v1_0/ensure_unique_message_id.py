@@ -0,0 +1,38 @@
+import frappe
+
+
+def execute():
+    """Make sure WhatsApp Message.message_id carries a unique index as the final dedup guard"""
+    
+    frappe.reload_doc("whatsapp_calling", "doctype", "whatsapp_message")
+    
+    if frappe.db.get_column_index("tabWhatsApp Message", "message_id", unique=True):
+        return
+    
+    # Keep the oldest row for any message id stored more than once before the constraint
+    duplicates = frappe.db.sql("""
+        select message_id
+        from `tabWhatsApp Message`
+        where ifnull(message_id, '') != ''
+        group by message_id
+        having count(*) > 1
+    """, pluck=True)
+    
+    for message_id in duplicates:
+        # Rows can share their creation time, so the name breaks the tie
+        keep = frappe.get_all(
+            "WhatsApp Message",
+            filters={"message_id": message_id},
+            order_by="creation asc, name asc",
+            limit=1,
+            pluck="name"
+        )[0]
+        frappe.db.sql("""
+            delete from `tabWhatsApp Message`
+            where message_id = %s and name != %s
+        """, (message_id, keep))
+    
+    frappe.db.add_unique("WhatsApp Message", ["message_id"], constraint_name="unique_message_id")
+    frappe.db.commit()
+    
+    print("WhatsApp Message message_id unique index created")
\ No newline at end of file
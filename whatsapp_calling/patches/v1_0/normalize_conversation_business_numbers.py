@@ -0,0 +1,41 @@
+import frappe
+from whatsapp_calling.utils.phone import normalize_phones
+from whatsapp_calling.whatsapp_integration.conversations import CONVERSATION_DOCTYPE, get_open_key
+
+
+def execute():
+    """Key conversations on the E.164 business number, and keep one open session per customer and number"""
+    
+    frappe.reload_doc("whatsapp_calling", "doctype", "whatsapp_conversation")
+    
+    business_numbers = frappe.get_all(CONVERSATION_DOCTYPE, distinct=True, pluck="business_number")
+    normalized = normalize_phones([number for number in business_numbers if number], international=True)
+    
+    for number, e164 in normalized.items():
+        if e164 and e164 != number:
+            frappe.db.sql(
+                f"update `tab{CONVERSATION_DOCTYPE}` set business_number = %s where business_number = %s",
+                (e164, number)
+            )
+    
+    # Display and setting spellings of one number opened a session each; the newest stays open
+    open_conversations = frappe.get_all(
+        CONVERSATION_DOCTYPE,
+        filters={"status": "Open"},
+        fields=["name", "whatsapp_phone_e164", "business_number"],
+        order_by="last_message_at desc, name desc"
+    )
+    
+    seen = set()
+    for conversation in open_conversations:
+        key = get_open_key(conversation.whatsapp_phone_e164, conversation.business_number)
+        
+        if key in seen:
+            frappe.db.set_value(CONVERSATION_DOCTYPE, conversation.name, {"status": "Closed", "open_key": None})
+        else:
+            frappe.db.set_value(CONVERSATION_DOCTYPE, conversation.name, "open_key", key)
+            seen.add(key)
+    
+    frappe.db.commit()
+    
+    print("WhatsApp conversation business numbers normalized")
\ No newline at end of file
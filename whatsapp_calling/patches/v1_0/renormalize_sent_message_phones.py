@@ -0,0 +1,9 @@
+from whatsapp_calling.patches.v1_0.backfill_whatsapp_phone_e164 import backfill_messages
+
+
+def execute():
+    """Re-key sent messages on the international number they were sent to, so replies join their thread"""
+    
+    backfill_messages()
+    
+    print("WhatsApp sent message numbers renormalized")
\ No newline at end of file
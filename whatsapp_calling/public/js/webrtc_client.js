@@ -13,6 +13,9 @@ class WhatsAppWebRTCClient {
         this.isAuthenticated = false;
         
         this.initMediaSoup();
+        
+        // Call state changes recorded by the server arrive in batched realtime events
+        frappe.realtime.on('whatsapp_realtime_batch', (batch) => this.applyRealtimeBatch(batch));
     }
     
     bindEvents() {
@@ -487,6 +490,9 @@ class WhatsAppWebRTCClient {
         const statusElement = $('.call-status');
         
         switch (status) {
+            case 'ringing':
+                statusElement.text('Ringing...');
+                break;
             case 'connecting':
                 statusElement.text('Connecting...');
                 break;
@@ -553,6 +559,32 @@ class WhatsAppWebRTCClient {
         }
     }
     
+    applyRealtimeBatch(batch) {
+        if (!batch || !batch.calls || !this.currentCall) return;
+        
+        const call = batch.calls[this.currentCall.session_id];
+        if (!call) return;
+        
+        switch (call.status) {
+            case 'Ringing':
+                this.updateCallStatus('ringing');
+                break;
+            case 'Connected':
+                this.handleCallAnswered(call);
+                break;
+            case 'Ended':
+                this.handleCallEnded(call);
+                break;
+            case 'Failed':
+                this.updateCallStatus('failed');
+                break;
+        }
+        
+        if (call.quality) {
+            this.handleQualityUpdate({ quality_score: call.quality });
+        }
+    }
+    
     handleIncomingCall(data) {
         // Handle incoming call (for future enhancement)
         console.log('Incoming call:', data);
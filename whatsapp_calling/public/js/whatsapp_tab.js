@@ -81,60 +81,153 @@ function load_whatsapp_history(frm) {
             docname: frm.docname
         },
         callback: function(r) {
-            if (r.message && r.message.length > 0) {
-                add_whatsapp_timeline_entries(frm, r.message);
+            if (r.message && r.message.messages && r.message.messages.length > 0) {
+                add_whatsapp_timeline_entries(frm, r.message.messages);
             }
         }
     });
 }
 
+// Cursor state of the open conversation dialog: next_cursor pages back, since polls for changes
+let conversationHistory = {};
+
 function load_conversation_in_dialog(frm, dialog) {
+    conversationHistory = { frm: frm };
+    
     frappe.call({
         method: 'whatsapp_calling.whatsapp_integration.api_client.get_conversation_history',
         args: {
             phone_number: frm.doc.mobile_no,
+            doctype: frm.doctype,
+            docname: frm.docname,
             limit: 50
         },
         callback: function(r) {
             if (r.message) {
-                render_conversation(r.message, '#whatsapp-conversation');
+                Object.assign(conversationHistory, r.message);
+                render_conversation(r.message.messages, '#whatsapp-conversation');
             }
         }
     });
 }
 
+function load_earlier_messages() {
+    const frm = conversationHistory.frm;
+    if (!frm || !conversationHistory.next_cursor) return;
+    
+    frappe.call({
+        method: 'whatsapp_calling.whatsapp_integration.api_client.get_conversation_history',
+        args: {
+            phone_number: frm.doc.mobile_no,
+            doctype: frm.doctype,
+            docname: frm.docname,
+            cursor: conversationHistory.next_cursor,
+            limit: 50
+        },
+        callback: function(r) {
+            if (!r.message) return;
+            
+            const conversationDiv = $('#whatsapp-conversation');
+            const previousHeight = conversationDiv[0].scrollHeight;
+            
+            conversationDiv.find('.load-earlier').remove();
+            conversationDiv.prepend(r.message.messages.map(render_message).join(''));
+            conversationHistory.next_cursor = r.message.next_cursor;
+            add_load_earlier_link(conversationDiv);
+            
+            // Keep the message the user was looking at in place
+            conversationDiv.scrollTop(conversationDiv[0].scrollHeight - previousHeight);
+        }
+    });
+}
+
+function poll_conversation_changes() {
+    const frm = conversationHistory.frm;
+    if (!frm || !conversationHistory.since) return;
+    
+    frappe.call({
+        method: 'whatsapp_calling.whatsapp_integration.api_client.get_conversation_history',
+        args: {
+            phone_number: frm.doc.mobile_no,
+            doctype: frm.doctype,
+            docname: frm.docname,
+            since: conversationHistory.since,
+            etag: conversationHistory.etag
+        },
+        callback: function(r) {
+            if (!r.message || r.message.not_modified) return;
+            
+            conversationHistory.since = r.message.since;
+            conversationHistory.etag = r.message.etag;
+            apply_conversation_changes(r.message.messages);
+        }
+    });
+}
+
+function apply_conversation_changes(messages) {
+    const conversationDiv = $('#whatsapp-conversation');
+    
+    messages.forEach(message => {
+        const existing = conversationDiv.find(`[data-message-id="${message.message_id}"]`);
+        if (existing.length) {
+            existing.find('.message-status').html(get_status_icon(message.status));
+        } else {
+            conversationDiv.append(render_message(message));
+        }
+    });
+    
+    if (messages.length) {
+        conversationDiv.scrollTop(conversationDiv[0].scrollHeight);
+    }
+}
+
 function render_conversation(messages, container) {
     const conversationDiv = $(container);
     conversationDiv.empty();
     
     messages.forEach(message => {
-        const messageClass = message.direction === 'sent' ? 'sent' : 'received';
-        const messageHtml = `
-            <div class="message ${messageClass}" style="margin-bottom: 10px;">
-                <div class="message-content" style="
-                    background: ${message.direction === 'sent' ? '#dcf8c6' : '#ffffff'};
-                    padding: 8px 12px;
-                    border-radius: 8px;
-                    max-width: 70%;
-                    margin-left: ${message.direction === 'sent' ? 'auto' : '0'};
-                    margin-right: ${message.direction === 'sent' ? '0' : 'auto'};
-                    border: 1px solid #e1e1e1;
-                ">
-                    <div class="message-text">${message.message_body}</div>
-                    <div class="message-time" style="font-size: 11px; color: #999; margin-top: 4px;">
-                        ${moment(message.timestamp).format('MMM DD, HH:mm')}
-                        ${message.direction === 'sent' ? '<span class="message-status">' + get_status_icon(message.status) + '</span>' : ''}
-                    </div>
-                </div>
-            </div>
-        `;
-        conversationDiv.append(messageHtml);
+        conversationDiv.append(render_message(message));
     });
+    add_load_earlier_link(conversationDiv);
     
     // Scroll to bottom
     conversationDiv.scrollTop(conversationDiv[0].scrollHeight);
 }
 
+function add_load_earlier_link(conversationDiv) {
+    if (!conversationHistory.next_cursor) return;
+    
+    $(`<div class="load-earlier text-center" style="margin-bottom: 10px;">
+        <a href="#">${__('Load earlier messages')}</a>
+    </div>`).prependTo(conversationDiv).find('a').on('click', function(e) {
+        e.preventDefault();
+        load_earlier_messages();
+    });
+}
+
+function render_message(message) {
+    const messageClass = message.direction === 'sent' ? 'sent' : 'received';
+    return `
+        <div class="message ${messageClass}" data-message-id="${message.message_id}" style="margin-bottom: 10px;">
+            <div class="message-content" style="
+                background: ${message.direction === 'sent' ? '#dcf8c6' : '#ffffff'};
+                padding: 8px 12px;
+                border-radius: 8px;
+                max-width: 70%;
+                margin-left: ${message.direction === 'sent' ? 'auto' : '0'};
+                margin-right: ${message.direction === 'sent' ? '0' : 'auto'};
+                border: 1px solid #e1e1e1;
+            ">
+                <div class="message-text">${message.message_body}</div>
+                <div class="message-time" style="font-size: 11px; color: #999; margin-top: 4px;">
+                    ${moment(message.timestamp).format('MMM DD, HH:mm')}
+                    ${message.direction === 'sent' ? '<span class="message-status">' + get_status_icon(message.status) + '</span>' : ''}
+                </div>
+            </div>
+        </div>
+    `;
+}
+
 function get_status_icon(status) {
     switch (status) {
         case 'sent':
@@ -173,7 +266,7 @@ function send_whatsapp_message(frm, dialog) {
                 });
                 
                 dialog.set_value('message', '');
-                load_conversation_in_dialog(frm, dialog);
+                poll_conversation_changes();
                 
                 // Add timeline entry
                 frm.timeline.insert_comment('Communication', __('WhatsApp message sent: {0}', [message]));
@@ -222,18 +315,13 @@ function add_whatsapp_timeline_entries(frm, messages) {
     });
 }
 
-// Auto-refresh conversation every 30 seconds if dialog is open
+// Poll for changes every 30 seconds while the dialog is open; realtime batches cover the gaps between
 let conversationRefreshInterval;
 
 $(document).on('show.bs.modal', function() {
     const dialog = $('.modal:visible').last();
     if (dialog.find('#whatsapp-conversation').length > 0) {
-        conversationRefreshInterval = setInterval(() => {
-            const frm = cur_frm;
-            if (frm && frm.doc.mobile_no) {
-                load_conversation_in_dialog(frm, { get_value: () => {} });
-            }
-        }, 30000);
+        conversationRefreshInterval = setInterval(poll_conversation_changes, 30000);
     }
 });
 
@@ -242,40 +330,45 @@ $(document).on('hide.bs.modal', function() {
         clearInterval(conversationRefreshInterval);
         conversationRefreshInterval = null;
     }
+    conversationHistory = {};
 });
 
-// Real-time message updates via Socket.IO
-if (typeof io !== 'undefined') {
-    const socket = io('/whatsapp-messages');
+// Batched realtime updates: new messages and the highest status per message, once per window
+frappe.realtime.on('whatsapp_realtime_batch', function(batch) {
+    if (!batch) return;
     
-    socket.on('new_message', function(data) {
-        if (cur_frm && cur_frm.doc.mobile_no === data.phone_number) {
-            // Refresh conversation if dialog is open
-            if ($('#whatsapp-conversation:visible').length > 0) {
-                load_conversation_in_dialog(cur_frm, { get_value: () => {} });
-            }
-            
-            // Add timeline entry
-            const direction = data.direction === 'sent' ? 'Outgoing' : 'Incoming';
-            const content = `${direction} WhatsApp message: ${data.message_body}`;
-            cur_frm.timeline.insert_comment('Communication', content);
-            
-            // Show notification for incoming messages
-            if (data.direction === 'received') {
-                frappe.show_alert({
-                    message: __('New WhatsApp message from {0}', [data.phone_number]),
-                    indicator: 'blue'
-                });
-            }
+    const conversationDiv = $('#whatsapp-conversation:visible');
+    const phone = cur_frm && cur_frm.doc.whatsapp_phone_e164;
+    
+    (batch.messages || []).forEach(message => {
+        if (!phone || message.whatsapp_phone_e164 !== phone) return;
+        
+        // Apply each message once; a later event for the same message only refreshes its status
+        const existing = conversationDiv.find(`[data-message-id="${message.message_id}"]`);
+        if (existing.length) return;
+        
+        if (conversationDiv.length) {
+            conversationDiv.append(render_message(message));
+        }
+        
+        // Add timeline entry
+        const direction = message.direction === 'sent' ? 'Outgoing' : 'Incoming';
+        cur_frm.timeline.insert_comment('Communication', `${direction} WhatsApp message: ${message.message_body}`);
+        
+        if (message.direction === 'received') {
+            frappe.show_alert({
+                message: __('New WhatsApp message from {0}', [cur_frm.doc.mobile_no]),
+                indicator: 'blue'
+            });
         }
     });
     
-    socket.on('message_status_update', function(data) {
-        if (cur_frm && cur_frm.doc.mobile_no === data.phone_number) {
-            // Update message status in conversation if dialog is open
-            if ($('#whatsapp-conversation:visible').length > 0) {
-                load_conversation_in_dialog(cur_frm, { get_value: () => {} });
-            }
-        }
+    Object.keys(batch.statuses || {}).forEach(message_id => {
+        const status_el = $(`#whatsapp-conversation [data-message-id="${message_id}"] .message-status`);
+        status_el.html(get_status_icon(batch.statuses[message_id]));
     });
-}
\ No newline at end of file
+    
+    if (conversationDiv.length && (batch.messages || []).length) {
+        conversationDiv.scrollTop(conversationDiv[0].scrollHeight);
+    }
+});
\ No newline at end of file
@@ -0,0 +1,77 @@
+"""
+Local HTTP stand-ins for Graph API endpoints, shared by the client tests: a
+server on a background thread, a JSON reply helper and a messages endpoint
+with per-number throttling and rejections
+"""
+
+import json
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+ACCESS_TOKEN = "test-access-token"
+
+
+class StandInServer(ThreadingHTTPServer):
+    """Threaded server on a free local port, serving from a daemon thread"""
+    
+    daemon_threads = True
+    # Room for every concurrent send; a connection refused under load is not retried
+    request_queue_size = 128
+    
+    def __init__(self, handler):
+        super().__init__(("127.0.0.1", 0), handler)
+        self.base_url = f"http://127.0.0.1:{self.server_port}"
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+    
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+
+class JSONHandler(BaseHTTPRequestHandler):
+    def reply(self, status, body, headers=None):
+        content = json.dumps(body).encode()
+        self.send_response(status)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+    
+    def log_message(self, *args):
+        pass
+
+
+class MessagesStandIn(JSONHandler):
+    """Accepts messages after an optional delay; throttled numbers get one 429 first, invalid ones a 400"""
+    
+    requests = Counter()
+    throttled = set()
+    invalid = set()
+    delay = 0
+    
+    @classmethod
+    def reset(cls):
+        cls.requests.clear()
+        cls.throttled.clear()
+        cls.invalid.clear()
+        cls.delay = 0
+    
+    def do_POST(self):
+        payload = json.loads(self.rfile.read(int(self.headers.get("Content-Length") or 0)))
+        to = payload["to"]
+        MessagesStandIn.requests[to] += 1
+        time.sleep(MessagesStandIn.delay)
+        
+        if to in MessagesStandIn.throttled:
+            MessagesStandIn.throttled.discard(to)
+            return self.reply(429, {"error": {"code": 130429, "message": "Rate limit hit"}}, {"Retry-After": "0"})
+        
+        if to in MessagesStandIn.invalid:
+            return self.reply(400, {"error": {"code": 131026, "message": "Message undeliverable"}})
+        
+        self.reply(200, {"messages": [{"id": f"wamid.{to}"}]})
\ No newline at end of file
@@ -0,0 +1 @@
+# Webhook throughput benchmarks
\ No newline at end of file
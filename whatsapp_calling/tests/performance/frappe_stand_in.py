@@ -0,0 +1,707 @@
+"""
+In-memory stand-in for the parts of the frappe API the webhook handlers use,
+so the benchmarks run without a site, MariaDB or Redis. Only the benchmark
+harness installs it; it never replaces a real frappe that is already imported.
+
+Reads and writes through frappe.get_all, frappe.db.get_value, bulk_insert and
+Document.insert are executed against dict tables. Raw frappe.db.sql is recorded
+and counted but not executed.
+"""
+
+import datetime
+import queue
+import secrets
+import sys
+import types
+from collections import Counter
+
+
+DEFAULT_SETTINGS = {
+    "account_name": "Benchmark Account",
+    "phone_number": "15550001234",
+    "phone_number_id": "100000000000001",
+    "business_account_id": "200000000000001",
+    "access_token": "bench-access-token",
+    "webhook_verify_token": "bench-verify-token",
+    "is_active": 1,
+    "default_country_code": "1",
+    "default_lead_owner": "Administrator",
+    "enable_bot": 0,
+    "queue_inbound_webhooks": 0,
+    "inbound_queue_consumers": 2
+}
+
+# Unique columns enforced by bulk_insert(ignore_duplicates=True)
+UNIQUE_FIELDS = {
+    "WhatsApp Message": ["message_id"]
+}
+
+
+class _dict(dict):
+    """Attribute access dict, like frappe._dict"""
+    __getattr__ = dict.get
+    
+    def __setattr__(self, key, value):
+        self[key] = value
+
+
+class AuthenticationError(Exception):
+    pass
+
+
+class ValidationError(Exception):
+    pass
+
+
+class Logger:
+    def __init__(self):
+        self.counts = Counter()
+    
+    def _log(self, level, message):
+        self.counts[level] += 1
+    
+    def debug(self, message):
+        self._log("debug", message)
+    
+    def info(self, message):
+        self._log("info", message)
+    
+    def warning(self, message):
+        self._log("warning", message)
+    
+    def error(self, message):
+        self._log("error", message)
+
+
+class CallbackManager:
+    """frappe.db.after_commit / after_rollback: callbacks run once, then cleared"""
+    
+    def __init__(self):
+        self.callbacks = []
+    
+    def add(self, callback):
+        self.callbacks.append(callback)
+    
+    def run(self):
+        callbacks, self.callbacks = self.callbacks, []
+        for callback in callbacks:
+            callback()
+    
+    def reset(self):
+        self.callbacks = []
+
+
+class Pipeline:
+    """Queues cache calls and runs them on execute(), like a redis pipeline"""
+    
+    def __init__(self, cache):
+        self.cache = cache
+        self.calls = []
+    
+    def __getattr__(self, name):
+        def queue_call(*args, **kwargs):
+            self.calls.append((name, args, kwargs))
+            return self
+        return queue_call
+    
+    def execute(self):
+        self.cache.stats["round_trips"] += 1
+        calls, self.calls = self.calls, []
+        return [getattr(self.cache, name)(*args, _batched=True, **kwargs) for name, args, kwargs in calls]
+
+
+class Lock:
+    """Single-process redis lock: always free, since the benchmark runs one request at a time"""
+    
+    def __init__(self, cache, name):
+        self.cache = cache
+        self.name = name
+    
+    def acquire(self):
+        self.cache.stats["round_trips"] += 1
+        return True
+    
+    def release(self):
+        self.cache.stats["round_trips"] += 1
+
+
+class PubSub:
+    def __init__(self, cache):
+        self.cache = cache
+        self.messages = queue.Queue()
+    
+    def subscribe(self, *channels):
+        for channel in channels:
+            self.cache.subscribers.setdefault(channel, []).append(self)
+    
+    def listen(self):
+        while True:
+            yield self.messages.get()
+
+
+class Cache:
+    """Redis semantics for the commands the app issues, kept in dicts"""
+    
+    def __init__(self):
+        self.values = {}
+        self.hashes = {}
+        self.sets = {}
+        self.subscribers = {}
+        self.stats = Counter()
+    
+    def _count(self, batched):
+        if not batched:
+            self.stats["round_trips"] += 1
+    
+    def make_key(self, key, user=None, shared=False):
+        return f"bench|{key}"
+    
+    def pipeline(self):
+        return Pipeline(self)
+    
+    def lock(self, name, timeout=None, blocking_timeout=None):
+        return Lock(self, name)
+    
+    def pubsub(self, ignore_subscribe_messages=False):
+        return PubSub(self)
+    
+    def publish(self, channel, message, _batched=False):
+        self._count(_batched)
+        for subscriber in self.subscribers.get(channel, []):
+            subscriber.messages.put({"type": "message", "channel": channel, "data": message})
+        return len(self.subscribers.get(channel, []))
+    
+    def set(self, key, value, nx=False, ex=None, _batched=False):
+        self._count(_batched)
+        if nx and key in self.values:
+            return None
+        self.values[key] = value
+        return True
+    
+    def get(self, key, _batched=False):
+        self._count(_batched)
+        return self.values.get(key)
+    
+    def incr(self, key, _batched=False):
+        self._count(_batched)
+        self.values[key] = int(self.values.get(key) or 0) + 1
+        return self.values[key]
+    
+    def delete(self, *keys, _batched=False):
+        self._count(_batched)
+        removed = 0
+        for key in keys:
+            removed += int(
+                self.values.pop(key, None) is not None
+                or self.hashes.pop(key, None) is not None
+                or self.sets.pop(key, None) is not None
+            )
+        return removed
+    
+    def sadd(self, name, *values, _batched=False):
+        self._count(_batched)
+        members = self.sets.setdefault(name, set())
+        added = len([value for value in values if value not in members])
+        members.update(values)
+        return added
+    
+    def hget(self, name, key, _batched=False):
+        self._count(_batched)
+        return self.hashes.get(name, {}).get(key)
+    
+    def hmget(self, name, keys, _batched=False):
+        self._count(_batched)
+        values = self.hashes.get(name, {})
+        return [values.get(key) for key in keys]
+    
+    def hset(self, name, key=None, value=None, mapping=None, _batched=False):
+        self._count(_batched)
+        values = self.hashes.setdefault(name, {})
+        items = dict(mapping or {})
+        if key is not None:
+            items[key] = value
+        added = len([item for item in items if item not in values])
+        values.update(items)
+        return added
+    
+    def hdel(self, name, *keys, _batched=False):
+        self._count(_batched)
+        values = self.hashes.get(name, {})
+        return len([values.pop(key) for key in keys if key in values])
+    
+    def hincrby(self, name, key, amount=1, _batched=False):
+        self._count(_batched)
+        values = self.hashes.setdefault(name, {})
+        values[key] = int(values.get(key) or 0) + amount
+        return values[key]
+    
+    def hlen(self, name, _batched=False):
+        self._count(_batched)
+        return len(self.hashes.get(name, {}))
+    
+    def hgetall(self, name, _batched=False):
+        self._count(_batched)
+        return dict(self.hashes.get(name, {}))
+    
+    def eval(self, script, numkeys, *args, _batched=False):
+        """Run one of the app's Lua scripts through its Python equivalent"""
+        self._count(_batched)
+        keys, argv = args[:numkeys], args[numkeys:]
+        return get_script(script)(self, keys, argv)
+
+
+class Database:
+    """Dict tables behind the frappe.db calls used on the webhook path"""
+    
+    db_type = "mariadb"
+    
+    def __init__(self):
+        self.tables = {}
+        self.unique_values = {}
+        self.singles = {}
+        self.queries = []
+        self.stats = Counter()
+        self.after_commit = CallbackManager()
+        self.after_rollback = CallbackManager()
+    
+    def table(self, doctype):
+        return self.tables.setdefault(doctype, {})
+    
+    def insert_row(self, doctype, row, ignore_duplicates=False):
+        table = self.table(doctype)
+        
+        for fieldname in UNIQUE_FIELDS.get(doctype, []):
+            value = row.get(fieldname)
+            if value and value in self.unique_values.get((doctype, fieldname), ()):
+                if ignore_duplicates:
+                    return False
+                raise ValidationError(f"Duplicate {fieldname} {value} in {doctype}")
+        
+        for fieldname in UNIQUE_FIELDS.get(doctype, []):
+            if row.get(fieldname):
+                self.unique_values.setdefault((doctype, fieldname), set()).add(row[fieldname])
+        
+        table[row["name"]] = _dict(row)
+        return True
+    
+    def bulk_insert(self, doctype, fields, values, ignore_duplicates=False, chunk_size=10000):
+        self.stats["writes"] += 1
+        for row in values:
+            self.insert_row(doctype, dict(zip(fields, row)), ignore_duplicates=ignore_duplicates)
+    
+    def get_value(self, doctype, filters=None, fieldname="name", as_dict=False, **kwargs):
+        self.stats["reads"] += 1
+        
+        if doctype in self.singles and (filters is None or filters == doctype):
+            single = self.singles[doctype]
+            return single if as_dict else single.get(fieldname)
+        
+        if isinstance(filters, str):
+            filters = {"name": filters}
+        
+        rows = select(self.table(doctype).values(), filters, limit=1)
+        if not rows:
+            return None
+        
+        if as_dict:
+            return rows[0]
+        if isinstance(fieldname, (list, tuple)):
+            return tuple(rows[0].get(field) for field in fieldname)
+        return rows[0].get(fieldname)
+    
+    def get_single_value(self, doctype, fieldname):
+        self.stats["reads"] += 1
+        return self.singles.get(doctype, {}).get(fieldname)
+    
+    def exists(self, doctype, filters=None):
+        return self.get_value(doctype, filters or {}, "name")
+    
+    def set_value(self, doctype, name, fieldname, value=None, update_modified=True):
+        self.stats["writes"] += 1
+        row = self.table(doctype).get(name)
+        if row is None:
+            return
+        
+        if isinstance(fieldname, dict):
+            row.update(fieldname)
+        else:
+            row[fieldname] = value
+    
+    def count(self, doctype, filters=None):
+        self.stats["reads"] += 1
+        return len(select(self.table(doctype).values(), filters))
+    
+    def sql(self, query, values=None, as_dict=False, **kwargs):
+        self.stats["sql"] += 1
+        self.queries.append((" ".join(query.split()), values))
+        return []
+    
+    def commit(self):
+        self.stats["commits"] += 1
+        self.after_rollback.reset()
+        self.after_commit.run()
+    
+    def savepoint(self, save_point):
+        pass
+    
+    @staticmethod
+    def is_duplicate_entry(e):
+        return isinstance(e, ValidationError) and str(e).startswith("Duplicate")
+    
+    def rollback(self, save_point=None):
+        self.stats["rollbacks"] += 1
+        if save_point:
+            return
+        self.after_commit.reset()
+        self.after_rollback.run()
+
+
+class Document(_dict):
+    """Just enough of frappe.model.document.Document for inserts on the webhook path"""
+    
+    def insert(self, ignore_permissions=False, ignore_if_duplicate=False):
+        if not self.name:
+            self.name = generate_hash(length=10)
+        
+        now = utils.now_datetime()
+        self.setdefault("creation", now)
+        self.setdefault("modified", now)
+        
+        db.stats["writes"] += 1
+        db.insert_row(self.doctype, dict(self), ignore_duplicates=ignore_if_duplicate)
+        return self
+    
+    def db_insert(self, ignore_if_duplicate=False):
+        return self.insert(ignore_if_duplicate=ignore_if_duplicate)
+    
+    def save(self, ignore_permissions=False):
+        db.stats["writes"] += 1
+        db.table(self.doctype)[self.name] = _dict(self)
+        return self
+    
+    def set(self, key, value):
+        self[key] = value
+    
+    def get_password(self, fieldname="password", raise_exception=True):
+        return self.get(fieldname)
+    
+    def get_doc_before_save(self):
+        return None
+
+
+def select(rows, filters=None, limit=None):
+    """Filter rows with the dict and list filter forms used by the app"""
+    if isinstance(filters, dict):
+        filters = [[field, *(value if isinstance(value, (list, tuple)) else ["=", value])]
+                   for field, value in filters.items()]
+    
+    matched = []
+    for row in rows:
+        if all(matches(row.get(field), operator, value) for field, operator, value in filters or []):
+            matched.append(row)
+            if limit and len(matched) >= limit:
+                break
+    
+    return matched
+
+
+def matches(actual, operator, value):
+    if operator == "=":
+        return actual == value
+    if operator == "!=":
+        return actual != value
+    if operator == "in":
+        return actual in value
+    if operator == "not in":
+        return actual not in value
+    if operator == ">":
+        return actual is not None and actual > value
+    if operator == "<":
+        return actual is not None and actual < value
+    raise NotImplementedError(f"Filter operator {operator} is not supported by the stand-in")
+
+
+def get_all(doctype, filters=None, fields=None, pluck=None, order_by=None, limit=None,
+            limit_page_length=None, **kwargs):
+    db.stats["reads"] += 1
+    rows = select(db.table(doctype).values(), filters, limit=limit or limit_page_length)
+    
+    if pluck:
+        return [row.get(pluck) for row in rows]
+    
+    fields = fields or ["name"]
+    return [_dict({field: row.get(field) for field in fields}) for row in rows]
+
+
+def get_doc(doctype, name=None):
+    if isinstance(doctype, dict):
+        return Document(doctype)
+    
+    if doctype in db.singles:
+        return Document(db.singles[doctype], doctype=doctype)
+    
+    db.stats["reads"] += 1
+    row = db.table(doctype).get(name)
+    if row is None:
+        raise ValidationError(f"{doctype} {name} not found")
+    return Document(row, doctype=doctype)
+
+
+def new_doc(doctype):
+    return Document(doctype=doctype)
+
+
+def get_single(doctype):
+    db.stats["reads"] += 1
+    return Document(db.singles.setdefault(doctype, {}), doctype=doctype, name=doctype)
+
+
+def enqueue(method, queue="default", job_id=None, deduplicate=False, **kwargs):
+    if deduplicate and job_id and job_id in {job["job_id"] for job in jobs}:
+        return None
+    
+    jobs.append({"method": method, "queue": queue, "job_id": job_id, "kwargs": kwargs})
+
+
+def publish_realtime(event=None, message=None, room=None, **kwargs):
+    realtime.append((event, room))
+
+
+def generate_hash(txt=None, length=56):
+    return secrets.token_hex(length // 2 + 1)[:length]
+
+
+def safe_decode(value, encoding="utf-8"):
+    return value.decode(encoding) if isinstance(value, bytes) else value
+
+
+def whitelist(allow_guest=False, xss_safe=False, methods=None):
+    return lambda fn: fn
+
+
+def throw(message, exc=ValidationError, title=None):
+    raise exc(message)
+
+
+def log_error(message=None, title=None):
+    error_log.append((title, message))
+
+
+def only_for(roles, message=False):
+    pass
+
+
+def get_attr(method_string):
+    module_name, attr = method_string.rsplit(".", 1)
+    __import__(module_name)
+    return getattr(sys.modules[module_name], attr)
+
+
+def logger(module=None, with_more_info=False):
+    return _logger
+
+
+def cache():
+    return _cache
+
+
+class Request:
+    def __init__(self, method="POST", data=b"", headers=None, args=None):
+        self.method = method
+        self.data = data
+        self.headers = headers or {}
+        self.args = args or {}
+
+
+def now_datetime():
+    return datetime.datetime.now()
+
+
+def get_datetime(value=None):
+    if value is None:
+        return now_datetime()
+    if isinstance(value, datetime.datetime):
+        return value
+    return datetime.datetime.fromisoformat(str(value))
+
+
+def add_to_date(date, days=0, hours=0, minutes=0, seconds=0, as_string=False, **kwargs):
+    return get_datetime(date) + datetime.timedelta(days=days, hours=hours, minutes=minutes, seconds=seconds)
+
+
+def cint(value, default=0):
+    try:
+        return int(float(value))
+    except (TypeError, ValueError):
+        return default
+
+
+def flt(value, precision=None):
+    try:
+        value = float(value)
+    except (TypeError, ValueError):
+        return 0.0
+    return round(value, precision) if precision is not None else value
+
+
+def cstr(value, encoding="utf-8"):
+    return safe_decode(value, encoding) if value is not None else ""
+
+
+db = Database()
+_cache = Cache()
+_logger = Logger()
+jobs = []
+realtime = []
+error_log = []
+utils = None
+
+
+def install():
+    """Register the stand-in as the frappe package; refuses to shadow a real frappe"""
+    global utils
+    
+    existing = sys.modules.get("frappe")
+    if existing is not None:
+        if getattr(existing, "__stand_in__", False):
+            return existing
+        raise RuntimeError("A real frappe is already imported; run the benchmarks outside a bench process")
+    
+    frappe = types.ModuleType("frappe")
+    frappe.__stand_in__ = True
+    frappe.__path__ = []
+    
+    utils = types.ModuleType("frappe.utils")
+    for name in ("now_datetime", "get_datetime", "add_to_date", "cint", "flt", "cstr"):
+        setattr(utils, name, globals()[name])
+    
+    model = types.ModuleType("frappe.model")
+    model.__path__ = []
+    document = types.ModuleType("frappe.model.document")
+    document.Document = Document
+    model.document = document
+    
+    for name in (
+        "_dict", "AuthenticationError", "ValidationError", "db", "get_all", "get_doc", "new_doc",
+        "get_single", "enqueue", "publish_realtime", "generate_hash", "safe_decode", "whitelist",
+        "throw", "log_error", "only_for", "get_attr", "logger", "cache"
+    ):
+        setattr(frappe, name, globals()[name])
+    
+    frappe.get_list = get_all
+    frappe.get_value = db.get_value
+    frappe.utils = utils
+    frappe.model = model
+    frappe.session = _dict(user="Administrator")
+    frappe.flags = _dict()
+    frappe.form_dict = _dict()
+    frappe.local = _dict(site="bench.local")
+    db.after_commit.reset()
+    db.after_rollback.reset()
+    frappe.request = Request()
+    
+    sys.modules.update({
+        "frappe": frappe,
+        "frappe.utils": utils,
+        "frappe.model": model,
+        "frappe.model.document": document
+    })
+    
+    return frappe
+
+
+def reset(settings=None, leads=()):
+    """Empty every table, cache and recorder; seed settings and existing Leads"""
+    db.tables.clear()
+    db.unique_values.clear()
+    db.singles.clear()
+    db.queries.clear()
+    db.stats.clear()
+    _cache.values.clear()
+    _cache.hashes.clear()
+    _cache.sets.clear()
+    _cache.stats.clear()
+    _logger.counts.clear()
+    del jobs[:], realtime[:], error_log[:]
+    
+    db.singles["WhatsApp Business Account"] = _dict(DEFAULT_SETTINGS, **(settings or {}))
+    
+    # Settings documents cached by the app belong to the previous run
+    settings_cache = sys.modules.get("whatsapp_calling.utils.settings_cache")
+    if settings_cache:
+        settings_cache._process_cache.clear()
+    
+    for phone_e164 in leads:
+        name = generate_hash(length=10)
+        db.table("Lead")[name] = _dict(
+            name=name, mobile_no=phone_e164.lstrip("+"), whatsapp_phone=phone_e164,
+            whatsapp_phone_e164=phone_e164
+        )
+    
+    new_request()
+
+
+def reset_stats():
+    """Zero the call counters without touching stored data"""
+    db.stats.clear()
+    db.queries.clear()
+    _cache.stats.clear()
+    _logger.counts.clear()
+    del jobs[:], realtime[:], error_log[:]
+
+
+def new_request(method="POST", data=b"", headers=None, args=None):
+    """Start a fresh request: new frappe.local and frappe.request, like each HTTP call"""
+    frappe = sys.modules["frappe"]
+    frappe.local = _dict(site="bench.local")
+    frappe.request = Request(method, data, headers, args)
+
+
+def get_stats():
+    """Database and cache call counts since the last reset"""
+    return {
+        "db": dict(db.stats),
+        "cache_round_trips": _cache.stats["round_trips"],
+        "jobs_enqueued": len(jobs),
+        "realtime_events": len(realtime),
+        "errors_logged": _logger.counts["error"]
+    }
+
+
+def merge_statuses(cache, keys, argv):
+    """Python equivalent of status_pipeline.MERGE_SCRIPT"""
+    from whatsapp_calling.whatsapp_integration.status_pipeline import STATUS_RANK
+    
+    buffer = cache.hashes.setdefault(keys[0], {})
+    for message_id, status in zip(argv[::2], argv[1::2]):
+        current = buffer.get(message_id)
+        if current is None or STATUS_RANK[status] > STATUS_RANK[current]:
+            buffer[message_id] = status
+    return len(buffer)
+
+
+def take_statuses(cache, keys, argv):
+    """Python equivalent of status_pipeline.TAKE_SCRIPT"""
+    buffer = cache.hashes.pop(keys[0], {})
+    return [item for pair in buffer.items() for item in pair]
+
+
+def take_realtime_events(cache, keys, argv):
+    """Python equivalent of realtime.TAKE_SCRIPT"""
+    return [
+        [room, [item for pair in cache.hashes.pop(argv[0] + room, {}).items() for item in pair]]
+        for room in cache.sets.pop(keys[0], set())
+    ]
+
+
+def get_script(script):
+    from whatsapp_calling.whatsapp_integration import realtime, status_pipeline
+    
+    scripts = {
+        status_pipeline.MERGE_SCRIPT: merge_statuses,
+        status_pipeline.TAKE_SCRIPT: take_statuses,
+        realtime.TAKE_SCRIPT: take_realtime_events
+    }
+    if script not in scripts:
+        raise NotImplementedError("Lua script has no Python equivalent in the stand-in")
+    return scripts[script]
\ No newline at end of file
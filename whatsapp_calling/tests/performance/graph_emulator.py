@@ -0,0 +1,433 @@
+"""
+Local stand-in for the WhatsApp Cloud API: the messages, media and templates
+endpoints with configurable latency, injected 429/5xx responses, Meta's
+per-number throughput limit and signed status webhooks for sent messages.
+
+    python -m whatsapp_calling.tests.performance.graph_emulator --port 8090 \\
+        --latency lognormal:80:40 --error-429 0.02 --error-5xx 0.01 \\
+        --webhook-url http://localhost:8000/api/method/whatsapp_calling.whatsapp_integration.webhook_handler.whatsapp_webhook \\
+        --webhook-secret <webhook verify token>
+
+Point Graph API URL on WhatsApp Business Account at http://127.0.0.1:8090 to
+send every outbound call to it. Counters are served at /_emulator/stats.
+"""
+
+import argparse
+import hashlib
+import heapq
+import itertools
+import json
+import math
+import random
+import re
+import string
+import threading
+import time
+import urllib.request
+from collections import Counter, deque
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from whatsapp_calling.tests.performance.payload_generator import WebhookPayloadGenerator, encode, sign
+
+
+DISTRIBUTIONS = ("fixed", "uniform", "normal", "lognormal", "exponential")
+VERSION_PATTERN = re.compile(r"^v\d+\.\d+$")
+
+# Meta answers throttling with HTTP 429 and error code 130429, outages with these
+THROTTLED_ERROR = {"code": 130429, "message": "(#130429) Rate limit hit", "type": "OAuthException"}
+SERVER_ERRORS = (
+    (500, {"code": 1, "message": "An unknown error occurred", "type": "OAuthException"}),
+    (503, {"code": 2, "message": "Service temporarily unavailable", "type": "OAuthException"})
+)
+
+# Seconds after the send at which each status callback goes out
+STATUS_DELAYS = (("sent", 0.5), ("delivered", 1.5), ("read", 5.0))
+WEBHOOK_BATCH_SIZE = 50
+WEBHOOK_THREADS = 8
+
+MEDIA_MIME_TYPE = "image/jpeg"
+DEFAULT_MEDIA_BYTES = 256 * 1024
+
+
+class LatencyModel:
+    """Response delay drawn from a distribution, parsed from 'name:mean_ms[:spread_ms]'"""
+    
+    def __init__(self, distribution="fixed", mean_ms=0, spread_ms=0, seed=None):
+        if distribution not in DISTRIBUTIONS:
+            raise ValueError(f"Unknown latency distribution {distribution}; use one of {', '.join(DISTRIBUTIONS)}")
+        
+        self.distribution = distribution
+        self.mean = mean_ms / 1000
+        self.spread = spread_ms / 1000
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+    
+    @classmethod
+    def parse(cls, spec, seed=None):
+        name, _, params = (spec or "fixed:0").partition(":")
+        values = [float(value) for value in params.split(":") if value] or [0]
+        return cls(name, values[0], values[1] if len(values) > 1 else 0, seed)
+    
+    def sample(self):
+        """Delay in seconds; spread is the standard deviation, or the half width for uniform"""
+        with self.lock:
+            if self.distribution == "uniform":
+                delay = self.random.uniform(self.mean - self.spread, self.mean + self.spread)
+            elif self.distribution == "normal":
+                delay = self.random.gauss(self.mean, self.spread)
+            elif self.distribution == "lognormal" and self.mean > 0:
+                # Long right tail with the given mean and standard deviation, like real API latency
+                sigma_squared = math.log(1 + (self.spread / self.mean) ** 2)
+                mu = math.log(self.mean) - sigma_squared / 2
+                delay = self.random.lognormvariate(mu, sigma_squared ** 0.5)
+            elif self.distribution == "exponential" and self.mean > 0:
+                delay = self.random.expovariate(1 / self.mean)
+            else:
+                delay = self.mean
+        
+        return max(delay, 0)
+
+
+class ThroughputLimit:
+    """Per phone number id sliding one-second window, like Meta's messages-per-second cap"""
+    
+    def __init__(self, rate):
+        self.rate = rate
+        self.windows = {}
+        self.lock = threading.Lock()
+    
+    def allow(self, key):
+        if not self.rate:
+            return True
+        
+        now = time.monotonic()
+        with self.lock:
+            window = self.windows.setdefault(key, deque())
+            while window and now - window[0] >= 1:
+                window.popleft()
+            
+            if len(window) >= self.rate:
+                return False
+            
+            window.append(now)
+            return True
+
+
+class WebhookDispatcher:
+    """Posts status callbacks to the app's webhook when they fall due, batching those due together"""
+    
+    def __init__(self, url, secret=None, delays=STATUS_DELAYS, generator=None):
+        self.url = url
+        self.secret = secret
+        self.delays = delays
+        self.generator = generator or WebhookPayloadGenerator()
+        self.queue = []
+        self.sequence = itertools.count()
+        self.condition = threading.Condition()
+        self.pool = ThreadPoolExecutor(max_workers=WEBHOOK_THREADS)
+        self.stats = Counter()
+        self.lock = threading.Lock()
+        self.stopping = False
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+    
+    def schedule(self, wamid, recipient):
+        sent_at = time.time()
+        with self.condition:
+            for status, delay in self.delays:
+                callback = {
+                    "id": wamid,
+                    "status": status,
+                    "timestamp": str(int(sent_at + delay)),
+                    "recipient_id": recipient,
+                    "conversation": {
+                        "id": hashlib.md5(recipient.encode()).hexdigest(),
+                        "origin": {"type": "service"}
+                    },
+                    "pricing": {"billable": True, "pricing_model": "CBP", "category": "service"}
+                }
+                heapq.heappush(self.queue, (time.monotonic() + delay, next(self.sequence), callback))
+            self.condition.notify()
+    
+    def run(self):
+        while True:
+            with self.condition:
+                while not self.stopping and (not self.queue or self.queue[0][0] > time.monotonic()):
+                    self.condition.wait(self.queue[0][0] - time.monotonic() if self.queue else None)
+                
+                if self.stopping:
+                    return
+                
+                due = []
+                while self.queue and self.queue[0][0] <= time.monotonic() and len(due) < WEBHOOK_BATCH_SIZE:
+                    due.append(heapq.heappop(self.queue)[2])
+            
+            body = encode(self.generator.envelope([self.generator.change_value(statuses=due)]))
+            # Keep the generator from growing with every callback
+            self.generator.history.clear()
+            self.pool.submit(self.post, body, len(due))
+    
+    def post(self, body, count):
+        request = urllib.request.Request(self.url, data=body, method="POST", headers={"Content-Type": "application/json"})
+        if self.secret:
+            request.add_header("X-Hub-Signature-256", sign(body, self.secret))
+        
+        try:
+            with urllib.request.urlopen(request, timeout=10) as response:
+                response.read()
+            self.count("webhooks_sent", "statuses_sent", count)
+            
+        except Exception:
+            self.count("webhooks_failed", "statuses_failed", count)
+    
+    def count(self, webhook_key, status_key, statuses):
+        with self.lock:
+            self.stats[webhook_key] += 1
+            self.stats[status_key] += statuses
+    
+    def stop(self):
+        with self.condition:
+            self.stopping = True
+            self.condition.notify()
+        self.pool.shutdown(wait=True)
+
+
+class GraphEmulator:
+    """Threaded HTTP server answering Graph API calls; start() returns the base URL to configure"""
+    
+    def __init__(self, host="127.0.0.1", port=0, latency=None, error_429=0.0, error_5xx=0.0, throughput=None,
+                 webhook_url=None, webhook_secret=None, status_delays=STATUS_DELAYS, templates=None, media_bytes=DEFAULT_MEDIA_BYTES, seed=0):
+        self.host = host
+        self.port = port
+        self.latency = latency or LatencyModel()
+        self.error_429 = error_429
+        self.error_5xx = error_5xx
+        self.limit = ThroughputLimit(throughput)
+        self.templates = templates or [
+            {"name": "hello_world", "language": "en_US", "status": "APPROVED", "category": "UTILITY"}
+        ]
+        self.media_bytes = media_bytes
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.stats = Counter()
+        self.latencies = []
+        self.webhooks = WebhookDispatcher(webhook_url, webhook_secret, status_delays) if webhook_url else None
+        self.server = None
+    
+    @property
+    def base_url(self):
+        return f"http://{self.host}:{self.server.server_port}"
+    
+    def start(self):
+        handler = type("GraphEmulatorHandler", (GraphEmulatorHandler,), {"emulator": self})
+        self.server = ThreadingHTTPServer((self.host, self.port), handler)
+        self.server.daemon_threads = True
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self.base_url
+    
+    def stop(self):
+        if self.server:
+            self.server.shutdown()
+            self.server.server_close()
+        if self.webhooks:
+            self.webhooks.stop()
+    
+    def count(self, key, delay=None):
+        with self.lock:
+            self.stats[key] += 1
+            if delay is not None:
+                self.latencies.append(delay)
+    
+    def roll_fault(self):
+        """(status, error) to inject for this call, or None"""
+        with self.lock:
+            roll = self.random.random()
+            if roll < self.error_429:
+                return 429, THROTTLED_ERROR
+            if roll < self.error_429 + self.error_5xx:
+                return self.random.choice(SERVER_ERRORS)
+        return None
+    
+    def wamid(self):
+        with self.lock:
+            return "wamid.HBgL" + "".join(self.random.choices(string.ascii_uppercase + string.digits, k=32))
+    
+    def get_stats(self):
+        with self.lock:
+            latencies = sorted(self.latencies)
+            stats = dict(self.stats)
+        
+        if latencies:
+            stats["latency_p50_ms"] = round(latencies[len(latencies) // 2] * 1000, 2)
+            stats["latency_p99_ms"] = round(latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))] * 1000, 2)
+        if self.webhooks:
+            with self.webhooks.lock:
+                stats.update(self.webhooks.stats)
+        
+        return stats
+    
+    def reset(self):
+        with self.lock:
+            self.stats.clear()
+            self.latencies = []
+
+
+class GraphEmulatorHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    emulator = None
+    
+    def do_GET(self):
+        self.route("GET")
+    
+    def do_POST(self):
+        self.route("POST")
+    
+    def route(self, method):
+        body = self.rfile.read(int(self.headers.get("Content-Length") or 0))
+        path = self.path.split("?")[0].strip("/").split("/")
+        
+        if path[0] == "_emulator":
+            if method == "POST" and path[-1] == "reset":
+                self.emulator.reset()
+            return self.reply(200, self.emulator.get_stats())
+        
+        if path[0] == "media-download":
+            return self.download(path[-1])
+        
+        # Any Graph API version is accepted
+        if VERSION_PATTERN.match(path[0]):
+            path = path[1:]
+        
+        if not self.headers.get("Authorization", "").startswith("Bearer "):
+            return self.reply(401, {"error": {"code": 190, "message": "Invalid OAuth access token", "type": "OAuthException"}})
+        
+        delay = self.emulator.latency.sample()
+        time.sleep(delay)
+        
+        if method == "POST" and len(path) == 2 and path[1] == "messages":
+            return self.send_message(path[0], body, delay)
+        
+        fault = self.emulator.roll_fault()
+        if fault:
+            self.emulator.count(f"injected_{fault[0]}", delay)
+            return self.reply(fault[0], {"error": fault[1]}, {"Retry-After": "1"} if fault[0] == 429 else None)
+        
+        if method == "GET" and len(path) == 2 and path[1] == "message_templates":
+            self.emulator.count("templates", delay)
+            return self.reply(200, {"data": self.emulator.templates, "paging": {}})
+        
+        if method == "GET" and len(path) == 1:
+            # Media ids resolve to a download URL; any other object id, such as the business account, answers too
+            self.emulator.count("objects", delay)
+            return self.reply(200, {
+                "id": path[0],
+                "name": "Emulated WhatsApp Business Account",
+                "url": f"{self.emulator.base_url}/media-download/{path[0]}",
+                "mime_type": MEDIA_MIME_TYPE,
+                "sha256": hashlib.sha256(self.media(path[0])).hexdigest(),
+                "file_size": self.emulator.media_bytes,
+                "messaging_product": "whatsapp"
+            })
+        
+        self.emulator.count("not_found", delay)
+        self.reply(400, {"error": {"code": 100, "message": "Unsupported request", "type": "GraphMethodException"}})
+    
+    def send_message(self, phone_number_id, body, delay):
+        try:
+            payload = json.loads(body or b"{}")
+        except ValueError:
+            payload = {}
+        
+        to = payload.get("to")
+        if not to:
+            self.emulator.count("invalid", delay)
+            return self.reply(400, {"error": {"code": 100, "message": "(#100) The parameter to is required"}})
+        
+        if not self.emulator.limit.allow(phone_number_id):
+            self.emulator.count("throttled", delay)
+            return self.reply(429, {"error": THROTTLED_ERROR}, {"Retry-After": "1"})
+        
+        fault = self.emulator.roll_fault()
+        if fault:
+            self.emulator.count(f"injected_{fault[0]}", delay)
+            return self.reply(fault[0], {"error": fault[1]}, {"Retry-After": "1"} if fault[0] == 429 else None)
+        
+        wamid = self.emulator.wamid()
+        self.emulator.count("messages", delay)
+        if self.emulator.webhooks:
+            self.emulator.webhooks.schedule(wamid, to)
+        
+        self.reply(200, {
+            "messaging_product": "whatsapp",
+            "contacts": [{"input": to, "wa_id": to}],
+            "messages": [{"id": wamid}]
+        })
+    
+    def download(self, media_id):
+        content = self.media(media_id)
+        self.emulator.count("downloads")
+        
+        self.send_response(200)
+        self.send_header("Content-Type", MEDIA_MIME_TYPE)
+        self.send_header("Content-Length", str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+    
+    def media(self, media_id):
+        """Deterministic content for a media id"""
+        block = hashlib.sha256(media_id.encode()).digest()
+        return (block * (self.emulator.media_bytes // len(block) + 1))[:self.emulator.media_bytes]
+    
+    def reply(self, status, body, headers=None):
+        content = json.dumps(body).encode()
+        self.send_response(status)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+    
+    def log_message(self, *args):
+        pass
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Local WhatsApp Cloud API emulator")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8090)
+    parser.add_argument("--latency", default="fixed:0",
+                        help=f"distribution:mean_ms[:spread_ms], distribution one of {', '.join(DISTRIBUTIONS)}")
+    parser.add_argument("--error-429", type=float, default=0.0, help="Share of calls answered with a 429")
+    parser.add_argument("--error-5xx", type=float, default=0.0, help="Share of calls answered with a 500 or 503")
+    parser.add_argument("--throughput", type=int, help="Messages per second per phone number id before 429s")
+    parser.add_argument("--webhook-url", help="Post sent, delivered and read statuses for every message here")
+    parser.add_argument("--webhook-secret", help="Sign status webhooks with this secret")
+    parser.add_argument("--media-bytes", type=int, default=DEFAULT_MEDIA_BYTES)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+    
+    emulator = GraphEmulator(
+        host=args.host,
+        port=args.port,
+        latency=LatencyModel.parse(args.latency, args.seed),
+        error_429=args.error_429,
+        error_5xx=args.error_5xx,
+        throughput=args.throughput,
+        webhook_url=args.webhook_url,
+        webhook_secret=args.webhook_secret,
+        media_bytes=args.media_bytes,
+        seed=args.seed
+    )
+    print(f"Graph API emulator listening on {emulator.start()}")
+    
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        emulator.stop()
+
+
+if __name__ == "__main__":
+    main()
\ No newline at end of file
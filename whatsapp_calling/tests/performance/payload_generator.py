@@ -0,0 +1,210 @@
+"""
+Generator for realistic WhatsApp Cloud API webhook payloads: text and media
+messages, status bursts, multi-entry posts and Meta retries of earlier posts.
+"""
+
+import copy
+import hashlib
+import hmac
+import json
+import random
+import string
+import time
+
+
+MEDIA_TYPES = {
+    "image": "image/jpeg",
+    "video": "video/mp4",
+    "audio": "audio/ogg; codecs=opus",
+    "document": "application/pdf"
+}
+
+SAMPLE_TEXTS = [
+    "Hi, I saw your ad and want to know the pricing",
+    "Can someone call me back tomorrow morning?",
+    "Is the premium plan available for 10 users?",
+    "Thanks!",
+    "I need help with my last order",
+    "What are your business hours?",
+    "Please share the brochure",
+    "Ok"
+]
+
+
+class WebhookPayloadGenerator:
+    """Deterministic source of Cloud API webhook bodies for a fixed pool of senders"""
+    
+    def __init__(self, seed=0, senders=500, business_number="15550001234",
+                 phone_number_id="100000000000001", business_account_id="200000000000001"):
+        self.random = random.Random(seed)
+        self.business_number = business_number
+        self.phone_number_id = phone_number_id
+        self.business_account_id = business_account_id
+        self.senders = [f"1{self.random.randint(2000000000, 9999999999)}" for _ in range(senders)]
+        self.outbound_ids = []
+        self.history = []
+    
+    def wamid(self):
+        """A Meta-style message id"""
+        suffix = "".join(self.random.choices(string.ascii_uppercase + string.digits, k=32))
+        return f"wamid.HBgL{suffix}"
+    
+    def text_message(self, sender=None):
+        """Inbound text message"""
+        return {
+            "from": sender or self.random.choice(self.senders),
+            "id": self.wamid(),
+            "timestamp": str(int(time.time())),
+            "type": "text",
+            "text": {"body": self.random.choice(SAMPLE_TEXTS)}
+        }
+    
+    def media_message(self, sender=None, media_type=None):
+        """Inbound image, video, audio or document message"""
+        media_type = media_type or self.random.choice(list(MEDIA_TYPES))
+        media = {
+            "id": str(self.random.randint(10 ** 15, 10 ** 16 - 1)),
+            "mime_type": MEDIA_TYPES[media_type],
+            "sha256": hashlib.sha256(str(self.random.random()).encode()).hexdigest()
+        }
+        
+        if media_type in ("image", "video"):
+            media["caption"] = self.random.choice(SAMPLE_TEXTS)
+        elif media_type == "document":
+            media["filename"] = f"quote-{self.random.randint(1000, 9999)}.pdf"
+        
+        return {
+            "from": sender or self.random.choice(self.senders),
+            "id": self.wamid(),
+            "timestamp": str(int(time.time())),
+            "type": media_type,
+            media_type: media
+        }
+    
+    def message(self, media_ratio=0.2):
+        """One inbound message, media with the given probability"""
+        if self.random.random() < media_ratio:
+            return self.media_message()
+        return self.text_message()
+    
+    def change_value(self, messages=None, statuses=None):
+        """The value block of one webhook change"""
+        value = {
+            "messaging_product": "whatsapp",
+            "metadata": {
+                "display_phone_number": self.business_number,
+                "phone_number_id": self.phone_number_id
+            }
+        }
+        
+        if messages:
+            value["contacts"] = [
+                {"profile": {"name": f"Customer {message['from'][-4:]}"}, "wa_id": message["from"]}
+                for message in messages
+            ]
+            value["messages"] = messages
+        
+        if statuses:
+            value["statuses"] = statuses
+        
+        return value
+    
+    def envelope(self, values):
+        """Wrap change values into a webhook body, one entry per value"""
+        payload = {
+            "object": "whatsapp_business_account",
+            "entry": [
+                {
+                    "id": self.business_account_id,
+                    "changes": [{"field": "messages", "value": value}]
+                }
+                for value in values
+            ]
+        }
+        self.history.append(payload)
+        return payload
+    
+    def messages_payload(self, count=1, entries=1, media_ratio=0.2):
+        """Inbound messages spread over one or more entries"""
+        values = []
+        for entry in range(entries):
+            per_entry = count // entries + (1 if entry < count % entries else 0)
+            values.append(self.change_value(messages=[self.message(media_ratio) for _ in range(per_entry)]))
+        
+        return self.envelope(values)
+    
+    def status_burst(self, count=10, statuses=("sent", "delivered", "read"), shuffle=True):
+        """Delivery callbacks for outbound messages; several per message, possibly out of order"""
+        while len(self.outbound_ids) < count:
+            self.outbound_ids.append(self.wamid())
+        
+        message_ids = self.random.sample(self.outbound_ids, count)
+        callbacks = []
+        
+        for message_id in message_ids:
+            recipient = self.random.choice(self.senders)
+            for status in statuses[:self.random.randint(1, len(statuses))]:
+                callbacks.append({
+                    "id": message_id,
+                    "status": status,
+                    "timestamp": str(int(time.time())),
+                    "recipient_id": recipient,
+                    "conversation": {
+                        "id": hashlib.md5(recipient.encode()).hexdigest(),
+                        "origin": {"type": "service"}
+                    },
+                    "pricing": {"billable": True, "pricing_model": "CBP", "category": "service"}
+                })
+        
+        if shuffle:
+            self.random.shuffle(callbacks)
+        
+        return self.envelope([self.change_value(statuses=callbacks)])
+    
+    def retry(self, payload=None):
+        """Redeliver an earlier payload unchanged, as Meta does when an ack is slow or lost"""
+        if payload is None:
+            payload = self.random.choice(self.history)
+        return copy.deepcopy(payload)
+    
+    def mixed_stream(self, count, status_ratio=0.4, retry_ratio=0.05, multi_entry_ratio=0.1,
+                     media_ratio=0.2, max_batch=5):
+        """Yield a realistic mix of message posts, status bursts and retries"""
+        for _ in range(count):
+            roll = self.random.random()
+            
+            if self.history and roll < retry_ratio:
+                yield self.retry()
+            elif roll < retry_ratio + status_ratio:
+                yield self.status_burst(count=self.random.randint(1, max_batch))
+            elif roll < retry_ratio + status_ratio + multi_entry_ratio:
+                yield self.messages_payload(
+                    count=self.random.randint(2, max_batch * 2),
+                    entries=self.random.randint(2, 3),
+                    media_ratio=media_ratio
+                )
+            else:
+                yield self.messages_payload(count=self.random.randint(1, max_batch), media_ratio=media_ratio)
+
+
+def encode(payload):
+    """Serialize a payload exactly as it goes over the wire"""
+    return json.dumps(payload, separators=(",", ":")).encode()
+
+
+def sign(body, secret):
+    """X-Hub-Signature-256 header value for a raw body"""
+    return "sha256=" + hmac.new(secret.encode(), body, hashlib.sha256).hexdigest()
+
+
+def count_items(payload):
+    """Number of messages and status callbacks carried by a payload"""
+    messages = statuses = 0
+    
+    for entry in payload.get("entry") or []:
+        for change in entry.get("changes") or []:
+            value = change.get("value") or {}
+            messages += len(value.get("messages") or [])
+            statuses += len(value.get("statuses") or [])
+    
+    return messages, statuses
\ No newline at end of file
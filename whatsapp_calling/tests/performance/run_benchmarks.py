@@ -0,0 +1,223 @@
+"""
+Webhook throughput benchmarks for whatsapp_webhook, process_incoming_message
+and process_message_status, run against the in-memory frappe stand-in.
+
+    python -m whatsapp_calling.tests.performance.run_benchmarks \\
+        --iterations 2000 --output results.json --baseline baseline.json
+
+Reports msgs/sec and p50/p99 latency per handler, stores the results as JSON
+and exits non-zero when a result regresses past --tolerance against a baseline.
+"""
+
+import argparse
+import json
+import platform
+import sys
+import time
+from datetime import datetime
+
+from whatsapp_calling.tests.performance import frappe_stand_in
+
+frappe = frappe_stand_in.install()
+
+from whatsapp_calling.tests.performance.payload_generator import (  # noqa: E402
+    WebhookPayloadGenerator, count_items, encode, sign
+)
+from whatsapp_calling.utils.phone import normalize_phones  # noqa: E402
+from whatsapp_calling.whatsapp_integration import status_pipeline, webhook_handler  # noqa: E402
+
+
+HANDLERS = ("whatsapp_webhook", "process_incoming_message", "process_message_status")
+DEFAULT_TOLERANCE = 0.10
+
+
+def bench_whatsapp_webhook(generator, iterations):
+    """Full request path: signature check, parse and batch processing of a mixed stream"""
+    secret = frappe_stand_in.DEFAULT_SETTINGS["webhook_verify_token"]
+    samples = []
+    
+    for payload in generator.mixed_stream(iterations):
+        body = encode(payload)
+        frappe_stand_in.new_request("POST", body, headers={"X-Hub-Signature-256": sign(body, secret)})
+        
+        start = time.perf_counter()
+        response = webhook_handler.whatsapp_webhook()
+        elapsed = time.perf_counter() - start
+        
+        if response.get("status") != "success":
+            raise RuntimeError(f"Webhook rejected a generated payload: {response}")
+        
+        samples.append((elapsed, sum(count_items(payload))))
+    
+    return samples
+
+
+def bench_process_incoming_message(generator, iterations):
+    """Inbound message batches, including multi-entry posts and retries"""
+    samples = []
+    
+    for i in range(iterations):
+        if i and i % 20 == 0:
+            payload = generator.retry()
+        else:
+            payload = generator.messages_payload(
+                count=generator.random.randint(1, 10),
+                entries=generator.random.choice([1, 1, 1, 2, 3])
+            )
+        frappe_stand_in.new_request()
+        
+        start = time.perf_counter()
+        webhook_handler.process_incoming_message(payload)
+        elapsed = time.perf_counter() - start
+        
+        samples.append((elapsed, count_items(payload)[0]))
+    
+    return samples
+
+
+def bench_process_message_status(generator, iterations):
+    """Out-of-order status bursts for outbound messages, from the webhook through the buffer flush and UPDATE"""
+    samples = []
+    
+    for _ in range(iterations):
+        payload = generator.status_burst(count=generator.random.randint(1, 25))
+        frappe_stand_in.new_request()
+        
+        start = time.perf_counter()
+        webhook_handler.process_message_status(payload)
+        # The flush job's work, without its window sleep
+        status_pipeline.apply_statuses(status_pipeline.take_buffered_statuses())
+        elapsed = time.perf_counter() - start
+        
+        samples.append((elapsed, count_items(payload)[1]))
+    
+    return samples
+
+
+def percentile(values, fraction):
+    """Nearest-rank percentile of a sorted list"""
+    if not values:
+        return 0.0
+    index = max(0, min(len(values) - 1, int(round(fraction * len(values) + 0.5)) - 1))
+    return values[index]
+
+
+def summarize(samples):
+    """Throughput and latency figures for one handler"""
+    latencies = sorted(elapsed for elapsed, _ in samples)
+    total_time = sum(latencies)
+    items = sum(count for _, count in samples)
+    
+    return {
+        "iterations": len(samples),
+        "messages": items,
+        "msgs_per_sec": round(items / total_time, 1) if total_time else 0.0,
+        "p50_ms": round(percentile(latencies, 0.50) * 1000, 4),
+        "p99_ms": round(percentile(latencies, 0.99) * 1000, 4),
+        "mean_ms": round(total_time / len(latencies) * 1000, 4) if latencies else 0.0
+    }
+
+
+def run_handler(name, iterations, warmup, seed, senders, known_ratio):
+    """Benchmark one handler on a freshly reset stand-in"""
+    generator = WebhookPayloadGenerator(seed=seed, senders=senders)
+    
+    # Part of the sender pool already exists in the CRM, the rest creates Leads
+    known = generator.senders[:int(len(generator.senders) * known_ratio)]
+    frappe_stand_in.reset(leads=[number for number in normalize_phones(known, international=True).values() if number])
+    
+    bench = globals()[f"bench_{name}"]
+    if warmup:
+        bench(generator, warmup)
+        frappe_stand_in.reset_stats()
+    
+    samples = bench(generator, iterations)
+    
+    result = summarize(samples)
+    result["stand_in_calls"] = frappe_stand_in.get_stats()
+    return result
+
+
+def compare(results, baseline, tolerance):
+    """List regressions of throughput or p99 latency beyond the tolerance"""
+    regressions = []
+    
+    for name, current in results["results"].items():
+        previous = baseline.get("results", {}).get(name)
+        if not previous:
+            continue
+        
+        if current["msgs_per_sec"] < previous["msgs_per_sec"] * (1 - tolerance):
+            regressions.append(
+                f"{name}: throughput {current['msgs_per_sec']} msgs/sec vs baseline {previous['msgs_per_sec']}"
+            )
+        
+        if current["p99_ms"] > previous["p99_ms"] * (1 + tolerance):
+            regressions.append(f"{name}: p99 {current['p99_ms']} ms vs baseline {previous['p99_ms']} ms")
+    
+    return regressions
+
+
+def print_report(results):
+    print(f"{'handler':<28}{'msgs/sec':>12}{'p50 ms':>10}{'p99 ms':>10}{'iterations':>12}")
+    for name, result in results["results"].items():
+        print(
+            f"{name:<28}{result['msgs_per_sec']:>12}{result['p50_ms']:>10}"
+            f"{result['p99_ms']:>10}{result['iterations']:>12}"
+        )
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="WhatsApp webhook throughput benchmarks")
+    parser.add_argument("--iterations", type=int, default=1000, help="Payloads per handler")
+    parser.add_argument("--warmup", type=int, default=100, help="Untimed payloads before measuring")
+    parser.add_argument("--handler", action="append", choices=HANDLERS, help="Run only these handlers")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--senders", type=int, default=500, help="Distinct customer numbers")
+    parser.add_argument("--known-ratio", type=float, default=0.5, help="Share of senders already in the CRM")
+    parser.add_argument("--output", help="Write results to this JSON file")
+    parser.add_argument("--baseline", help="Compare against results from an earlier run")
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE,
+                        help="Allowed relative regression, 0.10 = 10%%")
+    args = parser.parse_args(argv)
+    
+    results = {
+        "generated_at": datetime.now().isoformat(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "config": {
+            "iterations": args.iterations,
+            "warmup": args.warmup,
+            "seed": args.seed,
+            "senders": args.senders,
+            "known_ratio": args.known_ratio
+        },
+        "results": {}
+    }
+    
+    for name in args.handler or HANDLERS:
+        results["results"][name] = run_handler(
+            name, args.iterations, args.warmup, args.seed, args.senders, args.known_ratio
+        )
+    
+    print_report(results)
+    
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+    
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        
+        if regressions:
+            return 1
+    
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
\ No newline at end of file
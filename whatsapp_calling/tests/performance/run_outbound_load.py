@@ -0,0 +1,188 @@
+"""
+End-to-end outbound load test: sends messages through the outbound worker's
+delivery path, or through graph_client.graph_request on a thread pool as the
+inline path does, against the local Graph API emulator.
+
+    python -m whatsapp_calling.tests.performance.run_outbound_load \\
+        --messages 5000 --concurrency 200 --latency lognormal:80:40 \\
+        --error-429 0.02 --error-5xx 0.01 --throughput 1000 --output load.json
+
+Reports sent and failed messages, msgs/sec, p50/p99 send latency including
+retries, and the emulator's counters of throttled and injected responses.
+"""
+
+import argparse
+import asyncio
+import json
+import platform
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from whatsapp_calling.tests.performance import frappe_stand_in
+
+# Replaces frappe for the whole process; the module name keeps test runners from collecting it
+frappe = frappe_stand_in.install()
+
+from whatsapp_calling.tests.performance.graph_emulator import GraphEmulator, LatencyModel  # noqa: E402
+from whatsapp_calling.tests.performance.run_benchmarks import percentile  # noqa: E402
+from whatsapp_calling.whatsapp_integration import graph_client  # noqa: E402
+from whatsapp_calling.whatsapp_integration.outbound_worker import OutboundWorker  # noqa: E402
+
+
+MODES = ("worker", "inline")
+ACCESS_TOKEN = frappe_stand_in.DEFAULT_SETTINGS["access_token"]
+PHONE_NUMBER_ID = frappe_stand_in.DEFAULT_SETTINGS["phone_number_id"]
+
+
+def get_jobs(count):
+    return [
+        {
+            "message": f"LOAD-{index}",
+            "message_id": f"load-{index}",
+            "phone_number_id": PHONE_NUMBER_ID,
+            "payload": {
+                "messaging_product": "whatsapp",
+                "to": f"1555{index:07d}",
+                "type": "text",
+                "text": {"body": "Load test message"}
+            }
+        }
+        for index in range(count)
+    ]
+
+
+def run_worker(base_url, jobs, concurrency, rate):
+    """Deliver through OutboundWorker with at most concurrency sends in flight"""
+    worker = OutboundWorker(concurrency, "load-test", base_url=base_url)
+    worker.access_token = ACCESS_TOKEN
+    worker.rate = rate
+    samples = []
+    
+    async def send(job, slots):
+        async with slots:
+            started = time.perf_counter()
+            status, _ = await worker.deliver(job)
+            samples.append((time.perf_counter() - started, status))
+    
+    async def run():
+        slots = asyncio.Semaphore(concurrency)
+        await worker.open_client()
+        try:
+            await asyncio.gather(*[send(job, slots) for job in jobs])
+        finally:
+            await worker.close_client()
+    
+    asyncio.run(run())
+    return samples
+
+
+def run_inline(base_url, jobs, concurrency, rate):
+    """Deliver through graph_request on a thread pool; the rate comes from the settings"""
+    def send(job):
+        started = time.perf_counter()
+        try:
+            graph_client.graph_request(
+                "POST", f"{job['phone_number_id']}/messages",
+                json=job["payload"],
+                access_token=ACCESS_TOKEN,
+                rate_key=job["phone_number_id"],
+                endpoint="messages",
+                base_url=base_url
+            )
+            status = "sent"
+        except graph_client.GraphAPIError:
+            status = "failed"
+        return time.perf_counter() - started, status
+    
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        return list(pool.map(send, jobs))
+
+
+def summarize(samples, elapsed):
+    latencies = sorted(duration for duration, _ in samples)
+    sent = len([status for _, status in samples if status == "sent"])
+    
+    return {
+        "messages": len(samples),
+        "sent": sent,
+        "failed": len(samples) - sent,
+        "msgs_per_sec": round(sent / elapsed, 1) if elapsed else 0.0,
+        "elapsed_sec": round(elapsed, 3),
+        "p50_ms": round(percentile(latencies, 0.50) * 1000, 2),
+        "p99_ms": round(percentile(latencies, 0.99) * 1000, 2)
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Outbound WhatsApp load test against the Graph API emulator")
+    parser.add_argument("--mode", action="append", choices=MODES, help="Run only these send paths")
+    parser.add_argument("--messages", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=200, help="Sends in flight")
+    parser.add_argument("--rate", type=int, default=1000, help="Client-side messages per second limit")
+    parser.add_argument("--latency", default="lognormal:80:40", help="Emulator latency, distribution:mean_ms[:spread_ms]")
+    parser.add_argument("--error-429", type=float, default=0.0)
+    parser.add_argument("--error-5xx", type=float, default=0.0)
+    parser.add_argument("--throughput", type=int, help="Emulator messages per second cap per number")
+    parser.add_argument("--graph-url", help="Use an emulator that is already running instead of starting one")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Write results to this JSON file")
+    args = parser.parse_args(argv)
+    
+    emulator = None
+    base_url = args.graph_url
+    if not base_url:
+        emulator = GraphEmulator(
+            latency=LatencyModel.parse(args.latency, args.seed),
+            error_429=args.error_429,
+            error_5xx=args.error_5xx,
+            throughput=args.throughput,
+            seed=args.seed
+        )
+        base_url = emulator.start()
+    
+    results = {
+        "generated_at": datetime.now().isoformat(),
+        "python": platform.python_version(),
+        "config": {key: value for key, value in vars(args).items() if key != "output"},
+        "results": {}
+    }
+    
+    try:
+        for mode in args.mode or MODES:
+            frappe_stand_in.reset(settings=dict(frappe_stand_in.DEFAULT_SETTINGS, messaging_throughput=args.rate))
+            if emulator:
+                emulator.reset()
+            
+            started = time.perf_counter()
+            samples = globals()[f"run_{mode}"](
+                f"{base_url.rstrip('/')}/{graph_client.DEFAULT_GRAPH_API_VERSION}",
+                get_jobs(args.messages), args.concurrency, args.rate
+            )
+            
+            result = summarize(samples, time.perf_counter() - started)
+            if emulator:
+                result["emulator"] = emulator.get_stats()
+            results["results"][mode] = result
+        
+    finally:
+        if emulator:
+            emulator.stop()
+    
+    print(f"{'mode':<10}{'sent':>8}{'failed':>8}{'msgs/sec':>12}{'p50 ms':>10}{'p99 ms':>10}")
+    for mode, result in results["results"].items():
+        print(
+            f"{mode:<10}{result['sent']:>8}{result['failed']:>8}{result['msgs_per_sec']:>12}"
+            f"{result['p50_ms']:>10}{result['p99_ms']:>10}"
+        )
+    
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+    
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
\ No newline at end of file
@@ -0,0 +1,44 @@
+"""
+Bot engine lifetime tests: one engine and provider client per worker, rebuilt
+when the account settings version changes
+"""
+
+import unittest
+from unittest.mock import patch
+
+import frappe
+
+from whatsapp_calling.bot import ai_engine
+
+
+class TestBotEngineReuse(unittest.TestCase):
+    def setUp(self):
+        ai_engine._engines.by_site = {}
+        self.version = 1
+        
+        for target, kwargs in (
+            ("get_whatsapp_settings", {"return_value": frappe._dict(ai_provider="claude")}),
+            ("get_settings_secret", {"return_value": "sk-test"}),
+            ("get_settings_version", {"side_effect": lambda: self.version}),
+            ("anthropic", {})
+        ):
+            patcher = patch(f"whatsapp_calling.bot.ai_engine.{target}", **kwargs)
+            mock = patcher.start()
+            self.addCleanup(patcher.stop)
+        
+        self.anthropic = mock
+    
+    def test_engine_and_client_are_reused_between_jobs(self):
+        engine = ai_engine.get_engine()
+        
+        self.assertIs(ai_engine.get_engine(), engine)
+        self.assertIs(ai_engine.get_engine().client, engine.client)
+        self.assertEqual(self.anthropic.Anthropic.call_count, 1)
+    
+    def test_settings_change_rebuilds_the_engine(self):
+        engine = ai_engine.get_engine()
+        self.version = 2
+        
+        self.assertIsNot(ai_engine.get_engine(), engine)
+        self.assertEqual(ai_engine.get_engine().settings_version, 2)
+        self.assertEqual(self.anthropic.Anthropic.call_count, 2)
\ No newline at end of file
@@ -0,0 +1,93 @@
+"""
+Bot prompt tests: the static prefix compiled once per config version, the
+prompt cache breakpoint sent to Claude once the prefix can be cached and the
+recorded time-to-first-token and cached input tokens
+"""
+
+import unittest
+from types import SimpleNamespace
+from unittest.mock import MagicMock, patch
+
+from whatsapp_calling.bot import prompts
+from whatsapp_calling.bot.ai_engine import AIBotEngine
+from whatsapp_calling.bot.prompts import get_claude_system, get_openai_messages, get_static_prefix
+
+
+COMPANY_INFO = {"company_name": "Acme", "industry": "Technology", "products": "CRM Solutions", "contact": "Contact Sales"}
+
+
+class FakeStream:
+    """Stands in for anthropic's MessageStream: a few events, then the final message"""
+    
+    def __init__(self, message):
+        self.message = message
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, *args):
+        return False
+    
+    def __iter__(self):
+        for event_type in ("message_start", "content_block_start", "content_block_delta", "content_block_delta"):
+            yield SimpleNamespace(type=event_type)
+    
+    def get_final_message(self):
+        return self.message
+
+
+class TestBotPrompts(unittest.TestCase):
+    def setUp(self):
+        prompts._prefixes.clear()
+    
+    def test_static_prefix_is_compiled_once_per_config_version(self):
+        prefix = get_static_prefix("response", COMPANY_INFO)
+        
+        self.assertIn("WhatsApp bot for Acme", prefix)
+        self.assertIs(get_static_prefix("response", dict(COMPANY_INFO)), prefix)
+        self.assertIn("Globex", get_static_prefix("response", dict(COMPANY_INFO, company_name="Globex")))
+        self.assertNotIn("{", get_static_prefix("structured", COMPANY_INFO))
+    
+    def test_only_the_static_prefix_is_a_cache_breakpoint(self):
+        prefix = "Company profile and reply guidelines. " * prompts.MIN_CACHEABLE_TOKENS
+        blocks = get_claude_system(prefix, "suffix")
+        
+        self.assertEqual(blocks[0]["cache_control"], {"type": "ephemeral"})
+        self.assertNotIn("cache_control", blocks[1])
+        self.assertEqual(
+            [message["content"] for message in get_openai_messages("prefix", "suffix", "Hi")],
+            ["prefix", "suffix", "Hi"]
+        )
+    
+    def test_prefix_below_the_minimum_is_not_marked(self):
+        prefix = get_static_prefix("structured", COMPANY_INFO)
+        tools = [{"name": "bot_reply", "input_schema": {"description": "x" * prompts.MIN_CACHEABLE_TOKENS * 4}}]
+        
+        self.assertNotIn("cache_control", get_claude_system(prefix)[0])
+        # Tools are cached along with the prefix, so they count towards the minimum
+        self.assertIn("cache_control", get_claude_system(prefix, tools=tools)[0])
+    
+    def test_claude_reply_records_ttft_and_cached_tokens(self):
+        engine = AIBotEngine.__new__(AIBotEngine)
+        engine.ai_provider = "claude"
+        engine.client = MagicMock()
+        engine.client.messages.stream.return_value = FakeStream(SimpleNamespace(
+            content=[SimpleNamespace(type="text", text=" Our plans start at $10. Shall I share more? ")],
+            usage=SimpleNamespace(input_tokens=40, output_tokens=20, cache_read_input_tokens=900, cache_creation_input_tokens=0)
+        ))
+        
+        with patch.object(engine, "get_company_info", return_value=COMPANY_INFO), \
+                patch("whatsapp_calling.bot.ai_engine.record_prompt_usage") as record_prompt_usage:
+            response = engine.generate_response("pricing", "How much?", "{}")
+        
+        self.assertEqual(response, "Our plans start at $10. Shall I share more?")
+        self.assertEqual(engine.last_tokens, 960)
+        
+        system = engine.client.messages.stream.call_args.kwargs["system"]
+        self.assertIs(system[0]["text"], get_static_prefix("response", COMPANY_INFO))
+        self.assertIn("Current Intent: pricing", system[1]["text"])
+        
+        provider, call, ttft, input_tokens, cached_tokens = record_prompt_usage.call_args.args
+        self.assertEqual((provider, call, input_tokens, cached_tokens), ("claude", "response", 940, 900))
+        self.assertFalse(record_prompt_usage.call_args.kwargs["cacheable"])
+        self.assertIsNotNone(ttft)
\ No newline at end of file
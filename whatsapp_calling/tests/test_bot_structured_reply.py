@@ -0,0 +1,105 @@
+"""
+Structured bot reply tests: schema validation of the single-call result, the
+fallback to separate intent and reply calls and locally settled small talk
+"""
+
+import json
+import unittest
+from unittest.mock import MagicMock, patch
+
+import frappe
+
+from whatsapp_calling.bot.ai_engine import AIBotEngine, validate_bot_reply
+
+
+class TestStructuredBotReply(unittest.TestCase):
+    def setUp(self):
+        self.engine = AIBotEngine.__new__(AIBotEngine)
+        self.engine.settings = frappe._dict(structured_bot_replies=1)
+        self.engine.ai_provider = "claude"
+        
+        self.state = MagicMock(context_data=json.dumps({"user_data": {"email": "asha@example.com"}}))
+        self.state.is_escalated = False
+        self.state.lead_score = 0
+        
+        for method in ("get_conversation_context", "send_bot_response", "evaluate_lead_qualification"):
+            patcher = patch.object(self.engine, method, return_value="{}")
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        
+        patcher = patch("whatsapp_calling.bot.ai_engine.record_llm_turn")
+        self.record_llm_turn = patcher.start()
+        self.addCleanup(patcher.stop)
+    
+    def test_valid_reply_is_cleaned(self):
+        result = validate_bot_reply({
+            "intent": "Pricing",
+            "reply": " A representative will call you. ",
+            "language": "HI",
+            "user_fields": {"company": "Acme", "budget": "", "favourite_colour": "blue"}
+        })
+        
+        self.assertEqual(result["intent"], "pricing")
+        self.assertEqual(result["reply"], "A representative will call you.")
+        self.assertEqual(result["language"], "hi")
+        self.assertEqual(result["user_fields"], {"company": "Acme"})
+        self.assertIsNone(result["summary"])
+    
+    def test_invalid_replies_are_rejected(self):
+        self.assertIsNone(validate_bot_reply(None))
+        self.assertIsNone(validate_bot_reply({"intent": "shopping", "reply": "Hi"}))
+        self.assertIsNone(validate_bot_reply({"intent": "greeting", "reply": " "}))
+        self.assertIsNone(validate_bot_reply({"intent": "greeting", "reply": "Hi", "user_fields": ["Asha"]}))
+    
+    def test_structured_reply_replaces_both_calls(self):
+        structured = {
+            "intent": "appointment",
+            "reply": "Sure! Does Tuesday work? 📅",
+            "language": "en",
+            "user_fields": {"name": "Asha"},
+            "summary": "Asha wants a demo."
+        }
+        
+        with patch.object(self.engine, "generate_structured_reply", return_value=structured), \
+                patch.object(self.engine, "classify_intent") as classify_intent:
+            self.engine.process_message("15550000001", "Can we book a demo?", self.state, "wamid.1")
+        
+        classify_intent.assert_not_called()
+        self.engine.send_bot_response.assert_called_once_with("15550000001", "Sure! Does Tuesday work? 📅")
+        self.assertEqual(self.state.current_intent, "appointment")
+        self.assertEqual(self.state.language, "en")
+        
+        context_data = json.loads(self.state.context_data)
+        self.assertEqual(context_data["user_data"], {"email": "asha@example.com", "name": "Asha"})
+        self.assertEqual(context_data["summary"], "Asha wants a demo.")
+        self.record_llm_turn.assert_called_once()
+        self.assertFalse(self.record_llm_turn.call_args.kwargs["fallback"])
+    
+    def test_invalid_structured_reply_falls_back_to_two_calls(self):
+        with patch.object(self.engine, "generate_structured_reply", return_value={"intent": "greeting"}), \
+                patch.object(self.engine, "classify_intent", return_value="greeting") as classify_intent, \
+                patch.object(self.engine, "generate_response", return_value="Hello! 👋") as generate_response:
+            self.engine.process_message("15550000001", "Hi", self.state, "wamid.2")
+        
+        classify_intent.assert_called_once()
+        generate_response.assert_called_once()
+        self.engine.send_bot_response.assert_called_once_with("15550000001", "Hello! 👋")
+        
+        modes = [call.args[1] for call in self.record_llm_turn.call_args_list]
+        self.assertEqual(modes, ["structured", "two_call"])
+        self.assertTrue(self.record_llm_turn.call_args_list[0].kwargs["fallback"])
+    
+    def test_local_small_talk_skips_the_llm(self):
+        self.engine.settings.local_intent_classifier = 1
+        
+        with patch.object(self.engine, "generate_structured_reply") as generate_structured_reply, \
+                patch.object(self.engine, "classify_intent") as classify_intent:
+            self.engine.process_message("15550000001", "Hello!", self.state, "wamid.3")
+        
+        generate_structured_reply.assert_not_called()
+        classify_intent.assert_not_called()
+        self.engine.send_bot_response.assert_called_once_with("15550000001", self.engine.get_fallback_response("greeting"))
+        self.assertEqual(self.record_llm_turn.call_args.args[1], "local")
+        
+        history = json.loads(self.state.context_data)["conversation_history"]
+        self.assertEqual(history[-1]["intent_source"], "rules")
\ No newline at end of file
@@ -0,0 +1,141 @@
+"""
+Broadcast engine tests: streaming and resuming recipient files, and sending a
+chunk concurrently against a local HTTP stand-in for the Graph messages endpoint
+"""
+
+import io
+import unittest
+from unittest.mock import call, patch
+
+import frappe
+
+from whatsapp_calling.tests.graph_stand_in import ACCESS_TOKEN, MessagesStandIn, StandInServer
+from whatsapp_calling.whatsapp_integration import broadcast
+from whatsapp_calling.whatsapp_integration.broadcast import (
+    get_template_payload, iter_csv_chunks, send_chunk, send_recipients, unique_recipients
+)
+from whatsapp_calling.whatsapp_integration.graph_client import CircuitBreaker
+
+
+class TestBroadcast(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.server = StandInServer(MessagesStandIn)
+    
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.stop()
+    
+    def setUp(self):
+        MessagesStandIn.reset()
+        
+        self.doc = frappe._dict(template_name="spring_offer", template_language="en_US")
+        self.context = {
+            "url": f"{self.server.base_url}/123/messages",
+            "access_token": ACCESS_TOKEN,
+            "rate_key": "test-broadcast",
+            "rate": 1000,
+            "circuit": CircuitBreaker()
+        }
+    
+    def recipients(self, count):
+        return [
+            {"phone_e164": f"+1555000{index:04d}", "parameters": [f"Name {index}"], "links": None}
+            for index in range(count)
+        ]
+    
+    def test_csv_chunks_stream_and_resume_from_checkpoint(self):
+        rows = "\n".join(f"+1555000{index:04d},Name {index}" for index in range(25))
+        data = "Phone,First Name\n" + rows + "\n"
+        
+        chunks = list(iter_csv_chunks(io.StringIO(data), 0, ["first name"], chunk_size=10))
+        self.assertEqual([checkpoint for _, checkpoint, _ in chunks], ["10", "20", "25"])
+        self.assertEqual(chunks[0][0][0]["parameters"], ["Name 0"])
+        
+        resumed = list(iter_csv_chunks(io.StringIO(data), 20, ["first name"], chunk_size=10))
+        self.assertEqual(len(resumed), 1)
+        self.assertEqual(resumed[0][0][0]["phone_e164"], "+15550000020")
+    
+    def test_invalid_and_repeated_numbers_are_skipped(self):
+        recipients, skipped = unique_recipients([
+            {"phone_e164": "+15550000001"},
+            {"phone_e164": None},
+            {"phone_e164": "+15550000001"},
+            {"phone_e164": "+15550000002"}
+        ])
+        
+        self.assertEqual([recipient["phone_e164"] for recipient in recipients], ["+15550000001", "+15550000002"])
+        self.assertEqual(skipped, 2)
+    
+    def test_template_payload(self):
+        payload = get_template_payload(self.doc, {"phone_e164": "+15550000001", "parameters": ["Asha"]})
+        
+        self.assertEqual(payload["to"], "15550000001")
+        self.assertEqual(payload["template"]["name"], "spring_offer")
+        self.assertEqual(payload["template"]["components"][0]["parameters"], [{"type": "text", "text": "Asha"}])
+    
+    def test_send_chunk_retries_throttled_and_fails_invalid(self):
+        recipients = self.recipients(40)
+        MessagesStandIn.throttled.update({"15550000003", "15550000007"})
+        MessagesStandIn.invalid.add("15550000011")
+        
+        results, interrupted = send_chunk(self.doc, recipients, self.context)
+        
+        self.assertFalse(interrupted)
+        self.assertEqual(len(results), 40)
+        self.assertEqual(results[3], {"status": "sent", "message_id": "wamid.15550000003"})
+        self.assertEqual(results[11]["status"], "failed")
+        self.assertEqual(MessagesStandIn.requests["15550000003"], 2)
+        self.assertEqual(MessagesStandIn.requests["15550000011"], 1)
+        self.assertEqual(sum(MessagesStandIn.requests.values()), 42)
+    
+    def test_open_circuit_interrupts_the_chunk(self):
+        circuit = self.context["circuit"]
+        for _ in range(circuit.threshold):
+            circuit.record_failure()
+        circuit.cooldown = 3600
+        
+        with patch("whatsapp_calling.whatsapp_integration.broadcast.CIRCUIT_WAIT_SECONDS", 0):
+            results, interrupted = send_chunk(self.doc, self.recipients(5), self.context)
+        
+        self.assertTrue(interrupted)
+        self.assertEqual(results, {})
+        self.assertEqual(sum(MessagesStandIn.requests.values()), 0)
+    
+    def test_every_batch_is_logged_and_committed_before_the_next_is_sent(self):
+        recipients = self.recipients(120)
+        progress = {"sent_count": 0, "failed_count": 0, "skipped_count": 0, "run_processed": 0}
+        steps = []
+        
+        def log_chunk(doc, batch, results, context):
+            steps.append(("log", len(batch), sum(MessagesStandIn.requests.values())))
+        
+        def save_progress(doc, progress, checkpoint, **kwargs):
+            steps.append(("save", progress["sent_count"], checkpoint))
+        
+        with patch.object(broadcast, "log_chunk", log_chunk), patch.object(broadcast, "save_progress", save_progress):
+            self.assertTrue(send_recipients(self.doc, recipients, self.context, progress))
+        
+        # Each batch's log is written while only that batch and the ones before it were sent
+        self.assertEqual(steps, [
+            ("log", 50, 50), ("save", 50, None),
+            ("log", 50, 100), ("save", 100, None),
+            ("log", 20, 120), ("save", 120, None)
+        ])
+        self.assertEqual(progress["run_processed"], 120)
+    
+    def test_open_circuit_pauses_after_logging_the_batch(self):
+        circuit = self.context["circuit"]
+        for _ in range(circuit.threshold):
+            circuit.record_failure()
+        circuit.cooldown = 3600
+        progress = {"sent_count": 0, "failed_count": 0, "skipped_count": 0, "run_processed": 0}
+        
+        with patch.object(broadcast, "CIRCUIT_WAIT_SECONDS", 0), patch.object(broadcast, "log_chunk") as log_chunk, \
+                patch.object(broadcast, "save_progress") as save_progress:
+            self.assertFalse(send_recipients(self.doc, self.recipients(5), self.context, progress))
+        
+        log_chunk.assert_called_once()
+        self.assertEqual(save_progress.call_args, call(
+            self.doc, progress, None, status="Paused", last_error="Graph API unavailable; resume to continue"
+        ))
\ No newline at end of file
@@ -0,0 +1,118 @@
+"""
+Bot burst buffer tests: messages inside the window become one bot turn, the
+window moves with every message up to its cap, and conversations stay apart
+"""
+
+import time
+import unittest
+from unittest.mock import patch
+
+import frappe
+
+from whatsapp_calling.utils.phone import normalize_phone
+from whatsapp_calling.whatsapp_integration import burst_buffer
+from whatsapp_calling.whatsapp_integration.burst_buffer import (
+    buffer_messages, flush_bursts, flush_due_bursts, requeue_stale_claims
+)
+
+
+WINDOW = 3
+PHONE = "+15550001001"
+OTHER_PHONE = "+15550001002"
+
+
+class TestBurstBuffer(unittest.TestCase):
+    def setUp(self):
+        cache = frappe.cache()
+        cache.delete(
+            cache.make_key(burst_buffer.DUE_KEY),
+            cache.make_key(burst_buffer.FIRST_KEY),
+            cache.make_key(burst_buffer.CLAIMED_KEY),
+            *[
+                cache.make_key(prefix + self.get_conversation(phone))
+                for prefix in (burst_buffer.BURST_KEY, burst_buffer.PROCESSING_KEY)
+                for phone in (PHONE, OTHER_PHONE)
+            ]
+        )
+        
+        for target in ("dispatch_messages", "schedule_flush"):
+            patcher = patch(f"whatsapp_calling.whatsapp_integration.burst_buffer.{target}")
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        
+        self.dispatch_messages = burst_buffer.dispatch_messages
+    
+    def get_conversation(self, phone_number):
+        return normalize_phone(phone_number, international=True) or phone_number
+    
+    def get_dispatched(self):
+        return [message for call in self.dispatch_messages.call_args_list for message in call.args[0]]
+    
+    def test_burst_becomes_one_turn(self):
+        buffer_messages([(PHONE, "hi", "wamid.1"), (PHONE, "i need", "wamid.2")], WINDOW)
+        buffer_messages([(PHONE, "pricing for 20 seats", "wamid.3")], WINDOW)
+        
+        self.assertEqual(flush_due_bursts(time.time()), 0)
+        self.assertEqual(flush_due_bursts(time.time() + WINDOW + 1), 1)
+        self.assertEqual(self.get_dispatched(), [(PHONE, "hi\ni need\npricing for 20 seats", "wamid.3")])
+        
+        # The burst is gone once handed over
+        self.assertEqual(flush_due_bursts(time.time() + WINDOW + 1), 0)
+    
+    def test_conversations_are_flushed_separately(self):
+        buffer_messages([(PHONE, "hi", "wamid.1"), (OTHER_PHONE, "hello", "wamid.2"), (PHONE, "price?", "wamid.3")], WINDOW)
+        
+        self.assertEqual(flush_due_bursts(time.time() + WINDOW + 1), 2)
+        self.assertCountEqual(self.get_dispatched(), [(PHONE, "hi\nprice?", "wamid.3"), (OTHER_PHONE, "hello", "wamid.2")])
+    
+    def test_window_is_capped_for_a_user_who_keeps_typing(self):
+        cache = frappe.cache()
+        conversation = self.get_conversation(PHONE)
+        started = time.time() - WINDOW * burst_buffer.MAX_WINDOWS
+        
+        buffer_messages([(PHONE, "first", "wamid.1")], WINDOW)
+        # On the raw client like the buffer; RedisWrapper.hset would prefix the key again and pickle the value
+        cache.pipeline().hset(cache.make_key(burst_buffer.FIRST_KEY), conversation, started).execute()
+        buffer_messages([(PHONE, "still typing", "wamid.2")], WINDOW)
+        
+        self.assertEqual(flush_due_bursts(time.time()), 1)
+        self.assertEqual(self.get_dispatched(), [(PHONE, "first\nstill typing", "wamid.2")])
+    
+    def test_burst_taken_by_another_flusher_is_skipped(self):
+        cache = frappe.cache()
+        buffer_messages([(PHONE, "hi", "wamid.1")], WINDOW)
+        
+        # Read from the due set by this flusher, then taken by another one before the script ran
+        due = time.time() + WINDOW + 1
+        with patch.object(cache, "zrangebyscore", side_effect=lambda *args, **kwargs: [self.get_conversation(PHONE)]):
+            self.assertEqual(flush_due_bursts(due), 1)
+            self.assertEqual(flush_due_bursts(due), 0)
+        
+        self.assertEqual(self.get_dispatched(), [(PHONE, "hi", "wamid.1")])
+    
+    def test_burst_is_kept_until_it_was_dispatched(self):
+        buffer_messages([(PHONE, "hi", "wamid.1"), (PHONE, "pricing?", "wamid.2")], WINDOW)
+        self.dispatch_messages.side_effect = Exception("Worker killed")
+        
+        with self.assertRaises(Exception):
+            flush_due_bursts(time.time() + WINDOW + 1)
+        
+        # Claimed, so no other flusher takes it, until the claim goes stale
+        self.dispatch_messages.side_effect = None
+        self.assertEqual(flush_due_bursts(time.time() + WINDOW + 1), 0)
+        self.assertEqual(requeue_stale_claims(), 0)
+        
+        with patch.object(burst_buffer, "STALE_CLAIM_SECONDS", -1):
+            self.assertEqual(requeue_stale_claims(), 1)
+        
+        self.assertEqual(flush_due_bursts(time.time() + 1), 1)
+        self.assertEqual(self.dispatch_messages.call_args.args[0], [(PHONE, "hi\npricing?", "wamid.2")])
+    
+    def test_flush_job_hands_over_when_its_budget_runs_out(self):
+        buffer_messages([(PHONE, "hi", "wamid.1")], WINDOW)
+        
+        with patch.object(burst_buffer, "FLUSH_BUDGET_SECONDS", 0):
+            self.assertEqual(flush_bursts(), 0)
+        
+        burst_buffer.schedule_flush.assert_called_with(continued=True)
+        self.assertEqual(self.get_dispatched(), [])
\ No newline at end of file
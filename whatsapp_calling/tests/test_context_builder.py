@@ -0,0 +1,145 @@
+"""
+Conversation context tests: the local token estimate, a context that stays
+within its budget however long the conversation, and older turns folded into
+the rolling summary by the partition task
+"""
+
+import json
+import unittest
+from datetime import datetime, timedelta
+from unittest.mock import MagicMock, patch
+
+import frappe
+
+from whatsapp_calling.bot import context_builder
+from whatsapp_calling.bot.context_builder import (
+    build_context, estimate_tokens, get_unsummarized_turns, schedule_summary, update_rolling_summary
+)
+from whatsapp_calling.whatsapp_integration import partition_dispatcher
+
+
+SETTINGS = frappe._dict(context_token_budget=300, context_recent_turns=4)
+
+
+def get_history(turns, length=40):
+    started = datetime(2024, 1, 1)
+    return [
+        {
+            "timestamp": (started + timedelta(minutes=index)).isoformat(),
+            "user_message": "Tell me about the plans " * length + f"(question {index})",
+            "bot_response": "Here are the details " * length + f"(answer {index})",
+            "intent": "product_inquiry"
+        }
+        for index in range(turns)
+    ]
+
+
+def get_state(context_data):
+    state = MagicMock(context_data=json.dumps(context_data), current_intent="pricing", lead_score=20, language="en")
+    state.phone_number = "+15550002001"
+    return state
+
+
+class TestContextBuilder(unittest.TestCase):
+    def test_token_estimate(self):
+        self.assertEqual(estimate_tokens(""), 0)
+        self.assertEqual(estimate_tokens("a" * 40), 10)
+        self.assertEqual(estimate_tokens("नमस्ते"), 6)
+    
+    def test_context_stays_within_budget(self):
+        sizes = []
+        for turns in (5, 50):
+            context = build_context(get_state({
+                "user_data": {"name": "Asha"},
+                "summary": "Asha runs a 20 seat sales team and wants a demo. " * 20,
+                "conversation_history": get_history(turns)
+            }), SETTINGS)
+            
+            sizes.append(estimate_tokens(context))
+            context = json.loads(context)
+            self.assertIn(f"question {turns - 1}", context["recent_turns"][-1]["user"])
+            self.assertTrue(context["summary"])
+        
+        self.assertTrue(all(size <= SETTINGS.context_token_budget for size in sizes))
+    
+    def test_short_conversations_go_in_whole(self):
+        history = get_history(3, length=1)
+        context = json.loads(build_context(get_state({"conversation_history": history}), SETTINGS))
+        
+        self.assertEqual([turn["user"] for turn in context["recent_turns"]], [turn["user_message"] for turn in history])
+    
+    def test_old_turns_are_summarized_once_a_batch_is_waiting(self):
+        history = get_history(4 + context_builder.SUMMARY_BATCH, length=1)
+        context_data = {"conversation_history": history, "summary_through": history[0]["timestamp"]}
+        state = get_state(context_data)
+        
+        self.assertEqual(len(get_unsummarized_turns(context_data, 4)), context_builder.SUMMARY_BATCH - 1)
+        
+        with patch("whatsapp_calling.whatsapp_integration.partition_dispatcher.dispatch_task") as dispatch_task:
+            schedule_summary(state, context_data, SETTINGS)
+            dispatch_task.assert_not_called()
+            
+            context_data["summary_through"] = ""
+            frappe.cache().delete(frappe.cache().make_key(context_builder.SUMMARY_QUEUED_KEY + "+15550002001"))
+            schedule_summary(state, context_data, SETTINGS)
+            schedule_summary(state, context_data, SETTINGS)
+        
+        dispatch_task.assert_called_once_with("+15550002001", context_builder.SUMMARY_TASK)
+    
+    def test_partition_task_folds_turns_into_the_summary(self):
+        history = get_history(4 + context_builder.SUMMARY_BATCH, length=1)
+        state = get_state({"summary": "Asha wants a demo.", "conversation_history": history})
+        engine = MagicMock(settings=SETTINGS)
+        engine.fold_summary.return_value = "Asha wants a demo for 20 seats."
+        
+        with patch("whatsapp_calling.bot.ai_engine.get_engine", return_value=engine), \
+                patch("whatsapp_calling.whatsapp_integration.webhook_handler.get_bot_conversation_state", return_value=state):
+            update_rolling_summary("+15550002001")
+        
+        summary, turns = engine.fold_summary.call_args.args
+        self.assertEqual(summary, "Asha wants a demo.")
+        self.assertEqual(turns, history[:context_builder.SUMMARY_BATCH])
+        
+        context_data = json.loads(state.context_data)
+        self.assertEqual(context_data["summary"], "Asha wants a demo for 20 seats.")
+        self.assertEqual(context_data["summary_through"], history[context_builder.SUMMARY_BATCH - 1]["timestamp"])
+        state.save.assert_called_once()
+    
+    def test_scheduled_summary_is_written_by_the_partition(self):
+        history = get_history(4 + context_builder.SUMMARY_BATCH, length=1)
+        context_data = {"summary": "Asha wants a demo.", "conversation_history": history}
+        state = get_state(context_data)
+        engine = MagicMock(settings=SETTINGS)
+        engine.fold_summary.return_value = "Asha wants a demo for 20 seats."
+        
+        # Test keys, so the site's own partitions are left alone
+        for name, value in (
+            ("PARTITION_KEY", "whatsapp_calling:test_bot_partition:"),
+            ("LEASE_KEY", "whatsapp_calling:test_bot_partition_lease:"),
+            ("STATS_KEY", "whatsapp_calling:test_bot_partition_stats:")
+        ):
+            patcher = patch.object(partition_dispatcher, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        
+        cache = frappe.cache()
+        partition = partition_dispatcher.get_partition(state.phone_number)
+        keys = [
+            cache.make_key(context_builder.SUMMARY_QUEUED_KEY + state.phone_number),
+            cache.make_key(partition_dispatcher.PARTITION_KEY + str(partition)),
+            cache.make_key(partition_dispatcher.STATS_KEY + str(partition))
+        ]
+        cache.delete(*keys)
+        self.addCleanup(cache.delete, *keys)
+        
+        with patch.object(partition_dispatcher, "schedule_partition") as schedule_partition, \
+                patch.object(frappe.db, "commit"), \
+                patch("whatsapp_calling.bot.ai_engine.get_engine", return_value=engine), \
+                patch("whatsapp_calling.whatsapp_integration.webhook_handler.get_bot_conversation_state", return_value=state):
+            schedule_summary(state, context_data, SETTINGS)
+            schedule_partition.assert_called_once_with(partition)
+            
+            self.assertEqual(partition_dispatcher.drain_partition(partition), 1)
+        
+        self.assertEqual(json.loads(state.context_data)["summary"], "Asha wants a demo for 20 seats.")
+        self.assertEqual(partition_dispatcher.get_partition_depth(partition), 0)
\ No newline at end of file
@@ -0,0 +1,162 @@
+"""
+Outbound Graph client tests against a local HTTP stand-in: retries with
+Retry-After, non-retryable errors, sends that must not be repeated, the
+circuit breaker and the token bucket
+"""
+
+import time
+import unittest
+from collections import Counter, deque
+
+from whatsapp_calling.tests.graph_stand_in import ACCESS_TOKEN, JSONHandler, StandInServer
+from whatsapp_calling.whatsapp_integration import graph_client
+from whatsapp_calling.whatsapp_integration.graph_client import (
+    CircuitBreaker, GraphAPIError, TokenBucket, get_backoff, graph_request
+)
+
+
+class GraphStandIn(JSONHandler):
+    """Answers each path with the queued (status, headers, body) responses, then 200"""
+    
+    requests = Counter()
+    responses = {}
+    
+    def do_GET(self):
+        self.do_POST()
+    
+    def do_POST(self):
+        path = self.path.strip("/")
+        GraphStandIn.requests[path] += 1
+        self.rfile.read(int(self.headers.get("Content-Length") or 0))
+        
+        if self.headers.get("Authorization") != f"Bearer {ACCESS_TOKEN}":
+            return self.reply(401, {"error": {"message": "Invalid OAuth access token", "code": 190}})
+        
+        queued = GraphStandIn.responses.get(path)
+        if queued:
+            status, headers, body = queued.popleft()
+            return self.reply(status, body, headers)
+        
+        self.reply(200, {"messages": [{"id": f"wamid.{GraphStandIn.requests[path]}"}]})
+
+
+class TestGraphClient(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.server = StandInServer(GraphStandIn)
+        cls.base_url = cls.server.base_url
+    
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.stop()
+    
+    def setUp(self):
+        GraphStandIn.requests.clear()
+        GraphStandIn.responses.clear()
+        graph_client._circuits.clear()
+    
+    def post(self, path, **kwargs):
+        return graph_request("POST", path, json={"to": "15550001"}, access_token=ACCESS_TOKEN,
+                             base_url=self.base_url, endpoint="messages", **kwargs)
+    
+    def get(self, path, **kwargs):
+        return graph_request("GET", path, access_token=ACCESS_TOKEN, base_url=self.base_url, **kwargs)
+    
+    def queue(self, path, *responses):
+        GraphStandIn.responses[path] = deque(responses)
+    
+    def test_throttled_calls_honour_retry_after(self):
+        self.queue("throttled/messages", (429, {"Retry-After": "0"}, {"error": {"code": 130429}}))
+        
+        result = self.post("throttled/messages")
+        
+        self.assertEqual(result["messages"][0]["id"], "wamid.2")
+        self.assertEqual(GraphStandIn.requests["throttled/messages"], 2)
+    
+    def test_throttling_error_codes_are_retried(self):
+        self.queue("pair/messages", (400, {"Retry-After": "0"}, {"error": {"code": 131056}}))
+        
+        self.post("pair/messages")
+        
+        self.assertEqual(GraphStandIn.requests["pair/messages"], 2)
+    
+    def test_client_errors_are_not_retried(self):
+        self.queue("invalid/messages", (400, {}, {"error": {"message": "Invalid parameter", "code": 100}}))
+        
+        with self.assertRaises(GraphAPIError) as context:
+            self.post("invalid/messages")
+        
+        self.assertEqual(context.exception.status_code, 400)
+        self.assertFalse(context.exception.retryable)
+        self.assertIn("Invalid parameter", str(context.exception))
+        self.assertEqual(GraphStandIn.requests["invalid/messages"], 1)
+    
+    def test_server_errors_are_retried_on_reads(self):
+        self.queue("account", (503, {"Retry-After": "0"}, {"error": {"message": "Service unavailable"}}))
+        
+        self.get("account")
+        
+        self.assertEqual(GraphStandIn.requests["account"], 2)
+    
+    def test_server_errors_do_not_repeat_a_send(self):
+        # Meta may have accepted the message before failing, and a send has no idempotency key
+        self.queue("flaky/messages", (500, {"Retry-After": "0"}, {"error": {"message": "Internal error"}}))
+        
+        with self.assertRaises(GraphAPIError) as context:
+            self.post("flaky/messages")
+        
+        self.assertTrue(context.exception.retryable)
+        self.assertFalse(context.exception.unsent)
+        self.assertEqual(GraphStandIn.requests["flaky/messages"], 1)
+    
+    def test_failed_connects_are_retried_on_sends(self):
+        with self.assertRaises(GraphAPIError) as context:
+            graph_request("POST", "closed/messages", json={"to": "15550001"}, access_token=ACCESS_TOKEN,
+                          base_url="http://127.0.0.1:1", endpoint="closed", max_attempts=2)
+        
+        self.assertTrue(context.exception.unsent)
+        self.assertEqual(graph_client.get_circuit("closed").failures, 2)
+    
+    def test_circuit_opens_after_repeated_failures(self):
+        failure = (503, {"Retry-After": "0"}, {"error": {"message": "Service unavailable"}})
+        self.queue("down", *[failure] * 10)
+        
+        with self.assertRaises(GraphAPIError):
+            self.get("down", max_attempts=graph_client.CIRCUIT_FAILURE_THRESHOLD)
+        
+        with self.assertRaises(GraphAPIError) as context:
+            self.get("down")
+        
+        # The open circuit fails fast without calling the API
+        self.assertIn("circuit open", str(context.exception))
+        self.assertEqual(GraphStandIn.requests["down"], graph_client.CIRCUIT_FAILURE_THRESHOLD)
+    
+    def test_circuit_half_opens_after_cooldown(self):
+        circuit = CircuitBreaker(threshold=2, cooldown=0.05)
+        circuit.record_failure()
+        circuit.record_failure()
+        
+        self.assertFalse(circuit.allow())
+        time.sleep(0.06)
+        self.assertTrue(circuit.allow())
+        # Only the trial call goes through until it succeeds
+        self.assertFalse(circuit.allow())
+        
+        circuit.record_success()
+        self.assertTrue(circuit.allow())
+        self.assertFalse(circuit.is_open)
+    
+    def test_token_bucket_limits_to_the_rate(self):
+        bucket = TokenBucket(rate=10)
+        waits = [bucket.take() for _ in range(11)]
+        
+        self.assertEqual(waits[:10], [0] * 10)
+        self.assertGreater(waits[10], 0)
+        self.assertLessEqual(waits[10], 0.1)
+    
+    def test_backoff_is_capped_and_jittered(self):
+        self.assertEqual(get_backoff(1, "2"), 2.0)
+        self.assertEqual(get_backoff(1, "600"), graph_client.BACKOFF_MAX_SECONDS)
+        
+        for attempt in range(1, 12):
+            self.assertLessEqual(get_backoff(attempt), graph_client.BACKOFF_MAX_SECONDS)
\ No newline at end of file
@@ -0,0 +1,138 @@
+"""
+Graph API emulator tests: the app's outbound clients against the emulated
+messages and media endpoints, injected faults, the throughput cap and signed
+status webhooks
+"""
+
+import hashlib
+import hmac
+import json
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import frappe
+
+from whatsapp_calling.tests.performance.graph_emulator import GraphEmulator, LatencyModel
+from whatsapp_calling.whatsapp_integration import graph_client
+from whatsapp_calling.whatsapp_integration.graph_client import GraphAPIError, get_base_url, graph_request
+from whatsapp_calling.whatsapp_integration.media_pipeline import fetch_media
+
+
+ACCESS_TOKEN = "test-access-token"
+WEBHOOK_SECRET = "test-webhook-secret"
+
+
+class WebhookReceiver(BaseHTTPRequestHandler):
+    """Collects the status callbacks posted by the emulator"""
+    
+    posts = []
+    
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get("Content-Length") or 0))
+        WebhookReceiver.posts.append((self.headers.get("X-Hub-Signature-256"), body))
+        self.send_response(200)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+    
+    def log_message(self, *args):
+        pass
+
+
+class TestGraphEmulator(unittest.TestCase):
+    def setUp(self):
+        graph_client._circuits.clear()
+        self.emulators = []
+    
+    def tearDown(self):
+        for emulator in self.emulators:
+            emulator.stop()
+    
+    def start(self, **kwargs):
+        emulator = GraphEmulator(**kwargs)
+        self.emulators.append(emulator)
+        return emulator, f"{emulator.start()}/{graph_client.DEFAULT_GRAPH_API_VERSION}"
+    
+    def send(self, base_url, to="15550000001", **kwargs):
+        return graph_request(
+            "POST", "100000000000001/messages",
+            json={"messaging_product": "whatsapp", "to": to, "type": "text", "text": {"body": "Hi"}},
+            access_token=ACCESS_TOKEN, endpoint="messages", base_url=base_url, **kwargs
+        )
+    
+    def test_base_url_comes_from_the_settings(self):
+        settings = frappe._dict(graph_api_url="http://127.0.0.1:8090/", graph_api_version="v19.0")
+        
+        self.assertEqual(get_base_url(settings), "http://127.0.0.1:8090/v19.0")
+        self.assertEqual(get_base_url(frappe._dict()), graph_client.GRAPH_API_BASE_URL)
+    
+    def test_messages_and_media_endpoints(self):
+        emulator, base_url = self.start(media_bytes=4096)
+        target_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, target_dir)
+        
+        response = self.send(base_url)
+        stored = fetch_media("1234567890123456", ACCESS_TOKEN, target_dir, base_url=base_url)
+        
+        self.assertTrue(response["messages"][0]["id"].startswith("wamid."))
+        self.assertEqual(stored["size"], 4096)
+        self.assertEqual(emulator.get_stats()["downloads"], 1)
+    
+    def test_injected_errors_are_raised_without_repeating_the_send(self):
+        emulator, base_url = self.start(error_5xx=1.0)
+        
+        with self.assertRaises(GraphAPIError) as context:
+            self.send(base_url, max_attempts=2)
+        
+        self.assertTrue(context.exception.retryable)
+        self.assertEqual(sum(count for key, count in emulator.get_stats().items() if key.startswith("injected_")), 1)
+    
+    def test_throughput_cap_answers_429(self):
+        emulator, base_url = self.start(throughput=3)
+        
+        for _ in range(3):
+            self.send(base_url)
+        
+        with self.assertRaises(GraphAPIError) as context:
+            self.send(base_url, max_attempts=1)
+        
+        self.assertEqual(context.exception.status_code, 429)
+        self.assertEqual(emulator.get_stats()["throttled"], 1)
+    
+    def test_latency_distributions(self):
+        self.assertEqual(LatencyModel.parse("fixed:20").sample(), 0.02)
+        
+        model = LatencyModel.parse("lognormal:80:40", seed=1)
+        samples = [model.sample() for _ in range(2000)]
+        self.assertAlmostEqual(sum(samples) / len(samples), 0.08, delta=0.01)
+        self.assertTrue(all(sample >= 0 for sample in samples))
+    
+    def test_status_webhooks_are_signed_and_posted(self):
+        WebhookReceiver.posts = []
+        receiver = ThreadingHTTPServer(("127.0.0.1", 0), WebhookReceiver)
+        threading.Thread(target=receiver.serve_forever, daemon=True).start()
+        self.addCleanup(receiver.server_close)
+        self.addCleanup(receiver.shutdown)
+        
+        _, base_url = self.start(
+            webhook_url=f"http://127.0.0.1:{receiver.server_port}/webhook", webhook_secret=WEBHOOK_SECRET,
+            status_delays=(("sent", 0.05), ("delivered", 0.1), ("read", 0.15))
+        )
+        wamid = self.send(base_url)["messages"][0]["id"]
+        
+        deadline = time.monotonic() + 5
+        while time.monotonic() < deadline and len(WebhookReceiver.posts) < 3:
+            time.sleep(0.1)
+        
+        statuses = []
+        for signature, body in WebhookReceiver.posts:
+            expected = "sha256=" + hmac.new(WEBHOOK_SECRET.encode(), body, hashlib.sha256).hexdigest()
+            self.assertEqual(signature, expected)
+            for entry in json.loads(body)["entry"]:
+                statuses.extend(entry["changes"][0]["value"]["statuses"])
+        
+        self.assertEqual([status["status"] for status in statuses], ["sent", "delivered", "read"])
+        self.assertTrue(all(status["id"] == wamid for status in statuses))
\ No newline at end of file
@@ -0,0 +1,54 @@
+"""
+Local intent classifier tests: rule matches for small talk, the trained model,
+routing below the confidence threshold and the offline evaluation report
+"""
+
+import unittest
+
+from whatsapp_calling.bot.intent_classifier import classify, evaluate, match_rules, train_model
+
+
+TRAINING_PAIRS = [
+    (f"{prefix} {subject}", intent)
+    for intent, prefix, subjects in (
+        ("product_inquiry", "tell me about", ("your crm", "the features", "integrations", "your product", "the app")),
+        ("support", "i need help with", ("login", "my account", "the setup", "an error", "password reset")),
+        ("appointment", "can we meet on", ("monday", "tuesday", "friday", "next week", "the weekend"))
+    )
+    for subject in subjects
+] * 4
+
+
+class TestIntentClassifier(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.model = train_model(TRAINING_PAIRS)
+    
+    def test_small_talk_is_settled_by_rules(self):
+        self.assertEqual(match_rules("Hi there! 👋"), ("greeting", 1.0, "rules"))
+        self.assertEqual(match_rules("ok thanks a lot"), ("goodbye", 1.0, "rules"))
+        self.assertEqual(classify("Good morning", model=self.model)[0], "greeting")
+    
+    def test_rules_do_not_guess_on_longer_or_mixed_messages(self):
+        self.assertIsNone(match_rules("What does the pro plan cost, and can I get a refund?"))
+        self.assertIsNone(match_rules("hi, I want to know more"))
+    
+    def test_model_predicts_trained_intents(self):
+        self.assertEqual(self.model.predict("tell me about your integrations")[0], "product_inquiry")
+        self.assertEqual(self.model.predict("help with login please")[0], "support")
+        self.assertEqual(classify("can we meet on friday", 0.5, self.model)[0], "appointment")
+    
+    def test_low_confidence_goes_to_the_llm(self):
+        self.assertIsNone(classify("something unrelated entirely", 0.99, self.model))
+        self.assertIsNone(classify("", model=self.model))
+    
+    def test_evaluation_reports_share_accuracy_and_latency(self):
+        report = evaluate(TRAINING_PAIRS, thresholds=(0.5, 0.99), holdout=0.25, llm_latency_ms=800)
+        
+        self.assertEqual(report["train"] + report["test"], len(TRAINING_PAIRS))
+        self.assertEqual([row["threshold"] for row in report["rows"]], [0.5, 0.99])
+        
+        loose, strict = report["rows"]
+        self.assertGreaterEqual(loose["local_share"], strict["local_share"])
+        self.assertGreaterEqual(loose["local_accuracy"], 0.9)
+        self.assertLess(loose["expected_latency_ms"], 800)
\ No newline at end of file
@@ -0,0 +1,167 @@
+"""
+Media pipeline tests against a local HTTP stand-in for the Graph media
+endpoints: id resolution, chunked streaming, content-hash dedup and retries
+"""
+
+import hashlib
+import os
+import shutil
+import tempfile
+import unittest
+from collections import Counter
+
+from whatsapp_calling.tests.graph_stand_in import ACCESS_TOKEN, JSONHandler, StandInServer
+from whatsapp_calling.whatsapp_integration.media_pipeline import (
+    MediaDownloadError, fetch_all, fetch_media, get_media_reference
+)
+
+
+VIDEO = os.urandom(3 * 1024 * 1024 + 17)
+IMAGE = os.urandom(50 * 1024)
+
+# media id -> (content, mime type)
+MEDIA = {
+    "video-1": (VIDEO, "video/mp4"),
+    "image-1": (IMAGE, "image/jpeg"),
+    "image-copy": (IMAGE, "image/jpeg"),
+    "flaky-1": (IMAGE, "image/jpeg")
+}
+
+
+class GraphStandIn(JSONHandler):
+    """GET /<media_id> returns the download URL, GET /files/<media_id> streams the content"""
+    
+    requests = Counter()
+    failures = {}
+    
+    def do_GET(self):
+        path = self.path.strip("/")
+        GraphStandIn.requests[path] += 1
+        
+        if self.headers.get("Authorization") != f"Bearer {ACCESS_TOKEN}":
+            return self.send_error(401)
+        
+        media_id = path.split("/")[-1]
+        if media_id not in MEDIA:
+            return self.send_error(404)
+        
+        if GraphStandIn.failures.get(path, 0) > 0:
+            GraphStandIn.failures[path] -= 1
+            return self.send_error(503)
+        
+        content, mime_type = MEDIA[media_id]
+        
+        if path.startswith("files/"):
+            self.send_response(200)
+            self.send_header("Content-Type", mime_type)
+            self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+            for start in range(0, len(content), 100 * 1024):
+                chunk = content[start:start + 100 * 1024]
+                self.wfile.write(f"{len(chunk):x}\r\n".encode() + chunk + b"\r\n")
+            self.wfile.write(b"0\r\n\r\n")
+            return
+        
+        self.reply(200, {
+            "url": f"{self.server.base_url}/files/{media_id}",
+            "mime_type": mime_type,
+            "sha256": hashlib.sha256(content).hexdigest(),
+            "file_size": len(content),
+            "id": media_id
+        })
+
+
+class TestMediaPipeline(unittest.TestCase):
+    """Downloads go through the stand-in and land in a temporary file store"""
+    
+    @classmethod
+    def setUpClass(cls):
+        cls.server = StandInServer(GraphStandIn)
+        cls.base_url = cls.server.base_url
+    
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.stop()
+    
+    def setUp(self):
+        self.target_dir = tempfile.mkdtemp()
+        GraphStandIn.requests.clear()
+        GraphStandIn.failures.clear()
+    
+    def tearDown(self):
+        shutil.rmtree(self.target_dir)
+    
+    def fetch(self, media_id, **kwargs):
+        return fetch_media(media_id, ACCESS_TOKEN, self.target_dir, base_url=self.base_url,
+                           retry_backoff=0, **kwargs)
+    
+    def test_streams_media_to_a_content_addressed_file(self):
+        result = self.fetch("video-1")
+        
+        self.assertEqual(result["sha256"], hashlib.sha256(VIDEO).hexdigest())
+        self.assertEqual(result["size"], len(VIDEO))
+        self.assertTrue(result["file_name"].endswith(".mp4"))
+        with open(result["path"], "rb") as f:
+            self.assertEqual(f.read(), VIDEO)
+        
+        # No partial downloads left behind
+        self.assertEqual(os.listdir(self.target_dir), [result["file_name"]])
+    
+    def test_identical_content_is_stored_once(self):
+        first = self.fetch("image-1")
+        second = self.fetch("image-copy")
+        
+        self.assertEqual(first["path"], second["path"])
+        self.assertEqual(len(os.listdir(self.target_dir)), 1)
+    
+    def test_transient_errors_are_retried(self):
+        GraphStandIn.failures["files/flaky-1"] = 2
+        
+        result = self.fetch("flaky-1")
+        
+        self.assertEqual(result["sha256"], hashlib.sha256(IMAGE).hexdigest())
+        self.assertEqual(GraphStandIn.requests["files/flaky-1"], 3)
+        # Every attempt resolves a fresh download URL
+        self.assertEqual(GraphStandIn.requests["flaky-1"], 3)
+    
+    def test_missing_media_is_not_retried(self):
+        with self.assertRaises(MediaDownloadError) as context:
+            self.fetch("expired-1")
+        
+        self.assertFalse(context.exception.retryable)
+        self.assertEqual(GraphStandIn.requests["expired-1"], 1)
+    
+    def test_oversized_media_is_rejected(self):
+        with self.assertRaises(MediaDownloadError):
+            self.fetch("video-1", max_bytes=1024 * 1024)
+        
+        self.assertEqual(os.listdir(self.target_dir), [])
+    
+    def test_fetch_all_downloads_in_parallel(self):
+        references = [
+            {"media_id": media_id, "message_id": f"wamid.{media_id}", "mime_type": mime_type}
+            for media_id, (_, mime_type) in MEDIA.items()
+        ] + [{"media_id": "expired-1", "message_id": "wamid.expired-1"}]
+        
+        results = fetch_all(references, ACCESS_TOKEN, self.target_dir, base_url=self.base_url,
+                            workers=3, retry_backoff=0)
+        
+        self.assertIsInstance(results["expired-1"], MediaDownloadError)
+        self.assertEqual(results["video-1"]["size"], len(VIDEO))
+        self.assertEqual(results["image-1"]["path"], results["image-copy"]["path"])
+        self.assertEqual(len(os.listdir(self.target_dir)), 2)
+    
+    def test_media_reference_from_webhook_message(self):
+        message = {
+            "id": "wamid.TEST",
+            "type": "document",
+            "document": {"id": "doc-1", "mime_type": "application/pdf", "filename": "quote.pdf"}
+        }
+        
+        self.assertEqual(get_media_reference(message), {
+            "message_id": "wamid.TEST",
+            "media_id": "doc-1",
+            "mime_type": "application/pdf",
+            "filename": "quote.pdf"
+        })
+        self.assertIsNone(get_media_reference({"id": "wamid.TEXT", "type": "text", "text": {"body": "hi"}}))
\ No newline at end of file
@@ -0,0 +1,242 @@
+"""
+Outbound worker tests against a local HTTP stand-in for the Graph messages
+endpoint: sent, throttled and rejected messages, many sends in flight, and
+claiming, flushing and requeueing jobs through the Redis queue
+"""
+
+import asyncio
+import json
+import os
+import time
+import unittest
+from unittest.mock import patch
+
+import frappe
+
+from whatsapp_calling.tests.graph_stand_in import ACCESS_TOKEN, MessagesStandIn, StandInServer
+from whatsapp_calling.whatsapp_integration import outbound_queue, outbound_worker
+from whatsapp_calling.whatsapp_integration.outbound_queue import (
+    record_results, requeue_abandoned, requeue_unfinished, send_heartbeat
+)
+from whatsapp_calling.whatsapp_integration.outbound_worker import OutboundWorker
+
+
+WORKER = "test-worker"
+OTHER_WORKER = "test-worker-other"
+
+
+class TestOutboundWorker(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.server = StandInServer(MessagesStandIn)
+    
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.stop()
+    
+    def setUp(self):
+        MessagesStandIn.reset()
+        
+        # Test keys, so a worker running on this site keeps its queue
+        for name, value in (
+            ("OUTBOUND_KEY", "whatsapp_calling:test_outbound"),
+            ("PROCESSING_KEY", "whatsapp_calling:test_outbound_processing:"),
+            ("WORKERS_KEY", "whatsapp_calling:test_outbound_workers")
+        ):
+            patcher = patch.object(outbound_queue, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        
+        self.clear_queue()
+        self.addCleanup(self.clear_queue)
+    
+    def clear_queue(self):
+        cache = frappe.cache()
+        cache.delete(
+            cache.make_key(outbound_queue.OUTBOUND_KEY),
+            cache.make_key(outbound_queue.WORKERS_KEY),
+            *[cache.make_key(outbound_queue.PROCESSING_KEY + worker) for worker in (WORKER, OTHER_WORKER)]
+        )
+    
+    def job(self, to):
+        return {
+            "message": f"MSG-{to}",
+            "message_id": f"queued-{to}",
+            "phone_number_id": "test-outbound",
+            "payload": {"messaging_product": "whatsapp", "to": to, "type": "text", "text": {"body": "Hello"}}
+        }
+    
+    def get_worker(self, concurrency=50):
+        worker = OutboundWorker(concurrency, WORKER, base_url=self.server.base_url)
+        worker.access_token = ACCESS_TOKEN
+        worker.rate = 1000
+        return worker
+    
+    def run_worker(self, worker, calls):
+        """Run coroutines from the worker with its HTTP client open"""
+        async def run():
+            await worker.open_client()
+            try:
+                return await asyncio.gather(*calls())
+            finally:
+                await worker.close_client()
+        
+        return asyncio.run(run())
+    
+    def deliver(self, jobs, concurrency=50):
+        """Deliver jobs concurrently through a worker pointed at the stand-in"""
+        worker = self.get_worker(concurrency)
+        return worker, self.run_worker(worker, lambda: [worker.deliver(job) for job in jobs])
+    
+    def push(self, *jobs, key=None):
+        cache = frappe.cache()
+        raw = [json.dumps(job) for job in jobs]
+        # On the raw client, as the queue itself pushes
+        cache.pipeline().rpush(key or cache.make_key(outbound_queue.OUTBOUND_KEY), *raw).execute()
+        return raw
+    
+    def get_list(self, key):
+        cache = frappe.cache()
+        [items] = cache.pipeline().lrange(cache.make_key(key), 0, -1).execute()
+        return [frappe.safe_decode(item) for item in items]
+    
+    def test_default_name_is_unique_per_process(self):
+        self.assertTrue(OutboundWorker().name.endswith(f"-{os.getpid()}"))
+    
+    def test_sent_message_returns_wamid(self):
+        worker, results = self.deliver([self.job("15550000001")])
+        
+        self.assertEqual(results, [("sent", "wamid.15550000001")])
+        self.assertEqual(len(worker.calls), 1)
+    
+    def test_throttled_message_is_retried(self):
+        MessagesStandIn.throttled.add("15550000002")
+        
+        worker, results = self.deliver([self.job("15550000002")])
+        
+        self.assertEqual(results, [("sent", "wamid.15550000002")])
+        self.assertEqual(MessagesStandIn.requests["15550000002"], 2)
+        self.assertTrue(worker.calls[-1][2])
+    
+    def test_rejected_message_fails_without_retry(self):
+        MessagesStandIn.invalid.add("15550000003")
+        
+        _, results = self.deliver([self.job("15550000003")])
+        
+        self.assertEqual(results, [("failed", None)])
+        self.assertEqual(MessagesStandIn.requests["15550000003"], 1)
+    
+    def test_sends_are_in_flight_concurrently(self):
+        MessagesStandIn.delay = 0.2
+        jobs = [self.job(f"1555001{index:04d}") for index in range(40)]
+        
+        started = time.monotonic()
+        _, results = self.deliver(jobs)
+        
+        self.assertEqual(len([status for status, _ in results if status == "sent"]), 40)
+        # Sequential sends would take 8 seconds
+        self.assertLess(time.monotonic() - started, 2)
+    
+    def test_wamid_is_written_as_soon_as_the_send_returns(self):
+        job = self.job("15550000004")
+        worker = self.get_worker()
+        
+        with patch.object(outbound_worker, "record_wamid") as record_wamid:
+            self.run_worker(worker, lambda: [worker.process(json.dumps(job))])
+        
+        record_wamid.assert_called_once_with("MSG-15550000004", "queued-15550000004", "wamid.15550000004")
+        # The status still waits for the batched flush
+        self.assertEqual(worker.results[0][1], ("MSG-15550000004", "queued-15550000004", "sent", "wamid.15550000004"))
+    
+    def test_send_that_raised_is_recorded_as_failed(self):
+        job = self.job("15550000005")
+        worker = self.get_worker()
+        
+        async def deliver(job):
+            raise ValueError("Unexpected response")
+        
+        with patch.object(worker, "deliver", deliver):
+            self.run_worker(worker, lambda: [worker.process(json.dumps(job))])
+        
+        self.assertEqual(worker.results[0][1], ("MSG-15550000005", "queued-15550000005", "failed", None))
+    
+    def test_claim_keeps_jobs_in_processing_and_drops_sent_ones(self):
+        jobs = [self.job(f"1555002{index:04d}") for index in range(3)]
+        raw = self.push(*jobs)
+        queued = {jobs[0]["message"], jobs[2]["message"]}
+        
+        with patch.object(outbound_worker, "get_queued_messages", return_value=queued):
+            claimed = self.get_worker().claim(10)
+        
+        self.assertEqual([frappe.safe_decode(item) for item in claimed], [raw[0], raw[2]])
+        self.assertEqual(self.get_list(outbound_queue.OUTBOUND_KEY), [])
+        self.assertEqual(self.get_list(outbound_queue.PROCESSING_KEY + WORKER), [raw[0], raw[2]])
+    
+    def test_flush_records_results_and_finishes_jobs(self):
+        job = self.job("15550000006")
+        worker = self.get_worker()
+        
+        with patch.object(outbound_worker, "get_queued_messages", return_value={job["message"]}):
+            self.push(job)
+            [raw] = worker.claim(10)
+        
+        worker.results.append((raw, (job["message"], job["message_id"], "sent", "wamid.15550000006")))
+        with patch.object(outbound_worker, "record_results") as record:
+            worker.flush()
+        
+        record.assert_called_once_with([(job["message"], job["message_id"], "sent", "wamid.15550000006")])
+        self.assertEqual(worker.results, [])
+        self.assertEqual(self.get_list(outbound_queue.PROCESSING_KEY + WORKER), [])
+    
+    def test_flush_keeps_results_when_recording_fails(self):
+        job = self.job("15550000007")
+        worker = self.get_worker()
+        
+        with patch.object(outbound_worker, "get_queued_messages", return_value={job["message"]}):
+            self.push(job)
+            [raw] = worker.claim(10)
+        
+        result = (raw, (job["message"], job["message_id"], "sent", "wamid.15550000007"))
+        worker.results.append(result)
+        with patch.object(outbound_worker, "record_results", side_effect=Exception("Lost connection")), \
+                patch.object(outbound_worker, "reconnect"):
+            worker.flush()
+        
+        self.assertEqual(worker.results, [result])
+        self.assertEqual(self.get_list(outbound_queue.PROCESSING_KEY + WORKER), [raw])
+    
+    def test_record_results_writes_wamid_and_status_of_queued_rows(self):
+        results = [
+            ("MSG-1", "queued-1", "sent", "wamid.1"),
+            ("MSG-2", "queued-2", "failed", None)
+        ]
+        
+        with patch.object(frappe.db, "sql") as sql, patch.object(frappe.db, "commit"), \
+                patch.object(outbound_queue, "queue_status_events") as queue_status_events:
+            record_results(results)
+        
+        messages, conversations = sql.call_args_list
+        self.assertIn("status = 'queued'", messages.args[0])
+        self.assertEqual(messages.args[1][:8], ["MSG-1", "wamid.1", "MSG-2", "queued-2", "MSG-1", "sent", "MSG-2", "failed"])
+        # Conversations match the queued id or, once record_wamid swapped it, the wamid
+        self.assertEqual(conversations.args[1][-2:], ["queued-1", "wamid.1"])
+        queue_status_events.assert_called_once_with({"queued-1": "sent", "queued-2": "failed"})
+    
+    def test_requeue_puts_unfinished_jobs_back_first(self):
+        cache = frappe.cache()
+        unfinished = self.push(self.job("15550000008"), key=cache.make_key(outbound_queue.PROCESSING_KEY + WORKER))
+        waiting = self.push(self.job("15550000009"))
+        
+        self.assertEqual(requeue_unfinished(WORKER), 1)
+        self.assertEqual(self.get_list(outbound_queue.OUTBOUND_KEY), unfinished + waiting)
+        self.assertEqual(self.get_list(outbound_queue.PROCESSING_KEY + WORKER), [])
+    
+    def test_only_jobs_of_stopped_workers_are_requeued(self):
+        cache = frappe.cache()
+        live = self.push(self.job("15550000010"), key=cache.make_key(outbound_queue.PROCESSING_KEY + WORKER))
+        stopped = self.push(self.job("15550000011"), key=cache.make_key(outbound_queue.PROCESSING_KEY + OTHER_WORKER))
+        send_heartbeat(WORKER)
+        
+        self.assertEqual(requeue_abandoned(), 1)
+        self.assertEqual(self.get_list(outbound_queue.OUTBOUND_KEY), stopped)
+        self.assertEqual(self.get_list(outbound_queue.PROCESSING_KEY + WORKER), live)
\ No newline at end of file
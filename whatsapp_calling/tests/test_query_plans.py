@@ -0,0 +1,208 @@
+"""
+Query-plan regression tests: EXPLAIN every hot query issued by the webhook,
+bot and calling handlers and fail when one of them falls back to a full scan
+"""
+
+import unittest
+import frappe
+from frappe.utils import add_to_date, now_datetime
+
+
+SEED_ROWS = 500
+
+
+class TestQueryPlans(unittest.TestCase):
+    """Hot queries must be served from an index"""
+    
+    @classmethod
+    def setUpClass(cls):
+        if frappe.db.db_type != "mariadb":
+            raise unittest.SkipTest("Query plan checks target MariaDB EXPLAIN output")
+        
+        # With near-empty tables the optimizer prefers scans regardless of indexes
+        cls.seeded = {
+            "WhatsApp Message": seed_messages(),
+            "Bot Conversation State": seed_conversation_states(),
+            "WhatsApp Webhook Event": seed_webhook_events(),
+            "WhatsApp Call Log": seed_call_logs()
+        }
+        frappe.db.sql("analyze table `tabWhatsApp Message`, `tabBot Conversation State`, "
+                      "`tabWhatsApp Webhook Event`, `tabWhatsApp Call Log`")
+    
+    @classmethod
+    def tearDownClass(cls):
+        # ANALYZE TABLE commits implicitly, so a rollback would leave the seed rows behind
+        for doctype, names in cls.seeded.items():
+            frappe.db.delete(doctype, {"name": ["in", names]})
+        frappe.db.commit()
+    
+    def assertIndexed(self, query, table):
+        """EXPLAIN a query and check the named table is not read with a full scan"""
+        plan = frappe.db.sql(f"explain {query}", as_dict=True)
+        rows = [row for row in plan if row.table == table]
+        
+        self.assertTrue(rows, f"{table} missing from plan: {plan}")
+        
+        for row in rows:
+            self.assertNotEqual(row.type, "ALL", f"Full table scan on {table}: {row}")
+            self.assertTrue(row.key, f"No index used on {table}: {row}")
+    
+    def test_message_by_message_id(self):
+        """Duplicate checks look a message up by its wamid"""
+        query = frappe.get_all(
+            "WhatsApp Message",
+            filters={"message_id": ["in", ["wamid.TEST-1", "wamid.TEST-2"]]},
+            pluck="message_id",
+            run=0
+        )
+        self.assertIndexed(query, "tabWhatsApp Message")
+    
+    def test_messages_by_conversation(self):
+        """Bot context and conversation views read a conversation in timestamp order"""
+        query = frappe.get_all(
+            "WhatsApp Message",
+            filters={"conversation_id": "CONV-TEST-1"},
+            fields=["message_body", "direction", "timestamp"],
+            order_by="timestamp desc",
+            limit=5,
+            run=0
+        )
+        self.assertIndexed(query, "tabWhatsApp Message")
+    
+    def test_messages_by_phone(self):
+        """Phone history reads through the E.164 column"""
+        query = frappe.get_all(
+            "WhatsApp Message",
+            filters={"whatsapp_phone_e164": "+15550000001"},
+            fields=["message_id", "timestamp"],
+            order_by="timestamp desc",
+            limit=50,
+            run=0
+        )
+        self.assertIndexed(query, "tabWhatsApp Message")
+    
+    def test_message_changes_since(self):
+        """History polling reads a number's changes after a (modified, name) token"""
+        query = """
+            select name, message_id, status, modified
+            from `tabWhatsApp Message`
+            where whatsapp_phone_e164 = '+15550000001'
+            and (modified > '2024-01-01 00:00:00' or (modified = '2024-01-01 00:00:00' and name > 'a'))
+            order by modified asc, name asc
+            limit 51
+        """
+        self.assertIndexed(query, "tabWhatsApp Message")
+    
+    def test_active_conversation_state(self):
+        """Every inbound message looks up the sender's active bot state"""
+        query = frappe.get_all(
+            "Bot Conversation State",
+            filters={"whatsapp_phone_e164": "+15550000001", "is_active": 1},
+            pluck="name",
+            limit=1,
+            run=0
+        )
+        self.assertIndexed(query, "tabBot Conversation State")
+    
+    def test_inactive_conversation_cleanup(self):
+        """The cleanup job finds active states past the inactivity cutoff"""
+        query = frappe.get_all(
+            "Bot Conversation State",
+            filters={"is_active": 1, "last_interaction": ["<", add_to_date(now_datetime(), hours=-24)]},
+            pluck="name",
+            run=0
+        )
+        self.assertIndexed(query, "tabBot Conversation State")
+    
+    def test_claim_pending_webhook_events(self):
+        """Inbound queue consumers claim the oldest pending events"""
+        query = """
+            select name, payload, attempts
+            from `tabWhatsApp Webhook Event`
+            where status = 'Pending'
+            order by received_at asc
+            limit 100
+        """
+        self.assertIndexed(query, "tabWhatsApp Webhook Event")
+    
+    def test_call_log_by_session(self):
+        """MediaSoup callbacks resolve the call log from the session id"""
+        query = frappe.get_all(
+            "WhatsApp Call Log",
+            filters={"session_id": "session-test-1"},
+            pluck="name",
+            limit=1,
+            run=0
+        )
+        self.assertIndexed(query, "tabWhatsApp Call Log")
+    
+    def test_active_calls(self):
+        """The call quality monitor polls ringing and connected calls"""
+        query = frappe.get_all(
+            "WhatsApp Call Log",
+            filters={"status": ["in", ["Ringing", "Connected"]]},
+            fields=["name", "session_id", "call_id"],
+            run=0
+        )
+        self.assertIndexed(query, "tabWhatsApp Call Log")
+
+
+def seed_rows(doctype, fields, make_row):
+    now = now_datetime()
+    rows = [
+        (frappe.generate_hash(length=10), now, now, "Administrator", "Administrator", *make_row(i))
+        for i in range(SEED_ROWS)
+    ]
+    frappe.db.bulk_insert(
+        doctype,
+        ["name", "creation", "modified", "owner", "modified_by", *fields],
+        rows,
+        ignore_duplicates=True
+    )
+    return [row[0] for row in rows]
+
+
+def seed_messages():
+    return seed_rows(
+        "WhatsApp Message",
+        ["message_id", "conversation_id", "from_number", "to_number", "whatsapp_phone_e164",
+         "message_type", "message_body", "direction", "status", "timestamp"],
+        lambda i: (
+            f"wamid.SEED-{i}", f"CONV-SEED-{i % 50}", f"1555{i:07d}", "15550009999",
+            f"+1555{i % 50:07d}", "text", "seed", "received", "delivered",
+            add_to_date(now_datetime(), minutes=-i)
+        )
+    )
+
+
+def seed_conversation_states():
+    return seed_rows(
+        "Bot Conversation State",
+        ["conversation_id", "phone_number", "whatsapp_phone_e164", "is_active", "last_interaction"],
+        lambda i: (
+            f"CONV-SEED-{i}", f"1555{i:07d}", f"+1555{i:07d}", i % 10 == 0,
+            add_to_date(now_datetime(), hours=-i)
+        )
+    )
+
+
+def seed_webhook_events():
+    return seed_rows(
+        "WhatsApp Webhook Event",
+        ["status", "received_at", "attempts", "payload"],
+        lambda i: (
+            "Pending" if i % 20 == 0 else "Processed",
+            add_to_date(now_datetime(), seconds=-i), 0, "{}"
+        )
+    )
+
+
+def seed_call_logs():
+    return seed_rows(
+        "WhatsApp Call Log",
+        ["call_id", "session_id", "from_number", "to_number", "direction", "status"],
+        lambda i: (
+            f"call-seed-{i}", f"session-seed-{i}", f"1555{i:07d}", "15550009999",
+            "Incoming", "Connected" if i % 25 == 0 else "Ended"
+        )
+    )
\ No newline at end of file
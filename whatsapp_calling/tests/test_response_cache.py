@@ -0,0 +1,116 @@
+"""
+Bot response cache tests: the LRU with TTL, cache keys, replies served to a
+repeated question without an LLM call, intent opt-out and hit statistics
+"""
+
+import json
+import unittest
+from unittest.mock import MagicMock, patch
+
+import frappe
+
+from whatsapp_calling.bot import response_cache
+from whatsapp_calling.bot.ai_engine import AIBotEngine
+from whatsapp_calling.bot.response_cache import LRUCache, get_cache_key, get_response_cache_stats
+
+
+class TestResponseCache(unittest.TestCase):
+    def setUp(self):
+        response_cache._local.clear()
+        
+        self.engine = AIBotEngine.__new__(AIBotEngine)
+        self.engine.settings = frappe._dict(
+            structured_bot_replies=1, local_intent_classifier=1, bot_response_cache=1,
+            response_cache_excluded_intents="complaint, lead_qualification"
+        )
+        self.engine.ai_provider = "claude"
+        self.engine.last_tokens = 0
+        
+        # A company of its own keeps entries from earlier runs out of this test
+        company_info = {"company_name": frappe.generate_hash(length=10), "industry": "Technology"}
+        
+        for method, value in (
+            ("get_conversation_context", "{}"), ("send_bot_response", None),
+            ("evaluate_lead_qualification", None), ("get_company_info", company_info)
+        ):
+            patcher = patch.object(self.engine, method, return_value=value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        
+        patcher = patch("whatsapp_calling.bot.ai_engine.record_llm_turn")
+        self.record_llm_turn = patcher.start()
+        self.addCleanup(patcher.stop)
+    
+    def get_state(self, user_data=None):
+        state = MagicMock(context_data=json.dumps({"user_data": user_data or {}}), language="en")
+        state.is_escalated = False
+        state.lead_score = 0
+        return state
+    
+    def ask(self, message, intent, reply="Our plans start at $10 a month. Shall I share details? 💬", user_data=None, local=True):
+        def generate_structured_reply(message_body, context):
+            self.engine.last_tokens = 150
+            return {"intent": intent, "reply": reply, "language": "en"}
+        
+        state = self.get_state(user_data)
+        with patch.object(self.engine, "classify_locally", return_value=(intent, 0.9, "rules") if local else None), \
+                patch.object(self.engine, "generate_structured_reply", side_effect=generate_structured_reply) as llm, \
+                patch.object(self.engine, "update_conversation_state") as update_conversation_state:
+            self.engine.process_message("15550000001", message, state, "wamid.1")
+        
+        self.last_intent = update_conversation_state.call_args.args[1]
+        return llm.call_count
+    
+    def test_lru_evicts_oldest_and_expires_entries(self):
+        cache = LRUCache(2)
+        cache.set("a", 1, 60)
+        cache.set("b", 2, 60)
+        cache.get("a")
+        cache.set("c", 3, 60)
+        
+        self.assertEqual(cache.get("a"), 1)
+        self.assertIsNone(cache.get("b"))
+        
+        cache.set("c", 3, -1)
+        self.assertIsNone(cache.get("c"))
+    
+    def test_keys_ignore_punctuation_and_case(self):
+        self.assertEqual(get_cache_key("Price?", "en", "v1"), get_cache_key("  price!! 💰", "en", "v1"))
+        self.assertNotEqual(get_cache_key("price", "en", "v1"), get_cache_key("price", "hi", "v1"))
+        self.assertNotEqual(get_cache_key("price", "en", "v1"), get_cache_key("price", "en", "v2"))
+        self.assertIsNone(get_cache_key("🙂", "en", "v1"))
+        self.assertIsNone(get_cache_key("word " * 100, "en", "v1"))
+    
+    def test_repeated_question_is_answered_from_cache(self):
+        before = get_response_cache_stats()
+        
+        self.assertEqual(self.ask("What's the price?", "pricing"), 1)
+        self.assertEqual(self.ask("whats the PRICE", "pricing"), 1)
+        
+        response_cache._local.clear()
+        self.assertEqual(self.ask("What's the price", "pricing"), 0)
+        self.assertEqual(self.ask("what's the price?", "pricing"), 0)
+        
+        self.assertEqual(self.engine.send_bot_response.call_count, 4)
+        self.assertEqual(self.record_llm_turn.call_args.args[1], "cached")
+        
+        after = get_response_cache_stats()
+        self.assertEqual(after["hits"] - before["hits"], 2)
+        self.assertEqual(after["local_hits"] - before["local_hits"], 1)
+        self.assertEqual(after["saved_tokens"] - before["saved_tokens"], 300)
+        self.assertIsNotNone(after["hit_rate"])
+    
+    def test_cache_is_checked_before_the_llm_without_a_local_intent(self):
+        self.assertEqual(self.ask("Do you ship to Pune?", "product_inquiry", local=False), 1)
+        
+        response_cache._local.clear()
+        self.assertEqual(self.ask("do you ship to pune", "product_inquiry", local=False), 0)
+        self.assertEqual(self.last_intent, "product_inquiry")
+        self.assertEqual(self.record_llm_turn.call_args.args[1], "cached")
+    
+    def test_excluded_intents_and_personal_replies_are_not_cached(self):
+        self.ask("The app is broken", "complaint", reply="Sorry to hear that! What happened?")
+        self.assertEqual(self.ask("The app is broken", "complaint", reply="Sorry to hear that! What happened?"), 1)
+        
+        self.ask("Book a demo", "appointment", reply="Sure Asha, does Tuesday work?", user_data={"name": "Asha"})
+        self.assertEqual(self.ask("Book a demo", "appointment"), 1)
\ No newline at end of file
@@ -0,0 +1 @@
+# Shared utilities for WhatsApp Calling
\ No newline at end of file
@@ -0,0 +1,150 @@
+"""
+E.164 phone number normalization. Numbers are reduced to "+<country code><national
+number>" so the same person always produces the same key, whatever format it
+was typed or received in. Results are memoized per process.
+"""
+
+from functools import lru_cache
+import frappe
+
+
+E164_FIELD = "whatsapp_phone_e164"
+E164_MAX_DIGITS = 15
+E164_MIN_DIGITS = 7
+NORMALIZE_CACHE_SIZE = 100000
+
+# ITU-T E.164 assigned country calling codes; the set is prefix-free
+COUNTRY_CALLING_CODES = frozenset(
+    ["1", "7"]
+    + "20 27 30 31 32 33 34 36 39 40 41 43 44 45 46 47 48 49 51 52 53 54 55 56 57 58".split()
+    + "60 61 62 63 64 65 66 81 82 84 86 90 91 92 93 94 95 98".split()
+    + "211 212 213 216 218 290 291 297 298 299 420 421 423 670".split()
+    + [str(code) for code in range(220, 259)]
+    + [str(code) for code in range(260, 270)]
+    + [str(code) for code in range(350, 360)]
+    + "370 371 372 373 374 375 376 377 378 380 381 382 383 385 386 387 389".split()
+    + [str(code) for code in range(500, 510)]
+    + [str(code) for code in range(590, 600)]
+    + [str(code) for code in range(672, 693)]
+    + "800 808 850 852 853 855 856 870 878 880 881 882 883 886 888".split()
+    + [str(code) for code in range(960, 969)]
+    + "970 971 972 973 974 975 976 977 979 992 993 994 995 996 998".split()
+)
+
+# Longest national number that is still treated as national without a "+"
+MAX_NATIONAL_DIGITS = 10
+
+# Countries whose leading zero is part of the number rather than a trunk prefix
+ZERO_KEPT_CODES = frozenset(["39"])
+
+
+def get_default_country_code():
+    """Calling code applied to national numbers, from WhatsApp settings"""
+    from whatsapp_calling.utils.settings_cache import get_whatsapp_settings
+    
+    try:
+        account = get_whatsapp_settings()
+        code = (account.default_country_code or "") if account else ""
+        
+    except Exception:
+        code = ""
+    
+    return code.lstrip("+").strip() or "1"
+
+
+def split_country_code(digits):
+    """Split international digits into (country code, national number), or None"""
+    for length in (1, 2, 3):
+        code = digits[:length]
+        if code in COUNTRY_CALLING_CODES:
+            return code, digits[length:]
+    
+    return None
+
+
+def normalize_phone(phone_number, default_country_code=None, international=False):
+    """Normalize a phone number to E.164, or None when it cannot be a valid number.
+    
+    Numbers starting with "+" or "00" are international. Meta always sends full
+    international digits without a "+", so pass international=True for webhook
+    numbers. Anything else is national: a trunk "0" is dropped and the default
+    country calling code is prepended.
+    """
+    if not phone_number:
+        return None
+    
+    if default_country_code is None:
+        default_country_code = get_default_country_code()
+    
+    return _normalize(str(phone_number), default_country_code, international)
+
+
+def normalize_phones(phone_numbers, default_country_code=None, international=False):
+    """Bulk mode: normalize many numbers, returning a raw -> E.164 dict.
+    
+    Each distinct raw value is normalized once and the settings lookup happens
+    once for the whole list.
+    """
+    if default_country_code is None:
+        default_country_code = get_default_country_code()
+    
+    return {
+        phone_number: _normalize(str(phone_number), default_country_code, international)
+        for phone_number in set(phone_numbers) if phone_number
+    }
+
+
+@lru_cache(maxsize=NORMALIZE_CACHE_SIZE)
+def _normalize(phone_number, default_country_code, international):
+    raw = phone_number.strip()
+    digits = "".join(filter(str.isdigit, raw))
+    
+    if not digits:
+        return None
+    
+    if raw.startswith("+"):
+        international = True
+    elif digits.startswith("00"):
+        digits = digits[2:]
+        international = True
+    elif not international and len(digits) > MAX_NATIONAL_DIGITS and not digits.startswith("0"):
+        # Too long to be national, so the country code is already there
+        international = True
+    
+    if not international:
+        national = digits if default_country_code in ZERO_KEPT_CODES else digits.lstrip("0")
+        digits = default_country_code + national
+    
+    parts = split_country_code(digits)
+    if not parts or not parts[1]:
+        return None
+    
+    code, national = parts
+    # "+44 (0)20 ..." style numbers repeat the trunk prefix after the code
+    if code not in ZERO_KEPT_CODES:
+        national = national.lstrip("0")
+    
+    digits = code + national
+    if not E164_MIN_DIGITS <= len(digits) <= E164_MAX_DIGITS:
+        return None
+    
+    return f"+{digits}"
+
+
+def get_doc_phone_e164(doc):
+    """E.164 key for a CRM document: the WhatsApp number, else the mobile number"""
+    for fieldname in ("whatsapp_phone", "mobile_no"):
+        normalized = normalize_phone(doc.get(fieldname))
+        if normalized:
+            return normalized
+    
+    return None
+
+
+def set_phone_e164(doc, method=None):
+    """Doc event: keep the indexed E.164 column of a Lead, Contact or Customer current"""
+    try:
+        doc.set(E164_FIELD, get_doc_phone_e164(doc))
+        
+    except Exception as e:
+        frappe.logger().error(f"Error normalizing phone for {doc.doctype} {doc.name}: {str(e)}")
\ No newline at end of file
@@ -0,0 +1,169 @@
+"""
+Versioned cache for the app's single doctypes: a request-scoped layer in
+frappe.local in front of a process-scoped layer that keeps the loaded document
+and its decrypted passwords until a committed on_update publishes a new version.
+"""
+
+import os
+import threading
+import frappe
+
+
+WHATSAPP_SETTINGS = "WhatsApp Business Account"
+MEDIASOUP_SETTINGS = "MediaSoup WebRTC Settings"
+
+VERSION_KEY = "whatsapp_calling:settings_version:"
+INVALIDATION_CHANNEL = "whatsapp_calling:settings_invalidated"
+
+_process_cache = {}
+_lock = threading.Lock()
+_listener = {"pid": None, "thread": None}
+
+
+class SettingsEntry:
+    def __init__(self, doc, version):
+        self.doc = doc
+        self.version = version
+        self.secrets = {}
+
+
+def get_whatsapp_settings():
+    """Get the cached WhatsApp Business Account settings"""
+    return get_cached_settings(WHATSAPP_SETTINGS).doc
+
+
+def get_mediasoup_settings():
+    """Get the cached MediaSoup WebRTC Settings"""
+    return get_cached_settings(MEDIASOUP_SETTINGS).doc
+
+
+def get_settings_secret(fieldname, doctype=WHATSAPP_SETTINGS):
+    """Get a decrypted Password field, decrypting at most once per settings version"""
+    entry = get_cached_settings(doctype)
+    
+    if fieldname not in entry.secrets:
+        entry.secrets[fieldname] = entry.doc.get_password(fieldname, raise_exception=False)
+    
+    return entry.secrets[fieldname]
+
+
+def get_settings_version(doctype=WHATSAPP_SETTINGS):
+    """Version of the settings currently served to this request"""
+    return get_cached_settings(doctype).version
+
+
+def get_cached_settings(doctype):
+    """Resolve settings through the request layer, then the process layer"""
+    request_cache = getattr(frappe.local, "whatsapp_settings_cache", None)
+    if request_cache is None:
+        request_cache = frappe.local.whatsapp_settings_cache = {}
+    
+    if doctype not in request_cache:
+        request_cache[doctype] = get_process_entry(doctype)
+    
+    return request_cache[doctype]
+
+
+def get_process_entry(doctype):
+    """Get the process-wide entry, reloading it when the settings changed"""
+    listening = ensure_listener()
+    key = (frappe.local.site, doctype)
+    entry = _process_cache.get(key)
+    
+    # Without a live subscriber, fall back to one version check per request
+    version = entry.version if entry and listening else read_version(doctype)
+    
+    if not entry or entry.version != version:
+        entry = SettingsEntry(frappe.get_single(doctype), version)
+        
+        with _lock:
+            _process_cache[key] = entry
+    
+    return entry
+
+
+def read_version(doctype):
+    """Current settings version from Redis"""
+    try:
+        cache = frappe.cache()
+        return int(cache.get(cache.make_key(VERSION_KEY + doctype)) or 0)
+        
+    except Exception:
+        return 0
+
+
+def clear_settings_cache(doctype):
+    """Invalidate a settings doctype in every process once the save commits; call from on_update"""
+    drop_local_entries(doctype)
+    
+    # Before the commit other workers would reload the old row and keep it under the new version
+    frappe.db.after_commit.add(lambda: publish_settings_version(doctype))
+
+
+def publish_settings_version(doctype):
+    """Bump the settings version and tell every process to drop its entry"""
+    try:
+        cache = frappe.cache()
+        cache.incr(cache.make_key(VERSION_KEY + doctype))
+        cache.publish(INVALIDATION_CHANNEL, f"{frappe.local.site}|{doctype}")
+        
+    except Exception as e:
+        frappe.logger().error(f"Error publishing settings invalidation: {str(e)}")
+    
+    drop_local_entries(doctype)
+
+
+def drop_local_entries(doctype):
+    with _lock:
+        _process_cache.pop((frappe.local.site, doctype), None)
+    
+    request_cache = getattr(frappe.local, "whatsapp_settings_cache", None)
+    if request_cache:
+        request_cache.pop(doctype, None)
+
+
+def ensure_listener():
+    """Start the invalidation subscriber for this process; True when it is running"""
+    thread = _listener["thread"]
+    if _listener["pid"] == os.getpid() and thread and thread.is_alive():
+        return True
+    
+    with _lock:
+        # Threads do not survive a fork, so every worker process starts its own
+        if _listener["pid"] == os.getpid() and _listener["thread"] and _listener["thread"].is_alive():
+            return True
+        
+        try:
+            pubsub = frappe.cache().pubsub(ignore_subscribe_messages=True)
+            pubsub.subscribe(INVALIDATION_CHANNEL)
+            
+        except Exception as e:
+            frappe.logger().error(f"Settings invalidation subscriber unavailable: {str(e)}")
+            return False
+        
+        # Anything cached before the subscription could have missed a message
+        _process_cache.clear()
+        
+        thread = threading.Thread(target=listen_for_invalidations, args=(pubsub,), daemon=True)
+        thread.start()
+        _listener.update({"pid": os.getpid(), "thread": thread})
+    
+    return True
+
+
+def listen_for_invalidations(pubsub):
+    """Drop process-level entries named in invalidation messages"""
+    try:
+        for message in pubsub.listen():
+            if message.get("type") != "message":
+                continue
+            
+            site, doctype = frappe.safe_decode(message["data"]).split("|", 1)
+            
+            with _lock:
+                _process_cache.pop((site, doctype), None)
+        
+    except Exception:
+        # A dead subscriber makes readers fall back to version checks
+        with _lock:
+            _process_cache.clear()
\ No newline at end of file
@@ -2,6 +2,7 @@ import frappe
 from frappe.model.document import Document
 from datetime import datetime, timedelta
 import json
+from whatsapp_calling.utils.phone import E164_FIELD, normalize_phone
 
 
 class BotConversationState(Document):
@@ -20,6 +21,10 @@ class BotConversationState(Document):
         if not self.last_interaction:
             self.last_interaction = datetime.now()
     
+    def validate(self):
+        """Keep the indexed E.164 number in step with phone_number"""
+        self.whatsapp_phone_e164 = normalize_phone(self.phone_number, international=True)
+    
     def update_context(self, new_data):
         """Update conversation context data"""
         try:
@@ -112,7 +117,7 @@ class BotConversationState(Document):
         """Get existing conversation state or create new one"""
         existing = frappe.db.get_value(
             "Bot Conversation State", 
-            {"phone_number": phone_number, "is_active": 1},
+            {E164_FIELD: normalize_phone(phone_number, international=True), "is_active": 1},
             "name"
         )
         
@@ -152,4 +157,10 @@ class BotConversationState(Document):
             frappe.logger().info(f"Cleaned up {len(inactive_conversations)} inactive conversations")
             
         except Exception as e:
-            frappe.logger().error(f"Error cleaning up conversations: {str(e)}")
\ No newline at end of file
+            frappe.logger().error(f"Error cleaning up conversations: {str(e)}")
+
+
+def on_doctype_update():
+    """Composite indexes for the active-state lookup and the inactivity cleanup"""
+    frappe.db.add_index("Bot Conversation State", ["whatsapp_phone_e164", "is_active"])
+    frappe.db.add_index("Bot Conversation State", ["is_active", "last_interaction"])
\ No newline at end of file
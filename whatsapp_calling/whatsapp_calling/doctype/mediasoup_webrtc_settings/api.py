@@ -1,10 +1,11 @@
 import frappe
+from whatsapp_calling.utils.settings_cache import get_mediasoup_settings
 
 @frappe.whitelist()
 def get_mediasoup_config():
     """API endpoint to get MediaSoup configuration for frontend"""
     try:
-        settings = frappe.get_single("MediaSoup WebRTC Settings")
+        settings = get_mediasoup_settings()
         if not settings.is_enabled:
             frappe.throw("MediaSoup WebRTC is not enabled")
         
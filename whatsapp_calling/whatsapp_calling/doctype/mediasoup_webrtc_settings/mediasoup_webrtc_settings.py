@@ -5,6 +5,7 @@ import requests
 import socket
 import subprocess
 import os
+from whatsapp_calling.utils.settings_cache import clear_settings_cache
 
 
 class MediaSoupWebRTCSettings(Document):
@@ -15,6 +16,10 @@ class MediaSoupWebRTCSettings(Document):
             self.validate_ice_servers()
             self.validate_codec_preferences()
     
+    def on_update(self):
+        """Invalidate cached settings in every worker"""
+        clear_settings_cache(self.doctype)
+    
     def validate_ports(self):
         """Validate port ranges"""
         if self.rtc_min_port and self.rtc_max_port:
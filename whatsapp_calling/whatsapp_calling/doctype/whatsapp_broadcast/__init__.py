@@ -0,0 +1 @@
+# WhatsApp Broadcast DocType
\ No newline at end of file
@@ -0,0 +1,38 @@
+import frappe
+import json
+from frappe.model.document import Document
+
+
+class WhatsAppBroadcast(Document):
+    def validate(self):
+        """Validate the recipient source before the broadcast is started"""
+        if self.recipient_source == "Upload":
+            if not self.recipient_file:
+                frappe.throw("Attach a CSV file of recipients")
+            
+        elif self.recipient_filters:
+            try:
+                filters = json.loads(self.recipient_filters)
+            except ValueError:
+                frappe.throw("Recipient Filters must be valid JSON")
+            
+            if not isinstance(filters, (dict, list)):
+                frappe.throw("Recipient Filters must be a JSON object or list")
+    
+    @frappe.whitelist()
+    def start(self):
+        """Queue the broadcast, or resume it from its checkpoint"""
+        from whatsapp_calling.whatsapp_integration.broadcast import start_broadcast
+        return start_broadcast(self.name)
+    
+    @frappe.whitelist()
+    def pause(self):
+        """Stop after the chunk being sent; start resumes from the checkpoint"""
+        from whatsapp_calling.whatsapp_integration.broadcast import pause_broadcast
+        return pause_broadcast(self.name)
+    
+    @frappe.whitelist()
+    def cancel_broadcast(self):
+        """Stop the broadcast for good"""
+        from whatsapp_calling.whatsapp_integration.broadcast import cancel_broadcast
+        return cancel_broadcast(self.name)
\ No newline at end of file
@@ -1,30 +1,38 @@
 import frappe
 from frappe.model.document import Document
-import requests
-import json
 from datetime import datetime
+from whatsapp_calling.utils.settings_cache import clear_settings_cache
+from whatsapp_calling.whatsapp_integration.graph_client import graph_request, send_message, get_base_url, get_message_id, GraphAPIError
+from whatsapp_calling.whatsapp_integration.crm_resolver import resolve_phone, get_link_fields
+from whatsapp_calling.whatsapp_integration.outbound_queue import is_outbound_worker_running, queue_outbound_message
 
 
 class WhatsAppBusinessAccount(Document):
     def validate(self):
         """Validate the WhatsApp Business Account configuration"""
+        if self.graph_api_url and not self.graph_api_url.startswith(("http://", "https://")):
+            frappe.throw("Graph API URL must start with http:// or https://")
+        
         if self.is_active:
             self.validate_credentials()
     
+    def on_update(self):
+        """Invalidate cached settings in every worker"""
+        clear_settings_cache(self.doctype)
+    
     def validate_credentials(self):
         """Validate WhatsApp Business API credentials"""
         try:
-            headers = {
-                'Authorization': f'Bearer {self.access_token}',
-                'Content-Type': 'application/json'
-            }
-            
             # Test API connection
-            url = f"https://graph.facebook.com/v17.0/{self.business_account_id}"
-            response = requests.get(url, headers=headers, timeout=10)
+            graph_request(
+                "GET", self.business_account_id,
+                access_token=self.access_token,
+                base_url=get_base_url(self),
+                max_attempts=1
+            )
             
-            if response.status_code != 200:
-                frappe.throw(f"Invalid credentials: {response.text}")
+        except GraphAPIError as e:
+            frappe.throw(f"Invalid credentials: {str(e)}")
                 
         except Exception as e:
             frappe.throw(f"Failed to validate credentials: {str(e)}")
@@ -32,11 +40,6 @@ class WhatsAppBusinessAccount(Document):
     def send_message(self, to_number, message_body, message_type="text"):
         """Send message via WhatsApp Business API"""
         try:
-            headers = {
-                'Authorization': f'Bearer {self.access_token}',
-                'Content-Type': 'application/json'
-            }
-            
             payload = {
                 "messaging_product": "whatsapp",
                 "to": to_number,
@@ -46,23 +49,25 @@ class WhatsAppBusinessAccount(Document):
                 }
             }
             
-            url = f"https://graph.facebook.com/v17.0/{self.phone_number_id}/messages"
-            response = requests.post(url, json=payload, headers=headers)
+            # The outbound worker sends it and records the result
+            if is_outbound_worker_running():
+                message = self.create_message_log(to_number, message_body, "sent", "queued", payload=payload)
+                return {"queued": True, "message": message}
+            
+            result = send_message(payload, self.phone_number_id)
             
-            if response.status_code == 200:
-                # Log successful message
-                self.create_message_log(to_number, message_body, "sent", "delivered")
-                return response.json()
-            else:
-                frappe.throw(f"Failed to send message: {response.text}")
+            # Log successful message under its wamid, so status webhooks find it
+            self.create_message_log(to_number, message_body, "sent", "sent", message_id=get_message_id(result))
+            return result
                 
         except Exception as e:
             self.create_message_log(to_number, message_body, "sent", "failed")
             frappe.throw(f"Error sending message: {str(e)}")
     
-    def create_message_log(self, phone_number, message_body, direction, status):
+    def create_message_log(self, phone_number, message_body, direction, status, payload=None, message_id=None):
         """Create WhatsApp Message log"""
         message_log = frappe.new_doc("WhatsApp Message")
+        message_log.message_id = message_id
         message_log.conversation_id = f"CONV-{phone_number}-{datetime.now().strftime('%Y%m%d')}"
         message_log.from_number = self.phone_number if direction == "sent" else phone_number
         message_log.to_number = phone_number if direction == "sent" else self.phone_number
@@ -72,16 +77,15 @@ class WhatsAppBusinessAccount(Document):
         message_log.direction = direction
         message_log.timestamp = datetime.now()
         
-        # Link to Lead/Contact if exists
-        lead = frappe.db.get_value("Lead", {"mobile_no": phone_number}, "name")
-        contact = frappe.db.get_value("Contact", {"mobile_no": phone_number}, "name")
-        
-        if lead:
-            message_log.lead = lead
-        elif contact:
-            message_log.contact = contact
+        # Link to Lead/Contact/Customer if exists
+        message_log.update(get_link_fields(resolve_phone(phone_number, international=True)))
             
         message_log.insert(ignore_permissions=True)
+        
+        # Registered before the commit, so the job is pushed once the log exists
+        if status == "queued":
+            queue_outbound_message(message_log, payload, self.phone_number_id)
+        
         frappe.db.commit()
         
         return message_log.name
\ No newline at end of file
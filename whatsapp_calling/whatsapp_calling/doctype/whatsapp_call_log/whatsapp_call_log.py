@@ -2,6 +2,8 @@ import frappe
 from frappe.model.document import Document
 from datetime import datetime, timedelta
 import json
+from whatsapp_calling.utils.settings_cache import get_whatsapp_settings
+from whatsapp_calling.whatsapp_integration.realtime import queue_call_event
 
 
 class WhatsAppCallLog(Document):
@@ -22,6 +24,16 @@ class WhatsAppCallLog(Document):
             duration = end - start
             self.duration = duration.total_seconds()
     
+    def on_update(self):
+        """Push state and quality changes to the calling UI in the next realtime batch"""
+        if self.session_id and (self.has_value_changed("status") or self.has_value_changed("call_quality_score")):
+            queue_call_event(self.session_id, {
+                "call_id": self.call_id,
+                "status": self.status,
+                "duration": self.duration,
+                "quality": self.get_call_quality_score()
+            })
+    
     def start_call(self, agent_id=None):
         """Mark call as started"""
         self.status = "Ringing"
@@ -76,12 +88,12 @@ class WhatsAppCallLog(Document):
     
     def should_record_call(self):
         """Check if call recording is enabled based on tier"""
-        account = frappe.get_single("WhatsApp Business Account")
+        account = get_whatsapp_settings()
         return account and account.tier in ["Professional", "Enterprise"]
     
     def should_generate_transcript(self):
         """Check if transcript generation is enabled"""
-        account = frappe.get_single("WhatsApp Business Account")
+        account = get_whatsapp_settings()
         return account and account.tier in ["Professional", "Enterprise"]
     
     def start_recording(self):
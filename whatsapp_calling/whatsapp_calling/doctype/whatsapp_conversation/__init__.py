@@ -0,0 +1 @@
+# WhatsApp Conversation DocType
\ No newline at end of file
@@ -0,0 +1,17 @@
+import frappe
+from frappe.model.document import Document
+
+
+class WhatsAppConversation(Document):
+    @frappe.whitelist()
+    def mark_as_read(self):
+        """Mark the conversation's inbound messages as read"""
+        from whatsapp_calling.whatsapp_integration.conversations import mark_conversation_read
+        return mark_conversation_read(self.name)
+
+
+def on_doctype_update():
+    """Composite indexes for inbox listings and the open-session lookup"""
+    frappe.db.add_index("WhatsApp Conversation", ["status", "last_message_at"])
+    frappe.db.add_index("WhatsApp Conversation", ["assigned_to", "status", "last_message_at"])
+    frappe.db.add_index("WhatsApp Conversation", ["whatsapp_phone_e164", "status"])
\ No newline at end of file
@@ -1,6 +1,10 @@
 import frappe
 from frappe.model.document import Document
 from datetime import datetime
+from whatsapp_calling.whatsapp_integration.crm_resolver import resolve_phone, get_link_fields
+from whatsapp_calling.utils.phone import normalize_phone
+from whatsapp_calling.whatsapp_integration.realtime import queue_message_event, queue_status_events
+from whatsapp_calling.whatsapp_integration.conversations import assign_conversations, decrement_unread
 
 
 class WhatsAppMessage(Document):
@@ -11,6 +15,20 @@ class WhatsAppMessage(Document):
         
         if not self.timestamp:
             self.timestamp = datetime.now()
+        
+        # Index the customer's number in E.164; it is the wa_id Meta sent or the "to" we sent Meta,
+        # full international digits either way
+        if not self.whatsapp_phone_e164:
+            customer_phone = self.from_number if self.direction == "received" else self.to_number
+            self.whatsapp_phone_e164 = normalize_phone(customer_phone, international=True)
+        
+        # Link to CRM records before the row is written, so no second save is needed
+        if not (self.lead or self.contact or self.customer):
+            self.link_to_crm_record()
+        
+        # Fold into the customer's open conversation session
+        if not self.whatsapp_conversation:
+            self.whatsapp_conversation = assign_conversations([self.as_dict()]).get(self.message_id)
     
     def validate(self):
         """Validate message data"""
@@ -22,24 +40,23 @@ class WhatsAppMessage(Document):
     
     def after_insert(self):
         """Post-processing after message insertion"""
-        # Link to CRM records if not already linked
-        if not (self.lead or self.contact or self.customer):
-            self.link_to_crm_record()
-        
-        # Emit real-time update
-        frappe.publish_realtime(
-            event="whatsapp_message_created",
-            message={
-                "message_id": self.message_id,
-                "conversation_id": self.conversation_id,
-                "from_number": self.from_number,
-                "to_number": self.to_number,
-                "direction": self.direction,
-                "message_body": self.message_body,
-                "timestamp": self.timestamp.isoformat() if self.timestamp else None
-            },
-            room="whatsapp_messages"
-        )
+        # Sent with the next batched realtime event once the insert commits
+        queue_message_event(self.get_realtime_payload())
+    
+    def get_realtime_payload(self):
+        """Message fields the conversation views render"""
+        return {
+            "message_id": self.message_id,
+            "conversation_id": self.conversation_id,
+            "whatsapp_conversation": self.whatsapp_conversation,
+            "whatsapp_phone_e164": self.whatsapp_phone_e164,
+            "from_number": self.from_number,
+            "to_number": self.to_number,
+            "direction": self.direction,
+            "message_body": self.message_body,
+            "status": self.status,
+            "timestamp": self.timestamp
+        }
     
     def link_to_crm_record(self):
         """Auto-link message to existing CRM records"""
@@ -47,35 +64,8 @@ class WhatsAppMessage(Document):
             # Determine the customer's phone number
             customer_phone = self.from_number if self.direction == "received" else self.to_number
             
-            # Check for existing Lead
-            lead = frappe.db.get_value("Lead", {
-                "mobile_no": customer_phone
-            }, "name")
-            
-            if lead:
-                self.lead = lead
-                self.save(ignore_permissions=True)
-                return
-            
-            # Check for existing Contact  
-            contact = frappe.db.get_value("Contact", {
-                "mobile_no": customer_phone
-            }, "name")
-            
-            if contact:
-                self.contact = contact
-                self.save(ignore_permissions=True)
-                return
-                
-            # Check for existing Customer
-            customer = frappe.db.get_value("Customer", {
-                "mobile_no": customer_phone
-            }, "name")
-            
-            if customer:
-                self.customer = customer
-                self.save(ignore_permissions=True)
-                return
+            # Lead, then Contact, then Customer from the phone index
+            self.update(get_link_fields(resolve_phone(self.whatsapp_phone_e164 or customer_phone, international=True)))
             
         except Exception as e:
             frappe.logger().error(f"Error linking message to CRM: {str(e)}")
@@ -85,6 +75,9 @@ class WhatsAppMessage(Document):
         if self.direction == "received" and self.status != "read":
             self.status = "read"
             self.save(ignore_permissions=True)
+            
+            if self.whatsapp_conversation:
+                decrement_unread(self.whatsapp_conversation)
             frappe.db.commit()
     
     def get_conversation_messages(self, limit=50):
@@ -102,13 +95,10 @@ class WhatsAppMessage(Document):
     
     @staticmethod
     def get_conversation_by_phone(phone_number, limit=50):
-        """Get conversation messages for a specific phone number"""
+        """Get conversation messages for a specific WhatsApp number"""
         return frappe.get_all(
-            "WhatsApp Message", 
-            filters=[
-                ["from_number", "=", phone_number],
-                ["to_number", "=", phone_number]
-            ],
+            "WhatsApp Message",
+            filters={"whatsapp_phone_e164": normalize_phone(phone_number, international=True)},
             fields=[
                 "message_id", "from_number", "to_number", "message_body",
                 "direction", "status", "timestamp", "message_type", "media_url",
@@ -123,17 +113,21 @@ class WhatsAppMessage(Document):
         """Update message delivery status"""
         try:
             frappe.db.set_value("WhatsApp Message", message_id, "status", new_status)
-            frappe.db.commit()
             
-            # Emit real-time status update
-            frappe.publish_realtime(
-                event="whatsapp_message_status_update",
-                message={
-                    "message_id": message_id,
-                    "status": new_status
-                },
-                room="whatsapp_messages" 
-            )
+            # Emit real-time status update with the next batch after commit
+            queue_status_events({message_id: new_status})
+            frappe.db.commit()
             
         except Exception as e:
-            frappe.logger().error(f"Error updating message status: {str(e)}")
\ No newline at end of file
+            frappe.logger().error(f"Error updating message status: {str(e)}")
+
+
+def on_doctype_update():
+    """Composite indexes for the conversation history queries"""
+    frappe.db.add_index("WhatsApp Message", ["conversation_id", "timestamp"])
+    frappe.db.add_index("WhatsApp Message", ["whatsapp_phone_e164", "timestamp"])
+    # Delta polling of a number's history reads changes in modified order
+    frappe.db.add_index("WhatsApp Message", ["whatsapp_phone_e164", "modified"])
+    frappe.db.add_index("WhatsApp Message", ["whatsapp_conversation", "timestamp"])
+    # Broadcasts skip recipients they already messaged when they resume
+    frappe.db.add_index("WhatsApp Message", ["whatsapp_broadcast", "whatsapp_phone_e164"])
\ No newline at end of file
@@ -0,0 +1 @@
+# WhatsApp Webhook Event DocType
\ No newline at end of file
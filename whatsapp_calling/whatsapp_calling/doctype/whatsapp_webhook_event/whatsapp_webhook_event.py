@@ -0,0 +1,28 @@
+import frappe
+from frappe.model.document import Document
+
+
+class WhatsAppWebhookEvent(Document):
+    def before_insert(self):
+        """Set queue defaults for a newly received webhook payload"""
+        if not self.status:
+            self.status = "Pending"
+        
+        if not self.received_at:
+            self.received_at = frappe.utils.now_datetime()
+    
+    @frappe.whitelist()
+    def retry(self):
+        """Put a failed event back on the inbound queue"""
+        self.status = "Pending"
+        self.error = None
+        self.save(ignore_permissions=True)
+        frappe.db.commit()
+        
+        from whatsapp_calling.whatsapp_integration.inbound_queue import schedule_drain
+        schedule_drain()
+
+
+def on_doctype_update():
+    """Composite index for claiming the oldest pending events"""
+    frappe.db.add_index("WhatsApp Webhook Event", ["status", "received_at"])
\ No newline at end of file
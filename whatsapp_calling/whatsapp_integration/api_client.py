@@ -0,0 +1,223 @@
+import frappe
+import base64
+import hashlib
+from frappe.utils import cint, get_datetime
+from whatsapp_calling.utils.settings_cache import get_whatsapp_settings
+from whatsapp_calling.utils.phone import E164_FIELD, normalize_phone
+
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+HISTORY_FIELDS = [
+    "name", "message_id", "whatsapp_conversation", "from_number", "to_number",
+    "whatsapp_phone_e164", "message_type", "message_body", "direction", "status",
+    "timestamp", "media_url", "is_bot_message", "modified"
+]
+
+CRM_DOCTYPES = ("Lead", "Contact", "Customer")
+
+
+@frappe.whitelist()
+def get_conversation_history(phone_number=None, doctype=None, docname=None, limit=DEFAULT_PAGE_SIZE,
+                             cursor=None, since=None, etag=None):
+    """Conversation history for one customer number, served from the indexed E.164 column.
+    
+    Without since, returns a page of messages in timestamp order ending at cursor (the newest page
+    when cursor is empty) and next_cursor for the page before it. With since, returns only messages
+    created or changed after that delta token. Both return a since token for the next poll and an
+    ETag; a matching If-None-Match header or etag argument returns not_modified instead of rows.
+    """
+    phone_e164 = get_history_phone(phone_number, doctype, docname)
+    limit = min(cint(limit) or DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE)
+    
+    if not phone_e164:
+        return {"messages": [], "next_cursor": None, "since": None, "etag": None}
+    
+    current_etag = get_history_etag(phone_e164, cursor, since, limit)
+    set_response_header("ETag", f'"{current_etag}"')
+    
+    if current_etag in (etag, (frappe.get_request_header("If-None-Match") or "").strip('"')):
+        return {"not_modified": True, "etag": current_etag, "since": since}
+    
+    if since:
+        messages, has_more = get_changes_since(phone_e164, decode_cursor(since), limit)
+        latest = messages[-1] if messages else None
+        return {
+            "messages": [strip_internal(message) for message in messages],
+            "has_more": has_more,
+            "since": encode_cursor(latest.modified, latest.name) if latest else since,
+            "etag": current_etag
+        }
+    
+    messages, has_more = get_page(phone_e164, decode_cursor(cursor) if cursor else None, limit)
+    oldest = messages[0] if messages else None
+    
+    return {
+        "messages": [strip_internal(message) for message in messages],
+        "next_cursor": encode_cursor(oldest.timestamp, oldest.name) if oldest and has_more else None,
+        "since": get_latest_change_token(phone_e164),
+        "etag": current_etag
+    }
+
+
+def get_history_phone(phone_number=None, doctype=None, docname=None):
+    """E.164 number of the CRM record when given, otherwise of the phone number"""
+    # The history query reads messages directly, so it needs the same access as the message list
+    frappe.has_permission("WhatsApp Message", "read", throw=True)
+    
+    if doctype in CRM_DOCTYPES and docname:
+        frappe.has_permission(doctype, "read", docname, throw=True)
+        
+        # Only the record's own number; a caller-supplied one could read any other conversation
+        return frappe.db.get_value(doctype, docname, E164_FIELD)
+    
+    # A bare number is a WhatsApp number from a conversation
+    return normalize_phone(phone_number, international=True)
+
+
+def get_page(phone_e164, cursor, limit):
+    """One page of history before the (timestamp, name) cursor, returned oldest first"""
+    conditions = ""
+    values = {"phone": phone_e164, "limit": limit + 1}
+    
+    if cursor:
+        conditions = "and (timestamp < %(timestamp)s or (timestamp = %(timestamp)s and name < %(name)s))"
+        values.update(timestamp=cursor[0], name=cursor[1])
+    
+    messages = frappe.db.sql(
+        f"""
+        select {", ".join(HISTORY_FIELDS)}
+        from `tabWhatsApp Message`
+        where whatsapp_phone_e164 = %(phone)s {conditions}
+        order by timestamp desc, name desc
+        limit %(limit)s
+        """,
+        values,
+        as_dict=True
+    )
+    
+    has_more = len(messages) > limit
+    return list(reversed(messages[:limit])), has_more
+
+
+def get_changes_since(phone_e164, token, limit):
+    """Messages inserted or updated after the (modified, name) delta token, oldest change first"""
+    messages = frappe.db.sql(
+        f"""
+        select {", ".join(HISTORY_FIELDS)}
+        from `tabWhatsApp Message`
+        where whatsapp_phone_e164 = %(phone)s
+        and (modified > %(modified)s or (modified = %(modified)s and name > %(name)s))
+        order by modified asc, name asc
+        limit %(limit)s
+        """,
+        {"phone": phone_e164, "modified": token[0], "name": token[1], "limit": limit + 1},
+        as_dict=True
+    )
+    
+    return messages[:limit], len(messages) > limit
+
+
+def get_latest_change_token(phone_e164):
+    """Delta token for the most recent change, so the next poll starts from here"""
+    latest = frappe.db.sql(
+        """
+        select modified, name
+        from `tabWhatsApp Message`
+        where whatsapp_phone_e164 = %(phone)s
+        order by modified desc, name desc
+        limit 1
+        """,
+        {"phone": phone_e164},
+        as_dict=True
+    )
+    
+    return encode_cursor(latest[0].modified, latest[0].name) if latest else None
+
+
+def get_history_etag(phone_e164, cursor, since, limit):
+    """Validator for a history response; changes whenever a message of the number is added or modified"""
+    count, last_modified = frappe.db.sql(
+        """
+        select count(*), max(modified)
+        from `tabWhatsApp Message`
+        where whatsapp_phone_e164 = %(phone)s
+        """,
+        {"phone": phone_e164}
+    )[0]
+    
+    key = f"{phone_e164}|{cursor}|{since}|{limit}|{count}|{last_modified}"
+    return hashlib.md5(key.encode()).hexdigest()
+
+
+def encode_cursor(value, name):
+    """Opaque cursor for a (datetime, name) position"""
+    return base64.urlsafe_b64encode(f"{get_datetime(value).isoformat()}|{name}".encode()).decode()
+
+
+def decode_cursor(cursor):
+    """(datetime, name) position from encode_cursor"""
+    try:
+        value, name = base64.urlsafe_b64decode(cursor.encode()).decode().split("|", 1)
+        return get_datetime(value), name
+        
+    except Exception:
+        frappe.throw("Invalid conversation history cursor")
+
+
+def strip_internal(message):
+    message.pop("modified", None)
+    return message
+
+
+def set_response_header(name, value):
+    """Add a header to the response of the current request"""
+    headers = getattr(frappe.local, "response_headers", None)
+    if headers is not None:
+        headers[name] = value
+
+
+@frappe.whitelist()
+def send_message(to_number, message, doctype=None, docname=None):
+    """Send a text message from a CRM record's WhatsApp dialog"""
+    frappe.has_permission("WhatsApp Message", "create", throw=True)
+    
+    record = doctype in CRM_DOCTYPES and docname
+    if record:
+        frappe.has_permission(doctype, "write", docname, throw=True)
+    
+    try:
+        account = get_whatsapp_settings()
+        if not account or not account.is_active:
+            return {"success": False, "message": "WhatsApp Business Account is not active"}
+        
+        # The record's stored E.164 number is what its history is keyed on
+        phone_e164 = record and frappe.db.get_value(doctype, docname, E164_FIELD)
+        if not phone_e164:
+            phone_e164 = normalize_phone(to_number, international=not record)
+        if not phone_e164:
+            return {"success": False, "message": f"Invalid phone number {to_number}"}
+        
+        # Meta expects the international number without the leading +
+        result = frappe.get_doc("WhatsApp Business Account").send_message(
+            phone_e164.lstrip("+"), frappe.utils.strip_html(message)
+        )
+        
+        return {"success": True, "response": result}
+        
+    except Exception as e:
+        frappe.logger().error(f"Error sending WhatsApp message: {str(e)}")
+        return {"success": False, "message": str(e)}
+
+
+def create_lead_from_whatsapp(doc, method=None):
+    """Lead validate hook: use the mobile number as the WhatsApp number when none is set"""
+    if not doc.get("whatsapp_phone") and doc.get("mobile_no"):
+        doc.whatsapp_phone = doc.mobile_no
+
+
+def sync_contact_phone(doc, method=None):
+    """Contact validate hook: use the mobile number as the WhatsApp number when none is set"""
+    if not doc.get("whatsapp_phone") and doc.get("mobile_no"):
+        doc.whatsapp_phone = doc.mobile_no
\ No newline at end of file
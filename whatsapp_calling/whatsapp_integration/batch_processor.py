@@ -0,0 +1,188 @@
+import frappe
+from datetime import datetime
+from frappe.utils import now_datetime
+from whatsapp_calling.whatsapp_integration.dedup import claim_message_ids, confirm_message_ids, release_message_ids
+from whatsapp_calling.whatsapp_integration.status_pipeline import buffer_statuses
+from whatsapp_calling.whatsapp_integration.crm_resolver import resolve_phones, get_link_fields
+from whatsapp_calling.utils.phone import normalize_phones
+from whatsapp_calling.whatsapp_integration.realtime import queue_message_event
+from whatsapp_calling.whatsapp_integration.conversations import assign_conversations
+from whatsapp_calling.whatsapp_integration.media_pipeline import get_media_reference, enqueue_media_downloads
+
+
+MESSAGE_FIELDS = [
+    "name", "creation", "modified", "owner", "modified_by",
+    "message_id", "conversation_id", "from_number", "to_number", "message_type",
+    "message_body", "direction", "status", "timestamp", "is_bot_message",
+    "lead", "contact", "customer", "whatsapp_phone_e164", "media_id", "media_mime_type",
+    "whatsapp_conversation"
+]
+
+
+def iter_change_values(data):
+    """Yield the value of every change in every entry of a webhook payload"""
+    for entry in data.get("entry") or []:
+        for change in entry.get("changes") or []:
+            value = change.get("value")
+            if value:
+                yield value
+
+
+def collect_webhook_batch(data):
+    """Group all messages and statuses in a payload by kind"""
+    batch = {"messages": [], "statuses": []}
+    
+    for value in iter_change_values(data):
+        business_number = value.get("metadata", {}).get("display_phone_number")
+        
+        for message in value.get("messages") or []:
+            batch["messages"].append((message, business_number))
+        
+        batch["statuses"].extend(value.get("statuses") or [])
+    
+    return batch
+
+
+def process_webhook_batch(data):
+    """Process every message and status in a webhook payload as one batch"""
+    batch = collect_webhook_batch(data)
+    
+    if batch["messages"]:
+        process_message_batch(batch["messages"])
+    
+    if batch["statuses"]:
+        process_status_batch(batch["statuses"])
+
+
+def process_message_batch(messages):
+    """Log a batch of inbound messages with one multi-row insert and one commit"""
+    message_ids = [message.get("id") for message, _ in messages if message.get("id")]
+    
+    # Drop Meta retries in the shared cache before touching the database
+    fresh_ids = claim_message_ids(message_ids)
+    if fresh_ids is None:
+        fresh_ids = set(message_ids) - set(frappe.get_all(
+            "WhatsApp Message",
+            filters={"message_id": ["in", message_ids]},
+            pluck="message_id"
+        )) if message_ids else set()
+    
+    pending = []
+    for message, business_number in messages:
+        message_id = message.get("id")
+        if message_id not in fresh_ids:
+            continue
+        # Also drops duplicates inside the same payload
+        fresh_ids.discard(message_id)
+        pending.append((message, business_number))
+    
+    if not pending:
+        return []
+    
+    from whatsapp_calling.whatsapp_integration.webhook_handler import process_messages_with_bot
+    
+    pending_ids = [message.get("id") for message, _ in pending]
+    
+    try:
+        processed, media = insert_message_batch(pending)
+        
+    except Exception:
+        # Let Meta's retry through once the failure is fixed
+        release_message_ids(pending_ids)
+        raise
+    
+    # Keep the claims only now that the rows are committed; a Lead created on the way commits earlier
+    confirm_message_ids(pending_ids)
+    
+    process_messages_with_bot(processed)
+    enqueue_media_downloads(media)
+    
+    return processed
+
+
+def insert_message_batch(pending):
+    """Insert and commit new inbound messages; returns the (phone_number, body, message_id) tuples and media"""
+    from whatsapp_calling.whatsapp_integration.webhook_handler import (
+        get_message_text, get_business_phone_number, create_lead_from_whatsapp
+    )
+    
+    default_business_number = None
+    if any(not business_number for _, business_number in pending):
+        default_business_number = get_business_phone_number()
+    
+    # Meta sends full international numbers; normalize and resolve every distinct sender once
+    senders = normalize_phones([message.get("from") for message, _ in pending], international=True)
+    links = resolve_crm_links({number for number in senders.values() if number})
+    
+    now = now_datetime()
+    user = frappe.session.user
+    rows = []
+    processed = []
+    media = []
+    
+    for message, business_number in pending:
+        phone_number = message.get("from")
+        phone_e164 = senders.get(phone_number)
+        message_body = get_message_text(message)
+        
+        link_key = phone_e164 or phone_number
+        if link_key not in links:
+            # First message from an unknown number creates the Lead once per batch
+            lead = create_lead_from_whatsapp(phone_number, message_body)
+            links[link_key] = {"lead": lead} if lead else {}
+        
+        link = links[link_key]
+        reference = get_media_reference(message)
+        rows.append((
+            frappe.generate_hash(length=10), now, now, user, user,
+            message.get("id"),
+            f"CONV-{phone_number}-{datetime.now().strftime('%Y%m%d')}",
+            phone_number,
+            business_number or default_business_number,
+            message.get("type", "text"),
+            message_body,
+            "received",
+            "delivered",
+            datetime.fromtimestamp(int(message.get("timestamp", 0))),
+            0,
+            link.get("lead"),
+            link.get("contact"),
+            link.get("customer"),
+            phone_e164,
+            reference and reference["media_id"],
+            reference and reference["mime_type"],
+            None
+        ))
+        processed.append((phone_number, message_body, message.get("id")))
+        media.append(reference)
+    
+    # bulk_insert skips the document hooks, so fold the batch into conversations here
+    messages = [dict(zip(MESSAGE_FIELDS[5:], row[5:])) for row in rows]
+    conversations = assign_conversations(messages)
+    for message in messages:
+        message["whatsapp_conversation"] = conversations.get(message["message_id"])
+    rows = [row[:-1] + (message["whatsapp_conversation"],) for row, message in zip(rows, messages)]
+    
+    # The unique message_id index stays the final guard against duplicates
+    frappe.db.bulk_insert("WhatsApp Message", MESSAGE_FIELDS, rows, ignore_duplicates=True)
+    
+    # Realtime events go out on commit
+    for message in messages:
+        queue_message_event(message)
+    
+    frappe.db.commit()
+    
+    return processed, media
+
+
+def resolve_crm_links(phone_numbers):
+    """Resolve many phone numbers to message link fields in one resolver call"""
+    return {
+        phone_number: get_link_fields(record)
+        for phone_number, record in resolve_phones(phone_numbers).items()
+    }
+
+
+def process_status_batch(statuses):
+    """Hand a batch of delivery status callbacks to the coalescing status pipeline"""
+    buffer_statuses(statuses)
\ No newline at end of file
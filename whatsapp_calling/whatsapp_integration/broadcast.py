@@ -0,0 +1,525 @@
+import frappe
+import csv
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime, timedelta
+from frappe.utils import cint, cstr, now_datetime, add_to_date
+from whatsapp_calling.utils.settings_cache import get_whatsapp_settings, get_settings_secret
+from whatsapp_calling.utils.phone import E164_FIELD, normalize_phones
+from whatsapp_calling.whatsapp_integration.graph_client import (
+    CIRCUIT_COOLDOWN_SECONDS, call_graph, get_backoff, get_base_url, get_circuit,
+    get_message_id, get_throughput, record_calls, should_retry, wait_for_token
+)
+from whatsapp_calling.whatsapp_integration.batch_processor import MESSAGE_FIELDS, resolve_crm_links
+from whatsapp_calling.whatsapp_integration.conversations import assign_conversations
+
+
+BROADCAST_DOCTYPE = "WhatsApp Broadcast"
+RUN_METHOD = "whatsapp_calling.whatsapp_integration.broadcast.run_broadcast"
+RUN_JOB_ID = "whatsapp_broadcast_"
+PROGRESS_EVENT = "whatsapp_broadcast_progress"
+
+BROADCAST_MESSAGE_FIELDS = MESSAGE_FIELDS + ["whatsapp_broadcast"]
+
+CHUNK_SIZE = 500
+# Messages are logged and committed every batch, so a worker lost mid-chunk re-sends none of them
+SEND_BATCH_SIZE = 50
+SEND_WORKERS = 16
+MAX_ATTEMPTS = 3
+RUN_TIMEOUT = 6 * 3600
+
+# Broadcasts stop and wait to be resumed when the Graph API stays down longer than this
+CIRCUIT_WAIT_SECONDS = 2 * CIRCUIT_COOLDOWN_SECONDS
+
+# A running broadcast writes progress after every chunk; one silent this long lost its worker
+STALE_MINUTES = 10
+
+
+@frappe.whitelist()
+def start_broadcast(broadcast):
+    """Queue a broadcast; a paused or failed broadcast resumes from its checkpoint"""
+    doc = frappe.get_doc(BROADCAST_DOCTYPE, broadcast)
+    doc.check_permission("write")
+    
+    if doc.status not in ("Draft", "Paused", "Failed"):
+        frappe.throw(f"A broadcast that is {doc.status} cannot be started")
+    
+    values = {"status": "Queued", "last_error": None}
+    if doc.status == "Draft":
+        values["total_recipients"] = count_recipients(doc)
+    
+    doc.db_set(values)
+    enqueue_broadcast(doc.name)
+    
+    return {"success": True, "total_recipients": doc.total_recipients}
+
+
+@frappe.whitelist()
+def pause_broadcast(broadcast):
+    """Ask a running broadcast to stop after the chunk it is sending"""
+    return set_stopped(broadcast, "Paused")
+
+
+@frappe.whitelist()
+def cancel_broadcast(broadcast):
+    """Stop a broadcast for good"""
+    return set_stopped(broadcast, "Cancelled")
+
+
+def set_stopped(broadcast, status):
+    doc = frappe.get_doc(BROADCAST_DOCTYPE, broadcast)
+    doc.check_permission("write")
+    
+    if doc.status in ("Completed", "Cancelled"):
+        frappe.throw(f"The broadcast is already {doc.status}")
+    
+    doc.db_set("status", status)
+    return {"success": True}
+
+
+def enqueue_broadcast(broadcast):
+    """Queue the run job once the caller's transaction committed"""
+    frappe.enqueue(
+        RUN_METHOD,
+        queue="long",
+        timeout=RUN_TIMEOUT,
+        job_id=f"{RUN_JOB_ID}{broadcast}",
+        deduplicate=True,
+        enqueue_after_commit=True,
+        broadcast=broadcast
+    )
+
+
+def run_broadcast(broadcast):
+    """Background job: send a broadcast chunk by chunk, logging every batch and checkpointing after every chunk"""
+    doc = frappe.get_doc(BROADCAST_DOCTYPE, broadcast)
+    if doc.status not in ("Queued", "Running"):
+        return
+    
+    account = get_whatsapp_settings()
+    context = {
+        "url": f"{get_base_url(account)}/{account.phone_number_id}/messages",
+        "access_token": get_settings_secret("access_token"),
+        "rate_key": account.phone_number_id,
+        "rate": get_throughput(),
+        "circuit": get_circuit(account.phone_number_id),
+        "business_number": account.phone_number
+    }
+    
+    values = {"status": "Running"}
+    if not doc.started_at:
+        values["started_at"] = now_datetime()
+    doc.db_set(values, commit=True)
+    
+    progress = {
+        "sent_count": cint(doc.sent_count),
+        "failed_count": cint(doc.failed_count),
+        "skipped_count": cint(doc.skipped_count),
+        "run_started": time.monotonic(),
+        "run_processed": 0
+    }
+    
+    try:
+        for recipients, checkpoint, skipped in iter_recipient_chunks(doc):
+            if frappe.db.get_value(BROADCAST_DOCTYPE, doc.name, "status") != "Running":
+                # Paused or cancelled from the desk
+                return
+            
+            # Only a chunk stopped earlier has messages logged without its checkpoint; they were counted then
+            recipients = drop_already_sent(doc.name, recipients)
+            if not send_recipients(doc, recipients, context, progress):
+                return
+            
+            progress["skipped_count"] += skipped
+            progress["run_processed"] += skipped
+            save_progress(doc, progress, checkpoint)
+        
+        save_progress(doc, progress, doc.checkpoint, status="Completed")
+        
+    except Exception as e:
+        frappe.db.rollback()
+        frappe.logger().error(f"Error running WhatsApp broadcast {doc.name}: {str(e)}")
+        frappe.db.set_value(BROADCAST_DOCTYPE, doc.name, {"status": "Failed", "last_error": str(e)})
+        frappe.db.commit()
+
+
+def count_recipients(doc):
+    """Number of recipients the broadcast will go through"""
+    if doc.recipient_source == "Upload":
+        with open(get_recipient_file_path(doc), newline="", encoding="utf-8-sig") as f:
+            return sum(1 for _ in csv.DictReader(f))
+    
+    return frappe.db.count(doc.recipient_source, get_recipient_filters(doc))
+
+
+def iter_recipient_chunks(doc):
+    """Yield (recipients, checkpoint, skipped) chunks after the broadcast's checkpoint"""
+    parameters = get_template_parameters(doc)
+    
+    if doc.recipient_source == "Upload":
+        with open(get_recipient_file_path(doc), newline="", encoding="utf-8-sig") as f:
+            yield from iter_csv_chunks(f, cint(doc.checkpoint), parameters)
+        return
+    
+    yield from iter_record_chunks(doc, parameters)
+
+
+def iter_record_chunks(doc, parameters):
+    """Keyset pages of Leads or Contacts in name order; never loads the whole segment"""
+    filters = get_recipient_filters(doc)
+    fields = ["name", E164_FIELD] + [field for field in parameters if field not in ("name", E164_FIELD)]
+    link_field = doc.recipient_source.lower()
+    last_name = doc.checkpoint
+    
+    while True:
+        rows = frappe.get_all(
+            doc.recipient_source,
+            filters=filters + ([["name", ">", last_name]] if last_name else []),
+            fields=fields,
+            order_by="name asc",
+            limit_page_length=CHUNK_SIZE
+        )
+        if not rows:
+            return
+        
+        last_name = rows[-1].name
+        recipients, skipped = unique_recipients(
+            {
+                "phone_e164": row.get(E164_FIELD),
+                "parameters": [cstr(row.get(field)) for field in parameters],
+                "links": {link_field: row.name}
+            }
+            for row in rows
+        )
+        yield recipients, last_name, skipped
+
+
+def iter_csv_chunks(f, offset, parameters, chunk_size=CHUNK_SIZE):
+    """Stream chunks of an uploaded CSV from row offset; the checkpoint is the number of rows read"""
+    reader = csv.DictReader(f)
+    columns = {cstr(column).strip().lower(): column for column in reader.fieldnames or []}
+    phone_column = columns.get("phone") or columns.get("mobile_no") or columns.get("whatsapp_phone")
+    if not phone_column:
+        frappe.throw("The recipient file needs a phone column")
+    
+    for _ in range(offset):
+        if next(reader, None) is None:
+            return
+    
+    position = offset
+    while True:
+        rows = [row for _, row in zip(range(chunk_size), reader)]
+        if not rows:
+            return
+        
+        position += len(rows)
+        numbers = normalize_phones([row.get(phone_column) for row in rows])
+        recipients, skipped = unique_recipients(
+            {
+                "phone_e164": numbers.get(row.get(phone_column)),
+                "parameters": [cstr(row.get(columns.get(field.lower(), field))) for field in parameters],
+                "links": None
+            }
+            for row in rows
+        )
+        yield recipients, str(position), skipped
+
+
+def unique_recipients(recipients):
+    """Drop recipients without a valid number and repeated numbers; returns (recipients, skipped)"""
+    unique = {}
+    skipped = 0
+    
+    for recipient in recipients:
+        if not recipient["phone_e164"] or recipient["phone_e164"] in unique:
+            skipped += 1
+            continue
+        unique[recipient["phone_e164"]] = recipient
+    
+    return list(unique.values()), skipped
+
+
+def drop_already_sent(broadcast, recipients):
+    """Skip numbers this broadcast already logged, so a resumed chunk is not sent twice"""
+    if not recipients:
+        return recipients
+    
+    sent = set(frappe.get_all(
+        "WhatsApp Message",
+        filters={
+            "whatsapp_broadcast": broadcast,
+            "whatsapp_phone_e164": ["in", [recipient["phone_e164"] for recipient in recipients]]
+        },
+        pluck="whatsapp_phone_e164"
+    ))
+    
+    return [recipient for recipient in recipients if recipient["phone_e164"] not in sent]
+
+
+def send_recipients(doc, recipients, context, progress):
+    """Send a chunk in batches, committing each batch's log and counters before the next is sent.
+    
+    Returns False when the Graph API stayed unavailable and the broadcast was paused.
+    """
+    for start in range(0, len(recipients), SEND_BATCH_SIZE):
+        batch = recipients[start:start + SEND_BATCH_SIZE]
+        results, interrupted = send_chunk(doc, batch, context)
+        log_chunk(doc, batch, results, context)
+        
+        progress["sent_count"] += sum(1 for result in results.values() if result["status"] == "sent")
+        progress["failed_count"] += sum(1 for result in results.values() if result["status"] == "failed")
+        progress["run_processed"] += len(results)
+        
+        if interrupted:
+            # Keep the checkpoint; the chunk resumes with the recipients it has not messaged yet
+            save_progress(doc, progress, None, status="Paused", last_error="Graph API unavailable; resume to continue")
+            return False
+        
+        save_progress(doc, progress, None)
+    
+    return True
+
+
+def send_chunk(doc, recipients, context):
+    """Send one chunk on a thread pool within the account's rate limit.
+    
+    Worker threads only make HTTP calls; rate limiting, the circuit breaker and metrics stay on this
+    thread. Returns (index -> result, interrupted), interrupted when the Graph API stayed unavailable.
+    """
+    results = {}
+    calls = []
+    pending = list(range(len(recipients)))
+    circuit = context["circuit"]
+    
+    # Bound in-flight requests so tokens are taken just before their request is sent
+    slots = threading.BoundedSemaphore(SEND_WORKERS * 2)
+    
+    with ThreadPoolExecutor(max_workers=SEND_WORKERS) as pool:
+        for attempt in range(1, MAX_ATTEMPTS + 1):
+            futures = {}
+            interrupted = False
+            
+            for index in pending:
+                if not wait_for_circuit(circuit):
+                    interrupted = True
+                    break
+                
+                wait_for_token(context["rate_key"], context["rate"])
+                slots.acquire()
+                
+                future = pool.submit(
+                    call_graph, "POST", context["url"], context["access_token"],
+                    json=get_template_payload(doc, recipients[index])
+                )
+                future.add_done_callback(lambda _: slots.release())
+                futures[future] = index
+            
+            retry = []
+            retry_after = None
+            
+            for future in as_completed(futures):
+                index = futures[future]
+                call = future.result()
+                calls.append((call.duration, call.status_code, attempt > 1))
+                
+                if not call.error:
+                    circuit.record_success()
+                    results[index] = {"status": "sent", "message_id": get_message_id(call.json())}
+                    continue
+                
+                if call.error.retryable:
+                    circuit.record_failure()
+                    
+                    if attempt < MAX_ATTEMPTS and should_retry(call.error, "POST"):
+                        retry.append(index)
+                        retry_after = call.retry_after or retry_after
+                        continue
+                
+                results[index] = {"status": "failed", "error": str(call.error)}
+            
+            if interrupted:
+                break
+            
+            pending = sorted(retry)
+            if not pending:
+                break
+            
+            time.sleep(get_backoff(attempt, retry_after))
+    
+    record_calls("messages", calls)
+    return results, interrupted
+
+
+def wait_for_circuit(circuit):
+    """Wait for an open circuit to let calls through again; False when it stays open too long"""
+    deadline = time.monotonic() + CIRCUIT_WAIT_SECONDS
+    
+    while not circuit.allow():
+        if time.monotonic() > deadline:
+            return False
+        time.sleep(1)
+    
+    return True
+
+
+def get_template_payload(doc, recipient):
+    """Cloud API template message for one recipient"""
+    template = {
+        "name": doc.template_name,
+        "language": {"code": doc.template_language or "en_US"}
+    }
+    
+    if recipient["parameters"]:
+        template["components"] = [{
+            "type": "body",
+            "parameters": [{"type": "text", "text": value} for value in recipient["parameters"]]
+        }]
+    
+    return {
+        "messaging_product": "whatsapp",
+        "to": recipient["phone_e164"].lstrip("+"),
+        "type": "template",
+        "template": template
+    }
+
+
+def log_chunk(doc, recipients, results, context):
+    """Bulk insert the message log of a chunk and fold sent messages into their conversations"""
+    if not results:
+        return
+    
+    now = now_datetime()
+    user = frappe.session.user
+    day = datetime.now().strftime("%Y%m%d")
+    
+    if doc.recipient_source == "Upload":
+        links = resolve_crm_links({recipients[index]["phone_e164"] for index in results})
+    else:
+        links = {recipient["phone_e164"]: recipient["links"] for recipient in recipients}
+    
+    messages = []
+    for index, result in results.items():
+        recipient = recipients[index]
+        phone_number = recipient["phone_e164"].lstrip("+")
+        link = links.get(recipient["phone_e164"]) or {}
+        
+        messages.append({
+            "message_id": result.get("message_id"),
+            "conversation_id": f"CONV-{phone_number}-{day}",
+            "from_number": context["business_number"],
+            "to_number": phone_number,
+            "message_type": "template",
+            "message_body": get_message_preview(doc, recipient),
+            "direction": "sent",
+            "status": result["status"],
+            "timestamp": now,
+            "is_bot_message": 0,
+            "lead": link.get("lead"),
+            "contact": link.get("contact"),
+            "customer": link.get("customer"),
+            "whatsapp_phone_e164": recipient["phone_e164"],
+            "media_id": None,
+            "media_mime_type": None,
+            "whatsapp_conversation": None,
+            "whatsapp_broadcast": doc.name
+        })
+    
+    conversations = assign_conversations([message for message in messages if message["status"] == "sent"])
+    for message in messages:
+        if message["message_id"]:
+            message["whatsapp_conversation"] = conversations.get(message["message_id"])
+    
+    frappe.db.bulk_insert(
+        "WhatsApp Message",
+        BROADCAST_MESSAGE_FIELDS,
+        [
+            (frappe.generate_hash(length=10), now, now, user, user,
+             *[message[field] for field in BROADCAST_MESSAGE_FIELDS[5:]])
+            for message in messages
+        ],
+        ignore_duplicates=True
+    )
+
+
+def get_message_preview(doc, recipient):
+    """Message body stored in the log: the template name and its parameters"""
+    if not recipient["parameters"]:
+        return f"[{doc.template_name}]"
+    return f"[{doc.template_name}] " + ", ".join(recipient["parameters"])
+
+
+def save_progress(doc, progress, checkpoint, status=None, last_error=None):
+    """Write counters, throughput and ETA with the checkpoint, commit, and notify the desk"""
+    elapsed = time.monotonic() - progress["run_started"]
+    rate = progress["run_processed"] / elapsed if elapsed > 0 else 0
+    done = progress["sent_count"] + progress["failed_count"] + progress["skipped_count"]
+    remaining = max(cint(doc.total_recipients) - done, 0)
+    
+    values = {
+        "sent_count": progress["sent_count"],
+        "failed_count": progress["failed_count"],
+        "skipped_count": progress["skipped_count"],
+        "messages_per_second": round(rate, 2),
+        "estimated_completion": add_to_date(now_datetime(), seconds=remaining / rate) if rate and remaining else None
+    }
+    if checkpoint is not None:
+        values["checkpoint"] = checkpoint
+        doc.checkpoint = checkpoint
+    if status:
+        values["status"] = status
+        values["last_error"] = last_error
+        if status == "Completed":
+            values["completed_at"] = now_datetime()
+            values["estimated_completion"] = None
+    
+    frappe.db.set_value(BROADCAST_DOCTYPE, doc.name, values)
+    frappe.publish_realtime(
+        PROGRESS_EVENT,
+        dict(values, broadcast=doc.name, total_recipients=doc.total_recipients),
+        doctype=BROADCAST_DOCTYPE,
+        docname=doc.name,
+        after_commit=True
+    )
+    frappe.db.commit()
+
+
+def get_template_parameters(doc):
+    return [line.strip() for line in cstr(doc.template_parameters).splitlines() if line.strip()]
+
+
+def get_recipient_filters(doc):
+    """Broadcast filters as a list, restricted to records with a WhatsApp number"""
+    filters = json.loads(doc.recipient_filters) if doc.recipient_filters else []
+    
+    if isinstance(filters, dict):
+        filters = [
+            [field, *(value if isinstance(value, (list, tuple)) else ["=", value])]
+            for field, value in filters.items()
+        ]
+    
+    return list(filters) + [[E164_FIELD, "is", "set"]]
+
+
+def get_recipient_file_path(doc):
+    return frappe.get_doc("File", {"file_url": doc.recipient_file}).get_full_path()
+
+
+def resume_broadcasts():
+    """Scheduled safety net: requeue broadcasts whose worker stopped without finishing"""
+    try:
+        stale = frappe.get_all(
+            BROADCAST_DOCTYPE,
+            filters={
+                "status": ["in", ["Queued", "Running"]],
+                "modified": ["<", now_datetime() - timedelta(minutes=STALE_MINUTES)]
+            },
+            pluck="name"
+        )
+        
+        for broadcast in stale:
+            enqueue_broadcast(broadcast)
+        
+    except Exception as e:
+        frappe.logger().error(f"Error resuming WhatsApp broadcasts: {str(e)}")
\ No newline at end of file
@@ -0,0 +1,268 @@
+"""
+Debounce window in front of the bot: messages a user sends in quick succession
+are buffered per conversation and handed to the bot partitions as one turn
+once the conversation has been quiet for the account's burst window.
+"""
+
+import json
+import time
+import frappe
+from frappe.utils import cint, flt
+from whatsapp_calling.utils.phone import normalize_phone
+from whatsapp_calling.whatsapp_integration.partition_dispatcher import dispatch_messages
+
+
+BURST_KEY = "whatsapp_calling:bot_burst:"
+PROCESSING_KEY = "whatsapp_calling:bot_burst_processing:"
+DUE_KEY = "whatsapp_calling:bot_burst_due"
+FIRST_KEY = "whatsapp_calling:bot_burst_first"
+CLAIMED_KEY = "whatsapp_calling:bot_burst_claimed"
+STATS_KEY = "whatsapp_calling:bot_burst_stats"
+FLUSH_METHOD = "whatsapp_calling.whatsapp_integration.burst_buffer.flush_bursts"
+FLUSH_JOB_ID = "whatsapp_bot_burst_flush"
+
+# A user who keeps typing is answered at the latest this many windows after the first message
+MAX_WINDOWS = 4
+FLUSH_BATCH = 500
+POLL_SECONDS = 0.5
+FLUSH_BUDGET_SECONDS = 60
+FLUSH_JOB_TIMEOUT = 300
+
+# A burst claimed this long ago and still not dispatched lost its flusher
+STALE_CLAIM_SECONDS = 60
+
+# Move due bursts to their processing lists, off the due set; returns (conversation, processing list) pairs.
+# A conversation another flusher took since it was read from the due set is skipped.
+# KEYS: due, first, claimed, then burst and processing per conversation; ARGV: now, then the conversations
+TAKE_SCRIPT = """
+local bursts = {}
+for i = 2, #ARGV do
+    if redis.call('ZSCORE', KEYS[1], ARGV[i]) then
+        local burst, processing = KEYS[2 * i], KEYS[2 * i + 1]
+        local items = redis.call('LRANGE', burst, 0, -1)
+        if #items > 0 then
+            redis.call('RPUSH', processing, unpack(items))
+            redis.call('DEL', burst)
+        end
+        redis.call('ZREM', KEYS[1], ARGV[i])
+        redis.call('HDEL', KEYS[2], ARGV[i])
+        redis.call('ZADD', KEYS[3], ARGV[1], ARGV[i])
+        bursts[#bursts + 1] = {ARGV[i], redis.call('LRANGE', processing, 0, -1)}
+    end
+end
+return bursts
+"""
+
+# Put a claimed burst back at the head of its conversation's burst, due now.
+# KEYS: due, first, claimed, burst, processing; ARGV: conversation, now
+REQUEUE_SCRIPT = """
+local items = redis.call('LRANGE', KEYS[5], 0, -1)
+for i = #items, 1, -1 do
+    redis.call('LPUSH', KEYS[4], items[i])
+end
+redis.call('DEL', KEYS[5])
+redis.call('ZREM', KEYS[3], ARGV[1])
+if #items > 0 then
+    redis.call('ZADD', KEYS[1], ARGV[2], ARGV[1])
+    redis.call('HSETNX', KEYS[2], ARGV[1], ARGV[2])
+end
+return #items
+"""
+
+
+def buffer_messages(messages, window):
+    """Hold (phone_number, message_body, message_id) tuples until their conversation is quiet for window seconds"""
+    messages = [message for message in messages if message[0]]
+    if not messages:
+        return
+    
+    now = time.time()
+    conversations = []
+    
+    try:
+        cache = frappe.cache()
+        first_key = cache.make_key(FIRST_KEY)
+        
+        pipe = cache.pipeline()
+        for phone_number, message_body, message_id in messages:
+            conversation = normalize_phone(phone_number, international=True) or phone_number
+            if conversation not in conversations:
+                conversations.append(conversation)
+            
+            pipe.rpush(cache.make_key(BURST_KEY + conversation), json.dumps({
+                "phone_number": phone_number,
+                "message_body": message_body,
+                "message_id": message_id
+            }))
+            pipe.hsetnx(first_key, conversation, now)
+        pipe.hmget(first_key, conversations)
+        firsts = pipe.execute()[-1]
+        
+        # Every message pushes the turn back by a window, up to MAX_WINDOWS after the first one
+        pipe = cache.pipeline()
+        for conversation, first in zip(conversations, firsts):
+            due = min(now + window, flt(first or now) + window * MAX_WINDOWS)
+            pipe.zadd(cache.make_key(DUE_KEY), {conversation: due})
+        pipe.execute()
+        
+    except Exception as e:
+        # Without Redis there is no window; answer every message rather than drop them
+        frappe.logger().error(f"Bot burst buffer unavailable, dispatching directly: {str(e)}")
+        dispatch_messages(messages)
+        return
+    
+    schedule_flush()
+
+
+def schedule_flush(continued=False):
+    """Queue the flush job unless one is already queued or running.
+    
+    A job that ran out of budget is still running under its own id, so its follow-up
+    alternates between the plain and the continued job id.
+    """
+    try:
+        frappe.enqueue(
+            FLUSH_METHOD,
+            queue="short",
+            timeout=FLUSH_JOB_TIMEOUT,
+            job_id=f"{FLUSH_JOB_ID}{'_continued' if continued else ''}",
+            deduplicate=True,
+            continued=continued
+        )
+        
+    except Exception as e:
+        # The scheduler recovery job flushes whatever is left
+        frappe.logger().error(f"Error scheduling bot burst flush: {str(e)}")
+
+
+def flush_bursts(continued=False):
+    """Background worker: hand bursts to the bot partitions as they fall due, until none are waiting"""
+    deadline = time.monotonic() + FLUSH_BUDGET_SECONDS
+    flushed = 0
+    
+    while True:
+        flushed += flush_due_bursts()
+        
+        next_due = get_next_due()
+        if next_due is None:
+            break
+        
+        if time.monotonic() >= deadline:
+            schedule_flush(continued=not cint(continued))
+            break
+        
+        time.sleep(min(max(next_due - time.time(), 0.05), POLL_SECONDS))
+    
+    return flushed
+
+
+def flush_due_bursts(now=None):
+    """Merge every due burst into one message and dispatch it; returns the number of bursts"""
+    cache = frappe.cache()
+    due_key = cache.make_key(DUE_KEY)
+    claimed_key = cache.make_key(CLAIMED_KEY)
+    
+    conversations = [
+        frappe.safe_decode(conversation)
+        for conversation in cache.zrangebyscore(due_key, 0, now or time.time(), start=0, num=FLUSH_BATCH)
+    ]
+    if not conversations:
+        return 0
+    
+    # Atomic, so a message arriving meanwhile lands either in this burst or in the next one, and two
+    # flushers never take the same burst; it stays in Redis until it was dispatched
+    keys = [due_key, cache.make_key(FIRST_KEY), claimed_key]
+    for conversation in conversations:
+        keys.extend([cache.make_key(BURST_KEY + conversation), cache.make_key(PROCESSING_KEY + conversation)])
+    results = cache.eval(TAKE_SCRIPT, len(keys), *keys, time.time(), *conversations)
+    if not results:
+        return 0
+    
+    taken = [frappe.safe_decode(conversation) for conversation, _ in results]
+    bursts = [[json.loads(item) for item in items] for _, items in results]
+    merged = [merge_burst(burst) for burst in bursts if burst]
+    
+    dispatch_messages(merged)
+    
+    # Only the bursts this flusher took; another flusher's claim stays with it
+    pipe = cache.pipeline()
+    for conversation in taken:
+        pipe.delete(cache.make_key(PROCESSING_KEY + conversation))
+    pipe.zrem(claimed_key, *taken)
+    pipe.execute()
+    
+    record_bursts(len(merged), sum(len(burst) for burst in bursts))
+    return len(merged)
+
+
+def merge_burst(burst):
+    """One (phone_number, message_body, message_id) tuple for a burst, answering to its last message"""
+    body = "\n".join(message["message_body"] for message in burst if message.get("message_body"))
+    return burst[-1]["phone_number"], body, burst[-1].get("message_id")
+
+
+def get_next_due():
+    """Due time of the next waiting burst, or None when nothing is buffered"""
+    cache = frappe.cache()
+    head = cache.zrange(cache.make_key(DUE_KEY), 0, 0, withscores=True)
+    return head[0][1] if head else None
+
+
+def requeue_stale_claims():
+    """Put bursts a stopped flusher claimed but never dispatched back in the buffer; returns how many"""
+    cache = frappe.cache()
+    claimed_key = cache.make_key(CLAIMED_KEY)
+    stale = cache.zrangebyscore(claimed_key, 0, time.time() - STALE_CLAIM_SECONDS)
+    
+    for conversation in stale:
+        conversation = frappe.safe_decode(conversation)
+        cache.eval(
+            REQUEUE_SCRIPT, 5,
+            cache.make_key(DUE_KEY), cache.make_key(FIRST_KEY), claimed_key,
+            cache.make_key(BURST_KEY + conversation), cache.make_key(PROCESSING_KEY + conversation),
+            conversation, time.time()
+        )
+    
+    return len(stale)
+
+
+def record_bursts(bursts, messages):
+    try:
+        cache = frappe.cache()
+        pipe = cache.pipeline()
+        pipe.hincrby(cache.make_key(STATS_KEY), "bursts", bursts)
+        pipe.hincrby(cache.make_key(STATS_KEY), "messages", messages)
+        pipe.execute()
+        
+    except Exception as e:
+        frappe.logger().error(f"Error recording bot burst stats: {str(e)}")
+
+
+def recover_bursts():
+    """Scheduled safety net: flush bursts left behind by a flush job that stopped"""
+    try:
+        requeue_stale_claims()
+        
+        if get_next_due() is not None:
+            flush_due_bursts()
+            schedule_flush()
+        
+    except Exception as e:
+        frappe.logger().error(f"Error recovering bot bursts: {str(e)}")
+
+
+@frappe.whitelist()
+def get_burst_stats():
+    """Report conversations waiting out their window and how many messages each bot turn merged"""
+    frappe.only_for("System Manager")
+    
+    cache = frappe.cache()
+    pending = cache.zcard(cache.make_key(DUE_KEY))
+    bursts, messages = [cint(value) for value in cache.hmget(cache.make_key(STATS_KEY), ["bursts", "messages"])]
+    
+    return {
+        "pending_conversations": pending,
+        "bursts": bursts,
+        "messages": messages,
+        "messages_per_turn": flt(messages / bursts, 2) if bursts else None
+    }
\ No newline at end of file
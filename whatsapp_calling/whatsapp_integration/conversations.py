@@ -0,0 +1,272 @@
+import frappe
+from datetime import timedelta
+from frappe.utils import get_datetime, now_datetime, cint
+from whatsapp_calling.utils.phone import normalize_phones
+
+
+CONVERSATION_DOCTYPE = "WhatsApp Conversation"
+
+# A message after this much silence starts a new session; matches WhatsApp's customer service window
+SESSION_GAP = timedelta(hours=24)
+PREVIEW_LENGTH = 140
+
+CONVERSATION_FIELDS = [
+    "name", "whatsapp_phone_e164", "business_number", "open_key", "status", "assigned_to",
+    "session_started_at", "last_message_at", "last_inbound_at", "last_outbound_at",
+    "last_message_id", "last_message_preview", "last_message_direction", "last_message_status",
+    "unread_count", "message_count", "lead", "contact", "customer"
+]
+
+INBOX_FIELDS = [
+    "name", "whatsapp_phone_e164", "status", "assigned_to", "last_message_at",
+    "last_message_preview", "last_message_direction", "last_message_status", "unread_count",
+    "lead", "contact", "customer"
+]
+
+CRM_LINK_FIELDS = ("lead", "contact", "customer")
+
+SAVEPOINT = "whatsapp_conversations"
+
+
+def assign_conversations(messages):
+    """Fold new messages into their conversations; returns message_id -> conversation name.
+    
+    Each message is a dict with message_id, whatsapp_phone_e164, from_number, to_number,
+    direction, message_type, message_body, status, timestamp and the CRM link fields.
+    """
+    messages = [message for message in messages if message.get("whatsapp_phone_e164")]
+    if not messages:
+        return {}
+    
+    try:
+        frappe.db.savepoint(SAVEPOINT)
+        return fold_messages(messages)
+        
+    except Exception as e:
+        if not frappe.db.is_duplicate_entry(e):
+            raise
+        
+        # A concurrent batch opened the same session first; its row is committed now, so fold into it
+        frappe.db.rollback(save_point=SAVEPOINT)
+        return fold_messages(messages)
+
+
+def fold_messages(messages):
+    business_numbers = get_business_numbers(messages)
+    conversations = get_open_conversations({message["whatsapp_phone_e164"] for message in messages})
+    changed = {}
+    created = set()
+    assigned = {}
+    
+    for message in sorted(messages, key=get_message_time):
+        key = (message["whatsapp_phone_e164"], business_numbers.get(get_business_number(message)))
+        timestamp = get_message_time(message)
+        conversation = conversations.get(key)
+        
+        if conversation and timestamp - get_datetime(conversation.last_message_at) > SESSION_GAP:
+            # The previous session went quiet; close it and start a new one
+            conversation.status = "Closed"
+            conversation.open_key = None
+            changed[conversation.name] = conversation
+            conversation = new_conversation(key, timestamp, message, previous=conversation)
+            created.add(conversation.name)
+            
+        elif not conversation:
+            conversation = new_conversation(key, timestamp, message)
+            created.add(conversation.name)
+        
+        conversations[key] = conversation
+        apply_message(conversation, message, timestamp)
+        changed[conversation.name] = conversation
+        assigned[message.get("message_id")] = conversation.name
+    
+    save_conversations(changed, created)
+    return assigned
+
+
+def get_open_conversations(phone_numbers):
+    """Open conversations for the given E.164 numbers, keyed by (number, business number)"""
+    rows = frappe.get_all(
+        CONVERSATION_DOCTYPE,
+        filters={"whatsapp_phone_e164": ["in", list(phone_numbers)], "status": "Open"},
+        fields=CONVERSATION_FIELDS,
+        # Concurrent batches for the same customer update the row one after the other
+        for_update=True
+    )
+    
+    # Rows from before business numbers were normalized are keyed like new messages
+    business_numbers = normalize_phones({row.business_number for row in rows if row.business_number}, international=True)
+    
+    conversations = {}
+    for row in rows:
+        key = (row.whatsapp_phone_e164, business_numbers.get(row.business_number) or row.business_number)
+        current = conversations.get(key)
+        if not current or get_datetime(row.last_message_at) > get_datetime(current.last_message_at):
+            conversations[key] = row
+    
+    return conversations
+
+
+def new_conversation(key, timestamp, message, previous=None):
+    """A new open session; the assigned agent carries over from the previous session"""
+    phone_e164, business_number = key
+    
+    assigned_to = previous.assigned_to if previous else None
+    if not assigned_to and message.get("lead"):
+        assigned_to = frappe.db.get_value("Lead", message["lead"], "lead_owner")
+    
+    return frappe._dict({
+        "name": frappe.generate_hash(length=10),
+        "whatsapp_phone_e164": phone_e164,
+        "business_number": business_number,
+        "open_key": get_open_key(phone_e164, business_number),
+        "status": "Open",
+        "assigned_to": assigned_to,
+        "session_started_at": timestamp,
+        "last_message_at": timestamp,
+        "unread_count": 0,
+        "message_count": 0,
+        "lead": previous.lead if previous else None,
+        "contact": previous.contact if previous else None,
+        "customer": previous.customer if previous else None
+    })
+
+
+def apply_message(conversation, message, timestamp):
+    """Update a conversation's counters and last-message fields for one message"""
+    conversation.message_count = cint(conversation.message_count) + 1
+    
+    for fieldname in CRM_LINK_FIELDS:
+        if message.get(fieldname):
+            conversation[fieldname] = message[fieldname]
+    
+    if message.get("direction") == "received":
+        if message.get("status") != "read":
+            conversation.unread_count = cint(conversation.unread_count) + 1
+        conversation.last_inbound_at = latest(conversation.last_inbound_at, timestamp)
+    else:
+        conversation.last_outbound_at = latest(conversation.last_outbound_at, timestamp)
+    
+    # Messages can arrive out of order; the preview always shows the newest one
+    if timestamp >= get_datetime(conversation.last_message_at) or not conversation.last_message_id:
+        conversation.last_message_at = timestamp
+        conversation.last_message_id = message.get("message_id")
+        conversation.last_message_preview = get_preview(message)
+        conversation.last_message_direction = message.get("direction")
+        conversation.last_message_status = message.get("status")
+
+
+def save_conversations(changed, created):
+    """Update changed conversations in place, then insert new ones in one statement"""
+    now = now_datetime()
+    user = frappe.session.user
+    fields = CONVERSATION_FIELDS[1:]
+    
+    # Closed sessions first, so they give up their open key before their successors take it
+    for name, conversation in changed.items():
+        if name not in created:
+            frappe.db.set_value(
+                CONVERSATION_DOCTYPE,
+                name,
+                {field: conversation.get(field) for field in fields},
+                update_modified=True
+            )
+    
+    new_rows = [
+        (conversation.name, now, now, user, user, *[conversation.get(field) for field in fields])
+        for name, conversation in changed.items()
+        if name in created
+    ]
+    if new_rows:
+        frappe.db.bulk_insert(
+            CONVERSATION_DOCTYPE,
+            ["name", "creation", "modified", "owner", "modified_by", *fields],
+            new_rows
+        )
+
+
+def get_business_number(message):
+    """The business side of a message as stored: Meta's display number inbound, the account's number outbound"""
+    return message.get("to_number") if message.get("direction") == "received" else message.get("from_number")
+
+
+def get_business_numbers(messages):
+    """Raw business number -> E.164, so both spellings of the account's number key the same conversation"""
+    numbers = {get_business_number(message) for message in messages} - {None, ""}
+    normalized = normalize_phones(numbers, international=True)
+    return {number: normalized.get(number) or number for number in numbers}
+
+
+def get_open_key(phone_e164, business_number):
+    return f"{phone_e164}|{business_number or ''}"
+
+
+def get_message_time(message):
+    return get_datetime(message.get("timestamp")) if message.get("timestamp") else now_datetime()
+
+
+def get_preview(message):
+    """Short text for inbox rows; media messages without a caption show their type"""
+    body = (message.get("message_body") or "").strip()
+    if not body:
+        return f"[{message.get('message_type') or 'text'}]"
+    return body[:PREVIEW_LENGTH]
+
+
+def latest(current, timestamp):
+    if not current:
+        return timestamp
+    return max(get_datetime(current), timestamp)
+
+
+def decrement_unread(conversation, count=1):
+    """Lower the unread counter after inbound messages were read"""
+    frappe.db.sql(
+        f"""
+        update `tab{CONVERSATION_DOCTYPE}`
+        set unread_count = greatest(unread_count - %(count)s, 0)
+        where name = %(name)s
+        """,
+        {"name": conversation, "count": cint(count)}
+    )
+
+
+@frappe.whitelist()
+def mark_conversation_read(conversation):
+    """Mark every unread inbound message of a conversation as read"""
+    frappe.get_doc(CONVERSATION_DOCTYPE, conversation).check_permission("write")
+    
+    frappe.db.sql(
+        """
+        update `tabWhatsApp Message`
+        set status = 'read', modified = %(now)s
+        where whatsapp_conversation = %(conversation)s
+        and direction = 'received' and status != 'read'
+        """,
+        {"conversation": conversation, "now": now_datetime()}
+    )
+    frappe.db.set_value(CONVERSATION_DOCTYPE, conversation, "unread_count", 0)
+    frappe.db.commit()
+    
+    return {"success": True}
+
+
+@frappe.whitelist()
+def get_inbox(status="Open", assigned_to=None, unread_only=False, start=0, limit=20):
+    """Conversations for the inbox, most recent first"""
+    filters = {"status": status}
+    
+    if assigned_to:
+        filters["assigned_to"] = assigned_to
+    
+    if cint(unread_only):
+        filters["unread_count"] = [">", 0]
+    
+    return frappe.get_list(
+        CONVERSATION_DOCTYPE,
+        filters=filters,
+        fields=INBOX_FIELDS,
+        order_by="last_message_at desc",
+        start=cint(start),
+        limit=cint(limit) or 20
+    )
\ No newline at end of file
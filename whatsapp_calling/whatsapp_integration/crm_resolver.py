@@ -0,0 +1,209 @@
+import frappe
+import json
+from whatsapp_calling.utils.phone import E164_FIELD, normalize_phone, normalize_phones
+
+
+INDEX_KEY = "whatsapp_calling:phone_index"
+REBUILD_CHUNK_SIZE = 5000
+
+# When a number belongs to several records, the first doctype wins
+CRM_DOCTYPES = ("Lead", "Contact", "Customer")
+PHONE_FIELDS = ("mobile_no", "whatsapp_phone")
+
+
+def resolve_phone(phone_number, international=False):
+    """Resolve one phone number to a (doctype, name) tuple, or None"""
+    return resolve_phones([phone_number], international=international).get(phone_number)
+
+
+def resolve_phones(phone_numbers, international=False):
+    """Resolve many phone numbers in one index round trip plus one query per doctype for misses.
+    
+    Pass international=True for WhatsApp numbers (wa_ids), which never carry a "+".
+    """
+    keys = {}
+    for phone_number, key in normalize_phones(phone_numbers, international=international).items():
+        if key:
+            keys.setdefault(key, []).append(phone_number)
+    
+    if not keys:
+        return {}
+    
+    resolved = read_index(list(keys))
+    misses = [key for key in keys if key not in resolved]
+    
+    if misses:
+        found = lookup_database(misses)
+        if found:
+            write_index(found)
+        resolved.update(found)
+    
+    results = {}
+    for key, record in resolved.items():
+        for phone_number in keys[key]:
+            results[phone_number] = record
+    
+    return results
+
+
+def get_link_fields(record):
+    """Map a resolved record to WhatsApp Message link fields"""
+    if not record:
+        return {}
+    
+    doctype, name = record
+    return {doctype.lower(): name}
+
+
+def read_index(keys):
+    """Fetch index entries for normalized numbers"""
+    try:
+        cache = frappe.cache()
+        values = cache.hmget(cache.make_key(INDEX_KEY), keys)
+        
+        return {
+            key: tuple(json.loads(value))
+            for key, value in zip(keys, values) if value
+        }
+        
+    except Exception as e:
+        frappe.logger().error(f"Phone index unavailable: {str(e)}")
+        return {}
+
+
+def write_index(entries):
+    """Store normalized number -> (doctype, name) entries"""
+    try:
+        cache = frappe.cache()
+        pipe = cache.pipeline()
+        pipe.hset(cache.make_key(INDEX_KEY), mapping={
+            key: json.dumps(list(record)) for key, record in entries.items()
+        })
+        pipe.execute()
+        
+    except Exception as e:
+        frappe.logger().error(f"Error writing phone index: {str(e)}")
+
+
+def lookup_database(keys):
+    """Find CRM records for normalized numbers, one indexed query per doctype"""
+    found = {}
+    
+    for doctype in CRM_DOCTYPES:
+        pending = [key for key in keys if key not in found]
+        if not pending:
+            break
+        
+        records = frappe.get_all(
+            doctype,
+            filters={E164_FIELD: ["in", pending]},
+            fields=["name", E164_FIELD]
+        )
+        
+        for record in records:
+            key = record.get(E164_FIELD)
+            if key not in found:
+                found[key] = (doctype, record.name)
+    
+    return found
+
+
+def get_doc_phone_keys(doc):
+    """Normalized numbers stored on a CRM document"""
+    keys = {normalize_phone(doc.get(fieldname)) for fieldname in PHONE_FIELDS if doc.get(fieldname)}
+    keys.discard(None)
+    
+    return keys
+
+
+def update_phone_index(doc, method=None):
+    """Doc event: keep the index current when a Lead, Contact or Customer is saved"""
+    try:
+        keys = get_doc_phone_keys(doc)
+        
+        previous = doc.get_doc_before_save()
+        stale = get_doc_phone_keys(previous) - keys if previous else set()
+        if stale:
+            remove_entries(stale, doc.doctype, doc.name)
+        
+        if not keys:
+            return
+        
+        current = read_index(list(keys))
+        rank = CRM_DOCTYPES.index(doc.doctype)
+        
+        # Never replace a higher priority record with a lower one
+        entries = {
+            key: (doc.doctype, doc.name)
+            for key in keys
+            if key not in current or CRM_DOCTYPES.index(current[key][0]) >= rank
+        }
+        if entries:
+            write_index(entries)
+        
+    except Exception as e:
+        frappe.logger().error(f"Error updating phone index for {doc.doctype} {doc.name}: {str(e)}")
+
+
+def remove_from_phone_index(doc, method=None):
+    """Doc event: drop index entries that point at a deleted record"""
+    try:
+        remove_entries(get_doc_phone_keys(doc), doc.doctype, doc.name)
+        
+    except Exception as e:
+        frappe.logger().error(f"Error removing {doc.doctype} {doc.name} from phone index: {str(e)}")
+
+
+def remove_entries(keys, doctype, name):
+    """Delete entries for the given numbers that still point at this record"""
+    current = read_index(list(keys))
+    owned = [key for key, record in current.items() if record == (doctype, name)]
+    
+    if owned:
+        # The next lookup falls back to the database and finds any other owner
+        cache = frappe.cache()
+        pipe = cache.pipeline()
+        pipe.hdel(cache.make_key(INDEX_KEY), *owned)
+        pipe.execute()
+
+
+@frappe.whitelist()
+def rebuild_phone_index():
+    """Rebuild the whole index from Lead, Contact and Customer"""
+    frappe.only_for("System Manager")
+    frappe.enqueue(
+        "whatsapp_calling.whatsapp_integration.crm_resolver.build_phone_index",
+        queue="long",
+        job_id="whatsapp_phone_index_rebuild",
+        deduplicate=True
+    )
+
+
+def build_phone_index():
+    """Background job: load every CRM number into a fresh index"""
+    cache = frappe.cache()
+    cache.pipeline().delete(cache.make_key(INDEX_KEY)).execute()
+    
+    # Lowest priority first so higher priority doctypes overwrite shared numbers
+    for doctype in reversed(CRM_DOCTYPES):
+        last_name = ""
+        
+        while True:
+            records = frappe.get_all(
+                doctype,
+                filters={"name": [">", last_name]},
+                fields=["name", *PHONE_FIELDS],
+                order_by="name asc",
+                limit=REBUILD_CHUNK_SIZE
+            )
+            if not records:
+                break
+            
+            entries = {}
+            for record in records:
+                for key in get_doc_phone_keys(record):
+                    entries[key] = (doctype, record.name)
+            
+            if entries:
+                write_index(entries)
+            last_name = records[-1].name
\ No newline at end of file
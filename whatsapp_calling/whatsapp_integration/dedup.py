@@ -0,0 +1,112 @@
+import frappe
+
+
+DEDUP_KEY_PREFIX = "whatsapp_calling:wamid:"
+STATS_KEY = "whatsapp_calling:wamid_dedup_stats"
+
+# Meta keeps retrying undelivered webhooks for days, so remember ids well past that
+DEDUP_TTL_SECONDS = 3 * 24 * 60 * 60
+
+# A claim only lasts this long until its batch commits, so a replay after a killed
+# consumer (requeued after inbound_queue.STALE_PROCESSING_MINUTES) is processed again
+CLAIM_SECONDS = 5 * 60
+
+
+def claim_message_ids(message_ids):
+    """Atomically mark message ids as in flight across all workers.
+    
+    Returns the ids seen for the first time, or None when Redis is unavailable
+    and the caller has to fall back to the database check. Claims expire after
+    CLAIM_SECONDS unless confirm_message_ids keeps them once the batch commits.
+    """
+    message_ids = [message_id for message_id in message_ids if message_id]
+    if not message_ids:
+        return set()
+    
+    try:
+        cache = frappe.cache()
+        pipe = cache.pipeline()
+        
+        for message_id in message_ids:
+            pipe.set(cache.make_key(DEDUP_KEY_PREFIX + message_id), 1, nx=True, ex=CLAIM_SECONDS)
+        
+        results = pipe.execute()
+        
+        new_ids = {message_id for message_id, claimed in zip(message_ids, results) if claimed}
+        record_stats(hits=len(message_ids) - len(new_ids), misses=len(new_ids))
+        
+        return new_ids
+        
+    except Exception as e:
+        frappe.logger().error(f"Message dedup cache unavailable: {str(e)}")
+        return None
+
+
+def confirm_message_ids(message_ids):
+    """Remember committed ids for the full retry window"""
+    message_ids = [message_id for message_id in message_ids if message_id]
+    if not message_ids:
+        return
+    
+    try:
+        cache = frappe.cache()
+        pipe = cache.pipeline()
+        
+        for message_id in message_ids:
+            pipe.set(cache.make_key(DEDUP_KEY_PREFIX + message_id), 1, ex=DEDUP_TTL_SECONDS)
+        
+        pipe.execute()
+        
+    except Exception as e:
+        # The unique message_id index still rejects a later retry
+        frappe.logger().error(f"Error confirming message dedup keys: {str(e)}")
+
+
+def release_message_ids(message_ids):
+    """Forget claimed ids so a Meta retry is processed after a failure"""
+    message_ids = [message_id for message_id in message_ids if message_id]
+    if not message_ids:
+        return
+    
+    try:
+        cache = frappe.cache()
+        pipe = cache.pipeline()
+        pipe.delete(*[cache.make_key(DEDUP_KEY_PREFIX + message_id) for message_id in message_ids])
+        pipe.execute()
+        
+    except Exception as e:
+        frappe.logger().error(f"Error releasing message dedup keys: {str(e)}")
+
+
+def record_stats(hits=0, misses=0):
+    """Increment the shared hit and miss counters"""
+    cache = frappe.cache()
+    pipe = cache.pipeline()
+    key = cache.make_key(STATS_KEY)
+    
+    if hits:
+        pipe.hincrby(key, "hits", hits)
+    if misses:
+        pipe.hincrby(key, "misses", misses)
+    
+    pipe.execute()
+
+
+@frappe.whitelist()
+def get_dedup_stats():
+    """Report duplicate webhook deliveries dropped by the cache"""
+    frappe.only_for("System Manager")
+    
+    # Counters are raw integers, so read them past the pickling cache wrapper
+    cache = frappe.cache()
+    stats = cache.pipeline().hgetall(cache.make_key(STATS_KEY)).execute()[0] or {}
+    
+    hits = int(stats.get(b"hits", 0))
+    misses = int(stats.get(b"misses", 0))
+    total = hits + misses
+    
+    return {
+        "hits": hits,
+        "misses": misses,
+        "hit_rate": round(hits / total, 4) if total else 0
+    }
\ No newline at end of file
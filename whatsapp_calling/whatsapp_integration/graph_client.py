@@ -0,0 +1,424 @@
+import frappe
+import random
+import threading
+import time
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import NewConnectionError
+from frappe.utils import cint
+from whatsapp_calling.utils.settings_cache import get_whatsapp_settings, get_settings_secret
+
+
+DEFAULT_GRAPH_API_URL = "https://graph.facebook.com"
+DEFAULT_GRAPH_API_VERSION = "v17.0"
+GRAPH_API_BASE_URL = f"{DEFAULT_GRAPH_API_URL}/{DEFAULT_GRAPH_API_VERSION}"
+
+RATE_KEY = "whatsapp_calling:graph_rate:"
+METRICS_KEY = "whatsapp_calling:graph_metrics:"
+LATENCY_KEY = "whatsapp_calling:graph_latency:"
+METRIC_ENDPOINTS = ("messages", "account")
+LATENCY_SAMPLES = 1000
+
+TIMEOUT = (5, 30)
+POOL_SIZE = 10
+MAX_ATTEMPTS = 4
+BACKOFF_BASE_SECONDS = 0.5
+BACKOFF_MAX_SECONDS = 30
+
+# Meta's default throughput is 80 messages per second per business number, 1000 after an upgrade
+DEFAULT_THROUGHPUT = 80
+MAX_RATE_WAIT_SECONDS = 10
+
+# Graph error codes for throttling, sent with HTTP 400 as well as 429
+THROTTLING_ERROR_CODES = (4, 80007, 130429, 131056)
+
+CIRCUIT_FAILURE_THRESHOLD = 5
+CIRCUIT_COOLDOWN_SECONDS = 30
+
+# Refill a per-number bucket and take one token; returns the seconds to wait when it is empty
+TOKEN_BUCKET_SCRIPT = """
+local rate = tonumber(ARGV[1])
+local now = tonumber(ARGV[2])
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(state[1]) or rate
+local ts = tonumber(state[2]) or now
+tokens = math.min(rate, tokens + math.max(now - ts, 0) * rate)
+local wait = 0
+if tokens >= 1 then
+    tokens = tokens - 1
+else
+    wait = (1 - tokens) / rate
+end
+redis.call('HSET', KEYS[1], 'tokens', tokens, 'ts', now)
+redis.call('EXPIRE', KEYS[1], 60)
+return tostring(wait)
+"""
+
+_sessions = threading.local()
+_circuits = {}
+_local_buckets = {}
+_lock = threading.Lock()
+
+
+class GraphAPIError(Exception):
+    """A failed Graph API call; retryable errors were throttling, server or connection errors.
+    
+    unsent errors were throttled or never reached Meta, so even a message send is safe to repeat.
+    """
+    
+    def __init__(self, message, status_code=None, retryable=False, response=None, unsent=False):
+        super().__init__(message)
+        self.status_code = status_code
+        self.retryable = retryable
+        self.response = response
+        self.unsent = unsent
+
+
+class GraphCall:
+    """Outcome of a single Graph API request"""
+    
+    def __init__(self, response, error, duration):
+        self.response = response
+        self.error = error
+        self.duration = duration
+    
+    @property
+    def status_code(self):
+        return self.response.status_code if self.response is not None else None
+    
+    @property
+    def retry_after(self):
+        return self.response.headers.get("Retry-After") if self.response is not None else None
+    
+    def json(self):
+        return self.response.json() if self.response is not None and self.response.content else {}
+
+
+class CircuitBreaker:
+    """Stops calls to an account after repeated failures, then lets one trial call through per cooldown"""
+    
+    def __init__(self, threshold=CIRCUIT_FAILURE_THRESHOLD, cooldown=CIRCUIT_COOLDOWN_SECONDS):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.failures = 0
+        self.opened_at = None
+        self.lock = threading.Lock()
+    
+    def allow(self):
+        with self.lock:
+            if self.opened_at is None:
+                return True
+            
+            if time.monotonic() - self.opened_at >= self.cooldown:
+                # Half open: this call is the trial, the next ones wait for its result
+                self.opened_at = time.monotonic()
+                return True
+            
+            return False
+    
+    def record_success(self):
+        with self.lock:
+            self.failures = 0
+            self.opened_at = None
+    
+    def record_failure(self):
+        with self.lock:
+            self.failures += 1
+            if self.failures >= self.threshold:
+                self.opened_at = time.monotonic()
+    
+    @property
+    def is_open(self):
+        return self.opened_at is not None
+
+
+class TokenBucket:
+    """Process-local token bucket, used when Redis is unavailable"""
+    
+    def __init__(self, rate):
+        self.rate = rate
+        self.tokens = rate
+        self.updated_at = time.monotonic()
+        self.lock = threading.Lock()
+    
+    def take(self):
+        """Take one token; returns the seconds to wait when the bucket is empty"""
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.rate, self.tokens + (now - self.updated_at) * self.rate)
+            self.updated_at = now
+            
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return 0
+            
+            return (1 - self.tokens) / self.rate
+
+
+def send_message(payload, phone_number_id=None, access_token=None):
+    """Send a message payload from the business number; returns the Graph response"""
+    phone_number_id = phone_number_id or get_whatsapp_settings().phone_number_id
+    
+    return graph_request(
+        "POST",
+        f"{phone_number_id}/messages",
+        json=payload,
+        rate_key=phone_number_id,
+        access_token=access_token,
+        endpoint="messages"
+    )
+
+
+def get_message_id(response):
+    """wamid of a sent message from the messages endpoint response"""
+    messages = response.get("messages") or [{}]
+    return messages[0].get("id")
+
+
+def graph_request(method, path, json=None, params=None, access_token=None, rate_key=None,
+                  endpoint="account", base_url=None, max_attempts=MAX_ATTEMPTS):
+    """Call the Graph API through the pooled session with rate limiting, retries and a circuit breaker.
+    
+    Throttling (429), server errors and connection errors are retried with jittered exponential backoff,
+    honouring Retry-After. A POST has no idempotency key, so it is only repeated when it was throttled
+    or never connected. Returns the decoded JSON body or raises GraphAPIError.
+    """
+    access_token = access_token or get_settings_secret("access_token")
+    circuit = get_circuit(rate_key or endpoint)
+    url = f"{(base_url or get_base_url()).rstrip('/')}/{path.lstrip('/')}"
+    
+    for attempt in range(1, max_attempts + 1):
+        if not circuit.allow():
+            raise GraphAPIError(f"Graph API circuit open for {rate_key or endpoint}", retryable=True, unsent=True)
+        
+        if rate_key:
+            wait_for_token(rate_key)
+        
+        call = call_graph(method, url, access_token, json=json, params=params)
+        record_call(endpoint, call.duration, call.status_code, attempt > 1)
+        error = call.error
+        
+        if not error:
+            circuit.record_success()
+            return call.json()
+        
+        if error.retryable:
+            circuit.record_failure()
+        
+        if not should_retry(error, method) or attempt == max_attempts:
+            raise error
+        
+        time.sleep(get_backoff(attempt, call.retry_after))
+
+
+def should_retry(error, method):
+    """Whether a failed call may be repeated; Meta may already have acted on a POST that failed late"""
+    return error.retryable and (method.upper() != "POST" or error.unsent)
+
+
+def is_connect_error(error):
+    """True when the request failed before a connection was made, so it never reached Meta"""
+    if isinstance(error, requests.exceptions.ConnectTimeout):
+        return True
+    
+    reason = getattr(error.args[0], "reason", None) if error.args else None
+    return isinstance(error, requests.exceptions.ConnectionError) and isinstance(reason, NewConnectionError)
+
+
+def call_graph(method, url, access_token, json=None, params=None):
+    """One Graph API call without rate limiting, retries or metrics; safe to run on worker threads"""
+    started = time.monotonic()
+    
+    try:
+        response = get_session().request(
+            method,
+            url,
+            json=json,
+            params=params,
+            headers={"Authorization": f"Bearer {access_token}"},
+            timeout=TIMEOUT
+        )
+        
+    except requests.RequestException as e:
+        error = GraphAPIError(f"Graph API request failed: {str(e)}", retryable=True, unsent=is_connect_error(e))
+        return GraphCall(None, error, time.monotonic() - started)
+    
+    return GraphCall(response, get_response_error(response), time.monotonic() - started)
+
+
+def get_base_url(settings=None):
+    """Versioned Graph API root configured on the business account"""
+    if settings is None:
+        settings = get_whatsapp_settings()
+    
+    url = (settings.get("graph_api_url") or DEFAULT_GRAPH_API_URL).strip().rstrip("/")
+    version = (settings.get("graph_api_version") or DEFAULT_GRAPH_API_VERSION).strip().strip("/")
+    return f"{url}/{version}"
+
+
+def get_response_error(response):
+    """GraphAPIError for an error response, or None for a success"""
+    if response.status_code < 400:
+        return None
+    
+    try:
+        details = response.json().get("error", {})
+    except ValueError:
+        details = {}
+    
+    return get_graph_error(response.status_code, details, response.text, response)
+
+
+def get_graph_error(status_code, details, text=None, response=None):
+    """GraphAPIError from an error status and the error object of the body"""
+    throttled = status_code == 429 or details.get("code") in THROTTLING_ERROR_CODES
+    return GraphAPIError(
+        f"Graph API returned {status_code}: {details.get('message') or text}",
+        status_code=status_code,
+        retryable=throttled or status_code >= 500,
+        response=response,
+        unsent=throttled
+    )
+
+
+def get_backoff(attempt, retry_after=None):
+    """Seconds before the next attempt: Retry-After when given, else full-jitter exponential backoff"""
+    try:
+        if retry_after:
+            return min(float(retry_after), BACKOFF_MAX_SECONDS)
+    except ValueError:
+        pass
+    
+    return random.uniform(0, min(BACKOFF_MAX_SECONDS, BACKOFF_BASE_SECONDS * 2 ** attempt))
+
+
+def get_session():
+    """One keep-alive session per worker thread, without urllib3's own retries"""
+    session = getattr(_sessions, "session", None)
+    if session is None:
+        session = _sessions.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=POOL_SIZE, pool_maxsize=POOL_SIZE, max_retries=0)
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+    return session
+
+
+def get_circuit(key):
+    """The circuit breaker for an account or endpoint in this process"""
+    circuit = _circuits.get(key)
+    if circuit is None:
+        with _lock:
+            circuit = _circuits.setdefault(key, CircuitBreaker())
+    return circuit
+
+
+def get_throughput():
+    """Messages per second allowed for the business number"""
+    return cint(get_whatsapp_settings().messaging_throughput) or DEFAULT_THROUGHPUT
+
+
+def wait_for_token(rate_key, rate=None):
+    """Block until the number's token bucket allows another call"""
+    rate = rate or get_throughput()
+    deadline = time.monotonic() + MAX_RATE_WAIT_SECONDS
+    
+    while True:
+        wait = take_token(rate_key, rate)
+        if not wait:
+            return
+        
+        if time.monotonic() + wait > deadline:
+            raise GraphAPIError(
+                f"Rate limit wait exceeded for {rate_key}", status_code=429, retryable=True, unsent=True
+            )
+        
+        time.sleep(wait)
+
+
+def take_token(rate_key, rate):
+    """Take a token from the bucket shared by every worker; falls back to a process-local bucket"""
+    try:
+        cache = frappe.cache()
+        return float(cache.eval(TOKEN_BUCKET_SCRIPT, 1, cache.make_key(RATE_KEY + rate_key), rate, time.time()))
+        
+    except Exception:
+        bucket = _local_buckets.get(rate_key)
+        if bucket is None or bucket.rate != rate:
+            with _lock:
+                bucket = _local_buckets[rate_key] = TokenBucket(rate)
+        return bucket.take()
+
+
+def record_call(endpoint, duration, status_code=None, retry=False):
+    """Count a call and keep its latency in a capped sample list; no status code means the request failed"""
+    record_calls(endpoint, [(duration, status_code, retry)])
+
+
+def record_calls(endpoint, calls):
+    """Record many (duration, status_code, retry) calls in one round trip"""
+    if not calls:
+        return
+    
+    try:
+        cache = frappe.cache()
+        metrics_key = cache.make_key(METRICS_KEY + endpoint)
+        latency_key = cache.make_key(LATENCY_KEY + endpoint)
+        
+        counts = {"calls": len(calls), "throttled": 0, "errors": 0, "retries": 0}
+        for _, status_code, retry in calls:
+            if status_code == 429:
+                counts["throttled"] += 1
+            elif not status_code or status_code >= 400:
+                counts["errors"] += 1
+            if retry:
+                counts["retries"] += 1
+        
+        pipe = cache.pipeline()
+        for field, count in counts.items():
+            if count:
+                pipe.hincrby(metrics_key, field, count)
+        pipe.lpush(latency_key, *[round(duration * 1000, 2) for duration, _, _ in calls[-LATENCY_SAMPLES:]])
+        pipe.ltrim(latency_key, 0, LATENCY_SAMPLES - 1)
+        pipe.execute()
+        
+    except Exception as e:
+        frappe.logger().error(f"Error recording Graph API metrics: {str(e)}")
+
+
+@frappe.whitelist()
+def get_graph_client_stats():
+    """Report call counts, errors and latency percentiles of recent Graph API calls"""
+    frappe.only_for("System Manager")
+    
+    cache = frappe.cache()
+    pipe = cache.pipeline()
+    for endpoint in METRIC_ENDPOINTS:
+        pipe.hmget(cache.make_key(METRICS_KEY + endpoint), ["calls", "errors", "throttled", "retries"])
+        pipe.lrange(cache.make_key(LATENCY_KEY + endpoint), 0, -1)
+    results = pipe.execute()
+    
+    stats = {}
+    for index, endpoint in enumerate(METRIC_ENDPOINTS):
+        counts, samples = results[2 * index], results[2 * index + 1]
+        latencies = sorted(float(sample) for sample in samples)
+        calls, errors, throttled, retries = counts
+        
+        stats[endpoint] = {
+            "calls": cint(calls),
+            "errors": cint(errors),
+            "throttled": cint(throttled),
+            "retries": cint(retries),
+            "p50_ms": get_percentile(latencies, 0.5),
+            "p99_ms": get_percentile(latencies, 0.99)
+        }
+    
+    return {
+        "endpoints": stats,
+        "open_circuits": [key for key, circuit in _circuits.items() if circuit.is_open]
+    }
+
+
+def get_percentile(values, percentile):
+    if not values:
+        return None
+    return values[min(len(values) - 1, int(len(values) * percentile))]
\ No newline at end of file
@@ -0,0 +1,210 @@
+import frappe
+import json
+from datetime import timedelta
+from frappe.utils import now_datetime, cint
+from whatsapp_calling.utils.settings_cache import get_whatsapp_settings
+
+
+QUEUE_DOCTYPE = "WhatsApp Webhook Event"
+DRAIN_METHOD = "whatsapp_calling.whatsapp_integration.inbound_queue.drain_inbound_queue"
+DRAIN_JOB_ID = "whatsapp_inbound_queue_drain"
+DEFAULT_BATCH_SIZE = 100
+MAX_ATTEMPTS = 5
+STALE_PROCESSING_MINUTES = 10
+
+
+def enqueue_webhook_payload(raw_body):
+    """Append a raw webhook body to the durable inbound queue and wake a consumer"""
+    if isinstance(raw_body, bytes):
+        raw_body = raw_body.decode("utf-8")
+    
+    # db_insert skips validation and document hooks so the webhook can ack fast
+    event = frappe.get_doc({
+        "doctype": QUEUE_DOCTYPE,
+        "payload": raw_body,
+        "status": "Pending",
+        "received_at": now_datetime(),
+        "attempts": 0
+    })
+    event.db_insert()
+    frappe.db.commit()
+    
+    schedule_drain()
+    
+    return event.name
+
+
+def schedule_drain():
+    """Make sure a background consumer is queued for every configured slot"""
+    try:
+        consumers = cint(get_whatsapp_settings().inbound_queue_consumers) or 1
+        
+        for slot in range(consumers):
+            frappe.enqueue(
+                DRAIN_METHOD,
+                queue="short",
+                job_id=f"{DRAIN_JOB_ID}_{slot}",
+                deduplicate=True
+            )
+        
+    except Exception as e:
+        # The scheduler recovery job picks up anything left pending
+        frappe.logger().error(f"Error scheduling inbound queue drain: {str(e)}")
+
+
+def drain_inbound_queue(batch_size=DEFAULT_BATCH_SIZE):
+    """Background consumer: process pending webhook events in batches until the queue is empty"""
+    processed = 0
+    
+    while True:
+        events = claim_batch(batch_size)
+        if not events:
+            break
+        
+        processed += process_batch(events)
+    
+    return processed
+
+
+def claim_batch(batch_size=DEFAULT_BATCH_SIZE):
+    """Claim the oldest pending events for this consumer"""
+    events = frappe.db.sql(
+        f"""
+        select name, payload, attempts
+        from `tab{QUEUE_DOCTYPE}`
+        where status = 'Pending'
+        order by received_at asc
+        limit %(batch_size)s
+        for update skip locked
+        """,
+        {"batch_size": cint(batch_size)},
+        as_dict=True
+    )
+    
+    if events:
+        frappe.db.sql(
+            f"""
+            update `tab{QUEUE_DOCTYPE}`
+            set status = 'Processing', attempts = attempts + 1, modified = %(now)s
+            where name in %(names)s
+            """,
+            {"names": tuple(event.name for event in events), "now": now_datetime()}
+        )
+    
+    frappe.db.commit()
+    return events
+
+
+def process_batch(events):
+    """Run claimed events through the webhook processors and record the outcome"""
+    from whatsapp_calling.whatsapp_integration.webhook_handler import process_webhook_data
+    
+    done = []
+    
+    for event in events:
+        try:
+            process_webhook_data(json.loads(event.payload))
+            done.append(event.name)
+            
+        except Exception as e:
+            frappe.db.rollback()
+            mark_failed(event, str(e))
+    
+    if done:
+        frappe.db.sql(
+            f"""
+            update `tab{QUEUE_DOCTYPE}`
+            set status = 'Processed', processed_at = %(now)s, error = null, modified = %(now)s
+            where name in %(names)s
+            """,
+            {"names": tuple(done), "now": now_datetime()}
+        )
+    
+    frappe.db.commit()
+    return len(done)
+
+
+def mark_failed(event, error):
+    """Return a failed event to the queue, or park it once it runs out of attempts"""
+    status = "Failed" if cint(event.attempts) + 1 >= MAX_ATTEMPTS else "Pending"
+    
+    frappe.db.set_value(QUEUE_DOCTYPE, event.name, {
+        "status": status,
+        "error": error[:1000]
+    }, update_modified=False)
+    frappe.db.commit()
+    
+    frappe.logger().error(f"Inbound webhook event {event.name} failed ({status}): {error}")
+
+
+def recover_inbound_queue():
+    """Scheduled safety net: requeue stalled events and wake consumers if work is pending"""
+    try:
+        cutoff = now_datetime() - timedelta(minutes=STALE_PROCESSING_MINUTES)
+        
+        frappe.db.sql(
+            f"""
+            update `tab{QUEUE_DOCTYPE}`
+            set status = 'Pending'
+            where status = 'Processing' and modified < %(cutoff)s
+            """,
+            {"cutoff": cutoff}
+        )
+        frappe.db.commit()
+        
+        if frappe.db.exists(QUEUE_DOCTYPE, {"status": "Pending"}):
+            schedule_drain()
+        
+    except Exception as e:
+        frappe.logger().error(f"Error recovering inbound queue: {str(e)}")
+
+
+def purge_processed_events(days=7):
+    """Delete processed events older than the retention window"""
+    try:
+        cutoff = now_datetime() - timedelta(days=days)
+        
+        frappe.db.delete(QUEUE_DOCTYPE, {
+            "status": "Processed",
+            "processed_at": ["<", cutoff]
+        })
+        frappe.db.commit()
+        
+    except Exception as e:
+        frappe.logger().error(f"Error purging processed webhook events: {str(e)}")
+
+
+@frappe.whitelist()
+def get_inbound_queue_stats():
+    """Report inbound queue depth and consumer lag"""
+    frappe.only_for("System Manager")
+    
+    counts = frappe.db.sql(
+        f"""
+        select status, count(*) as count
+        from `tab{QUEUE_DOCTYPE}`
+        group by status
+        """,
+        as_dict=True
+    )
+    
+    oldest_pending = frappe.db.sql(
+        f"""
+        select min(received_at)
+        from `tab{QUEUE_DOCTYPE}`
+        where status in ('Pending', 'Processing')
+        """
+    )[0][0]
+    
+    lag_seconds = (now_datetime() - oldest_pending).total_seconds() if oldest_pending else 0
+    
+    stats = {row.status.lower(): row.count for row in counts}
+    
+    return {
+        "pending": stats.get("pending", 0),
+        "processing": stats.get("processing", 0),
+        "processed": stats.get("processed", 0),
+        "failed": stats.get("failed", 0),
+        "oldest_pending": oldest_pending,
+        "lag_seconds": round(lag_seconds, 3)
+    }
\ No newline at end of file
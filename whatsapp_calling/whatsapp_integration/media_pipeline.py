@@ -0,0 +1,268 @@
+import frappe
+import hashlib
+import mimetypes
+import os
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import requests
+from frappe.utils import now_datetime
+from whatsapp_calling.utils.settings_cache import get_settings_secret
+from whatsapp_calling.whatsapp_integration.graph_client import GRAPH_API_BASE_URL, get_base_url, get_session
+
+
+MEDIA_TYPES = ("image", "audio", "video", "document", "sticker")
+DOWNLOAD_METHOD = "whatsapp_calling.whatsapp_integration.media_pipeline.download_media"
+
+DOWNLOAD_WORKERS = 4
+CHUNK_SIZE = 64 * 1024
+MAX_ATTEMPTS = 3
+RETRY_BACKOFF_SECONDS = 1.0
+TIMEOUT = (5, 30)
+
+# WhatsApp caps documents at 100 MB; anything larger is not a Cloud API download
+MAX_MEDIA_BYTES = 100 * 1024 * 1024
+
+FILE_PREFIX = "whatsapp-"
+
+
+class MediaDownloadError(Exception):
+    """A media download that failed; retryable errors are attempted again"""
+    
+    def __init__(self, message, retryable=True):
+        super().__init__(message)
+        self.retryable = retryable
+
+
+def get_media_reference(message):
+    """Media id, mime type and filename of an inbound media message, or None for other types"""
+    message_type = message.get("type")
+    if message_type not in MEDIA_TYPES:
+        return None
+    
+    media = message.get(message_type) or {}
+    if not media.get("id"):
+        return None
+    
+    return {
+        "message_id": message.get("id"),
+        "media_id": media["id"],
+        "mime_type": media.get("mime_type"),
+        "filename": media.get("filename")
+    }
+
+
+def enqueue_media_downloads(references):
+    """Queue one background job for the media of a committed batch of messages"""
+    references = [reference for reference in references if reference]
+    if not references:
+        return
+    
+    try:
+        frappe.enqueue(DOWNLOAD_METHOD, queue="long", references=references)
+        
+    except Exception as e:
+        frappe.logger().error(f"Error queueing media downloads: {str(e)}")
+
+
+def download_media(references, workers=DOWNLOAD_WORKERS):
+    """Background job: download media on a bounded thread pool and attach it to the messages.
+    
+    Worker threads only do HTTP and disk IO; database writes stay on this thread.
+    """
+    stored = set(frappe.get_all(
+        "WhatsApp Message",
+        filters={"message_id": ["in", [reference["message_id"] for reference in references]], "media_url": ["is", "set"]},
+        pluck="message_id"
+    ))
+    pending = [reference for reference in references if reference["message_id"] not in stored]
+    if not pending:
+        return 0
+    
+    results = fetch_all(
+        pending,
+        get_settings_secret("access_token"),
+        frappe.get_site_path("private", "files"),
+        base_url=get_base_url(),
+        workers=workers
+    )
+    
+    attached = 0
+    for reference in pending:
+        result = results.get(reference["media_id"])
+        
+        if isinstance(result, Exception):
+            frappe.logger().error(f"Media {reference['media_id']} for {reference['message_id']} failed: {str(result)}")
+            continue
+        
+        attach_media(reference, result)
+        attached += 1
+    
+    frappe.db.commit()
+    return attached
+
+
+def fetch_all(references, access_token, target_dir, base_url=GRAPH_API_BASE_URL, workers=DOWNLOAD_WORKERS,
+              retry_backoff=RETRY_BACKOFF_SECONDS, max_bytes=MAX_MEDIA_BYTES):
+    """Download every distinct media id in parallel; returns media_id -> result dict or exception"""
+    media = {reference["media_id"]: reference for reference in references}
+    results = {}
+    
+    with ThreadPoolExecutor(max_workers=max(1, min(workers, len(media)))) as pool:
+        futures = {
+            pool.submit(
+                fetch_media, media_id, access_token, target_dir,
+                base_url=base_url,
+                mime_type=reference.get("mime_type"),
+                filename=reference.get("filename"),
+                retry_backoff=retry_backoff,
+                max_bytes=max_bytes
+            ): media_id
+            for media_id, reference in media.items()
+        }
+        
+        for future in as_completed(futures):
+            try:
+                results[futures[future]] = future.result()
+            except Exception as e:
+                results[futures[future]] = e
+    
+    return results
+
+
+def fetch_media(media_id, access_token, target_dir, base_url=GRAPH_API_BASE_URL, mime_type=None, filename=None,
+                retry_backoff=RETRY_BACKOFF_SECONDS, max_bytes=MAX_MEDIA_BYTES):
+    """Resolve a media id and stream it into target_dir, retrying transient failures.
+    
+    Files are named by their SHA-256, so the same content is stored once however often it is sent.
+    """
+    for attempt in range(1, MAX_ATTEMPTS + 1):
+        try:
+            # Download URLs expire after a few minutes, so every attempt resolves a fresh one
+            info = resolve_media(media_id, access_token, base_url)
+            return stream_to_file(
+                info["url"], access_token, target_dir,
+                mime_type=info.get("mime_type") or mime_type,
+                filename=filename,
+                max_bytes=max_bytes
+            )
+            
+        except (MediaDownloadError, requests.RequestException) as e:
+            retryable = getattr(e, "retryable", True)
+            if not retryable or attempt == MAX_ATTEMPTS:
+                raise
+            
+            time.sleep(retry_backoff * 2 ** (attempt - 1))
+
+
+def resolve_media(media_id, access_token, base_url=GRAPH_API_BASE_URL):
+    """Look up the short-lived download URL and metadata of a media id"""
+    response = get_session().get(
+        f"{base_url.rstrip('/')}/{media_id}",
+        headers={"Authorization": f"Bearer {access_token}"},
+        timeout=TIMEOUT
+    )
+    check_response(response, f"resolving media {media_id}")
+    return response.json()
+
+
+def stream_to_file(url, access_token, target_dir, mime_type=None, filename=None, max_bytes=MAX_MEDIA_BYTES):
+    """Stream a download to disk in chunks, hashing as it goes; never holds the whole file in memory"""
+    os.makedirs(target_dir, exist_ok=True)
+    temp_path = os.path.join(target_dir, f".{FILE_PREFIX}{uuid.uuid4().hex}.part")
+    digest = hashlib.sha256()
+    size = 0
+    
+    try:
+        with get_session().get(url, headers={"Authorization": f"Bearer {access_token}"},
+                               stream=True, timeout=TIMEOUT) as response:
+            check_response(response, "downloading media")
+            
+            declared = int(response.headers.get("Content-Length") or 0)
+            if declared > max_bytes:
+                raise MediaDownloadError(f"Media of {declared} bytes exceeds the {max_bytes} byte limit", False)
+            
+            with open(temp_path, "wb") as f:
+                for chunk in response.iter_content(chunk_size=CHUNK_SIZE):
+                    size += len(chunk)
+                    if size > max_bytes:
+                        raise MediaDownloadError(f"Media exceeds the {max_bytes} byte limit", False)
+                    
+                    digest.update(chunk)
+                    f.write(chunk)
+        
+        sha256 = digest.hexdigest()
+        file_name = f"{FILE_PREFIX}{sha256}{get_extension(mime_type, filename)}"
+        path = os.path.join(target_dir, file_name)
+        
+        if os.path.exists(path):
+            # Same content already stored
+            os.remove(temp_path)
+        else:
+            os.replace(temp_path, path)
+        
+        return {
+            "file_name": file_name,
+            "path": path,
+            "sha256": sha256,
+            "size": size,
+            "mime_type": mime_type,
+            "original_filename": filename
+        }
+        
+    finally:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+
+
+def check_response(response, action):
+    """Raise a MediaDownloadError for error statuses; throttling and server errors are retryable"""
+    if response.status_code == 200:
+        return
+    
+    retryable = response.status_code == 429 or response.status_code >= 500
+    raise MediaDownloadError(f"Graph API returned {response.status_code} {action}", retryable)
+
+
+def get_extension(mime_type, filename=None):
+    """File extension from the original filename, else from the mime type"""
+    if filename and os.path.splitext(filename)[1]:
+        return os.path.splitext(filename)[1].lower()
+    
+    base_type = (mime_type or "").split(";")[0].strip()
+    return mimetypes.guess_extension(base_type) or ""
+
+
+def attach_media(reference, result):
+    """Point the message at the stored file, creating its File record once per content hash"""
+    file_url = f"/private/files/{result['file_name']}"
+    
+    if not frappe.db.exists("File", {"file_url": file_url}):
+        message_name = frappe.db.get_value("WhatsApp Message", {"message_id": reference["message_id"]}, "name")
+        
+        # db_insert: the file is already on disk, and File hooks would read it back into memory
+        file_doc = frappe.get_doc({
+            "doctype": "File",
+            "file_name": result.get("original_filename") or result["file_name"],
+            "file_url": file_url,
+            "file_size": result["size"],
+            "is_private": 1,
+            "folder": "Home/Attachments",
+            "attached_to_doctype": "WhatsApp Message",
+            "attached_to_name": message_name
+        })
+        file_doc.db_insert()
+    
+    frappe.db.sql(
+        """
+        update `tabWhatsApp Message`
+        set media_url = %(file_url)s, media_sha256 = %(sha256)s, modified = %(now)s
+        where message_id = %(message_id)s
+        """,
+        {
+            "file_url": file_url,
+            "sha256": result["sha256"],
+            "now": now_datetime(),
+            "message_id": reference["message_id"]
+        }
+    )
\ No newline at end of file
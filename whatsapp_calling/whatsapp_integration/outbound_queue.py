@@ -0,0 +1,283 @@
+import frappe
+import json
+import time
+from datetime import timedelta
+from frappe.utils import now_datetime
+from whatsapp_calling.utils.settings_cache import get_whatsapp_settings
+from whatsapp_calling.whatsapp_integration.graph_client import send_message, GraphAPIError, get_message_id
+from whatsapp_calling.whatsapp_integration.realtime import queue_status_events
+
+
+OUTBOUND_KEY = "whatsapp_calling:outbound"
+PROCESSING_KEY = "whatsapp_calling:outbound_processing:"
+WORKERS_KEY = "whatsapp_calling:outbound_workers"
+RECOVER_METHOD = "whatsapp_calling.whatsapp_integration.outbound_queue.send_stale_messages"
+
+# A worker counts as running while its heartbeat is this recent
+HEARTBEAT_TIMEOUT_SECONDS = 15
+
+# Jobs claimed by a worker silent this long are handed to the others
+ABANDONED_SECONDS = 60
+
+# Messages still queued this long after the last worker stopped are sent by a background job instead
+STALE_MINUTES = 10
+RECOVER_BATCH_SIZE = 200
+
+# Move up to ARGV[1] jobs from the queue to this worker's processing list
+CLAIM_SCRIPT = """
+local items = redis.call('LRANGE', KEYS[1], 0, tonumber(ARGV[1]) - 1)
+if #items > 0 then
+    redis.call('LTRIM', KEYS[1], #items, -1)
+    redis.call('RPUSH', KEYS[2], unpack(items))
+end
+return items
+"""
+
+# Put a worker's unfinished jobs back at the head of the queue
+REQUEUE_SCRIPT = """
+local items = redis.call('LRANGE', KEYS[1], 0, -1)
+redis.call('DEL', KEYS[1])
+for i = #items, 1, -1 do
+    redis.call('LPUSH', KEYS[2], items[i])
+end
+return #items
+"""
+
+
+def is_outbound_worker_running():
+    """True when at least one outbound worker sent a heartbeat recently"""
+    try:
+        cache = frappe.cache()
+        return cache.zcount(cache.make_key(WORKERS_KEY), time.time() - HEARTBEAT_TIMEOUT_SECONDS, "+inf") > 0
+        
+    except Exception:
+        return False
+
+
+def queue_outbound_message(message_log, payload, phone_number_id=None):
+    """Hand a logged message to the outbound workers once the log is committed.
+    
+    message_log is the WhatsApp Message inserted with status queued; the worker fills in the wamid
+    and the send result. Without Redis the message is sent inline instead.
+    """
+    job = json.dumps({
+        "message": message_log.name,
+        "message_id": message_log.message_id,
+        "phone_number_id": phone_number_id or get_whatsapp_settings().phone_number_id,
+        "payload": payload,
+        "enqueued_at": time.time()
+    })
+    
+    def push():
+        try:
+            # On the raw client, like dispatch_messages; RedisWrapper.rpush would prefix the key a second time
+            cache = frappe.cache()
+            cache.pipeline().rpush(cache.make_key(OUTBOUND_KEY), job).execute()
+            
+        except Exception as e:
+            frappe.logger().error(f"Outbound queue unavailable, sending {message_log.name} inline: {str(e)}")
+            send_inline(message_log.name, message_log.message_id, payload, phone_number_id)
+    
+    frappe.db.after_commit.add(push)
+
+
+def send_inline(message, message_id, payload, phone_number_id=None):
+    """Send a queued message from this process and record the result"""
+    try:
+        response = send_message(payload, phone_number_id)
+        record_results([(message, message_id, "sent", get_message_id(response))])
+        
+    except GraphAPIError as e:
+        frappe.logger().error(f"Failed to send WhatsApp message {message}: {str(e)}")
+        record_results([(message, message_id, "failed", None)])
+
+
+def send_heartbeat(worker):
+    """Announce a running worker, so senders hand messages to the queue"""
+    cache = frappe.cache()
+    key = cache.make_key(WORKERS_KEY)
+    
+    pipe = cache.pipeline()
+    pipe.zadd(key, {worker: time.time()})
+    # Forget workers that stopped without saying so
+    pipe.zremrangebyscore(key, 0, time.time() - 24 * 3600)
+    pipe.execute()
+
+
+def remove_heartbeat(worker):
+    cache = frappe.cache()
+    cache.zrem(cache.make_key(WORKERS_KEY), worker)
+
+
+def claim_jobs(worker, count):
+    """Move up to count jobs into the worker's processing list and return them"""
+    cache = frappe.cache()
+    return cache.eval(
+        CLAIM_SCRIPT, 2,
+        cache.make_key(OUTBOUND_KEY), cache.make_key(PROCESSING_KEY + worker),
+        count
+    ) or []
+
+
+def finish_jobs(worker, jobs):
+    """Drop sent jobs from the worker's processing list"""
+    cache = frappe.cache()
+    key = cache.make_key(PROCESSING_KEY + worker)
+    
+    pipe = cache.pipeline()
+    for job in jobs:
+        pipe.lrem(key, 1, job)
+    pipe.execute()
+
+
+def requeue_unfinished(worker):
+    """Return jobs a previous run of this worker claimed but never finished"""
+    cache = frappe.cache()
+    return cache.eval(
+        REQUEUE_SCRIPT, 2,
+        cache.make_key(PROCESSING_KEY + worker), cache.make_key(OUTBOUND_KEY)
+    )
+
+
+def requeue_abandoned():
+    """Return jobs claimed by workers that stopped without finishing them; returns the number requeued"""
+    cache = frappe.cache()
+    prefix = frappe.safe_decode(cache.make_key(PROCESSING_KEY))
+    workers_key = cache.make_key(WORKERS_KEY)
+    requeued = 0
+    
+    for key in cache.scan_iter(match=cache.make_key(PROCESSING_KEY + "*")):
+        worker = frappe.safe_decode(key)[len(prefix):]
+        heartbeat = cache.zscore(workers_key, worker)
+        
+        if heartbeat is None or heartbeat < time.time() - ABANDONED_SECONDS:
+            requeued += requeue_unfinished(worker) or 0
+    
+    return requeued
+
+
+def get_queued_messages(names):
+    """Names of the given messages that still wait to be sent"""
+    if not names:
+        return set()
+    
+    return set(frappe.get_all(
+        "WhatsApp Message",
+        filters={"name": ["in", names], "status": "queued"},
+        pluck="name"
+    ))
+
+
+def record_wamid(message, message_id, wamid):
+    """Swap a sent message's queued id for its wamid right away, so early status callbacks find it"""
+    frappe.db.sql(
+        """
+        update `tabWhatsApp Message`
+        set message_id = %s
+        where name = %s and message_id = %s
+        """,
+        (wamid, message, message_id)
+    )
+    frappe.db.sql(
+        """
+        update `tabWhatsApp Conversation`
+        set last_message_id = %s
+        where last_message_id = %s
+        """,
+        (wamid, message_id)
+    )
+    frappe.db.commit()
+
+
+def record_results(results):
+    """Write (message, queued message_id, status, wamid) results with one UPDATE per table"""
+    if not results:
+        return
+    
+    names = [name for name, _, _, _ in results]
+    placeholders = ", ".join(["%s"] * len(results))
+    cases = " ".join(["when %s then %s"] * len(results))
+    
+    id_values, status_values = [], []
+    for name, message_id, status, wamid in results:
+        id_values.extend([name, wamid or message_id])
+        status_values.extend([name, status])
+    
+    # Only rows still queued, so a late result never overwrites one recorded by the recovery job
+    frappe.db.sql(
+        f"""
+        update `tabWhatsApp Message`
+        set message_id = case name {cases} end,
+            status = case name {cases} end,
+            modified = %s
+        where name in ({placeholders}) and status = 'queued'
+        """,
+        id_values + status_values + [now_datetime()] + names
+    )
+    
+    # Conversations whose last message was one of these point at its wamid from now on; record_wamid
+    # usually swapped the id already, and a status callback may have moved the conversation on since
+    sent = [(message_id, wamid, status) for _, message_id, status, wamid in results if wamid]
+    if sent:
+        ids = [value for message_id, wamid, _ in sent for value in (message_id, wamid)]
+        conversation_cases = " ".join(["when %s then %s"] * len(ids))
+        frappe.db.sql(
+            f"""
+            update `tabWhatsApp Conversation`
+            set last_message_status = case last_message_id {conversation_cases} end,
+                last_message_id = case last_message_id {conversation_cases} end
+            where last_message_id in ({", ".join(["%s"] * len(ids))}) and last_message_status = 'queued'
+            """,
+            [value for message_id, wamid, status in sent for value in (message_id, status, wamid, status)]
+            + [value for message_id, wamid, _ in sent for value in (message_id, wamid, wamid, wamid)]
+            + ids
+        )
+    
+    # The open views know the message by its queued id
+    queue_status_events({message_id: status for _, message_id, status, _ in results})
+    frappe.db.commit()
+
+
+def recover_outbound_queue():
+    """Scheduled safety net: requeue jobs of stopped workers, and send messages left queued when none is running"""
+    try:
+        requeue_abandoned()
+        
+    except Exception as e:
+        frappe.logger().error(f"Error requeueing abandoned outbound jobs: {str(e)}")
+    
+    if is_outbound_worker_running():
+        return
+    
+    try:
+        stale = frappe.db.exists(
+            "WhatsApp Message",
+            {"status": "queued", "modified": ["<", now_datetime() - timedelta(minutes=STALE_MINUTES)]}
+        )
+        if stale:
+            frappe.enqueue(RECOVER_METHOD, queue="long", job_id=RECOVER_METHOD, deduplicate=True)
+        
+    except Exception as e:
+        frappe.logger().error(f"Error recovering outbound queue: {str(e)}")
+
+
+def send_stale_messages():
+    """Background job: send stale queued text messages inline, oldest first"""
+    while not is_outbound_worker_running():
+        messages = frappe.get_all(
+            "WhatsApp Message",
+            filters={"status": "queued", "modified": ["<", now_datetime() - timedelta(minutes=STALE_MINUTES)]},
+            fields=["name", "message_id", "to_number", "message_body"],
+            order_by="modified asc",
+            limit=RECOVER_BATCH_SIZE
+        )
+        if not messages:
+            break
+        
+        for message in messages:
+            send_inline(message.name, message.message_id, {
+                "messaging_product": "whatsapp",
+                "to": message.to_number,
+                "type": "text",
+                "text": {"body": message.message_body}
+            })
\ No newline at end of file
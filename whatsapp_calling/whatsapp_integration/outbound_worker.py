@@ -0,0 +1,292 @@
+"""
+Dedicated asyncio sender for queued outbound messages: one process keeps
+hundreds of Graph API requests in flight over a single pooled HTTP client,
+so send throughput no longer depends on the number of RQ workers. Start it
+with `bench --site <site> whatsapp-outbound-worker`.
+"""
+
+import asyncio
+import json
+import os
+import signal
+import socket
+import time
+from concurrent.futures import ThreadPoolExecutor
+import frappe
+from whatsapp_calling.whatsapp_integration.graph_client import (
+    TIMEOUT, CircuitBreaker, GraphAPIError, call_graph, get_backoff, get_base_url, get_graph_error,
+    get_message_id, get_throughput, record_calls, should_retry, take_token
+)
+from whatsapp_calling.whatsapp_integration.outbound_queue import (
+    claim_jobs, finish_jobs, get_queued_messages, record_results, record_wamid, remove_heartbeat,
+    requeue_abandoned, requeue_unfinished, send_heartbeat
+)
+from whatsapp_calling.utils.settings_cache import get_settings_secret
+
+try:
+    import aiohttp
+except ImportError:
+    # Without aiohttp, requests run on a thread pool; still non-blocking for the event loop
+    aiohttp = None
+
+
+DEFAULT_CONCURRENCY = 200
+CLAIM_BATCH_SIZE = 100
+MAX_ATTEMPTS = 4
+IDLE_SECONDS = 0.05
+FLUSH_SECONDS = 0.2
+FLUSH_BATCH_SIZE = 200
+HEARTBEAT_SECONDS = 5
+FALLBACK_THREADS = 64
+
+
+class OutboundWorker:
+    """Claims queued messages from Redis, sends them concurrently and records results in batches"""
+    
+    def __init__(self, concurrency=DEFAULT_CONCURRENCY, name=None, base_url=None):
+        self.concurrency = concurrency
+        # Unique per process, so workers sharing a host never requeue each other's jobs
+        self.name = name or f"{socket.gethostname()}-{os.getpid()}"
+        # Without an explicit URL, the configured one is re-read with the settings
+        self.fixed_base_url = base_url
+        self.base_url = base_url.rstrip("/") if base_url else None
+        self.circuit = CircuitBreaker()
+        self.in_flight = set()
+        self.results = []
+        self.calls = []
+        self.stopping = False
+        self.access_token = None
+        self.rate = None
+        self.session = None
+        self.executor = None
+        self.last_heartbeat = 0
+    
+    def stop(self):
+        self.stopping = True
+    
+    async def run(self):
+        """Send until stopped, then finish the requests in flight"""
+        loop = asyncio.get_running_loop()
+        for signum in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(signum, self.stop)
+        
+        requeued = requeue_unfinished(self.name) + requeue_abandoned()
+        if requeued:
+            frappe.logger().info(f"Outbound worker {self.name} requeued {requeued} unfinished messages")
+        
+        await self.open_client()
+        flusher = asyncio.create_task(self.flush_periodically())
+        
+        try:
+            while not self.stopping:
+                self.heartbeat()
+                
+                free = self.concurrency - len(self.in_flight)
+                jobs = self.claim(min(free, CLAIM_BATCH_SIZE)) if free > 0 else []
+                if not jobs:
+                    await asyncio.sleep(IDLE_SECONDS)
+                    continue
+                
+                for raw in jobs:
+                    task = asyncio.create_task(self.process(raw))
+                    self.in_flight.add(task)
+                    task.add_done_callback(self.in_flight.discard)
+            
+            if self.in_flight:
+                await asyncio.gather(*self.in_flight)
+            
+        finally:
+            flusher.cancel()
+            self.flush()
+            remove_heartbeat(self.name)
+            await self.close_client()
+    
+    def heartbeat(self):
+        """Announce the worker and pick up changed settings"""
+        if time.monotonic() - self.last_heartbeat < HEARTBEAT_SECONDS and self.access_token:
+            return
+        
+        frappe.local.whatsapp_settings_cache = {}
+        self.access_token = get_settings_secret("access_token")
+        self.rate = get_throughput()
+        if not self.fixed_base_url:
+            self.base_url = get_base_url()
+        send_heartbeat(self.name)
+        self.last_heartbeat = time.monotonic()
+    
+    def claim(self, count):
+        """Claim jobs, dropping any whose message is no longer queued"""
+        jobs = claim_jobs(self.name, count)
+        if not jobs:
+            return []
+        
+        decoded = [(raw, json.loads(raw)) for raw in jobs]
+        names = [job["message"] for _, job in decoded]
+        
+        try:
+            queued = get_queued_messages(names)
+        except Exception:
+            # The connection of an idle worker may have timed out
+            reconnect()
+            queued = get_queued_messages(names)
+        
+        # End the read snapshot so the next claim sees messages committed since
+        frappe.db.commit()
+        
+        stale = [raw for raw, job in decoded if job["message"] not in queued]
+        if stale:
+            # Already sent by the recovery job
+            finish_jobs(self.name, stale)
+        
+        return [raw for raw, job in decoded if job["message"] in queued]
+    
+    async def process(self, raw):
+        job = json.loads(raw)
+        
+        try:
+            status, wamid = await self.deliver(job)
+            
+        except Exception as e:
+            # It may have gone out, so it is not sent again; the flush marks it failed and finishes the job
+            frappe.logger().error(f"Error sending WhatsApp message {job['message']}: {str(e)}")
+            status, wamid = "failed", None
+        
+        if wamid:
+            self.save_wamid(job, wamid)
+        
+        self.results.append((raw, (job["message"], job["message_id"], status, wamid)))
+    
+    def save_wamid(self, job, wamid):
+        """Write the wamid before the batched flush; status callbacks for it can arrive first"""
+        try:
+            record_wamid(job["message"], job["message_id"], wamid)
+            
+        except Exception as e:
+            # The flush writes it with the result
+            frappe.logger().error(f"Error recording wamid of WhatsApp message {job['message']}: {str(e)}")
+            reconnect()
+    
+    async def deliver(self, job):
+        """Send one message with retries; returns (status, wamid)"""
+        url = f"{self.base_url}/{job['phone_number_id']}/messages"
+        
+        for attempt in range(1, MAX_ATTEMPTS + 1):
+            await self.wait_for_circuit()
+            await self.wait_for_token(job["phone_number_id"])
+            
+            status_code, body, retry_after, error, duration = await self.post(url, job["payload"])
+            self.calls.append((duration, status_code, attempt > 1))
+            
+            if not error:
+                self.circuit.record_success()
+                return "sent", get_message_id(body)
+            
+            if error.retryable:
+                self.circuit.record_failure()
+            
+            if not should_retry(error, "POST") or attempt == MAX_ATTEMPTS:
+                frappe.logger().error(f"Failed to send WhatsApp message {job['message']}: {str(error)}")
+                return "failed", None
+            
+            await asyncio.sleep(get_backoff(attempt, retry_after))
+    
+    async def post(self, url, payload):
+        """POST a message; returns (status_code, body, retry_after, error, duration)"""
+        if not self.session:
+            call = await asyncio.get_running_loop().run_in_executor(
+                self.executor, lambda: call_graph("POST", url, self.access_token, json=payload)
+            )
+            return call.status_code, call.json() if not call.error else {}, call.retry_after, call.error, call.duration
+        
+        started = time.monotonic()
+        try:
+            async with self.session.post(
+                url, json=payload, headers={"Authorization": f"Bearer {self.access_token}"}
+            ) as response:
+                text = await response.text()
+                duration = time.monotonic() - started
+                
+                try:
+                    body = json.loads(text) if text else {}
+                except ValueError:
+                    body = {}
+                
+                error = None
+                if response.status >= 400:
+                    error = get_graph_error(response.status, body.get("error") or {}, text)
+                
+                return response.status, body, response.headers.get("Retry-After"), error, duration
+            
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            # Only a failed connect is known not to have reached Meta
+            error = GraphAPIError(
+                f"Graph API request failed: {str(e)}", retryable=True,
+                unsent=isinstance(e, aiohttp.ClientConnectorError)
+            )
+            return None, {}, None, error, time.monotonic() - started
+    
+    async def wait_for_circuit(self):
+        while not self.circuit.allow():
+            await asyncio.sleep(1)
+    
+    async def wait_for_token(self, rate_key):
+        """Take a token from the shared per-number bucket without blocking the loop"""
+        while True:
+            wait = take_token(rate_key, self.rate)
+            if not wait:
+                return
+            await asyncio.sleep(wait)
+    
+    async def flush_periodically(self):
+        while True:
+            await asyncio.sleep(FLUSH_SECONDS)
+            if self.results or self.calls:
+                self.flush()
+    
+    def flush(self):
+        """Record finished sends with one batched update, then drop them from the processing list"""
+        calls, self.calls = self.calls, []
+        record_calls("messages", calls)
+        
+        while self.results:
+            results, self.results = self.results[:FLUSH_BATCH_SIZE], self.results[FLUSH_BATCH_SIZE:]
+            
+            try:
+                record_results([result for _, result in results])
+                finish_jobs(self.name, [raw for raw, _ in results])
+                
+            except Exception as e:
+                # Keep the results for the next flush
+                frappe.logger().error(f"Error recording outbound results: {str(e)}")
+                self.results = results + self.results
+                reconnect()
+                break
+    
+    async def open_client(self):
+        if aiohttp:
+            self.session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=self.concurrency, keepalive_timeout=60),
+                timeout=aiohttp.ClientTimeout(sock_connect=TIMEOUT[0], sock_read=TIMEOUT[1])
+            )
+        else:
+            self.executor = ThreadPoolExecutor(max_workers=min(self.concurrency, FALLBACK_THREADS))
+    
+    async def close_client(self):
+        if self.session:
+            await self.session.close()
+        if self.executor:
+            self.executor.shutdown(wait=True)
+
+
+def reconnect():
+    """Reopen the database connection of the long-running worker after an error"""
+    try:
+        frappe.db.rollback()
+    except Exception:
+        frappe.db.close()
+        frappe.db.connect()
+
+
+def start_outbound_worker(concurrency=DEFAULT_CONCURRENCY, name=None):
+    """Run an outbound worker in the current site context until it is stopped"""
+    asyncio.run(OutboundWorker(concurrency, name).run())
\ No newline at end of file
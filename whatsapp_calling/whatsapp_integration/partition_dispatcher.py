@@ -0,0 +1,354 @@
+import frappe
+import json
+import time
+import zlib
+from frappe.utils import cint
+from whatsapp_calling.utils.settings_cache import get_whatsapp_settings
+from whatsapp_calling.utils.phone import normalize_phone
+
+
+PARTITION_KEY = "whatsapp_calling:bot_partition:"
+LEASE_KEY = "whatsapp_calling:bot_partition_lease:"
+STATS_KEY = "whatsapp_calling:bot_partition_stats:"
+PHONE_LOCK_KEY = "whatsapp_calling:phone_lock:"
+DRAIN_METHOD = "whatsapp_calling.whatsapp_integration.partition_dispatcher.drain_partition"
+PROCESS_METHOD = "whatsapp_calling.whatsapp_integration.partition_dispatcher.process_partition_message"
+DRAIN_JOB_ID = "whatsapp_bot_partition_"
+DEFAULT_PARTITIONS = 16
+
+# A bot turn includes an LLM call; the lease is renewed after every message
+LEASE_SECONDS = 120
+
+# A drain job stops taking messages after its budget and hands the rest to a fresh job, so
+# budget plus one lease stays inside the job timeout and the lease never outlives its holder
+DRAIN_BUDGET_SECONDS = 60
+DRAIN_JOB_TIMEOUT = 300
+PHONE_LOCK_SECONDS = 30
+PHONE_LOCK_WAIT_SECONDS = 10
+
+# Delete the lease only if this worker still holds it
+RELEASE_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+
+def get_partition_count():
+    """Number of bot partitions configured on the account"""
+    return cint(get_whatsapp_settings().bot_partitions) or DEFAULT_PARTITIONS
+
+
+def get_partition(phone_number, partitions=None):
+    """Stable partition for a phone number; every worker and node maps a number to the same one"""
+    key = normalize_phone(phone_number, international=True) or phone_number or ""
+    return zlib.crc32(key.encode()) % (partitions or get_partition_count())
+
+
+def dispatch_messages(messages):
+    """Append (phone_number, message_body, message_id) tuples to their partitions in arrival order"""
+    messages = [message for message in messages if message[0]]
+    if not messages:
+        return
+    
+    partitions = get_partition_count()
+    touched = set()
+    
+    try:
+        cache = frappe.cache()
+        pipe = cache.pipeline()
+        
+        for phone_number, message_body, message_id in messages:
+            partition = get_partition(phone_number, partitions)
+            touched.add(partition)
+            pipe.rpush(cache.make_key(PARTITION_KEY + str(partition)), json.dumps({
+                "phone_number": phone_number,
+                "message_body": message_body,
+                "message_id": message_id,
+                "enqueued_at": time.time()
+            }))
+        
+        pipe.execute()
+        
+    except Exception as e:
+        # Without Redis there are no partitions; process unordered rather than drop the messages
+        frappe.logger().error(f"Bot partitions unavailable, enqueueing directly: {str(e)}")
+        for phone_number, message_body, message_id in messages:
+            frappe.enqueue(
+                PROCESS_METHOD,
+                queue="short",
+                message={"phone_number": phone_number, "message_body": message_body, "message_id": message_id}
+            )
+        return
+    
+    for partition in sorted(touched):
+        schedule_partition(partition)
+
+
+def dispatch_task(phone_number, method):
+    """Run a method for a conversation in its partition, in order with the conversation's messages"""
+    partition = get_partition(phone_number)
+    cache = frappe.cache()
+    
+    # On the raw client, like dispatch_messages; RedisWrapper.rpush would prefix the key a second time
+    pipe = cache.pipeline()
+    pipe.rpush(cache.make_key(PARTITION_KEY + str(partition)), json.dumps({
+        "phone_number": phone_number,
+        "task": method,
+        "enqueued_at": time.time()
+    }))
+    pipe.execute()
+    
+    schedule_partition(partition)
+
+
+def schedule_partition(partition, continued=False):
+    """Queue a drain job for a partition unless one is already queued or running.
+    
+    A job that ran out of budget is still running under its own id, so its follow-up
+    alternates between the plain and the continued job id.
+    """
+    try:
+        frappe.enqueue(
+            DRAIN_METHOD,
+            queue="short",
+            timeout=DRAIN_JOB_TIMEOUT,
+            job_id=f"{DRAIN_JOB_ID}{partition}{'_continued' if continued else ''}",
+            deduplicate=True,
+            partition=partition,
+            continued=continued
+        )
+        
+    except Exception as e:
+        # The scheduler recovery job wakes partitions that still hold messages
+        frappe.logger().error(f"Error scheduling bot partition {partition}: {str(e)}")
+
+
+def drain_partition(partition, continued=False):
+    """Background worker: process one partition's messages in order while holding its lease"""
+    partition = cint(partition)
+    deadline = time.monotonic() + DRAIN_BUDGET_SECONDS
+    processed = 0
+    
+    while True:
+        token = acquire_lease(partition)
+        if not token:
+            # Another worker holds the partition and drains it
+            break
+        
+        try:
+            processed += drain_leased_partition(partition, token, deadline)
+        finally:
+            release_lease(partition, token)
+        
+        # A message pushed while this job was finishing would not get a new job, so look again
+        if not get_partition_depth(partition):
+            break
+        
+        if time.monotonic() >= deadline:
+            schedule_partition(partition, continued=not cint(continued))
+            break
+    
+    return processed
+
+
+def drain_leased_partition(partition, token, deadline):
+    """Process messages from the head of the partition until it is empty or the deadline passes"""
+    cache = frappe.cache()
+    key = cache.make_key(PARTITION_KEY + str(partition))
+    stats_key = cache.make_key(STATS_KEY + str(partition))
+    lease_key = cache.make_key(LEASE_KEY + str(partition))
+    processed = 0
+    
+    while time.monotonic() < deadline:
+        # Peek rather than pop, so a worker that dies mid-message leaves it for the next lease holder
+        item = cache.lindex(key, 0)
+        if item is None:
+            break
+        
+        message = json.loads(item)
+        succeeded = process_partition_message(message)
+        now = time.time()
+        
+        pipe = cache.pipeline()
+        pipe.lpop(key)
+        pipe.hincrby(stats_key, "processed" if succeeded else "failed", 1)
+        pipe.hset(stats_key, mapping={
+            "last_processed_at": now,
+            "last_lag_seconds": round(now - message.get("enqueued_at", now), 3)
+        })
+        pipe.set(lease_key, token, xx=True, ex=LEASE_SECONDS)
+        pipe.execute()
+        
+        processed += 1
+    
+    return processed
+
+
+def process_partition_message(message):
+    """Run one message through the bot; the conversation state is read after the previous turn committed"""
+    from whatsapp_calling.whatsapp_integration.webhook_handler import get_bot_conversation_state
+    from whatsapp_calling.bot.ai_engine import process_message
+    
+    try:
+        # Conversation upkeep such as the rolling summary, queued behind the turn it follows
+        if message.get("task"):
+            frappe.get_attr(message["task"])(message["phone_number"])
+            frappe.db.commit()
+            return True
+        
+        conversation_state = get_bot_conversation_state(message["phone_number"])
+        if not conversation_state:
+            return False
+        
+        process_message(
+            message["phone_number"],
+            message["message_body"],
+            conversation_state.name,
+            message.get("message_id")
+        )
+        frappe.db.commit()
+        return True
+        
+    except Exception as e:
+        frappe.db.rollback()
+        frappe.logger().error(f"Error processing partitioned bot message {message.get('message_id')}: {str(e)}")
+        return False
+
+
+def acquire_lease(partition):
+    """Claim a partition for this worker; returns the lease token or None"""
+    cache = frappe.cache()
+    token = frappe.generate_hash(length=16)
+    
+    if cache.set(cache.make_key(LEASE_KEY + str(partition)), token, nx=True, ex=LEASE_SECONDS):
+        return token
+    return None
+
+
+def release_lease(partition, token):
+    """Give up a partition lease held by this worker"""
+    try:
+        cache = frappe.cache()
+        cache.eval(RELEASE_SCRIPT, 1, cache.make_key(LEASE_KEY + str(partition)), token)
+        
+    except Exception as e:
+        # The lease expires on its own
+        frappe.logger().error(f"Error releasing bot partition {partition}: {str(e)}")
+
+
+def get_partition_depth(partition):
+    """Messages waiting in a partition"""
+    cache = frappe.cache()
+    pipe = cache.pipeline()
+    pipe.llen(cache.make_key(PARTITION_KEY + str(partition)))
+    return pipe.execute()[0]
+
+
+def acquire_phone_lock(phone_number, timeout=PHONE_LOCK_SECONDS, wait=PHONE_LOCK_WAIT_SECONDS):
+    """Serialize work on one phone number across workers; returns the lock, or None if it is not held"""
+    key = normalize_phone(phone_number, international=True) or phone_number
+    
+    try:
+        cache = frappe.cache()
+        lock = cache.lock(cache.make_key(PHONE_LOCK_KEY + key), timeout=timeout, blocking_timeout=wait)
+        if lock.acquire():
+            return lock
+        
+        frappe.logger().warning(f"Timed out waiting for the lock on {key}")
+        
+    except Exception as e:
+        frappe.logger().error(f"Phone lock unavailable for {key}: {str(e)}")
+    
+    return None
+
+
+def release_phone_lock(lock):
+    """Release a lock from acquire_phone_lock"""
+    if not lock:
+        return
+    
+    try:
+        lock.release()
+        
+    except Exception as e:
+        # Already expired; the timeout released it
+        frappe.logger().error(f"Error releasing phone lock: {str(e)}")
+
+
+def recover_partitions():
+    """Scheduled safety net: wake every partition that holds messages but has no active worker"""
+    try:
+        cache = frappe.cache()
+        prefix = frappe.safe_decode(cache.make_key(PARTITION_KEY))
+        
+        # Scan by key, so partitions left over after the partition count shrank are drained too
+        partitions = sorted({
+            cint(frappe.safe_decode(key)[len(prefix):])
+            for key in cache.scan_iter(match=cache.make_key(PARTITION_KEY + "*"))
+        })
+        if not partitions:
+            return
+        
+        pipe = cache.pipeline()
+        for partition in partitions:
+            pipe.llen(cache.make_key(PARTITION_KEY + str(partition)))
+            pipe.exists(cache.make_key(LEASE_KEY + str(partition)))
+        results = pipe.execute()
+        
+        for index, partition in enumerate(partitions):
+            depth, leased = results[2 * index], results[2 * index + 1]
+            if depth and not leased:
+                schedule_partition(partition)
+        
+    except Exception as e:
+        frappe.logger().error(f"Error recovering bot partitions: {str(e)}")
+
+
+@frappe.whitelist()
+def get_partition_stats():
+    """Report depth, lag and throughput for every bot partition"""
+    frappe.only_for("System Manager")
+    
+    cache = frappe.cache()
+    partitions = get_partition_count()
+    now = time.time()
+    
+    pipe = cache.pipeline()
+    for partition in range(partitions):
+        pipe.llen(cache.make_key(PARTITION_KEY + str(partition)))
+        pipe.lindex(cache.make_key(PARTITION_KEY + str(partition)), 0)
+        pipe.exists(cache.make_key(LEASE_KEY + str(partition)))
+        pipe.hmget(
+            cache.make_key(STATS_KEY + str(partition)),
+            ["processed", "failed", "last_processed_at", "last_lag_seconds"]
+        )
+    results = pipe.execute()
+    
+    rows = []
+    for partition in range(partitions):
+        depth, head, leased, stats = results[4 * partition:4 * partition + 4]
+        
+        # Lag is the age of the oldest message still waiting in the partition
+        lag_seconds = now - json.loads(head)["enqueued_at"] if head else 0
+        processed, failed, last_processed_at, last_lag_seconds = stats
+        
+        rows.append({
+            "partition": partition,
+            "depth": depth,
+            "active": bool(leased),
+            "lag_seconds": round(lag_seconds, 3),
+            "processed": cint(processed),
+            "failed": cint(failed),
+            "last_processed_at": float(last_processed_at) if last_processed_at else None,
+            "last_lag_seconds": float(last_lag_seconds) if last_lag_seconds else None
+        })
+    
+    return {
+        "partitions": partitions,
+        "pending": sum(row["depth"] for row in rows),
+        "active_partitions": sum(1 for row in rows if row["active"]),
+        "max_lag_seconds": max((row["lag_seconds"] for row in rows), default=0),
+        "partition_stats": rows
+    }
\ No newline at end of file
@@ -0,0 +1,173 @@
+import frappe
+import json
+import time
+from frappe.utils import now_datetime
+
+
+BATCH_EVENT = "whatsapp_realtime_batch"
+MESSAGES_ROOM = "whatsapp_messages"
+CALLS_ROOM = "whatsapp_calls"
+
+ROOMS_KEY = "whatsapp_calling:realtime_rooms"
+BUFFER_KEY = "whatsapp_calling:realtime_buffer:"
+FLUSH_METHOD = "whatsapp_calling.whatsapp_integration.realtime.flush_realtime_buffer"
+FLUSH_JOB_ID = "whatsapp_realtime_flush"
+FLUSH_WINDOW_SECONDS = 0.15
+
+# Atomically take every room's buffer; ARGV[1] is the buffer key prefix
+TAKE_SCRIPT = """
+local rooms = redis.call('SMEMBERS', KEYS[1])
+redis.call('DEL', KEYS[1])
+local result = {}
+for _, room in ipairs(rooms) do
+    local key = ARGV[1] .. room
+    table.insert(result, {room, redis.call('HGETALL', key)})
+    redis.call('DEL', key)
+end
+return result
+"""
+
+
+def queue_message_event(message, room=MESSAGES_ROOM):
+    """Queue a new or updated message; later events for the same message replace earlier ones"""
+    key = message.get("message_id") or frappe.generate_hash(length=10)
+    queue_realtime(room, f"message:{key}", message)
+
+
+def queue_status_events(statuses, room=MESSAGES_ROOM):
+    """Queue message_id -> status changes; each batch carries the highest status per message"""
+    for message_id, status in statuses.items():
+        queue_realtime(room, f"status:{message_id}:{status}", {"message_id": message_id, "status": status})
+
+
+def queue_call_event(session_id, data, room=CALLS_ROOM):
+    """Queue the latest state of a call session"""
+    queue_realtime(room, f"call:{session_id}", dict(data, session_id=session_id))
+
+
+def queue_realtime(room, key, data):
+    """Collect an event for this request; it reaches the shared buffer after commit"""
+    buffer = getattr(frappe.local, "whatsapp_realtime_buffer", None)
+    
+    if buffer is None:
+        buffer = frappe.local.whatsapp_realtime_buffer = {}
+        # Events for writes that are rolled back are never sent
+        frappe.db.after_commit.add(flush_request_buffer)
+        frappe.db.after_rollback.add(discard_request_buffer)
+    
+    buffer.setdefault(room, {})[key] = json.dumps(data, default=str)
+
+
+def discard_request_buffer():
+    """Drop events queued by a transaction that was rolled back"""
+    frappe.local.whatsapp_realtime_buffer = None
+
+
+def flush_request_buffer():
+    """Move this request's events into the shared per-room buffer and schedule a publish"""
+    buffer = getattr(frappe.local, "whatsapp_realtime_buffer", None)
+    frappe.local.whatsapp_realtime_buffer = None
+    
+    if not buffer:
+        return
+    
+    try:
+        cache = frappe.cache()
+        pipe = cache.pipeline()
+        
+        for room, items in buffer.items():
+            pipe.sadd(cache.make_key(ROOMS_KEY), room)
+            pipe.hset(cache.make_key(BUFFER_KEY + room), mapping=items)
+        
+        pipe.execute()
+        
+    except Exception as e:
+        # Without Redis there is no shared window, so publish this request's batch directly
+        frappe.logger().error(f"Realtime buffer unavailable, publishing directly: {str(e)}")
+        for room, items in buffer.items():
+            publish_batch(room, items)
+        return
+    
+    frappe.enqueue(
+        FLUSH_METHOD,
+        queue="short",
+        job_id=FLUSH_JOB_ID,
+        deduplicate=True
+    )
+
+
+def flush_realtime_buffer(window=FLUSH_WINDOW_SECONDS):
+    """Background publisher: one batched event per room per window until the buffer is empty"""
+    while True:
+        time.sleep(window)
+        
+        rooms = take_buffered_events()
+        if not rooms:
+            break
+        
+        for room, items in rooms.items():
+            publish_batch(room, items)
+
+
+def take_buffered_events():
+    """Drain the shared buffer into a room -> {key: event json} dict"""
+    cache = frappe.cache()
+    taken = cache.eval(TAKE_SCRIPT, 1, cache.make_key(ROOMS_KEY), cache.make_key(BUFFER_KEY))
+    
+    rooms = {}
+    for room, items in taken:
+        rooms[frappe.safe_decode(room)] = {
+            frappe.safe_decode(items[i]): frappe.safe_decode(items[i + 1])
+            for i in range(0, len(items), 2)
+        }
+    
+    return rooms
+
+
+def build_batch(room, items):
+    """Group buffered events by kind, keeping the highest status per message"""
+    from whatsapp_calling.whatsapp_integration.status_pipeline import STATUS_RANK
+    
+    batch = {
+        "room": room,
+        "messages": [],
+        "statuses": {},
+        "calls": {},
+        "timestamp": now_datetime().isoformat()
+    }
+    
+    for key, value in items.items():
+        kind = key.split(":", 1)[0]
+        data = json.loads(value)
+        
+        if kind == "message":
+            batch["messages"].append(data)
+        elif kind == "status":
+            current = batch["statuses"].get(data["message_id"])
+            if not current or STATUS_RANK.get(data["status"], 0) > STATUS_RANK.get(current, 0):
+                batch["statuses"][data["message_id"]] = data["status"]
+        elif kind == "call":
+            batch["calls"][data["session_id"]] = data
+    
+    batch["messages"].sort(key=lambda message: message.get("timestamp") or "")
+    
+    return batch
+
+
+def publish_batch(room, items):
+    """Publish one aggregated realtime event for a room"""
+    try:
+        frappe.publish_realtime(event=BATCH_EVENT, message=build_batch(room, items), room=room)
+        
+    except Exception as e:
+        frappe.logger().error(f"Error publishing realtime batch to {room}: {str(e)}")
+
+
+def recover_realtime_buffer():
+    """Scheduled safety net: publish anything left behind by a finished publisher"""
+    try:
+        for room, items in take_buffered_events().items():
+            publish_batch(room, items)
+        
+    except Exception as e:
+        frappe.logger().error(f"Error recovering realtime buffer: {str(e)}")
\ No newline at end of file
@@ -0,0 +1,186 @@
+import frappe
+import time
+from frappe.utils import now_datetime
+from whatsapp_calling.whatsapp_integration.realtime import queue_status_events
+
+
+BUFFER_KEY = "whatsapp_calling:status_buffer"
+FLUSH_METHOD = "whatsapp_calling.whatsapp_integration.status_pipeline.flush_status_buffer"
+FLUSH_JOB_ID = "whatsapp_status_flush"
+FLUSH_WINDOW_SECONDS = 1.0
+UPDATE_CHUNK_SIZE = 1000
+
+# Delivery statuses only move forward; failed is terminal and beats everything
+STATUS_RANK = {
+    "sent": 1,
+    "delivered": 2,
+    "read": 3,
+    "failed": 4
+}
+
+# Tables that mirror a message's delivery status: doctype, message id column, status column
+STATUS_TARGETS = [
+    ("WhatsApp Message", "message_id", "status"),
+    ("WhatsApp Conversation", "last_message_id", "last_message_status")
+]
+
+# Keep the highest ranked status per wamid inside the shared buffer
+MERGE_SCRIPT = """
+local ranks = {sent=1, delivered=2, read=3, failed=4}
+for i = 1, #ARGV, 2 do
+    local current = redis.call('HGET', KEYS[1], ARGV[i])
+    if not current or ranks[ARGV[i + 1]] > ranks[current] then
+        redis.call('HSET', KEYS[1], ARGV[i], ARGV[i + 1])
+    end
+end
+return redis.call('HLEN', KEYS[1])
+"""
+
+# Atomically take everything buffered so far
+TAKE_SCRIPT = """
+local items = redis.call('HGETALL', KEYS[1])
+redis.call('DEL', KEYS[1])
+return items
+"""
+
+
+def coalesce_statuses(statuses):
+    """Reduce status callbacks to the highest status per wamid"""
+    coalesced = {}
+    
+    for status in statuses:
+        message_id = status.get("id")
+        new_status = status.get("status")
+        
+        if not message_id or new_status not in STATUS_RANK:
+            continue
+        
+        current = coalesced.get(message_id)
+        if not current or STATUS_RANK[new_status] > STATUS_RANK[current]:
+            coalesced[message_id] = new_status
+    
+    return coalesced
+
+
+def buffer_statuses(statuses):
+    """Add status callbacks to the shared buffer and make sure a flush is scheduled"""
+    coalesced = coalesce_statuses(statuses)
+    if not coalesced:
+        return
+    
+    try:
+        cache = frappe.cache()
+        args = [value for item in coalesced.items() for value in item]
+        cache.eval(MERGE_SCRIPT, 1, cache.make_key(BUFFER_KEY), *args)
+        
+    except Exception as e:
+        # Without Redis there is no shared window, so apply this payload directly
+        frappe.logger().error(f"Status buffer unavailable, applying directly: {str(e)}")
+        apply_statuses(coalesced)
+        return
+    
+    frappe.enqueue(
+        FLUSH_METHOD,
+        queue="short",
+        job_id=FLUSH_JOB_ID,
+        deduplicate=True
+    )
+
+
+def flush_status_buffer(window=FLUSH_WINDOW_SECONDS):
+    """Background flusher: let the window fill, then apply it until the buffer is empty"""
+    while True:
+        time.sleep(window)
+        
+        coalesced = take_buffered_statuses()
+        if not coalesced:
+            break
+        
+        apply_statuses(coalesced)
+
+
+def take_buffered_statuses():
+    """Drain the shared buffer into a wamid -> status dict"""
+    cache = frappe.cache()
+    items = cache.eval(TAKE_SCRIPT, 1, cache.make_key(BUFFER_KEY))
+    
+    return {
+        frappe.safe_decode(items[i]): frappe.safe_decode(items[i + 1])
+        for i in range(0, len(items), 2)
+    }
+
+
+def apply_statuses(coalesced):
+    """Apply coalesced statuses with one batched, forward-only UPDATE and one realtime event"""
+    message_ids = list(coalesced)
+    changed = []
+    
+    for start in range(0, len(message_ids), UPDATE_CHUNK_SIZE):
+        chunk = message_ids[start:start + UPDATE_CHUNK_SIZE]
+        changed.extend(update_status_chunk(chunk, coalesced))
+    
+    # Queued for the realtime batch published after this commit; rejected and unknown ids stay silent
+    emit_status_batch({message_id: coalesced[message_id] for message_id in changed})
+    
+    frappe.db.commit()
+
+
+def update_status_chunk(message_ids, coalesced):
+    """Move each message forward to its new status, never backwards; returns the message ids it moved"""
+    status_cases = " ".join(["when %s then %s"] * len(message_ids))
+    current_rank = " ".join(f"when '{status}' then {rank}" for status, rank in STATUS_RANK.items())
+    placeholders = ", ".join(["%s"] * len(message_ids))
+    
+    new_statuses, new_ranks = [], []
+    for message_id in message_ids:
+        new_statuses.extend([message_id, coalesced[message_id]])
+        new_ranks.extend([message_id, STATUS_RANK[coalesced[message_id]]])
+    
+    # Lock the rows the UPDATE will move, so the ids read here are exactly the ones it changes
+    doctype, id_field, status_field = STATUS_TARGETS[0]
+    changed = frappe.db.sql(
+        f"""
+        select {id_field}
+        from `tab{doctype}`
+        where {id_field} in ({placeholders})
+        and (case {status_field} {current_rank} else 0 end) < (case {id_field} {status_cases} end)
+        for update
+        """,
+        message_ids + new_ranks,
+        pluck=True
+    )
+    
+    # modified records when we applied the change, not Meta's callback timestamp
+    for doctype, id_field, status_field in STATUS_TARGETS:
+        frappe.db.sql(
+            f"""
+            update `tab{doctype}`
+            set {status_field} = case {id_field} {status_cases} end,
+                modified = %s
+            where {id_field} in ({placeholders})
+            and (case {status_field} {current_rank} else 0 end) < (case {id_field} {status_cases} end)
+            """,
+            new_statuses + [now_datetime()] + message_ids + new_ranks
+        )
+    
+    return changed
+
+
+def emit_status_batch(coalesced):
+    """Queue the flushed statuses for the next batched realtime event"""
+    try:
+        queue_status_events(coalesced)
+        
+    except Exception as e:
+        frappe.logger().error(f"Error emitting status batch: {str(e)}")
+
+
+def recover_status_buffer():
+    """Scheduled safety net: flush anything left behind by a finished flusher"""
+    try:
+        coalesced = take_buffered_statuses()
+        if coalesced:
+            apply_statuses(coalesced)
+        
+    except Exception as e:
+        frappe.logger().error(f"Error recovering status buffer: {str(e)}")
\ No newline at end of file
@@ -4,6 +4,19 @@ import hashlib
 import hmac
 from datetime import datetime
 import requests
+from frappe.utils import flt
+from whatsapp_calling.utils.settings_cache import get_whatsapp_settings
+from whatsapp_calling.whatsapp_integration.inbound_queue import enqueue_webhook_payload
+from whatsapp_calling.utils.phone import E164_FIELD, normalize_phone
+from whatsapp_calling.whatsapp_integration.status_pipeline import buffer_statuses
+from whatsapp_calling.whatsapp_integration.realtime import queue_message_event, queue_status_events
+from whatsapp_calling.whatsapp_integration.partition_dispatcher import (
+    dispatch_messages, acquire_phone_lock, release_phone_lock
+)
+from whatsapp_calling.whatsapp_integration.burst_buffer import buffer_messages
+from whatsapp_calling.whatsapp_integration.batch_processor import (
+    collect_webhook_batch, process_webhook_batch, process_message_batch, process_status_batch
+)
 
 
 @frappe.whitelist(allow_guest=True)
@@ -14,18 +27,19 @@ def whatsapp_webhook():
         if not verify_webhook_signature():
             frappe.throw("Invalid webhook signature", frappe.AuthenticationError)
         
-        data = json.loads(frappe.request.data)
-        
         # Handle webhook verification
         if frappe.request.method == "GET":
             return handle_webhook_verification()
         
-        # Process webhook data
-        if "messages" in data.get("entry", [{}])[0].get("changes", [{}])[0].get("value", {}):
-            process_incoming_message(data)
+        # Fast-ack mode: persist the raw body and let background consumers process it
+        if get_whatsapp_settings().queue_inbound_webhooks:
+            enqueue_webhook_payload(frappe.request.data)
+            return {"status": "success"}
         
-        if "statuses" in data.get("entry", [{}])[0].get("changes", [{}])[0].get("value", {}):
-            process_message_status(data)
+        data = json.loads(frappe.request.data)
+        
+        # Process webhook data
+        process_webhook_data(data)
         
         return {"status": "success"}
         
@@ -35,12 +49,17 @@ def whatsapp_webhook():
         return {"status": "error", "message": str(e)}
 
 
+def process_webhook_data(data):
+    """Process every entry and change in a parsed webhook payload as one batch"""
+    process_webhook_batch(data)
+
+
 def handle_webhook_verification():
     """Handle WhatsApp webhook verification"""
     verify_token = frappe.request.args.get("hub.verify_token")
     challenge = frappe.request.args.get("hub.challenge")
     
-    account = frappe.get_single("WhatsApp Business Account")
+    account = get_whatsapp_settings()
     if account and verify_token == account.webhook_verify_token:
         return challenge
     else:
@@ -50,7 +69,7 @@ def handle_webhook_verification():
 def verify_webhook_signature():
     """Verify webhook signature from WhatsApp"""
     try:
-        account = frappe.get_single("WhatsApp Business Account")
+        account = get_whatsapp_settings()
         if not account or not account.webhook_verify_token:
             return False
         
@@ -69,56 +88,24 @@ def verify_webhook_signature():
 
 
 def process_incoming_message(data):
-    """Process incoming WhatsApp message"""
+    """Process incoming WhatsApp messages from every entry in the payload"""
     try:
-        entry = data.get("entry", [{}])[0]
-        changes = entry.get("changes", [{}])[0]
-        value = changes.get("value", {})
-        messages = value.get("messages", [])
+        messages = collect_webhook_batch(data)["messages"]
         
-        for message in messages:
-            phone_number = message.get("from")
-            message_body = get_message_text(message)
-            message_type = message.get("type", "text")
-            message_id = message.get("id")
-            timestamp = datetime.fromtimestamp(int(message.get("timestamp", 0)))
-            
-            # Create message log
-            create_message_log(
-                phone_number=phone_number,
-                message_body=message_body,
-                message_type=message_type,
-                message_id=message_id,
-                direction="received",
-                status="delivered",
-                timestamp=timestamp
-            )
-            
-            # Process with AI bot if enabled
-            process_with_bot(phone_number, message_body, message_id)
-            
-            # Emit real-time update
-            emit_message_update(phone_number, message_body, "received")
+        # Log all messages with one insert, then hand each to the bot
+        process_message_batch(messages)
             
     except Exception as e:
         frappe.logger().error(f"Error processing incoming message: {str(e)}")
 
 
 def process_message_status(data):
-    """Process message delivery status updates"""
+    """Process message delivery status updates from every entry in the payload"""
     try:
-        entry = data.get("entry", [{}])[0]
-        changes = entry.get("changes", [{}])[0]
-        value = changes.get("value", {})
-        statuses = value.get("statuses", [])
+        statuses = collect_webhook_batch(data)["statuses"]
         
-        for status in statuses:
-            message_id = status.get("id")
-            new_status = status.get("status")  # sent, delivered, read, failed
-            timestamp = datetime.fromtimestamp(int(status.get("timestamp", 0)))
-            
-            # Update message status
-            update_message_status(message_id, new_status, timestamp)
+        # sent, delivered, read, failed
+        process_status_batch(statuses)
             
     except Exception as e:
         frappe.logger().error(f"Error processing message status: {str(e)}")
@@ -145,85 +132,23 @@ def get_message_text(message):
         return f"[{message_type.title()} Message]"
 
 
-def create_message_log(phone_number, message_body, message_type, message_id, direction, status, timestamp):
-    """Create WhatsApp Message log entry"""
+def create_lead_from_whatsapp(phone_number, first_message):
+    """Create new Lead from WhatsApp conversation"""
+    # Two first messages from one number can arrive in parallel webhooks
+    lock = acquire_phone_lock(phone_number)
+    
     try:
-        # Check if message already exists
-        existing = frappe.db.get_value("WhatsApp Message", {"message_id": message_id}, "name")
+        phone_e164 = normalize_phone(phone_number, international=True)
+        
+        # The other webhook may have created the Lead while this one waited
+        existing = phone_e164 and frappe.db.get_value("Lead", {E164_FIELD: phone_e164}, "name")
         if existing:
             return existing
         
-        message_log = frappe.new_doc("WhatsApp Message")
-        message_log.message_id = message_id
-        message_log.conversation_id = f"CONV-{phone_number}-{datetime.now().strftime('%Y%m%d')}"
-        message_log.from_number = phone_number if direction == "received" else get_business_phone_number()
-        message_log.to_number = get_business_phone_number() if direction == "received" else phone_number
-        message_log.message_body = message_body
-        message_log.message_type = message_type
-        message_log.status = status
-        message_log.direction = direction
-        message_log.timestamp = timestamp
-        
-        # Link to Lead/Contact/Customer if exists
-        link_to_crm_record(message_log, phone_number)
-        
-        message_log.insert(ignore_permissions=True)
-        frappe.db.commit()
-        
-        return message_log.name
-        
-    except Exception as e:
-        frappe.logger().error(f"Error creating message log: {str(e)}")
-        return None
-
-
-def link_to_crm_record(message_log, phone_number):
-    """Link message to existing CRM records"""
-    try:
-        # Format phone number for searching
-        formatted_phone = format_phone_number(phone_number)
-        
-        # Check for Lead
-        lead = frappe.db.get_value("Lead", {
-            "mobile_no": ["in", [phone_number, formatted_phone]]
-        }, "name")
-        
-        if lead:
-            message_log.lead = lead
-            return
-        
-        # Check for Contact
-        contact = frappe.db.get_value("Contact", {
-            "mobile_no": ["in", [phone_number, formatted_phone]]
-        }, "name")
-        
-        if contact:
-            message_log.contact = contact
-            return
-        
-        # Check for Customer
-        customer = frappe.db.get_value("Customer", {
-            "mobile_no": ["in", [phone_number, formatted_phone]]
-        }, "name")
-        
-        if customer:
-            message_log.customer = customer
-            return
-        
-        # Create new Lead if no existing record
-        if not lead and not contact and not customer:
-            create_lead_from_whatsapp(phone_number, message_log.message_body)
-            
-    except Exception as e:
-        frappe.logger().error(f"Error linking to CRM record: {str(e)}")
-
-
-def create_lead_from_whatsapp(phone_number, first_message):
-    """Create new Lead from WhatsApp conversation"""
-    try:
         lead = frappe.new_doc("Lead")
         lead.first_name = f"WhatsApp Lead {phone_number[-4:]}"
         lead.mobile_no = phone_number
+        lead.whatsapp_phone = phone_e164 or phone_number
         lead.source = "WhatsApp"
         lead.status = "Lead"
         lead.lead_owner = get_default_lead_owner()
@@ -238,27 +163,31 @@ def create_lead_from_whatsapp(phone_number, first_message):
     except Exception as e:
         frappe.logger().error(f"Error creating lead from WhatsApp: {str(e)}")
         return None
+    
+    finally:
+        release_phone_lock(lock)
 
 
 def process_with_bot(phone_number, message_body, message_id):
     """Process message with AI bot if enabled"""
+    process_messages_with_bot([(phone_number, message_body, message_id)])
+
+
+def process_messages_with_bot(messages):
+    """Hand (phone_number, message_body, message_id) tuples to the bot if enabled"""
     try:
-        account = frappe.get_single("WhatsApp Business Account")
+        account = get_whatsapp_settings()
         if not account or not account.enable_bot:
             return
         
-        # Get or create bot conversation state
-        conversation_state = get_bot_conversation_state(phone_number)
+        # Messages sent in quick succession wait out the burst window and become one turn
+        if flt(account.bot_burst_window) > 0:
+            buffer_messages(messages, flt(account.bot_burst_window))
+            return
         
-        # Process with AI bot
-        frappe.enqueue(
-            "whatsapp_calling.bot.ai_engine.process_message",
-            phone_number=phone_number,
-            message_body=message_body,
-            conversation_state=conversation_state,
-            message_id=message_id,
-            queue="short"
-        )
+        # Ordered per conversation, parallel across conversations; the partition
+        # worker loads the conversation state when it reaches each message
+        dispatch_messages(messages)
         
     except Exception as e:
         frappe.logger().error(f"Error processing with bot: {str(e)}")
@@ -267,7 +196,11 @@ def process_with_bot(phone_number, message_body, message_id):
 def get_bot_conversation_state(phone_number):
     """Get or create bot conversation state"""
     try:
-        state_name = frappe.db.get_value("Bot Conversation State", {"phone_number": phone_number}, "name")
+        state_name = frappe.db.get_value(
+            "Bot Conversation State",
+            {E164_FIELD: normalize_phone(phone_number, international=True)},
+            "name"
+        )
         
         if state_name:
             return frappe.get_doc("Bot Conversation State", state_name)
@@ -292,86 +225,56 @@ def get_bot_conversation_state(phone_number):
         return None
 
 
-def update_message_status(message_id, new_status, timestamp):
-    """Update message delivery status"""
+def update_message_status(message_id, new_status, timestamp=None):
+    """Update message delivery status through the coalescing status pipeline"""
     try:
-        message_log = frappe.get_value("WhatsApp Message", {"message_id": message_id}, "name")
-        
-        if message_log:
-            frappe.db.set_value("WhatsApp Message", message_log, {
-                "status": new_status,
-                "modified": timestamp
-            })
-            frappe.db.commit()
-            
-            # Emit real-time status update
-            emit_status_update(message_id, new_status)
+        # Applied forward-only in the next flush, which also emits the realtime update
+        buffer_statuses([{"id": message_id, "status": new_status}])
             
     except Exception as e:
         frappe.logger().error(f"Error updating message status: {str(e)}")
 
 
-def emit_message_update(phone_number, message_body, direction):
-    """Emit real-time message update via Socket.IO"""
+def emit_message_update(phone_number, message_body, direction, message_id=None):
+    """Emit real-time message update with the next batched realtime event"""
     try:
-        frappe.publish_realtime(
-            event="whatsapp_message_received",
-            message={
-                "phone_number": phone_number,
-                "message_body": message_body,
-                "direction": direction,
-                "timestamp": datetime.now().isoformat()
-            },
-            room="whatsapp_messages"
-        )
+        queue_message_event({
+            "message_id": message_id,
+            "whatsapp_phone_e164": normalize_phone(phone_number, international=direction == "received"),
+            "phone_number": phone_number,
+            "message_body": message_body,
+            "direction": direction,
+            "timestamp": datetime.now().isoformat()
+        })
         
     except Exception as e:
         frappe.logger().error(f"Error emitting message update: {str(e)}")
 
 
 def emit_status_update(message_id, status):
-    """Emit real-time status update"""
+    """Emit real-time status update with the next batched realtime event"""
     try:
-        frappe.publish_realtime(
-            event="whatsapp_message_status_update",
-            message={
-                "message_id": message_id,
-                "status": status,
-                "timestamp": datetime.now().isoformat()
-            },
-            room="whatsapp_messages"
-        )
+        queue_status_events({message_id: status})
         
     except Exception as e:
         frappe.logger().error(f"Error emitting status update: {str(e)}")
 
 
 def format_phone_number(phone_number):
-    """Format phone number for consistent searching"""
-    # Remove non-digit characters
-    digits_only = ''.join(filter(str.isdigit, phone_number))
-    
-    # Add country code if missing
-    if len(digits_only) == 10:
-        return f"+1{digits_only}"  # Default to US
-    elif len(digits_only) == 11 and digits_only.startswith('1'):
-        return f"+{digits_only}"
-    elif not digits_only.startswith('+'):
-        return f"+{digits_only}"
-    
-    return phone_number
+    """Format a WhatsApp number for consistent searching"""
+    return normalize_phone(phone_number, international=True) or phone_number
 
 
 def get_business_phone_number():
     """Get business phone number from settings"""
-    account = frappe.get_single("WhatsApp Business Account")
+    account = get_whatsapp_settings()
     return account.phone_number if account else None
 
 
 def get_default_lead_owner():
     """Get default lead owner for auto-created leads"""
     # Try to get from WhatsApp settings first
-    account = frappe.get_single("WhatsApp Business Account")
+    account = get_whatsapp_settings()
     if account and account.default_lead_owner:
         return account.default_lead_owner
     